@@ -1,14 +1,12 @@
 from web.app import app
+from common.logging_setup import setup_logging
 import threading
 import os
 import sys
 import logging
 
-# إعداد التسجيل
-logging.basicConfig(
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    level=logging.INFO
-)
+# إعداد التسجيل المركزي (طابور وخيط كتابة واحد)
+setup_logging()
 logger = logging.getLogger(__name__)
 
 # إضافة المجلد الرئيسي إلى مسار البحث
@@ -26,7 +24,7 @@ def run_bot():
         # تشغيل البوت من خلال الدالة المعرفة في bot/__init__.py
         start_bot()
     except Exception as e:
-        logger.error(f"خطأ في تشغيل بوت التلغرام: {str(e)}")
+        logger.error("خطأ في تشغيل بوت التلغرام: %s", e)
 
 # بدء تشغيل البوت في خيط منفصل
 bot_thread = threading.Thread(target=run_bot)
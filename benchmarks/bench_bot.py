@@ -0,0 +1,345 @@
+#!/usr/bin/env python3
+"""
+قياس إنتاجية بوت التلغرام مقابل خادم Bot API وهمي محلي
+
+يوجه تطبيق البوت إلى FakeBotAPI ويستبدل المحمل بمحمل وهمي، ثم يعيد تشغيل تدفق
+اصطناعي من التحديثات (روابط، أزرار تنسيق، إلغاء) لآلاف المستخدمين ويقيس:
+- زمن تنفيذ كل معالج وزمن انتظار التحديث قبل معالجته
+- معدل استدعاءات Bot API الصادرة لكل طريقة
+- الخيوط والذاكرة المستخدمة لكل تحميل نشط
+
+الاستخدام:
+    python benchmarks/bench_bot.py --users 500 --output bot.json
+"""
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import logging
+import argparse
+import tempfile
+import threading
+import functools
+from collections import defaultdict
+from typing import Dict, List
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+# كل المستخدمين الاصطناعيين يتشاركون الحد نفسه من المعدل، فيُعطل افتراضيًا
+os.environ.setdefault('BOT_TOKEN', '123456:benchmark')
+os.environ.setdefault('RATE_LIMIT_REFILL_RATE', '0')
+os.environ.setdefault('DOWNLOAD_PATH', os.path.join(tempfile.gettempdir(), 'ytdl-bot-bench'))
+
+from telegram.ext import Application
+
+from benchmarks.fake_bot_api import FakeBotAPI, BOT_USER
+from benchmarks.fakes import FakeDownloader
+from common.scheduler import get_scheduler
+import bot.telegram_bot as telegram_bot
+
+VIDEO_URL = 'https://www.youtube.com/watch?v=BotBench001'
+FIRST_USER_ID = 100000
+
+
+def summarize(samples: List[float]) -> Dict:
+    """ملخص زمني بالمللي ثانية"""
+    if not samples:
+        return {'count': 0}
+    ordered = sorted(samples)
+    pick = lambda p: ordered[min(len(ordered) - 1, int(len(ordered) * p))] * 1000
+    return {
+        'count': len(ordered),
+        'mean_ms': sum(ordered) / len(ordered) * 1000,
+        'p50_ms': pick(0.50),
+        'p95_ms': pick(0.95),
+        'p99_ms': pick(0.99),
+        'max_ms': ordered[-1] * 1000,
+    }
+
+
+def current_rss() -> int:
+    """الذاكرة المقيمة الحالية للعملية بالبايت"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class SyntheticUsers:
+    """
+    مستخدمون اصطناعيون يتفاعلون مع ردود البوت كما يصلها خادم Bot API الوهمي
+    """
+
+    def __init__(self, api: FakeBotAPI, users: int, cancel_ratio: float, audio_ratio: float, seed: int,
+                 first_user: int = FIRST_USER_ID, abandon_ratio: float = 0.0):
+        self.api = api
+        rng = random.Random(seed)
+        self.plans: Dict[int, str] = {}
+        self.media: Dict[int, str] = {}
+        for i in range(users):
+            user_id = first_user + i
+            if rng.random() < cancel_ratio:
+                # نصف الملغين يضغط زر الإلغاء قبل اختيار التنسيق، والنصف الآخر يرسل /cancel أثناء الانتظار
+                self.plans[user_id] = rng.choice(('cancel_button', 'cancel_queued'))
+            elif abandon_ratio and rng.random() < abandon_ratio:
+                # يرسل الرابط ثم لا يختار تنسيقًا (تبقى جلسته في البوت حتى انتهاء صلاحيتها)
+                self.plans[user_id] = 'abandon'
+            else:
+                self.plans[user_id] = 'download'
+            self.media[user_id] = 'audio' if rng.random() < audio_ratio else 'video'
+
+        self.arrived_at: Dict[int, float] = {}
+        self.outcomes: Dict[int, str] = {}
+        self.end_to_end: List[float] = []
+        self.uploads_after_cancel = 0
+        self._lock = threading.Lock()
+        self.finished = threading.Event()
+        api.add_listener(self.on_call)
+
+    @staticmethod
+    def _user(user_id: int) -> Dict:
+        return {'id': user_id, 'is_bot': False, 'first_name': f'user{user_id}'}
+
+    def _message(self, user_id: int, text: str, command: bool = False) -> Dict:
+        message = {
+            'message_id': self.api.new_message_id(),
+            'date': int(time.time()),
+            'chat': {'id': user_id, 'type': 'private'},
+            'from': self._user(user_id),
+            'text': text,
+        }
+        if command:
+            message['entities'] = [{'type': 'bot_command', 'offset': 0, 'length': len(text)}]
+        return {'message': message}
+
+    def _callback(self, user_id: int, message_id: int, data: str) -> Dict:
+        return {'callback_query': {
+            'id': f'{user_id}-{message_id}',
+            'from': self._user(user_id),
+            'chat_instance': str(user_id),
+            'data': data,
+            'message': {
+                'message_id': message_id,
+                'date': int(time.time()),
+                'chat': {'id': user_id, 'type': 'private'},
+                'from': BOT_USER,
+                'text': '...',
+            },
+        }}
+
+    def close(self) -> None:
+        """إيقاف الاستماع لاستدعاءات البوت (عند تشغيل عدة مجموعات متتالية)"""
+        self.api.remove_listener(self.on_call)
+
+    def arrive(self, user_id: int) -> None:
+        self.arrived_at[user_id] = time.perf_counter()
+        self.api.push_update(self._message(user_id, VIDEO_URL))
+
+    def _finish(self, user_id: int, outcome: str) -> None:
+        with self._lock:
+            if user_id in self.outcomes:
+                return
+            self.outcomes[user_id] = outcome
+            if outcome == 'completed':
+                self.end_to_end.append(time.perf_counter() - self.arrived_at[user_id])
+            if len(self.outcomes) == len(self.plans):
+                self.finished.set()
+
+    def on_call(self, method: str, params: Dict) -> None:
+        user_id = int(params.get('chat_id') or 0)
+        plan = self.plans.get(user_id)
+        if plan is None:
+            return
+        text = params.get('text') or ''
+
+        if method in ('sendVideo', 'sendAudio'):
+            with self._lock:
+                if self.outcomes.get(user_id) == 'cancelled':
+                    self.uploads_after_cancel += 1
+            self._finish(user_id, 'completed')
+        elif text.startswith('✅ تم إلغاء'):
+            self._finish(user_id, 'cancelled')
+        elif text.startswith('❌') or 'فشل التحميل' in text:
+            self._finish(user_id, 'failed')
+        elif method == 'editMessageText' and 'format_' in (params.get('reply_markup') or ''):
+            # وصلت لوحة اختيار التنسيق
+            message_id = int(params['message_id'])
+            if plan == 'abandon':
+                self._finish(user_id, 'abandoned')
+                return
+            if plan == 'cancel_button':
+                self.api.push_update(self._callback(user_id, message_id, 'cancel'))
+                return
+            suffix = f"_{self.media[user_id]}"
+            keyboard = json.loads(params['reply_markup'])['inline_keyboard']
+            choices = [b['callback_data'] for row in keyboard for b in row
+                       if b.get('callback_data', '').startswith('format_') and b['callback_data'].endswith(suffix)]
+            self.api.push_update(self._callback(user_id, message_id, choices[0]))
+        elif method == 'editMessageText' and 'في انتظار دورك' in text and plan == 'cancel_queued':
+            self.api.push_update(self._message(user_id, '/cancel', command=True))
+
+
+class HandlerTimer:
+    """تغليف معالجات التطبيق لقياس زمن التنفيذ وزمن الانتظار قبل المعالجة"""
+
+    def __init__(self, api: FakeBotAPI):
+        self.api = api
+        self.durations: Dict[str, List[float]] = defaultdict(list)
+        self.queue_delays: List[float] = []
+
+    def install(self, application: Application) -> None:
+        for handlers in application.handlers.values():
+            for handler in handlers:
+                handler.callback = self._wrap(handler.callback)
+
+    def _wrap(self, callback):
+        @functools.wraps(callback)
+        async def timed(update, context):
+            started = time.perf_counter()
+            pushed_at = self.api.pushed_at.get(update.update_id)
+            if pushed_at is not None:
+                self.queue_delays.append(started - pushed_at)
+            try:
+                return await callback(update, context)
+            finally:
+                self.durations[callback.__name__].append(time.perf_counter() - started)
+        return timed
+
+
+class ResourceSampler(threading.Thread):
+    """أخذ عينات دورية من عدد الخيوط والذاكرة وعدد التحميلات النشطة"""
+
+    def __init__(self, interval: float = 0.05):
+        super().__init__(name='resource-sampler', daemon=True)
+        self.interval = interval
+        self.samples: List[Dict] = []
+        self._stop_event = threading.Event()
+
+    def run(self):
+        scheduler = get_scheduler()
+        while not self._stop_event.wait(self.interval):
+            self.samples.append({
+                'threads': threading.active_count(),
+                'rss': current_rss(),
+                'active_downloads': len(telegram_bot.active_downloads),
+                'running_jobs': scheduler.active_jobs,
+            })
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+
+async def run_benchmark(args) -> Dict:
+    api = FakeBotAPI().start()
+    users = SyntheticUsers(api, args.users, args.cancel_ratio, args.audio_ratio, args.seed)
+
+    telegram_bot.downloader = FakeDownloader(
+        os.environ['DOWNLOAD_PATH'],
+        extract_latency=args.extract_latency,
+        download_latency=args.download_latency,
+        size_bytes=args.size_bytes
+    )
+
+    application = Application.builder().token(os.environ['BOT_TOKEN']).base_url(api.base_url).build()
+    telegram_bot.register_handlers(application)
+    timer = HandlerTimer(api)
+    timer.install(application)
+
+    await application.initialize()
+    await application.start()
+    await application.updater.start_polling(poll_interval=0, timeout=1)
+
+    baseline = {'threads': threading.active_count(), 'rss': current_rss()}
+    sampler = ResourceSampler()
+    sampler.start()
+
+    started = time.perf_counter()
+    gap = args.ramp / args.users if args.users else 0
+    for user_id in users.plans:
+        users.arrive(user_id)
+        if gap:
+            await asyncio.sleep(gap)
+
+    # انتظار انتهاء كل المستخدمين ثم التحميلات التي استمرت بعد الإلغاء
+    deadline = time.monotonic() + args.timeout
+    while not users.finished.is_set() and time.monotonic() < deadline:
+        await asyncio.sleep(0.1)
+    scheduler = get_scheduler()
+    while (telegram_bot.active_downloads or scheduler.queue_depth or scheduler.active_jobs) \
+            and time.monotonic() < deadline:
+        await asyncio.sleep(0.1)
+    elapsed = time.perf_counter() - started
+
+    sampler.stop()
+    await application.updater.stop()
+    await application.stop()
+    await application.shutdown()
+    api.stop()
+
+    peak_threads = max((s['threads'] for s in sampler.samples), default=baseline['threads'])
+    peak_rss = max((s['rss'] for s in sampler.samples), default=baseline['rss'])
+    peak_active = max((s['active_downloads'] for s in sampler.samples), default=0)
+    outcomes = defaultdict(int)
+    for outcome in users.outcomes.values():
+        outcomes[outcome] += 1
+    outcomes['unfinished'] = args.users - len(users.outcomes)
+
+    api_calls = {method: {'count': count, 'per_second': count / elapsed}
+                 for method, count in sorted(api.calls.items())}
+    outbound = sum(count for method, count in api.calls.items() if method != 'getUpdates')
+
+    return {
+        'config': {k: v for k, v in vars(args).items() if k != 'output'},
+        'elapsed_seconds': elapsed,
+        'outcomes': dict(outcomes),
+        'uploads_after_cancel': users.uploads_after_cancel,
+        'end_to_end': summarize(users.end_to_end),
+        'update_queue_delay': summarize(timer.queue_delays),
+        'handlers': {name: summarize(samples) for name, samples in timer.durations.items()},
+        'api_calls': api_calls,
+        'outbound_calls_per_second': outbound / elapsed,
+        'uploaded_bytes': api.uploaded_bytes,
+        'resources': {
+            'baseline_threads': baseline['threads'],
+            'peak_threads': peak_threads,
+            'baseline_rss_mb': baseline['rss'] / (1024 * 1024),
+            'peak_rss_mb': peak_rss / (1024 * 1024),
+            'peak_active_downloads': peak_active,
+            'threads_per_active_download': (peak_threads - baseline['threads']) / max(peak_active, 1),
+            'rss_mb_per_active_download': (peak_rss - baseline['rss']) / (1024 * 1024) / max(peak_active, 1),
+        },
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='قياس إنتاجية بوت التلغرام مقابل Bot API وهمي')
+    parser.add_argument('--users', type=int, default=500, help='عدد المستخدمين الاصطناعيين')
+    parser.add_argument('--ramp', type=float, default=5, help='مدة وصول المستخدمين (ث)')
+    parser.add_argument('--cancel-ratio', type=float, default=0.1, help='نسبة المستخدمين الذين يلغون')
+    parser.add_argument('--audio-ratio', type=float, default=0.3, help='نسبة طلبات الصوت')
+    parser.add_argument('--extract-latency', type=float, default=0.02, help='زمن الاستخراج الوهمي (ث)')
+    parser.add_argument('--download-latency', type=float, default=0.1, help='زمن التحميل الوهمي (ث)')
+    parser.add_argument('--size-bytes', type=int, default=256 * 1024, help='حجم الملف الوهمي')
+    parser.add_argument('--timeout', type=float, default=600, help='المهلة القصوى للتشغيل (ث)')
+    parser.add_argument('--seed', type=int, default=1, help='بذرة توزيع خطط المستخدمين')
+    parser.add_argument('--output', help='ملف JSON لحفظ النتائج (افتراضيًا: الطباعة)')
+    args = parser.parse_args()
+
+    logging.disable(logging.WARNING)
+
+    report = asyncio.run(run_benchmark(args))
+    output = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output)
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,223 @@
+#!/usr/bin/env python3
+"""
+مجموعة قياس أداء YouTubeDownloader دون اتصال بالإنترنت
+
+تشغل المحمل على مستخرج وهمي وخادم وسائط محلي وتقيس:
+- كلفة الاستخراج (معالجة معلومات JSON وفرز التنسيقات)، وإنتاجيته المتزامنة في الخيوط
+  وفي مجمع العمليات (--extract-processes)
+- معدل التحميل للملف التدريجي والمجزأ (HLS)
+- كلفة المعالجة اللاحقة (تحويل الصوت، يتطلب FFmpeg)
+- زمن فحص مجلد التحميل في cleanup_old_files بأحجام مختلفة
+
+الاستخدام:
+    python benchmarks/bench_downloader.py --output results.json
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import logging
+import platform
+import argparse
+import tempfile
+import statistics
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from benchmarks.fake_media_server import FakeMediaServer, prepare_media
+from benchmarks.fakes import FakeYoutubeIE, OfflineDownloader
+from common.downloader import YouTubeDownloader
+from common.extract_pool import ExtractionPool
+from common.tracing import Trace, activate
+
+VIDEO_URL = 'https://www.youtube.com/watch?v=BenchVideo1'
+
+
+def summarize(samples: List[float]) -> Dict:
+    """ملخص إحصائي لعينات زمنية (بالثواني)"""
+    ordered = sorted(samples)
+    return {
+        'runs': len(samples),
+        'mean': statistics.mean(samples),
+        'p50': ordered[len(ordered) // 2],
+        'p95': ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))],
+        'min': ordered[0],
+        'max': ordered[-1],
+    }
+
+
+def bench_extraction(downloader: YouTubeDownloader, runs: int) -> Dict:
+    """زمن الاستخراج بدون الذاكرة المؤقتة"""
+    samples = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        downloader._extract_video_info(VIDEO_URL)
+        samples.append(time.perf_counter() - start)
+    return summarize(samples)
+
+
+def bench_extraction_throughput(downloader: YouTubeDownloader, runs: int, concurrency: int) -> Dict:
+    """عدد الاستخراجات في الثانية من concurrency خيطًا متزامنًا (بدون الذاكرة المؤقتة)"""
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        start = time.perf_counter()
+        list(pool.map(lambda _: downloader._extract_video_info(VIDEO_URL), range(runs)))
+        elapsed = time.perf_counter() - start
+    return {'runs': runs, 'concurrency': concurrency, 'per_second': runs / elapsed}
+
+
+def bench_download(downloader: YouTubeDownloader, format_id: str, runs: int) -> Dict:
+    """معدل التحميل لتنسيق معين"""
+    samples, sizes = [], []
+    for _ in range(runs):
+        start = time.perf_counter()
+        file_path = downloader.download_video(VIDEO_URL, format_id)
+        elapsed = time.perf_counter() - start
+        if not file_path:
+            raise RuntimeError(f"فشل تحميل التنسيق {format_id}")
+        sizes.append(os.path.getsize(file_path))
+        samples.append(elapsed)
+        os.remove(file_path)
+
+    result = summarize(samples)
+    result['bytes'] = sizes[0]
+    result['mb_per_second'] = statistics.mean(s / t for s, t in zip(sizes, samples)) / (1024 * 1024)
+    return result
+
+
+def bench_postprocess(downloader: YouTubeDownloader, runs: int) -> Dict:
+    """زمن تحويل الصوت إلى MP3 مقاسًا من مراحل المهمة"""
+    fetch, postprocess = [], []
+    for i in range(runs):
+        trace = Trace(f'bench-{i}')
+        with activate(trace):
+            file_path = downloader.download_audio(VIDEO_URL, 'audio')
+            trace.end_all()
+        if not file_path:
+            raise RuntimeError("فشل تحميل الصوت")
+        os.remove(file_path)
+        spans = trace.to_list()
+        fetch.append(sum(s['duration'] for s in spans if s['name'] == 'fetch'))
+        postprocess.append(sum(s['duration'] for s in spans if s['name'].startswith('postprocess:')))
+    return {'fetch': summarize(fetch), 'postprocess': summarize(postprocess)}
+
+
+def bench_cleanup(sizes: List[int], runs: int) -> Dict:
+    """زمن فحص وتنظيف مجلد يحتوي على عدد معين من الملفات (نصفها قديم)"""
+    results = {}
+    old_mtime = time.time() - 2 * 3600
+    for count in sizes:
+        samples = []
+        for _ in range(runs):
+            directory = tempfile.mkdtemp(prefix='bench-cleanup-')
+            try:
+                for i in range(count):
+                    path = os.path.join(directory, f'video_{i}.mp4')
+                    with open(path, 'wb'):
+                        pass
+                    if i % 2 == 0:
+                        os.utime(path, (old_mtime, old_mtime))
+                downloader = YouTubeDownloader(directory)
+                start = time.perf_counter()
+                downloader.cleanup_old_files(1)
+                samples.append(time.perf_counter() - start)
+            finally:
+                shutil.rmtree(directory, ignore_errors=True)
+        results[str(count)] = summarize(samples)
+    return results
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            cwd=os.path.dirname(os.path.abspath(__file__)), stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def main():
+    parser = argparse.ArgumentParser(description='قياس أداء YouTubeDownloader دون اتصال')
+    parser.add_argument('--output', help='ملف JSON لحفظ النتائج (افتراضيًا: الطباعة)')
+    parser.add_argument('--size-mb', type=float, default=20, help='حجم ملف الوسائط بالميجابايت')
+    parser.add_argument('--duration', type=int, default=60, help='مدة الوسائط بالثواني')
+    parser.add_argument('--runs', type=int, default=3, help='عدد مرات تكرار كل قياس')
+    parser.add_argument('--extract-runs', type=int, default=50, help='عدد مرات قياس الاستخراج')
+    parser.add_argument('--extract-concurrency', type=int, default=4, help='الاستخراجات المتزامنة لقياس الإنتاجية')
+    parser.add_argument('--extract-processes', type=int, default=0,
+                        help='عدد عمليات مجمع الاستخراج لمقارنة إنتاجيته بالخيوط (0 = بلا مقارنة)')
+    parser.add_argument('--cleanup-sizes', default='100,1000,10000', help='أحجام مجلد التنظيف (مفصولة بفواصل)')
+    parser.add_argument('--no-ffmpeg', action='store_true', help='استخدام بيانات عشوائية بدلًا من وسائط حقيقية')
+    args = parser.parse_args()
+
+    logging.disable(logging.INFO)
+
+    import yt_dlp
+
+    workdir = tempfile.mkdtemp(prefix='bench-downloader-')
+    media_root = os.path.join(workdir, 'media')
+    download_path = os.path.join(workdir, 'downloads')
+    os.makedirs(download_path)
+
+    try:
+        media = prepare_media(media_root, args.size_mb, args.duration,
+                              use_ffmpeg=False if args.no_ffmpeg else None)
+        results = {}
+        with FakeMediaServer(media_root) as server:
+            fake_ie = FakeYoutubeIE(server.base_url, media, args.duration)
+            downloader = OfflineDownloader(download_path, fake_ie, real_media=media['real_media'])
+
+            results['extraction'] = bench_extraction(downloader, args.extract_runs)
+            throughput = {'thread': bench_extraction_throughput(
+                downloader, args.extract_runs, args.extract_concurrency)}
+            if args.extract_processes:
+                downloader.extract_pool = ExtractionPool(*downloader._extractor_factory(), args.extract_processes)
+                try:
+                    # بدء العمليات وتهيئة مستخرجاتها خارج القياس
+                    bench_extraction_throughput(downloader, args.extract_processes, args.extract_processes)
+                    throughput['process'] = bench_extraction_throughput(
+                        downloader, args.extract_runs, args.extract_concurrency)
+                finally:
+                    downloader.extract_pool.close()
+                    downloader.extract_pool = None
+            results['extraction_throughput'] = throughput
+            results['download_progressive'] = bench_download(downloader, 'progressive', args.runs)
+            results['download_hls'] = bench_download(downloader, 'hls', args.runs)
+            if media['real_media'] and downloader.has_ffmpeg:
+                results['postprocess_audio'] = bench_postprocess(downloader, args.runs)
+            else:
+                results['postprocess_audio'] = {'skipped': 'FFmpeg غير متوفر'}
+
+        sizes = [int(n) for n in args.cleanup_sizes.split(',') if n]
+        results['cleanup_scan'] = bench_cleanup(sizes, args.runs)
+
+        report = {
+            'meta': {
+                'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+                'git_revision': git_revision(),
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+                'yt_dlp': yt_dlp.version.__version__,
+                'size_mb': args.size_mb,
+                'duration': args.duration,
+                'real_media': media['real_media'],
+            },
+            'results': results,
+        }
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    output = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output)
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main()
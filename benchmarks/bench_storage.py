@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+"""
+اختبار مخزن S3 (S3Storage) مقابل خادم S3 وهمي محلي دون اتصال بالإنترنت
+
+يمر بدورة حياة الملف المنشور كما تستخدمها الواجهات ويقيس زمن كل خطوة:
+- النشر: رفع ملفات من مجلد التحميل (متعدد الأجزاء فوق 8 ميجابايت) وحذف النسخة المحلية
+- الرابط الموقع: تنزيل الملف منه دون مفاتيح وصول مع اسم الملف في Content-Disposition
+- إعادة التوجيه: /download/<id> في تطبيق الويب يعيد التوجيه إلى رابط موقع صالح
+- انتهاء الصلاحية: الرابط يُرفض بعد --presign-expiry ثانية
+- الحذف والتنظيف: delete يزيل الكائن، و cleanup يحذف القديم فقط
+
+يخرج البرنامج بالرمز 1 إذا فشل أي فحص (يتطلب حزمة boto3).
+
+الاستخدام:
+    python benchmarks/bench_storage.py --files 5 --size-mb 10 --output storage.json
+"""
+import os
+import sys
+import json
+import time
+import hashlib
+import argparse
+import tempfile
+import urllib.error
+import urllib.request
+from typing import Dict, List, Optional, Tuple
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+os.environ.setdefault('DOWNLOAD_PATH', tempfile.mkdtemp(prefix='ytdl-bench-storage-'))
+
+from benchmarks.fake_s3 import FakeS3Server
+from common.jobs import Job
+import common.storage as storage_module
+from common.storage import S3Storage
+
+BUCKET = 'benchmark'
+
+
+def fetch(url: str) -> Tuple[int, bytes, Dict[str, str]]:
+    """طلب GET دون مفاتيح وصول: (الحالة، المحتوى، الترويسات)"""
+    try:
+        with urllib.request.urlopen(url, timeout=30) as response:
+            return response.status, response.read(), dict(response.headers)
+    except urllib.error.HTTPError as e:
+        return e.code, e.read(), dict(e.headers)
+
+
+def write_file(directory: str, name: str, size: int) -> Tuple[str, str]:
+    """إنشاء ملف عشوائي بالحجم المطلوب: (المسار، مجموع sha256)"""
+    path = os.path.join(directory, name)
+    digest = hashlib.sha256()
+    block = os.urandom(1024 * 1024)
+    with open(path, 'wb') as f:
+        for offset in range(0, size, len(block)):
+            chunk = block[:min(len(block), size - offset)]
+            f.write(chunk)
+            digest.update(chunk)
+    return path, digest.hexdigest()
+
+
+def summarize(samples: List[float], size: int) -> Dict:
+    ordered = sorted(samples)
+    return {
+        'runs': len(ordered),
+        'p50': ordered[len(ordered) // 2],
+        'max': ordered[-1],
+        'mb_per_second': size * len(ordered) / sum(ordered) / (1024 * 1024),
+    }
+
+
+def check_redirect(storage: S3Storage, key: str, expected: str) -> Tuple[bool, Optional[str]]:
+    """تنزيل ملف منشور عبر /download/<id> في تطبيق الويب وتتبع إعادة التوجيه"""
+    # المخزن المشترك يُحدد قبل استيراد التطبيق، فيعمل التطبيق كله على S3 الوهمي
+    storage_module._storage = storage
+    import web.app as web_app
+
+    job = Job(lambda job: None, owner='benchmark')
+    job.status = 'completed'
+    job.result = key
+    web_app.download_jobs.set(job.id, job)
+    response = web_app.app.test_client().get(f'/download/{job.id}')
+    location = response.headers.get('Location')
+    if response.status_code != 302 or not location:
+        return False, None
+    status, body, _ = fetch(location)
+    return status == 200 and hashlib.sha256(body).hexdigest() == expected, location
+
+
+def run(args) -> Dict:
+    server = FakeS3Server().start()
+    server.create_bucket(BUCKET)
+    scratch = os.environ['DOWNLOAD_PATH']
+    storage = S3Storage(BUCKET, scratch, server.base_url, 'us-east-1', 'benchmark', 'benchmark',
+                        prefix='downloads/', presign_expiry=args.presign_expiry)
+    size = int(args.size_mb * 1024 * 1024)
+    checks: Dict[str, bool] = {}
+
+    # النشر
+    published = []
+    publish_times = []
+    for i in range(args.files):
+        path, digest = write_file(scratch, f'video_{i}.mp4', size)
+        started = time.perf_counter()
+        key = storage.publish(path)
+        publish_times.append(time.perf_counter() - started)
+        published.append((key, digest, path))
+    checks['publish_removes_local'] = not any(os.path.exists(path) for _, _, path in published)
+    checks['publish_exists'] = all(storage.exists(key) for key, _, _ in published)
+    checks['open_matches'] = all(hashlib.sha256(storage.open(key).read()).hexdigest() == digest
+                                 for key, digest, _ in published)
+
+    # الروابط الموقعة
+    get_times = []
+    presigned_ok = True
+    for key, digest, _ in published:
+        filename = os.path.basename(key)
+        started = time.perf_counter()
+        status, body, headers = fetch(storage.url(key, filename))
+        get_times.append(time.perf_counter() - started)
+        presigned_ok &= (status == 200 and hashlib.sha256(body).hexdigest() == digest
+                         and f'filename="{filename}"' in headers.get('Content-Disposition', ''))
+    checks['presigned_get'] = presigned_ok
+    key, digest, _ = published[0]
+    checks['unsigned_get_denied'] = fetch(f'{server.base_url}/{BUCKET}/{key}')[0] == 403
+
+    checks['web_redirect'], redirect_url = check_redirect(storage, key, digest)
+
+    # انتهاء الصلاحية (توقيت الرابط بدقة ثانية)
+    expiring_url = storage.url(key)
+    time.sleep(args.presign_expiry + 1.5)
+    checks['presigned_expired'] = fetch(expiring_url)[0] == 403
+    checks['redirect_expired'] = redirect_url is not None and fetch(redirect_url)[0] == 403
+
+    # الحذف
+    for key, _, _ in published:
+        storage.delete(key)
+    checks['delete_removes'] = not any(storage.exists(key) for key, _, _ in published)
+    checks['deleted_get_404'] = fetch(storage.url(published[0][0]))[0] == 404
+
+    # التنظيف: كائن قديم يُحذف وكائن حديث يبقى
+    old_key = storage.publish(write_file(scratch, 'old.mp4', 1024)[0])
+    new_key = storage.publish(write_file(scratch, 'new.mp4', 1024)[0])
+    server.set_modified(BUCKET, old_key, time.time() - 2 * args.cleanup_age)
+    removed = storage.cleanup(args.cleanup_age)
+    checks['cleanup_prunes_old'] = removed == 1 and not storage.exists(old_key) and storage.exists(new_key)
+
+    server.stop()
+    return {
+        'config': {k: v for k, v in vars(args).items() if k != 'output'},
+        'publish': summarize(publish_times, size),
+        'presigned_get': summarize(get_times, size),
+        'requests': server.requests,
+        'checks': checks,
+        'passed': all(checks.values()),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='اختبار مخزن S3 مقابل خادم S3 وهمي محلي')
+    parser.add_argument('--files', type=int, default=5, help='عدد الملفات المنشورة')
+    parser.add_argument('--size-mb', type=float, default=10,
+                        help='حجم كل ملف بالميجابايت (فوق 8 يُرفع بأجزاء متعددة)')
+    parser.add_argument('--presign-expiry', type=int, default=2, help='مدة صلاحية الروابط الموقعة (ث)')
+    parser.add_argument('--cleanup-age', type=float, default=600, help='عمر الملفات المحذوفة في التنظيف (ث)')
+    parser.add_argument('--output', help='ملف JSON لحفظ النتائج (افتراضيًا: الطباعة)')
+    args = parser.parse_args()
+
+    import logging
+    logging.disable(logging.WARNING)
+
+    report = run(args)
+    output = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output)
+    else:
+        print(output)
+    sys.exit(0 if report['passed'] else 1)
+
+
+if __name__ == '__main__':
+    main()
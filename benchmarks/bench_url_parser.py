@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""
+قياس أداء محلل روابط يوتيوب مقارنة بالتحقق القديم بخمسة أنماط
+
+الاستخدام:
+    python benchmarks/bench_url_parser.py [--number 20000]
+"""
+import os
+import re
+import sys
+import json
+import timeit
+import argparse
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from common.url_parser import parse_youtube_url
+
+SAMPLE_URLS = [
+    'https://www.youtube.com/watch?v=dQw4w9WgXcQ',
+    'https://youtube.com/watch?v=dQw4w9WgXcQ&list=PL590L5WQmH8fJ54F369BLDSqIwcs-TCfs&index=2',
+    'https://m.youtube.com/watch?feature=share&v=dQw4w9WgXcQ&t=1m30s',
+    'https://music.youtube.com/watch?v=dQw4w9WgXcQ&si=abcdef',
+    'https://www.youtube.com/shorts/dQw4w9WgXcQ?feature=share',
+    'https://www.youtube.com/embed/dQw4w9WgXcQ?start=42',
+    'https://www.youtube-nocookie.com/embed/dQw4w9WgXcQ',
+    'https://youtu.be/dQw4w9WgXcQ?t=90',
+    'https://www.youtube.com/live/dQw4w9WgXcQ',
+    'https://example.com/watch?v=dQw4w9WgXcQ',
+    'not a url at all',
+]
+
+# التحقق القديم كما كان في YouTubeDownloader.is_valid_youtube_url (بدون التسجيل)
+LEGACY_PATTERNS = [
+    r'^https?://(?:www\.)?youtube\.com/watch\?v=[\w-]+',
+    r'^https?://(?:www\.)?youtube\.com/embed/[\w-]+',
+    r'^https?://(?:www\.)?youtube\.com/v/[\w-]+',
+    r'^https?://(?:www\.)?youtube\.com/shorts/[\w-]+',
+    r'^https?://youtu\.be/[\w-]+'
+]
+
+
+def legacy_is_valid(url: str) -> bool:
+    for pattern in LEGACY_PATTERNS:
+        if re.match(pattern, url):
+            return True
+    return False
+
+
+def run_all(fn):
+    for url in SAMPLE_URLS:
+        fn(url)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='قياس أداء محلل روابط يوتيوب')
+    parser.add_argument('--number', type=int, default=20000, help='عدد التكرارات')
+    parser.add_argument('--json', action='store_true', help='إخراج النتائج بصيغة JSON')
+    args = parser.parse_args()
+
+    results = {}
+    for name, fn in (('legacy_is_valid', legacy_is_valid), ('parse_youtube_url', parse_youtube_url)):
+        elapsed = min(timeit.repeat(lambda: run_all(fn), number=args.number, repeat=3))
+        per_call_ns = elapsed / (args.number * len(SAMPLE_URLS)) * 1e9
+        results[name] = {'per_call_ns': round(per_call_ns, 1)}
+
+    if args.json:
+        print(json.dumps(results))
+        return
+
+    for name, result in results.items():
+        print(f"{name:20s} {result['per_call_ns']:10.1f} ns/call")
+    print()
+    for url in SAMPLE_URLS:
+        print(f"{str(parse_youtube_url(url)):70s} <- {url}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+"""
+اختبار الطابور المشترك (SQLiteWorkQueue و RedisWorkQueue) دون اتصال بالإنترنت
+
+يشغل نفس الفحوص على كل خلفية، وRedis مقابل خادم Redis وهمي محلي:
+- المطالبة المتزامنة: عدة عمال (كل منهم باتصاله) يفرغون الطابور، وكل مهمة يطالب بها عامل واحد فقط
+- النبضة: تنجح لمالك المهمة وحده
+- الإنهاء: يُتجاهل من غير المالك
+- الإلغاء: المهمة المنتظرة تُلغى فورًا ولا يطالب بها أحد، والجارية يوقفها عاملها عند النبضة التالية
+- انتهاء الملكية: مهمة العامل المتوقف تعود إلى الطابور فيستأنفها عامل آخر، ويفقد الأول ملكيتها
+
+يخرج البرنامج بالرمز 1 إذا فشل أي فحص (خلفية Redis تتطلب حزمتي redis و "fakeredis[lua]").
+
+الاستخدام:
+    python benchmarks/bench_work_queue.py --jobs 200 --workers 8 --output queue.json
+"""
+import os
+import sys
+import json
+import time
+import uuid
+import argparse
+import tempfile
+import threading
+from typing import Callable, Dict, List
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from common.work_queue import RedisWorkQueue, SQLiteWorkQueue, WorkQueue
+
+# ينشئ اتصالًا جديدًا بنفس الطابور مع مدة الملكية المعطاة
+QueueFactory = Callable[[float], WorkQueue]
+# ينشئ طابورًا فارغًا جديدًا لكل فحص، فلا تؤثر مهام فحص في آخر
+StoreFactory = Callable[[], QueueFactory]
+
+
+def enqueue_jobs(queue: WorkQueue, count: int) -> List[str]:
+    job_ids = [uuid.uuid4().hex for _ in range(count)]
+    for job_id in job_ids:
+        queue.enqueue(job_id, 'video', f'https://www.youtube.com/watch?v={job_id[:11]}', 'best')
+    return job_ids
+
+
+def check_concurrent_claims(make: QueueFactory, jobs: int, workers: int) -> Dict:
+    """عدة عمال يفرغون الطابور معًا: (الفحوص، المطالبات في الثانية)"""
+    job_ids = enqueue_jobs(make(60), jobs)
+    claimed: Dict[str, List[str]] = {name: [] for name in (f'worker-{i}' for i in range(workers))}
+    queues = {name: make(60) for name in claimed}
+    barrier = threading.Barrier(workers)
+
+    def drain(name: str) -> None:
+        barrier.wait()
+        while True:
+            job = queues[name].claim(name)
+            if job is None:
+                return
+            claimed[name].append(job['id'])
+
+    threads = [threading.Thread(target=drain, args=(name,)) for name in claimed]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    all_claimed = [job_id for ids in claimed.values() for job_id in ids]
+    checker = make(60)
+    owners_match = all(checker.get(job_id)['worker'] == name and checker.get(job_id)['state'] == 'running'
+                       for name, ids in claimed.items() for job_id in ids)
+    return {
+        'checks': {
+            'claimed_once': len(all_claimed) == len(set(all_claimed)) == jobs,
+            'claimed_all': set(all_claimed) == set(job_ids),
+            'owners_recorded': owners_match,
+        },
+        'claims_per_second': jobs / elapsed,
+        'per_worker': {name: len(ids) for name, ids in claimed.items()},
+    }
+
+
+def check_lifecycle(make: QueueFactory) -> Dict[str, bool]:
+    """النبضة والإنهاء والإلغاء"""
+    queue = make(60)
+    checks: Dict[str, bool] = {}
+
+    job_id, = enqueue_jobs(queue, 1)
+    queue.enqueue(job_id, 'video', 'https://www.youtube.com/watch?v=dQw4w9WgXcQ', 'best')
+    job = queue.claim('owner')
+    checks['enqueue_idempotent'] = job is not None and job['id'] == job_id and queue.claim('other') is None
+    checks['heartbeat_owner'] = queue.heartbeat(job_id, 'owner', 50, 100, 3)
+    checks['heartbeat_progress'] = queue.get(job_id)['downloaded'] == 50
+    checks['heartbeat_other_denied'] = not queue.heartbeat(job_id, 'other', 60, 100, 2)
+    queue.finish(job_id, 'other', 'failed', error='not mine')
+    checks['finish_other_ignored'] = queue.get(job_id)['state'] == 'running'
+    queue.finish(job_id, 'owner', 'completed', result_path='/tmp/video.mp4')
+    job = queue.get(job_id)
+    checks['finish_owner'] = job['state'] == 'completed' and job['result_path'] == '/tmp/video.mp4'
+    checks['finished_not_reclaimed'] = queue.claim('other') is None
+
+    queued_id, = enqueue_jobs(queue, 1)
+    queue.cancel(queued_id)
+    checks['cancel_queued'] = queue.get(queued_id)['state'] == 'cancelled' and queue.claim('owner') is None
+
+    running_id, = enqueue_jobs(queue, 1)
+    queue.claim('owner')
+    queue.cancel(running_id)
+    checks['cancel_running_stops_heartbeat'] = not queue.heartbeat(running_id, 'owner', 1, 100, 1)
+
+    missing_id = uuid.uuid4().hex
+    queue.cancel(missing_id)
+    checks['cancel_missing_noop'] = queue.get(missing_id) is None
+
+    queue.remove(job_id)
+    checks['remove'] = queue.get(job_id) is None
+    return checks
+
+
+def check_lease_expiry(make: QueueFactory, lease_timeout: float) -> Dict[str, bool]:
+    """مهمة عامل متوقف عن النبضات تنتقل إلى عامل آخر"""
+    queue = make(lease_timeout)
+    job_id, = enqueue_jobs(queue, 1)
+    first = queue.claim('stalled')
+    checks = {'not_reclaimed_before_lease': queue.claim('rescuer') is None}
+    time.sleep(lease_timeout * 1.5)
+    second = queue.claim('rescuer')
+    checks['reclaimed_after_lease'] = (first is not None and second is not None and second['id'] == job_id
+                                       and second['worker'] == 'rescuer')
+    checks['stalled_loses_heartbeat'] = not queue.heartbeat(job_id, 'stalled', 1, 100, 1)
+    queue.finish(job_id, 'stalled', 'failed', error='stale')
+    checks['stalled_finish_ignored'] = queue.get(job_id)['state'] == 'running'
+    checks['rescuer_heartbeat'] = queue.heartbeat(job_id, 'rescuer', 1, 100, 1)
+    return checks
+
+
+def run_backend(new_store: StoreFactory, args) -> Dict:
+    concurrent = check_concurrent_claims(new_store(), args.jobs, args.workers)
+    checks = dict(concurrent.pop('checks'))
+    checks.update(check_lifecycle(new_store()))
+    checks.update(check_lease_expiry(new_store(), args.lease_timeout))
+    return dict(concurrent, checks=checks, passed=all(checks.values()))
+
+
+def run(args) -> Dict:
+    backends: Dict[str, Dict] = {}
+
+    directory = tempfile.mkdtemp(prefix='ytdl-bench-queue-')
+
+    def new_sqlite_store() -> QueueFactory:
+        path = os.path.join(directory, f'{uuid.uuid4().hex}.sqlite3')
+        return lambda lease: SQLiteWorkQueue(path, lease)
+
+    backends['sqlite'] = run_backend(new_sqlite_store, args)
+
+    if not args.skip_redis:
+        from benchmarks.fake_redis import FakeRedisServer
+        with FakeRedisServer() as server:
+            def new_redis_store() -> QueueFactory:
+                prefix = f'bench-{uuid.uuid4().hex[:8]}'
+                return lambda lease: RedisWorkQueue(server.base_url, lease, prefix=prefix)
+
+            backends['redis'] = run_backend(new_redis_store, args)
+
+    return {
+        'config': {k: v for k, v in vars(args).items() if k != 'output'},
+        'backends': backends,
+        'passed': all(backend['passed'] for backend in backends.values()),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='اختبار الطابور المشترك على SQLite وخادم Redis وهمي محلي')
+    parser.add_argument('--jobs', type=int, default=200, help='عدد المهام في اختبار المطالبة المتزامنة')
+    parser.add_argument('--workers', type=int, default=8, help='عدد العمال المتزامنين')
+    parser.add_argument('--lease-timeout', type=float, default=1.0, help='مدة الملكية في اختبار انتهائها (ث)')
+    parser.add_argument('--skip-redis', action='store_true', help='اختبار SQLite فقط')
+    parser.add_argument('--output', help='ملف JSON لحفظ النتائج (افتراضيًا: الطباعة)')
+    args = parser.parse_args()
+
+    import logging
+    logging.disable(logging.WARNING)
+
+    report = run(args)
+    output = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output)
+    else:
+        print(output)
+    sys.exit(0 if report['passed'] else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,200 @@
+"""
+خادم Bot API وهمي محلي لأدوات القياس: يقدم getUpdates من طابور تحديثات اصطناعية
+ويرد على طرق الإرسال والتعديل بردود صالحة مع تسجيل كل استدعاء صادر من البوت
+"""
+import json
+import time
+import threading
+from collections import Counter
+from email.parser import BytesParser
+from email.policy import HTTP
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List, Optional
+from urllib.parse import parse_qs
+
+BOT_USER = {'id': 1, 'is_bot': True, 'first_name': 'Benchmark', 'username': 'benchmark_bot'}
+
+# طرق ترجع رسالة (Message) في Bot API
+_MESSAGE_METHODS = {'sendMessage', 'editMessageText', 'sendVideo', 'sendAudio', 'sendDocument', 'sendPhoto'}
+
+# استدعاء يُمرر إليه اسم الطريقة ومعاملاتها بعد الرد عليها
+CallListener = Callable[[str, Dict], None]
+
+
+def _parse_multipart(content_type: str, body: bytes) -> Dict:
+    """تحليل جسم multipart/form-data: الحقول النصية كما هي والملفات بحجمها فقط"""
+    message = BytesParser(policy=HTTP).parsebytes(
+        f'Content-Type: {content_type}\r\n\r\n'.encode() + body
+    )
+    params = {}
+    for part in message.iter_parts():
+        name = part.get_param('name', header='content-disposition')
+        payload = part.get_payload(decode=True) or b''
+        if part.get_filename():
+            params[name] = {'filename': part.get_filename(), 'size': len(payload)}
+        else:
+            params[name] = payload.decode('utf-8')
+    return params
+
+
+class _BotAPIHandler(BaseHTTPRequestHandler):
+    """معالج طلبات /bot<token>/<method>"""
+    protocol_version = 'HTTP/1.1'
+    # إرسال الترويسات والجسم معًا وتعطيل Nagle لتجنب تأخير ACK المؤجل في الاتصالات الدائمة
+    wbufsize = 64 * 1024
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        self._handle()
+
+    def do_POST(self):
+        self._handle()
+
+    def _handle(self):
+        api: 'FakeBotAPI' = self.server.api
+        method = self.path.split('?', 1)[0].rstrip('/').rsplit('/', 1)[-1]
+        body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        content_type = self.headers.get('Content-Type', '')
+
+        if content_type.startswith('multipart/form-data'):
+            params = _parse_multipart(content_type, body)
+        elif content_type.startswith('application/json'):
+            params = json.loads(body or b'{}')
+        else:
+            params = {k: v[0] for k, v in parse_qs(body.decode('utf-8')).items()}
+
+        result = api.handle(method, params)
+        payload = json.dumps({'ok': True, 'result': result}).encode()
+        try:
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+        except (BrokenPipeError, ConnectionResetError):
+            return
+        api.notify(method, params)
+
+
+class FakeBotAPI:
+    """
+    خادم Bot API وهمي في خيط منفصل
+
+    يُوجه تطبيق البوت إليه عبر ApplicationBuilder().base_url(api.base_url).
+    """
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 0):
+        self._httpd = ThreadingHTTPServer((host, port), _BotAPIHandler)
+        self._httpd.daemon_threads = True
+        self._httpd.api = self
+        self._thread: Optional[threading.Thread] = None
+
+        self._updates: List[Dict] = []
+        self._next_update_id = 1
+        self._next_message_id = 1
+        self._cond = threading.Condition()
+        self._listeners: List[CallListener] = []
+
+        # وقت دفع كل تحديث (لقياس زمن انتظاره قبل المعالجة)
+        self.pushed_at: Dict[int, float] = {}
+        self.calls: Counter = Counter()
+        self.uploaded_bytes = 0
+        self._stats_lock = threading.Lock()
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}/bot"
+
+    def add_listener(self, listener: CallListener) -> None:
+        self._listeners.append(listener)
+
+    def remove_listener(self, listener: CallListener) -> None:
+        self._listeners.remove(listener)
+
+    def push_update(self, update: Dict) -> int:
+        """
+        إضافة تحديث إلى الطابور الذي يقدمه getUpdates
+
+        Args:
+            update: التحديث بدون update_id
+
+        Returns:
+            معرف التحديث المعين
+        """
+        with self._cond:
+            update_id = self._next_update_id
+            self._next_update_id += 1
+            self._updates.append(dict(update, update_id=update_id))
+            self.pushed_at[update_id] = time.perf_counter()
+            self._cond.notify_all()
+        return update_id
+
+    def new_message_id(self) -> int:
+        with self._cond:
+            message_id = self._next_message_id
+            self._next_message_id += 1
+        return message_id
+
+    def handle(self, method: str, params: Dict):
+        """إنشاء رد الطريقة المطلوبة"""
+        with self._stats_lock:
+            self.calls[method] += 1
+            for value in params.values():
+                if isinstance(value, dict) and 'size' in value:
+                    self.uploaded_bytes += value['size']
+
+        if method == 'getUpdates':
+            return self._get_updates(int(params.get('offset') or 0), float(params.get('timeout') or 0))
+        if method == 'getMe':
+            return BOT_USER
+        if method in _MESSAGE_METHODS:
+            chat_id = int(params.get('chat_id') or 0)
+            message_id = int(params.get('message_id') or 0) or self.new_message_id()
+            return {
+                'message_id': message_id,
+                'date': int(time.time()),
+                'chat': {'id': chat_id, 'type': 'private'},
+                'from': BOT_USER,
+                'text': params.get('text') or '',
+            }
+        return True
+
+    def notify(self, method: str, params: Dict) -> None:
+        if method == 'getUpdates':
+            return
+        for listener in self._listeners:
+            listener(method, params)
+
+    def _get_updates(self, offset: int, timeout: float) -> List[Dict]:
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            # التحديثات الأقدم من offset تم تأكيد استلامها
+            if offset:
+                self._updates = [u for u in self._updates if u['update_id'] >= offset]
+            while not self._updates:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return []
+                self._cond.wait(remaining)
+            return list(self._updates[:100])
+
+    def start(self) -> 'FakeBotAPI':
+        self._thread = threading.Thread(target=self._httpd.serve_forever, name='fake-bot-api', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        with self._cond:
+            self._cond.notify_all()
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def __enter__(self) -> 'FakeBotAPI':
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
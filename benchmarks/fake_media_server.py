@@ -0,0 +1,183 @@
+"""
+خادم وسائط محلي لأدوات القياس: يقدم ملفات تدريجية (مع دعم Range) وقوائم HLS مجزأة
+"""
+import os
+import re
+import shutil
+import logging
+import subprocess
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+_RANGE_RE = re.compile(r'bytes=(\d*)-(\d*)')
+
+_CONTENT_TYPES = {
+    '.mp4': 'video/mp4',
+    '.m4a': 'audio/mp4',
+    '.ts': 'video/mp2t',
+    '.m3u8': 'application/vnd.apple.mpegurl',
+}
+
+
+class _MediaHandler(BaseHTTPRequestHandler):
+    """معالج ملفات ثابتة يدعم طلبات Range الجزئية"""
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_HEAD(self):
+        self._serve(head=True)
+
+    def do_GET(self):
+        self._serve(head=False)
+
+    def _serve(self, head: bool):
+        root = self.server.media_root
+        path = os.path.normpath(os.path.join(root, self.path.split('?', 1)[0].lstrip('/')))
+        if not path.startswith(root) or not os.path.isfile(path):
+            self.send_error(404)
+            return
+
+        size = os.path.getsize(path)
+        start, end = 0, size - 1
+        status = 200
+
+        match = _RANGE_RE.match(self.headers.get('Range', ''))
+        if match and (match.group(1) or match.group(2)):
+            if match.group(1):
+                start = int(match.group(1))
+                end = int(match.group(2)) if match.group(2) else size - 1
+            else:
+                start = max(0, size - int(match.group(2)))
+            end = min(end, size - 1)
+            if start > end:
+                self.send_response(416)
+                self.send_header('Content-Range', f'bytes */{size}')
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+            status = 206
+
+        self.send_response(status)
+        self.send_header('Content-Type', _CONTENT_TYPES.get(os.path.splitext(path)[1], 'application/octet-stream'))
+        self.send_header('Accept-Ranges', 'bytes')
+        self.send_header('Content-Length', str(end - start + 1))
+        if status == 206:
+            self.send_header('Content-Range', f'bytes {start}-{end}/{size}')
+        self.end_headers()
+        if head:
+            return
+
+        with open(path, 'rb') as f:
+            f.seek(start)
+            remaining = end - start + 1
+            while remaining > 0:
+                chunk = f.read(min(256 * 1024, remaining))
+                if not chunk:
+                    break
+                try:
+                    self.wfile.write(chunk)
+                except (BrokenPipeError, ConnectionResetError):
+                    return
+                remaining -= len(chunk)
+
+
+class FakeMediaServer:
+    """
+    خادم HTTP محلي في خيط منفصل يقدم محتويات مجلد وسائط
+    """
+
+    def __init__(self, media_root: str, host: str = '127.0.0.1', port: int = 0):
+        self.media_root = os.path.abspath(media_root)
+        self._httpd = ThreadingHTTPServer((host, port), _MediaHandler)
+        self._httpd.daemon_threads = True
+        self._httpd.media_root = self.media_root
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> 'FakeMediaServer':
+        self._thread = threading.Thread(target=self._httpd.serve_forever, name='fake-media-server', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def __enter__(self) -> 'FakeMediaServer':
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+
+def prepare_media(media_root: str, size_mb: float = 20, duration: int = 60,
+                  segment_seconds: int = 4, use_ffmpeg: Optional[bool] = None) -> Dict[str, str]:
+    """
+    إنشاء ملفات الوسائط المقدمة: ملف تدريجي، ملف صوت، وقائمة HLS مجزأة
+
+    عند توفر FFmpeg تُنشأ وسائط حقيقية (لقياس المعالجة اللاحقة)، وإلا بيانات عشوائية
+    بالحجم المطلوب (كافية لقياس التحميل فقط).
+
+    Args:
+        media_root: مجلد الإخراج
+        size_mb: الحجم التقريبي للملف التدريجي بالميجابايت
+        duration: مدة الوسائط بالثواني
+        segment_seconds: مدة كل جزء في قائمة HLS
+        use_ffmpeg: استخدام FFmpeg (None = حسب توفره)
+
+    Returns:
+        قاموس بالمسارات النسبية: progressive و audio و hls و real_media
+    """
+    os.makedirs(os.path.join(media_root, 'hls'), exist_ok=True)
+    if use_ffmpeg is None:
+        use_ffmpeg = shutil.which('ffmpeg') is not None
+
+    if use_ffmpeg:
+        video_kbps = max(100, int(size_mb * 8 * 1024 / duration))
+        run = lambda cmd: subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
+        run(['ffmpeg', '-y', '-f', 'lavfi', '-i', f'testsrc=size=1280x720:rate=30:duration={duration}',
+             '-f', 'lavfi', '-i', f'sine=frequency=440:duration={duration}',
+             '-c:v', 'libx264', '-preset', 'ultrafast', '-b:v', f'{video_kbps}k', '-g', '60',
+             '-c:a', 'aac', '-b:a', '128k', '-shortest', os.path.join(media_root, 'progressive.mp4')])
+        run(['ffmpeg', '-y', '-i', os.path.join(media_root, 'progressive.mp4'), '-vn', '-c:a', 'copy',
+             os.path.join(media_root, 'audio.m4a')])
+        run(['ffmpeg', '-y', '-i', os.path.join(media_root, 'progressive.mp4'), '-c', 'copy',
+             '-f', 'hls', '-hls_time', str(segment_seconds), '-hls_list_size', '0',
+             '-hls_segment_filename', os.path.join(media_root, 'hls', 'seg%05d.ts'),
+             os.path.join(media_root, 'hls', 'index.m3u8')])
+    else:
+        size = int(size_mb * 1024 * 1024)
+        block = os.urandom(1024 * 1024)
+        with open(os.path.join(media_root, 'progressive.mp4'), 'wb') as f:
+            for offset in range(0, size, len(block)):
+                f.write(block[:min(len(block), size - offset)])
+        with open(os.path.join(media_root, 'audio.m4a'), 'wb') as f:
+            f.write(os.urandom(max(1, int(duration * 128 * 1000 / 8))))
+
+        segments = max(1, duration // segment_seconds)
+        segment_size = size // segments
+        playlist = ['#EXTM3U', '#EXT-X-VERSION:3', f'#EXT-X-TARGETDURATION:{segment_seconds}',
+                    '#EXT-X-MEDIA-SEQUENCE:0']
+        for i in range(segments):
+            with open(os.path.join(media_root, 'hls', f'seg{i:05d}.ts'), 'wb') as f:
+                f.write(block[:min(segment_size, len(block))] * max(1, segment_size // len(block)))
+            playlist += [f'#EXTINF:{segment_seconds:.1f},', f'seg{i:05d}.ts']
+        playlist.append('#EXT-X-ENDLIST')
+        with open(os.path.join(media_root, 'hls', 'index.m3u8'), 'w') as f:
+            f.write('\n'.join(playlist) + '\n')
+
+    return {
+        'progressive': 'progressive.mp4',
+        'audio': 'audio.m4a',
+        'hls': 'hls/index.m3u8',
+        'real_media': use_ffmpeg,
+    }
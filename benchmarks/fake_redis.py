@@ -0,0 +1,48 @@
+"""
+خادم Redis وهمي محلي لأدوات القياس (بديل خادم Redis حقيقي): يحفظ البيانات في الذاكرة ويتحدث بروتوكول Redis عبر TCP
+
+مبني على fakeredis مع lupa لتنفيذ سكربتات Lua (pip install "fakeredis[lua]")، فيعمل RedisWorkQueue
+مقابله دون تعديل عبر base_url. الأخطاء التي يعيدها الخادم تغلق الاتصال، لذا لا يُستخدم EVALSHA
+الذي يعتمد على خطأ NOSCRIPT للرجوع إلى SCRIPT LOAD.
+"""
+import threading
+from typing import Optional
+
+try:
+    from fakeredis import TcpFakeServer
+except ImportError:
+    TcpFakeServer = None
+
+
+class FakeRedisServer:
+    """
+    خادم Redis محلي في خيط منفصل، يُمرر base_url إلى RedisWorkQueue كعنوان الخادم
+    """
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 0):
+        if TcpFakeServer is None:
+            raise RuntimeError('حزمة fakeredis غير مثبتة. قم بتثبيتها باستخدام: pip install "fakeredis[lua]"')
+        self._server = TcpFakeServer((host, port), server_type='redis')
+        # خيوط الاتصالات لا تمنع إنهاء العملية
+        self._server.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"redis://{host}:{port}/0"
+
+    def start(self) -> 'FakeRedisServer':
+        self._thread = threading.Thread(target=self._server.serve_forever, name='fake-redis-server', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self) -> 'FakeRedisServer':
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
@@ -0,0 +1,310 @@
+"""
+خادم S3 وهمي محلي لأدوات القياس (بديل MinIO): يحفظ الكائنات في الذاكرة ويدعم ما يستخدمه S3Storage
+
+العمليات المدعومة بعنونة المسار (http://127.0.0.1:<port>/<bucket>/<key>): إنشاء الحاوية، رفع الكائن
+مباشرة أو متعدد الأجزاء، HEAD و GET و DELETE، و ListObjectsV2 مع الصفحات. الروابط الموقعة (SigV4 و SigV2)
+تُقبل حتى انتهاء صلاحيتها وتُرفض بعده بـ 403 كما في S3، ويُرفض الطلب الذي لا يحمل توقيعًا أصلًا.
+لا يُتحقق من صحة التوقيع نفسه، فأي مفاتيح وصول تكفي.
+"""
+import time
+import uuid
+import calendar
+import hashlib
+import threading
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, unquote, urlsplit
+from xml.sax.saxutils import escape
+
+_XML_HEADER = '<?xml version="1.0" encoding="UTF-8"?>'
+_XMLNS = 'http://s3.amazonaws.com/doc/2006-03-01/'
+
+# بيانات الكائن: (المحتوى، وقت آخر تعديل، ETag)
+S3Object = Tuple[bytes, float, str]
+
+
+def _etag(data: bytes) -> str:
+    return f'"{hashlib.md5(data).hexdigest()}"'
+
+
+def _iso_time(timestamp: float) -> str:
+    return time.strftime('%Y-%m-%dT%H:%M:%S.000Z', time.gmtime(timestamp))
+
+
+def _decode_aws_chunked(body: bytes) -> bytes:
+    """فك ترميز aws-chunked الذي يرسله botocore مع المجاميع الاختبارية اللاحقة"""
+    data = bytearray()
+    position = 0
+    while True:
+        line_end = body.index(b'\r\n', position)
+        size = int(body[position:line_end].split(b';', 1)[0], 16)
+        position = line_end + 2
+        if size == 0:
+            return bytes(data)
+        data += body[position:position + size]
+        position += size + 2
+
+
+class _S3Handler(BaseHTTPRequestHandler):
+    """معالج طلبات S3 بعنونة المسار"""
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_PUT(self):
+        self._handle('PUT')
+
+    def do_POST(self):
+        self._handle('POST')
+
+    def do_GET(self):
+        self._handle('GET')
+
+    def do_HEAD(self):
+        self._handle('HEAD')
+
+    def do_DELETE(self):
+        self._handle('DELETE')
+
+    def _read_body(self) -> bytes:
+        if self.headers.get('Transfer-Encoding', '').lower() == 'chunked':
+            body = bytearray()
+            while True:
+                size = int(self.rfile.readline().split(b';', 1)[0], 16)
+                if size == 0:
+                    # الترويسات اللاحقة حتى السطر الفارغ
+                    while self.rfile.readline() not in (b'\r\n', b'\n', b''):
+                        pass
+                    break
+                body += self.rfile.read(size)
+                self.rfile.readline()
+            body = bytes(body)
+        else:
+            body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        if 'aws-chunked' in self.headers.get('Content-Encoding', ''):
+            body = _decode_aws_chunked(body)
+        return body
+
+    def _send(self, status: int, body: bytes = b'', headers: Optional[Dict[str, str]] = None,
+              head: bool = False) -> None:
+        try:
+            self.send_response(status)
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            if body and not head:
+                self.wfile.write(body)
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+    def _send_xml(self, status: int, xml: str) -> None:
+        self._send(status, (_XML_HEADER + xml).encode(), {'Content-Type': 'application/xml'})
+
+    def _send_error(self, status: int, code: str, message: str, head: bool = False) -> None:
+        xml = f'<Error><Code>{code}</Code><Message>{escape(message)}</Message></Error>'
+        self._send(status, (_XML_HEADER + xml).encode(), {'Content-Type': 'application/xml'}, head=head)
+
+    def _authorized(self, query: Dict[str, str]) -> Optional[str]:
+        """سبب رفض الطلب (رابط موقع منتهي أو طلب دون توقيع)، أو None إذا قُبل"""
+        if 'X-Amz-Signature' in query:
+            # رابط SigV4: وقت التوقيع ومدة الصلاحية
+            signed_at = calendar.timegm(time.strptime(query.get('X-Amz-Date', ''), '%Y%m%dT%H%M%SZ'))
+            expires = signed_at + int(query.get('X-Amz-Expires', 0))
+        elif 'Signature' in query:
+            # رابط SigV2 (افتراضي botocore لبعض المناطق): وقت الانتهاء مباشرة
+            expires = int(query.get('Expires', 0))
+        elif self.headers.get('Authorization', '').startswith(('AWS4-HMAC-SHA256', 'AWS ')):
+            return None
+        else:
+            return 'Request is not signed'
+        if time.time() > expires:
+            return 'Request has expired'
+        return None
+
+    def _handle(self, method: str):
+        server: 'FakeS3Server' = self.server.s3
+        parts = urlsplit(self.path)
+        query = {name: values[0] for name, values in parse_qs(parts.query, keep_blank_values=True).items()}
+        bucket, _, key = unquote(parts.path).lstrip('/').partition('/')
+        head = method == 'HEAD'
+
+        # يُقرأ الجسم دائمًا حتى يبقى الاتصال الدائم صالحًا للطلب التالي
+        body = self._read_body() if method in ('PUT', 'POST') else b''
+        denied = self._authorized(query)
+        if denied:
+            server.count('denied')
+            self._send_error(403, 'AccessDenied', denied, head=head)
+            return
+
+        if not key:
+            if method == 'PUT':
+                server.create_bucket(bucket)
+                self._send(200)
+            elif method == 'GET' and bucket in server.buckets:
+                self._list(bucket, query)
+            elif bucket in server.buckets:
+                self._send(200 if head else 405)
+            else:
+                self._send_error(404, 'NoSuchBucket', bucket, head=head)
+            return
+        if bucket not in server.buckets:
+            self._send_error(404, 'NoSuchBucket', bucket, head=head)
+            return
+
+        server.count(method)
+        if method == 'PUT' and 'uploadId' in query:
+            etag = server.put_part(query['uploadId'], int(query['partNumber']), body)
+            self._send(200, headers={'ETag': etag})
+        elif method == 'PUT':
+            self._send(200, headers={'ETag': server.put(bucket, key, body)})
+        elif method == 'POST' and 'uploads' in query:
+            upload_id = server.create_upload()
+            self._send_xml(200, f'<InitiateMultipartUploadResult xmlns="{_XMLNS}"><Bucket>{escape(bucket)}</Bucket>'
+                                f'<Key>{escape(key)}</Key><UploadId>{upload_id}</UploadId>'
+                                f'</InitiateMultipartUploadResult>')
+        elif method == 'POST' and 'uploadId' in query:
+            etag = server.complete_upload(query['uploadId'], bucket, key)
+            self._send_xml(200, f'<CompleteMultipartUploadResult xmlns="{_XMLNS}"><Bucket>{escape(bucket)}</Bucket>'
+                                f'<Key>{escape(key)}</Key><ETag>{escape(etag)}</ETag>'
+                                f'</CompleteMultipartUploadResult>')
+        elif method == 'DELETE' and 'uploadId' in query:
+            server.abort_upload(query['uploadId'])
+            self._send(204)
+        elif method == 'DELETE':
+            server.delete(bucket, key)
+            self._send(204)
+        elif method in ('GET', 'HEAD'):
+            obj = server.get(bucket, key)
+            if obj is None:
+                self._send_error(404, 'NoSuchKey', key, head=head)
+                return
+            data, modified, etag = obj
+            headers = {
+                'Content-Type': query.get('response-content-type', 'application/octet-stream'),
+                'ETag': etag,
+                'Last-Modified': formatdate(modified, usegmt=True),
+            }
+            if 'response-content-disposition' in query:
+                headers['Content-Disposition'] = query['response-content-disposition']
+            self._send(200, data, headers, head=head)
+        else:
+            self._send(405)
+
+    def _list(self, bucket: str, query: Dict[str, str]) -> None:
+        server: 'FakeS3Server' = self.server.s3
+        prefix = query.get('prefix', '')
+        max_keys = int(query.get('max-keys', 1000))
+        after = query.get('continuation-token') or query.get('start-after') or ''
+        keys = [key for key in server.keys(bucket) if key.startswith(prefix) and key > after]
+        page, truncated = keys[:max_keys], len(keys) > max_keys
+
+        contents = []
+        for key in page:
+            obj = server.get(bucket, key)
+            if obj is None:
+                continue
+            data, modified, etag = obj
+            contents.append(f'<Contents><Key>{escape(key)}</Key><LastModified>{_iso_time(modified)}</LastModified>'
+                            f'<ETag>{escape(etag)}</ETag><Size>{len(data)}</Size>'
+                            f'<StorageClass>STANDARD</StorageClass></Contents>')
+        token = f'<NextContinuationToken>{escape(page[-1])}</NextContinuationToken>' if truncated else ''
+        self._send_xml(200, f'<ListBucketResult xmlns="{_XMLNS}"><Name>{escape(bucket)}</Name>'
+                            f'<Prefix>{escape(prefix)}</Prefix><KeyCount>{len(contents)}</KeyCount>'
+                            f'<MaxKeys>{max_keys}</MaxKeys><IsTruncated>{str(truncated).lower()}</IsTruncated>'
+                            f'{token}{"".join(contents)}</ListBucketResult>')
+
+
+class FakeS3Server:
+    """
+    خادم S3 محلي في خيط منفصل، يُمرر base_url إلى S3Storage كـ endpoint_url
+    """
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 0):
+        self.buckets: Dict[str, Dict[str, S3Object]] = {}
+        self.requests: Dict[str, int] = {}
+        self._uploads: Dict[str, Dict[int, bytes]] = {}
+        self._lock = threading.Lock()
+        self._httpd = ThreadingHTTPServer((host, port), _S3Handler)
+        self._httpd.daemon_threads = True
+        self._httpd.s3 = self
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> 'FakeS3Server':
+        self._thread = threading.Thread(target=self._httpd.serve_forever, name='fake-s3-server', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def __enter__(self) -> 'FakeS3Server':
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+    def count(self, name: str) -> None:
+        """عد الطلبات حسب الطريقة (والمرفوضة)"""
+        with self._lock:
+            self.requests[name] = self.requests.get(name, 0) + 1
+
+    def create_bucket(self, bucket: str) -> None:
+        with self._lock:
+            self.buckets.setdefault(bucket, {})
+
+    def keys(self, bucket: str) -> List[str]:
+        with self._lock:
+            return sorted(self.buckets.get(bucket, {}))
+
+    def get(self, bucket: str, key: str) -> Optional[S3Object]:
+        with self._lock:
+            return self.buckets.get(bucket, {}).get(key)
+
+    def put(self, bucket: str, key: str, data: bytes) -> str:
+        etag = _etag(data)
+        with self._lock:
+            self.buckets[bucket][key] = (data, time.time(), etag)
+        return etag
+
+    def delete(self, bucket: str, key: str) -> None:
+        with self._lock:
+            self.buckets.get(bucket, {}).pop(key, None)
+
+    def set_modified(self, bucket: str, key: str, timestamp: float) -> None:
+        """تغيير وقت آخر تعديل لكائن (لمحاكاة الملفات القديمة في اختبار التنظيف)"""
+        with self._lock:
+            data, _, etag = self.buckets[bucket][key]
+            self.buckets[bucket][key] = (data, timestamp, etag)
+
+    def create_upload(self) -> str:
+        upload_id = uuid.uuid4().hex
+        with self._lock:
+            self._uploads[upload_id] = {}
+        return upload_id
+
+    def put_part(self, upload_id: str, number: int, data: bytes) -> str:
+        with self._lock:
+            self._uploads[upload_id][number] = data
+        return _etag(data)
+
+    def complete_upload(self, upload_id: str, bucket: str, key: str) -> str:
+        with self._lock:
+            parts = self._uploads.pop(upload_id)
+        data = b''.join(parts[number] for number in sorted(parts))
+        self.put(bucket, key, data)
+        # ETag الرفع متعدد الأجزاء في S3: md5 لمجاميع الأجزاء مع عددها
+        digest = hashlib.md5(b''.join(hashlib.md5(parts[number]).digest() for number in sorted(parts))).hexdigest()
+        return f'"{digest}-{len(parts)}"'
+
+    def abort_upload(self, upload_id: str) -> None:
+        with self._lock:
+            self._uploads.pop(upload_id, None)
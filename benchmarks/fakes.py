@@ -0,0 +1,189 @@
+"""
+بدائل محلية لأدوات القياس: مستخرج yt-dlp وهمي يشير إلى خادم الوسائط المحلي،
+ومحمل حتمي بالكامل لاختبارات تحميل الواجهات
+"""
+import os
+import sys
+import time
+import uuid
+from typing import Dict, Optional
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from common.backends import YTDLP, BackendRouter
+from common.downloader import YouTubeDownloader
+from common.url_parser import parse_youtube_url
+
+try:
+    import yt_dlp
+    from yt_dlp.extractor.common import InfoExtractor
+except ImportError:
+    yt_dlp = None
+    InfoExtractor = object
+
+
+class FakeYoutubeIE(InfoExtractor):
+    """
+    مستخرج وهمي يطابق روابط يوتيوب ويعيد معلومات JSON ثابتة تشير إلى خادم الوسائط المحلي
+    """
+    IE_NAME = 'fakeyoutube'
+    _VALID_URL = r'https?://(?:www\.)?youtube\.com/watch\?v=(?P<id>[\w-]{11})'
+
+    def __init__(self, base_url: str, media: Dict[str, str], duration: int,
+                 extra_formats: int = 20, downloader=None):
+        """
+        Args:
+            base_url: عنوان خادم الوسائط المحلي
+            media: المسارات النسبية كما تعيدها prepare_media
+            duration: مدة الوسائط بالثواني
+            extra_formats: عدد التنسيقات الإضافية (لمحاكاة حجم قائمة التنسيقات الحقيقية)
+        """
+        super().__init__(downloader)
+        self.base_url = base_url
+        self.media = media
+        self.duration = duration
+        self.extra_formats = extra_formats
+
+    def _real_extract(self, url):
+        video_id = self._match_id(url)
+        base = self.base_url
+        formats = [{
+            'format_id': 'progressive',
+            'url': f"{base}/{self.media['progressive']}",
+            'ext': 'mp4', 'protocol': 'https' if base.startswith('https') else 'http',
+            'vcodec': 'avc1.64001f', 'acodec': 'mp4a.40.2',
+            'width': 1280, 'height': 720, 'tbr': 2000,
+        }, {
+            'format_id': 'hls',
+            'url': f"{base}/{self.media['hls']}",
+            'ext': 'mp4', 'protocol': 'm3u8_native',
+            'vcodec': 'avc1.64001f', 'acodec': 'mp4a.40.2',
+            'width': 1280, 'height': 720, 'tbr': 1900,
+        }, {
+            'format_id': 'audio',
+            'url': f"{base}/{self.media['audio']}",
+            'ext': 'm4a', 'vcodec': 'none', 'acodec': 'mp4a.40.2', 'abr': 128,
+        }]
+        # تنسيقات إضافية بنفس الملف لمحاكاة كلفة فرز وتنسيق قائمة كبيرة
+        for i in range(self.extra_formats):
+            height = (144, 240, 360, 480, 720, 1080)[i % 6]
+            formats.append({
+                'format_id': f'extra-{i}',
+                'url': f"{base}/{self.media['progressive']}",
+                'ext': 'mp4', 'vcodec': 'avc1', 'acodec': 'mp4a' if i % 2 else 'none',
+                'width': height * 16 // 9, 'height': height, 'tbr': height * 2,
+                'filesize': height * 10000,
+            })
+
+        return {
+            'id': video_id,
+            'title': f'Benchmark video {video_id}',
+            'uploader': 'benchmark',
+            'duration': self.duration,
+            'thumbnail': f"{base}/thumb.jpg",
+            'formats': formats,
+        }
+
+
+class OfflineDownloader(YouTubeDownloader):
+    """
+    YouTubeDownloader يستخدم المستخرج الوهمي بدلًا من مستخرجات yt-dlp الحقيقية
+    """
+
+    def __init__(self, download_path: str, fake_ie: FakeYoutubeIE, real_media: bool = True):
+        # قبل تهيئة المحمل لأن _extractor_factory يحتاجهما
+        self.fake_ie = fake_ie
+        self.real_media = real_media
+        # المستخرج الوهمي مسجل في yt-dlp فقط، فلا توجيه إلى pytube (الذي يحتاج الشبكة)
+        super().__init__(download_path, router=BackendRouter([YTDLP]))
+
+    def _extractor_factory(self):
+        # المستخرج المسجل في YoutubeDL لا يُنقل عبر pickle، فيُنشأ مستخرج جديد بنفس الإعدادات
+        ie = self.fake_ie
+        return _offline_extractor, (self.download_path, ie.base_url, ie.media, ie.duration,
+                                    ie.extra_formats, self.real_media)
+
+    def _create_ydl(self, ydl_opts: Dict) -> 'yt_dlp.YoutubeDL':
+        opts = dict(ydl_opts, quiet=True, noprogress=True)
+        if not self.real_media:
+            # البيانات العشوائية ليست وسائط صالحة فلا معنى لإصلاحها بـ FFmpeg
+            opts['fixup'] = 'never'
+        ydl = yt_dlp.YoutubeDL(opts, auto_init=False)
+        ydl.add_info_extractor(self.fake_ie)
+        return ydl
+
+
+def _offline_extractor(download_path: str, base_url: str, media: Dict[str, str], duration: int,
+                       extra_formats: int, real_media: bool) -> OfflineDownloader:
+    """إنشاء OfflineDownloader في عمليات مجمع الاستخراج"""
+    return OfflineDownloader(download_path, FakeYoutubeIE(base_url, media, duration, extra_formats), real_media)
+
+
+class FakeDownloader:
+    """
+    بديل حتمي لـ YouTubeDownloader بزمن استجابة وحجم قابلين للضبط (لاختبارات التحميل)
+    """
+
+    def __init__(self, download_path: str, extract_latency: float = 0.2,
+                 download_latency: float = 1.0, size_bytes: int = 1024 * 1024,
+                 preview_latency: float = 0.02):
+        """
+        Args:
+            download_path: مجلد كتابة الملفات الناتجة
+            extract_latency: زمن استخراج المعلومات الكاملة بالثواني
+            preview_latency: زمن استخراج المعاينة السريعة بالثواني
+            download_latency: زمن التحميل بالثواني
+            size_bytes: حجم الملف الناتج بالبايت
+        """
+        self.download_path = download_path
+        self.extract_latency = extract_latency
+        self.preview_latency = preview_latency
+        self.download_latency = download_latency
+        self.size_bytes = size_bytes
+        self.has_ffmpeg = False
+        self._payload = b'\0' * min(size_bytes, 1024 * 1024)
+        os.makedirs(download_path, exist_ok=True)
+
+    def is_valid_youtube_url(self, url: str) -> bool:
+        return parse_youtube_url(url) is not None
+
+    def get_video_preview(self, url: str) -> Dict:
+        time.sleep(self.preview_latency)
+        return {'title': 'Load test video', 'thumbnail': '', 'duration': 120, 'channel': 'load-test'}
+
+    def get_video_info(self, url: str) -> Dict:
+        time.sleep(self.extract_latency)
+        return {
+            'title': 'Load test video',
+            'thumbnail': '',
+            'duration': 120,
+            'channel': 'load-test',
+            'formats': [
+                {'id': '18', 'type': 'video', 'quality': '360p', 'extension': 'mp4', 'size': self.size_bytes},
+                {'id': '140', 'type': 'audio', 'quality': '128kbps', 'extension': 'm4a', 'size': self.size_bytes // 4},
+            ],
+        }
+
+    def _download(self, prefix: str, progress_callback=None, cancel_token=None, **kwargs) -> Optional[str]:
+        steps = 10
+        for step in range(1, steps + 1):
+            time.sleep(self.download_latency / steps)
+            if cancel_token is not None:
+                cancel_token.check()
+            if progress_callback is not None:
+                progress_callback(self.size_bytes * step // steps, self.size_bytes, 0)
+
+        file_path = os.path.join(self.download_path, f'{prefix}_{uuid.uuid4().hex}.bin')
+        with open(file_path, 'wb') as f:
+            for offset in range(0, self.size_bytes, len(self._payload)):
+                f.write(self._payload[:self.size_bytes - offset])
+        return file_path
+
+    def download_video(self, url: str, format_id: str, progress_callback=None, **kwargs) -> Optional[str]:
+        return self._download('video', progress_callback, **kwargs)
+
+    def download_audio(self, url: str, format_id: str, progress_callback=None, **kwargs) -> Optional[str]:
+        return self._download('audio', progress_callback, **kwargs)
+
+    def cleanup_old_files(self, expiry_hours=24):
+        pass
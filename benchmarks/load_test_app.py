@@ -0,0 +1,40 @@
+"""
+تطبيق Flask مع محمل وهمي حتمي لاختبارات التحميل
+
+يمكن تشغيله داخل gunicorn لقياس سعة نسخة واحدة:
+    FAKE_EXTRACT_LATENCY=0.2 FAKE_DOWNLOAD_LATENCY=1 FAKE_SIZE_BYTES=1048576 \\
+        gunicorn benchmarks.load_test_app:app --workers 1 --threads 8
+"""
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+# اختبار التحميل يرسل كل الطلبات من عنوان واحد، فيُعطل تحديد المعدل افتراضيًا
+os.environ.setdefault('RATE_LIMIT_REFILL_RATE', '0')
+os.environ.setdefault('DOWNLOAD_PATH', os.path.join(tempfile.gettempdir(), 'ytdl-load-test'))
+
+from benchmarks.fakes import FakeDownloader
+import web.app as web_app
+
+
+def install_fake_downloader(extract_latency: float, download_latency: float, size_bytes: int) -> FakeDownloader:
+    """استبدال محمل تطبيق الويب بمحمل وهمي"""
+    fake = FakeDownloader(
+        os.environ['DOWNLOAD_PATH'],
+        extract_latency=extract_latency,
+        download_latency=download_latency,
+        size_bytes=size_bytes
+    )
+    web_app.downloader = fake
+    return fake
+
+
+install_fake_downloader(
+    float(os.getenv('FAKE_EXTRACT_LATENCY', 0.2)),
+    float(os.getenv('FAKE_DOWNLOAD_LATENCY', 1.0)),
+    int(os.getenv('FAKE_SIZE_BYTES', 1024 * 1024)),
+)
+
+app = web_app.app
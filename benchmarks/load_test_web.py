@@ -0,0 +1,232 @@
+#!/usr/bin/env python3
+"""
+اختبار تحميل متزامن لواجهة الويب دون اتصال بالإنترنت
+
+يشغل تطبيق Flask مع محمل وهمي (أو يستهدف خادمًا قائمًا عبر --url) ويمرر N عميلًا
+متزامنًا عبر مسار: استخراج ← تحميل ← متابعة الحالة ← تنزيل الملف، ثم يعرض
+زمن الاستجابة p50/p95/p99 لكل نقطة نهاية والإنتاجية ونسب الأخطاء.
+
+الاستخدام:
+    python benchmarks/load_test_web.py --clients 20 --flows 5
+    python benchmarks/load_test_web.py --url http://127.0.0.1:8000 --clients 50
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import threading
+import http.client
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+TEST_URL = 'https://www.youtube.com/watch?v=LoadTest001'
+
+
+class Stats:
+    """تجميع أزمنة الاستجابة والأخطاء لكل نقطة نهاية (آمن للخيوط)"""
+
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.errors: Dict[str, Dict[str, int]] = defaultdict(lambda: defaultdict(int))
+        self.flows_completed = 0
+        self.flows_failed = 0
+        self._lock = threading.Lock()
+
+    def record(self, endpoint: str, latency: float, status: Optional[int]) -> None:
+        with self._lock:
+            self.latencies[endpoint].append(latency)
+            if status is None or status >= 400:
+                self.errors[endpoint][str(status or 'exception')] += 1
+
+    def flow_done(self, ok: bool) -> None:
+        with self._lock:
+            if ok:
+                self.flows_completed += 1
+            else:
+                self.flows_failed += 1
+
+
+def percentile(ordered: List[float], p: float) -> float:
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(len(ordered) * p))]
+
+
+class Client:
+    """عميل HTTP باتصال دائم واحد"""
+
+    def __init__(self, base_url: str, stats: Stats, timeout: float):
+        parts = urlsplit(base_url)
+        self.host = parts.hostname
+        self.port = parts.port or 80
+        self.stats = stats
+        self.timeout = timeout
+        self.conn: Optional[http.client.HTTPConnection] = None
+
+    def request(self, endpoint: str, method: str, path: str, body: Optional[Dict] = None) -> Tuple[Optional[int], Optional[Dict]]:
+        start = time.perf_counter()
+        status, data = None, None
+        try:
+            if self.conn is None:
+                self.conn = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+            headers = {'Content-Type': 'application/json'} if body is not None else {}
+            self.conn.request(method, path, body=json.dumps(body) if body is not None else None, headers=headers)
+            response = self.conn.getresponse()
+            raw = response.read()
+            status = response.status
+            if response.getheader('Content-Type', '').startswith('application/json'):
+                data = json.loads(raw)
+        except (OSError, http.client.HTTPException, ValueError):
+            if self.conn is not None:
+                self.conn.close()
+            self.conn = None
+        self.stats.record(endpoint, time.perf_counter() - start, status)
+        return status, data
+
+    def run_flow(self, format_type: str, poll_interval: float, flow_timeout: float) -> bool:
+        status, data = self.request('extract', 'POST', '/api/extract', {'url': TEST_URL})
+        if status != 200:
+            return False
+        session_id = data['session_id']
+        deadline = time.monotonic() + flow_timeout
+
+        # المعاينة تصل أولًا، ثم تُستطلع قائمة التنسيقات كما تفعل الواجهة
+        video_info = data['video_info']
+        while 'formats' not in video_info:
+            if time.monotonic() > deadline:
+                return False
+            time.sleep(poll_interval)
+            status, data = self.request('formats', 'GET', f'/api/formats/{session_id}')
+            if status != 200:
+                return False
+            video_info = data.get('video_info', {})
+        format_id = next(f['id'] for f in video_info['formats'] if f['type'] == format_type)
+
+        status, data = self.request('download', 'POST', '/api/download', {
+            'session_id': session_id, 'format_id': format_id, 'format_type': format_type
+        })
+        if status != 200:
+            return False
+        download_id = data['download_id']
+
+        while time.monotonic() < deadline:
+            status, data = self.request('status', 'GET', f'/api/status/{download_id}')
+            if status != 200:
+                return False
+            if data['status'] == 'completed':
+                break
+            if data['status'] == 'failed':
+                return False
+            time.sleep(poll_interval)
+        else:
+            return False
+
+        status, _ = self.request('file', 'GET', f'/download/{download_id}')
+        self.request('cleanup', 'POST', '/api/cleanup', {'session_id': session_id})
+        return status == 200
+
+
+def start_local_server(args) -> Tuple[str, object]:
+    """تشغيل التطبيق مع المحمل الوهمي على خادم werkzeug متعدد الخيوط"""
+    os.environ['FAKE_EXTRACT_LATENCY'] = str(args.extract_latency)
+    os.environ['FAKE_DOWNLOAD_LATENCY'] = str(args.download_latency)
+    os.environ['FAKE_SIZE_BYTES'] = str(args.size_bytes)
+
+    from werkzeug.serving import make_server
+    from benchmarks.load_test_app import app
+
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, name='load-test-server', daemon=True).start()
+    return f"http://127.0.0.1:{server.server_port}", server
+
+
+def main():
+    parser = argparse.ArgumentParser(description='اختبار تحميل متزامن لواجهة الويب')
+    parser.add_argument('--url', help='عنوان خادم قائم (افتراضيًا: تشغيل خادم محلي مع محمل وهمي)')
+    parser.add_argument('--clients', type=int, default=20, help='عدد العملاء المتزامنين')
+    parser.add_argument('--flows', type=int, default=5, help='عدد المسارات الكاملة لكل عميل')
+    parser.add_argument('--audio-ratio', type=float, default=0.3, help='نسبة طلبات الصوت')
+    parser.add_argument('--extract-latency', type=float, default=0.2, help='زمن الاستخراج الوهمي (ث)')
+    parser.add_argument('--download-latency', type=float, default=1.0, help='زمن التحميل الوهمي (ث)')
+    parser.add_argument('--size-bytes', type=int, default=1024 * 1024, help='حجم الملف الوهمي')
+    parser.add_argument('--poll-interval', type=float, default=0.5, help='فاصل متابعة الحالة (ث)')
+    parser.add_argument('--flow-timeout', type=float, default=300, help='المهلة القصوى لكل مسار (ث)')
+    parser.add_argument('--output', help='ملف JSON لحفظ النتائج')
+    args = parser.parse_args()
+
+    import logging
+    logging.disable(logging.WARNING)
+
+    server = None
+    base_url = args.url
+    if not base_url:
+        base_url, server = start_local_server(args)
+
+    stats = Stats()
+
+    def client_loop(index: int):
+        client = Client(base_url, stats, timeout=args.flow_timeout)
+        for flow in range(args.flows):
+            # توزيع حتمي لطلبات الصوت حسب النسبة المطلوبة
+            is_audio = ((index * args.flows + flow) % 100) < args.audio_ratio * 100
+            ok = client.run_flow('audio' if is_audio else 'video', args.poll_interval, args.flow_timeout)
+            stats.flow_done(ok)
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=client_loop, args=(i,)) for i in range(args.clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    if server is not None:
+        server.shutdown()
+
+    endpoints = {}
+    total_requests = 0
+    for endpoint, samples in stats.latencies.items():
+        ordered = sorted(samples)
+        errors = sum(stats.errors[endpoint].values())
+        total_requests += len(samples)
+        endpoints[endpoint] = {
+            'requests': len(samples),
+            'p50_ms': percentile(ordered, 0.50) * 1000,
+            'p95_ms': percentile(ordered, 0.95) * 1000,
+            'p99_ms': percentile(ordered, 0.99) * 1000,
+            'max_ms': ordered[-1] * 1000,
+            'error_rate': errors / len(samples),
+            'errors': dict(stats.errors[endpoint]),
+        }
+
+    total_flows = stats.flows_completed + stats.flows_failed
+    report = {
+        'config': {k: v for k, v in vars(args).items() if k != 'output'},
+        'elapsed_seconds': elapsed,
+        'flows_completed': stats.flows_completed,
+        'flows_failed': stats.flows_failed,
+        'flow_error_rate': stats.flows_failed / total_flows if total_flows else 0.0,
+        'flows_per_second': stats.flows_completed / elapsed,
+        'requests_per_second': total_requests / elapsed,
+        'endpoints': endpoints,
+    }
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(json.dumps(report, indent=2, ensure_ascii=False))
+
+    print(f"العملاء: {args.clients}  المسارات: {total_flows}  المدة: {elapsed:.1f} ث")
+    print(f"المسارات الناجحة/ث: {report['flows_per_second']:.2f}  الطلبات/ث: {report['requests_per_second']:.1f}  "
+          f"نسبة فشل المسارات: {report['flow_error_rate']:.1%}")
+    print(f"{'endpoint':10s} {'requests':>9s} {'p50 ms':>9s} {'p95 ms':>9s} {'p99 ms':>9s} {'errors':>8s}")
+    for endpoint, result in endpoints.items():
+        print(f"{endpoint:10s} {result['requests']:9d} {result['p50_ms']:9.1f} {result['p95_ms']:9.1f} "
+              f"{result['p99_ms']:9.1f} {result['error_rate']:8.1%}")
+
+
+if __name__ == '__main__':
+    main()
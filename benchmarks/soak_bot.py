@@ -0,0 +1,216 @@
+#!/usr/bin/env python3
+"""
+اختبار تحمل طويل لذاكرة بوت التلغرام مقابل خادم Bot API وهمي محلي
+
+يشغل موجات متتالية من المستخدمين الاصطناعيين (مستخدمون جدد في كل موجة، بعضهم يلغي وبعضهم
+يترك الجلسة دون اختيار تنسيق) حتى انتهاء المدة، ويأخذ بعد كل موجة وجمع المهملات عينة من:
+- الذاكرة المقيمة، والذاكرة المخصصة مع MEMORY_DIAGNOSTICS_ENABLED=true (tracemalloc)
+- أحجام المخازن المسجلة في مراقب الذاكرة (الجلسات، المهام الأخيرة، ...) وعدد الخيوط والملفات المفتوحة
+
+ثم يحسب ميل نمو الذاكرة بعد فترة الإحماء بالانحدار الخطي: تُعد الذاكرة مستقرة إذا لم يتجاوز
+الميل --max-growth-mb-per-hour (ويخرج البرنامج بالرمز 1 خلاف ذلك).
+
+الاستخدام:
+    python benchmarks/soak_bot.py --duration 86400 --output soak.json
+    USER_SESSION_TTL=30 python benchmarks/soak_bot.py --duration 900 --wave-users 50
+"""
+import os
+import gc
+import sys
+import json
+import time
+import asyncio
+import logging
+import argparse
+import tempfile
+import threading
+from collections import defaultdict
+from typing import Dict, List, Sequence
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+os.environ.setdefault('DOWNLOAD_PATH', os.path.join(tempfile.gettempdir(), 'ytdl-bot-soak'))
+
+from telegram.ext import Application
+
+from benchmarks.bench_bot import FIRST_USER_ID, SyntheticUsers
+from benchmarks.fake_bot_api import FakeBotAPI
+from benchmarks.fakes import FakeDownloader
+from common.memory import get_memory_monitor, rss_bytes
+from common.scheduler import get_scheduler
+import bot.telegram_bot as telegram_bot
+
+
+def open_files() -> int:
+    """عدد واصفات الملفات المفتوحة في العملية (0 إذا لم يتوفر /proc)"""
+    try:
+        return len(os.listdir('/proc/self/fd'))
+    except OSError:
+        return 0
+
+
+def slope(points: Sequence[tuple]) -> float:
+    """ميل خط الانحدار الخطي للنقاط (x, y)"""
+    if len(points) < 2:
+        return 0.0
+    mean_x = sum(x for x, _ in points) / len(points)
+    mean_y = sum(y for _, y in points) / len(points)
+    variance = sum((x - mean_x) ** 2 for x, _ in points)
+    if not variance:
+        return 0.0
+    return sum((x - mean_x) * (y - mean_y) for x, y in points) / variance
+
+
+async def run_wave(api: FakeBotAPI, args, wave: int) -> Dict[str, int]:
+    """تشغيل موجة من المستخدمين الجدد حتى انتهاء كل تحميلاتها"""
+    users = SyntheticUsers(api, args.wave_users, args.cancel_ratio, args.audio_ratio, args.seed + wave,
+                           first_user=FIRST_USER_ID + wave * args.wave_users,
+                           abandon_ratio=args.abandon_ratio)
+    gap = args.ramp / args.wave_users if args.wave_users else 0
+    for user_id in users.plans:
+        users.arrive(user_id)
+        if gap:
+            await asyncio.sleep(gap)
+
+    deadline = time.monotonic() + args.wave_timeout
+    while not users.finished.is_set() and time.monotonic() < deadline:
+        await asyncio.sleep(0.1)
+    scheduler = get_scheduler()
+    while (telegram_bot.active_downloads or scheduler.queue_depth or scheduler.active_jobs) \
+            and time.monotonic() < deadline:
+        await asyncio.sleep(0.1)
+    users.close()
+    # أوقات دفع التحديثات يحتفظ بها الخادم الوهمي لقياس الانتظار فقط
+    api.pushed_at.clear()
+
+    outcomes = defaultdict(int)
+    for outcome in users.outcomes.values():
+        outcomes[outcome] += 1
+    outcomes['unfinished'] = args.wave_users - len(users.outcomes)
+    return outcomes
+
+
+def sample(started: float, wave: int) -> Dict:
+    """عينة من موارد العملية بعد جمع المهملات"""
+    gc.collect()
+    monitor = get_memory_monitor()
+    entry = {
+        'elapsed': time.monotonic() - started,
+        'wave': wave,
+        'rss': rss_bytes(),
+        'threads': threading.active_count(),
+        'open_files': open_files(),
+        'sizes': monitor.sizes(),
+    }
+    if monitor.enabled:
+        import tracemalloc
+        entry['traced'] = tracemalloc.get_traced_memory()[0]
+    return entry
+
+
+async def run_soak(args) -> Dict:
+    api = FakeBotAPI().start()
+    telegram_bot.downloader = FakeDownloader(
+        os.environ['DOWNLOAD_PATH'],
+        extract_latency=args.extract_latency,
+        download_latency=args.download_latency,
+        size_bytes=args.size_bytes
+    )
+
+    application = Application.builder().token(os.environ['BOT_TOKEN']).base_url(api.base_url).build()
+    telegram_bot.register_handlers(application)
+    await application.initialize()
+    await application.start()
+    await application.updater.start_polling(poll_interval=0, timeout=1)
+
+    started = time.monotonic()
+    samples: List[Dict] = [sample(started, 0)]
+    totals = defaultdict(int)
+    wave = 0
+    last_prune = started
+    while time.monotonic() - started < args.duration:
+        wave += 1
+        for outcome, count in (await run_wave(api, args, wave)).items():
+            totals[outcome] += count
+        # مهمة التنظيف الدورية في البوت (كل ساعة في التشغيل الفعلي) لحذف الجلسات المنتهية
+        if time.monotonic() - last_prune >= args.cleanup_interval:
+            telegram_bot.user_data_cache.prune()
+            telegram_bot.recent_jobs.prune()
+            last_prune = time.monotonic()
+        samples.append(sample(started, wave))
+        if args.pause:
+            await asyncio.sleep(args.pause)
+
+    await application.updater.stop()
+    await application.stop()
+    await application.shutdown()
+    api.stop()
+
+    elapsed = time.monotonic() - started
+    steady = [s for s in samples if s['elapsed'] >= elapsed * args.warmup] or samples[-2:]
+    mb = 1024 * 1024
+    rss_growth = slope([(s['elapsed'] / 3600, s['rss'] / mb) for s in steady])
+    result = {
+        'config': {k: v for k, v in vars(args).items() if k != 'output'},
+        'elapsed_seconds': elapsed,
+        'waves': wave,
+        'outcomes': dict(totals),
+        'rss_mb': {
+            'start': samples[0]['rss'] / mb,
+            'steady_start': steady[0]['rss'] / mb,
+            'end': samples[-1]['rss'] / mb,
+            'peak': max(s['rss'] for s in samples) / mb,
+            'growth_mb_per_hour': rss_growth,
+        },
+        'threads': {'start': samples[0]['threads'], 'end': samples[-1]['threads']},
+        'open_files': {'start': samples[0]['open_files'], 'end': samples[-1]['open_files']},
+        'sizes_end': samples[-1]['sizes'],
+        'flat': rss_growth <= args.max_growth_mb_per_hour,
+        'samples': samples,
+    }
+    if 'traced' in samples[-1]:
+        result['traced_mb'] = {
+            'steady_start': steady[0]['traced'] / mb,
+            'end': samples[-1]['traced'] / mb,
+            'growth_mb_per_hour': slope([(s['elapsed'] / 3600, s['traced'] / mb) for s in steady]),
+        }
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='اختبار تحمل طويل لذاكرة بوت التلغرام')
+    parser.add_argument('--duration', type=float, default=24 * 3600, help='مدة الاختبار (ث)')
+    parser.add_argument('--wave-users', type=int, default=100, help='عدد المستخدمين الجدد في كل موجة')
+    parser.add_argument('--ramp', type=float, default=5, help='مدة وصول مستخدمي الموجة (ث)')
+    parser.add_argument('--pause', type=float, default=0, help='الانتظار بين الموجات (ث)')
+    parser.add_argument('--cancel-ratio', type=float, default=0.1, help='نسبة المستخدمين الذين يلغون')
+    parser.add_argument('--abandon-ratio', type=float, default=0.2,
+                        help='نسبة المستخدمين الذين يتركون الجلسة دون اختيار تنسيق')
+    parser.add_argument('--audio-ratio', type=float, default=0.3, help='نسبة طلبات الصوت')
+    parser.add_argument('--extract-latency', type=float, default=0.02, help='زمن الاستخراج الوهمي (ث)')
+    parser.add_argument('--download-latency', type=float, default=0.1, help='زمن التحميل الوهمي (ث)')
+    parser.add_argument('--size-bytes', type=int, default=256 * 1024, help='حجم الملف الوهمي')
+    parser.add_argument('--wave-timeout', type=float, default=300, help='المهلة القصوى لكل موجة (ث)')
+    parser.add_argument('--cleanup-interval', type=float, default=3600, help='الفترة بين تنظيف الجلسات (ث)')
+    parser.add_argument('--warmup', type=float, default=0.25,
+                        help='نسبة المدة الأولى المستبعدة من حساب الميل (امتلاء المخازن حتى حدودها)')
+    parser.add_argument('--max-growth-mb-per-hour', type=float, default=1.0,
+                        help='أقصى ميل للذاكرة المقيمة بعد الإحماء لاعتبارها مستقرة')
+    parser.add_argument('--seed', type=int, default=1, help='بذرة توزيع خطط المستخدمين')
+    parser.add_argument('--output', help='ملف JSON لحفظ النتائج (افتراضيًا: الطباعة)')
+    args = parser.parse_args()
+
+    logging.disable(logging.WARNING)
+
+    report = asyncio.run(run_soak(args))
+    output = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output)
+    else:
+        print(output)
+    sys.exit(0 if report['flat'] else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,6 +1,8 @@
 import os
+import time
 import asyncio
 from bot.telegram_bot import main as _start_bot
+from common.leader import get_bot_lease
 
 # تصدير الدالة start_bot للاستخدام من خارج الوحدة
 __all__ = ['start_bot']
@@ -8,17 +10,37 @@ __all__ = ['start_bot']
 def start_bot():
     """
     بدء تشغيل البوت مع التحقق من متغير البيئة BOT_ENABLED
+    
+    عند تشغيل عدة عمليات (مثل عمال gunicorn) تشغل عملية واحدة فقط البوت بعد
+    الاستحواذ على ملكية دوره، وتنتظر الأخرى في وضع الاحتياط لتحل محلها إذا توقفت.
     """
     # التحقق من متغير البيئة BOT_ENABLED
     if os.environ.get('BOT_ENABLED', 'true').lower() != 'true':
         print("البوت معطل عن طريق متغير البيئة BOT_ENABLED")
         return
     
-    # تشغيل البوت فقط إذا كان مُمكّنًا
-    try:
-        # استخدام asyncio لتشغيل الدالة غير المتزامنة
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        loop.run_until_complete(_start_bot())
-    except Exception as e:
-        print(f"خطأ في تشغيل البوت: {str(e)}")
+    lease = get_bot_lease()
+    # استخدام asyncio لتشغيل الدالة غير المتزامنة
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    standby = False
+    
+    while True:
+        if not lease.acquire():
+            if not standby:
+                print("البوت يعمل في عملية أخرى، هذه العملية في وضع الاحتياط")
+                standby = True
+            time.sleep(lease.renew_interval)
+            continue
+        
+        standby = False
+        print("تم اختيار هذه العملية لتشغيل البوت")
+        try:
+            loop.run_until_complete(_start_bot(lease))
+        except Exception as e:
+            print(f"خطأ في تشغيل البوت: {str(e)}")
+        finally:
+            lease.release()
+        
+        # توقف البوت أو فقد ملكيته: إتاحة الدور لعملية أخرى قبل المحاولة مجددًا
+        time.sleep(lease.renew_interval)
@@ -1,7 +1,9 @@
 import os
 import sys
+import time
+import uuid
+import asyncio
 import logging
-import threading
 from typing import Dict, Optional, Any
 
 from telegram import Update
@@ -15,26 +17,67 @@ from telegram.ext import (
 # إضافة المجلد الرئيسي إلى مسار النظام
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
-from config import BOT_TOKEN, DOWNLOAD_PATH, FILE_EXPIRY, MAX_FILE_SIZE, BASE_URL
-from common.downloader import YouTubeDownloader
+from config import (
+    BOT_TOKEN, FILE_EXPIRY, TELEGRAM_UPLOAD_LIMIT, BASE_URL,
+    INFO_CACHE_SIZE, INFO_CACHE_TTL, RATE_LIMIT_CAPACITY, RATE_LIMIT_REFILL_RATE,
+    JOB_BASE_COST, JOB_COST_PER_MB, METRICS_DIR, METRICS_FLUSH_INTERVAL,
+    JOB_PROFILING_ENABLED, PROFILE_PATH, MAX_CONCURRENT_UPLOADS, UPLOAD_TIMEOUT
+)
+from common.admission import CapacityExceeded
+from common.bandwidth import get_bandwidth
+from common.cache import TTLCache
+from common.cancellation import JobCancelled, StageTimeout
+from common.jobs import estimate_job_cost
+from common.journal import get_journal
+from common.leader import Lease
+from common.logging_setup import setup_logging
+from common.memory import get_memory_monitor
+from common.metrics import registry as metrics_registry, UPLOAD_SECONDS, BOT_LEADERS, WATCHDOG_KILLS
+from common.rate_limit import RateLimiter
+from common.scheduler import get_scheduler
+from common.storage import get_storage
+from common.transcode import get_transcoder, fit_format_id, needs_fit, parse_fit_format
+from common.url_parser import parse_time_range, parse_youtube_url
+from common.workers import create_downloader
 from bot.utils import (
-    user_data_cache, format_video_info, create_format_keyboard,
-    clean_user_data
+    user_data_cache, format_video_info, create_format_keyboard, fit_button,
+    format_size, format_duration, clean_user_data
 )
 
-# إعداد التسجيل
-logging.basicConfig(
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    level=logging.INFO
-)
+# إعداد التسجيل المركزي (طابور وخيط كتابة واحد)
+setup_logging()
 logger = logging.getLogger(__name__)
 
 # إنشاء محمل YouTube
-downloader = YouTubeDownloader(DOWNLOAD_PATH)
+downloader = create_downloader(get_storage().scratch_dir, INFO_CACHE_SIZE, INFO_CACHE_TTL, get_bandwidth())
 
 # قاموس لتخزين مهام التحميل النشطة
 active_downloads = {}
 
+# آخر مهمة لكل مستخدم لعرض حالتها ومراحلها عبر /status
+recent_jobs = TTLCache(maxsize=1000, ttl=3600)
+
+# أحجام المخازن في الذاكرة لتقرير الذاكرة الدوري
+memory_monitor = get_memory_monitor()
+memory_monitor.register('bot_sessions', lambda: len(user_data_cache))
+memory_monitor.register('bot_active_downloads', lambda: len(active_downloads))
+memory_monitor.register('bot_recent_jobs', lambda: len(recent_jobs))
+
+# المستخدمون الذين طلبوا تحليل مهمتهم التالية عبر /profile
+profile_next_job = set()
+
+# تحديد معدل التحميل لكل مستخدم تلغرام
+user_rate_limiter = RateLimiter(RATE_LIMIT_REFILL_RATE, RATE_LIMIT_CAPACITY)
+
+# الحد الأدنى بين تحديثات رسالة التقدم (بالثواني) لتجنب حدود تلغرام
+PROGRESS_UPDATE_INTERVAL = 3
+
+# عمليات الإرسال المتزامنة إلى تلغرام (تُنشأ عند أول إرسال داخل حلقة الأحداث)
+upload_slots: Optional[asyncio.Semaphore] = None
+
+# مهلة كتابة طلب إرسال الملف (بالثواني) قبل تمديدها حسب حصة الرفع
+UPLOAD_WRITE_TIMEOUT = 20
+
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """
     معالجة أمر البدء /start.
@@ -59,14 +102,20 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
         "1️⃣ أرسل رابط فيديو يوتيوب\n"
         "2️⃣ اختر جودة التحميل المفضلة لديك\n"
         "3️⃣ انتظر حتى يتم تحميل الفيديو وإرساله إليك\n\n"
+        "✂️ *تحميل مقطع فقط:*\n"
+        "أرسل الرابط متبوعًا بالبداية والنهاية، مثل:\n"
+        "`https://youtu.be/... 1:30-3:45`\n"
+        "ويُستخدم وقت البدء في الرابط (t=) إذا لم تحدد المقطع\n\n"
         "📌 *أوامر إضافية:*\n"
         "/start - بدء استخدام البوت\n"
         "/help - عرض هذه المساعدة\n"
-        "/cancel - إلغاء العملية الحالية\n\n"
+        "/cancel - إلغاء العملية الحالية\n"
+        "/status - عرض حالة التحميل الحالي ومراحله\n\n"
         "🔗 *واجهة الويب:*\n"
         f"يمكنك أيضًا استخدام واجهة الويب: {BASE_URL}\n\n"
         "⚠️ *ملاحظات:*\n"
-        "- الحد الأقصى لحجم الملف هو 50 ميجابايت\n"
+        f"- الحد الأقصى لحجم الملف هو {format_size(TELEGRAM_UPLOAD_LIMIT)}، "
+        "ويمكن ضغط الفيديوهات الأكبر منه بخيار 📦\n"
         "- قد يستغرق تحميل الفيديوهات الطويلة وقتًا أطول\n"
         "- إذا واجهت أي مشكلة، يرجى إعادة المحاولة لاحقًا"
     )
@@ -76,6 +125,37 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
         parse_mode=ParseMode.MARKDOWN
     )
 
+async def status_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """
+    معالجة أمر الحالة /status: عرض حالة آخر تحميل ومدة كل مرحلة.
+    """
+    job = recent_jobs.get(update.effective_user.id)
+    if job is None:
+        await update.message.reply_text("ℹ️ لا يوجد تحميل حالي أو حديث.")
+        return
+    
+    info = job.to_dict()
+    lines = [f"ℹ️ حالة التحميل: {info['status']} ({info['progress']}%)"]
+    for stage in info['spans']:
+        lines.append(f"• {stage['name']}: {stage['duration']:.2f} ث")
+    if info['error']:
+        lines.append(f"❌ {info['error']}")
+    if info['profile']:
+        lines.append(f"📊 ملف التحليل: {info['profile']}")
+    
+    await update.message.reply_text("\n".join(lines))
+
+async def profile_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """
+    معالجة أمر /profile: التقاط ملف cProfile للتحميل التالي لهذا المستخدم.
+    """
+    if not JOB_PROFILING_ENABLED:
+        await update.message.reply_text("❌ التحليل غير مفعل على هذا الخادم.")
+        return
+    
+    profile_next_job.add(update.effective_user.id)
+    await update.message.reply_text("📊 سيتم تحليل التحميل التالي. استخدم /status بعد انتهائه.")
+
 async def cancel(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """
     معالجة أمر الإلغاء /cancel.
@@ -86,25 +166,71 @@ async def cancel(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     clean_user_data(user_id)
     
     # إلغاء التحميل النشط إذا وجد
-    if user_id in active_downloads:
-        del active_downloads[user_id]
+    await cancel_active_download(context, user_id)
     
     await update.message.reply_text("✅ تم إلغاء العملية الحالية.")
 
+def cancel_keyboard() -> InlineKeyboardMarkup:
+    """لوحة مفاتيح بزر إلغاء التحميل الجاري"""
+    return InlineKeyboardMarkup([[InlineKeyboardButton("إلغاء", callback_data="cancel")]])
+
+async def cancel_active_download(context: ContextTypes.DEFAULT_TYPE, user_id: int) -> bool:
+    """
+    إلغاء تحميل المستخدم النشط فعليًا: إيقاف المهمة في المجدول (فيتوقف yt-dlp وFFmpeg
+    وتُحذف الملفات الجزئية ويتحرر العامل)، وإلغاء مهمة الإرسال إذا كان الرفع قد بدأ.
+    
+    Returns:
+        True إذا كان هناك تحميل نشط
+    """
+    entry = active_downloads.pop(user_id, None)
+    if entry is None:
+        return False
+    
+    if entry.get('job') is not None:
+        get_scheduler().cancel(entry['job'])
+    if entry.get('task') is not None:
+        entry['task'].cancel()
+    if entry.get('job_id'):
+        get_journal().remove(entry['job_id'])
+    clean_user_data(user_id)
+    
+    try:
+        await context.bot.edit_message_text(
+            chat_id=entry['chat_id'],
+            message_id=entry['message_id'],
+            text="✅ تم إلغاء التحميل. أرسل رابط فيديو آخر للتحميل."
+        )
+    except Exception as e:
+        logger.error("خطأ في تحديث رسالة الإلغاء: %s", e)
+    return True
+
 async def process_youtube_url(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """
     معالجة رابط يوتيوب المرسل من المستخدم.
     """
     user_id = update.effective_user.id
-    message_text = update.message.text
+    # الرسالة: الرابط متبوعًا اختياريًا بمقطع زمني (مثل 1:30-3:45)
+    url, _, range_text = update.message.text.strip().partition(' ')
     
     # التحقق من أن الرسالة هي رابط يوتيوب
-    if not downloader.is_valid_youtube_url(message_text):
+    if not downloader.is_valid_youtube_url(url):
         await update.message.reply_text(
             "❌ الرابط غير صالح. الرجاء إرسال رابط يوتيوب صالح."
         )
         return
     
+    if range_text.strip():
+        clip = parse_time_range(range_text)
+        if clip is None:
+            await update.message.reply_text(
+                "❌ صيغة المقطع غير صالحة. أرسل الرابط متبوعًا بالبداية والنهاية، مثل: 1:30-3:45"
+            )
+            return
+    else:
+        # وقت البدء من الرابط المشارك (t=) يعني تحميل الفيديو من تلك اللحظة
+        key = parse_youtube_url(url)
+        clip = (key.start_time, None) if key is not None and key.start_time else None
+    
     # إرسال رسالة "جاري المعالجة"
     processing_message = await update.message.reply_text(
         "⏳ جاري معالجة الرابط...",
@@ -114,8 +240,9 @@ async def process_youtube_url(update: Update, context: ContextTypes.DEFAULT_TYPE
     )
     
     try:
-        # استخراج معلومات الفيديو
-        video_info = downloader.get_video_info(message_text)
+        # معاينة سريعة أولًا (العنوان والمدة)، دون إيقاف حلقة الأحداث أثناء الاستخراج
+        loop = asyncio.get_running_loop()
+        video_info = await loop.run_in_executor(None, downloader.get_video_preview, url)
         
         if not video_info:
             await processing_message.edit_text(
@@ -123,18 +250,48 @@ async def process_youtube_url(update: Update, context: ContextTypes.DEFAULT_TYPE
             )
             return
         
+        # مطابقة المقطع مع مدة الفيديو
+        duration = video_info.get('duration') or 0
+        if clip and duration:
+            start, end = clip
+            if start is not None and start >= duration:
+                await processing_message.edit_text("❌ بداية المقطع بعد نهاية الفيديو.")
+                return
+            clip = (start, end if end is not None and end < duration else None)
+        
         # تخزين معلومات الفيديو في بيانات المستخدم
-        user_data_cache[user_id] = {
-            'url': message_text,
+        session = {
+            'url': url,
             'video_info': video_info,
+            'clip': clip,
             'page': 0
         }
+        user_data_cache.set(user_id, session)
+        
+        if 'formats' not in video_info:
+            # عرض المعاينة ثم إكمال الرسالة بقائمة التنسيقات عند استخراجها
+            await processing_message.edit_text(
+                text=format_video_info(video_info, clip, loading=True),
+                parse_mode=ParseMode.MARKDOWN,
+                reply_markup=processing_message.reply_markup
+            )
+            video_info = await loop.run_in_executor(None, downloader.get_video_info, url)
+            # ألغى المستخدم العملية أو أرسل رابطًا آخر أثناء الانتظار
+            if user_data_cache.get(user_id) is not session:
+                return
+            session['video_info'] = video_info
         
         # إنشاء نص الرسالة
-        message_text = format_video_info(video_info)
+        message_text = format_video_info(video_info, clip)
         
-        # إنشاء لوحة المفاتيح
-        keyboard = create_format_keyboard(video_info)
+        # إنشاء لوحة المفاتيح، مع خيار الضغط إذا تجاوزت كل التنسيقات حد الإرسال
+        clip_duration = None
+        if clip:
+            clip_duration = (clip[1] or duration) - (clip[0] or 0)
+        fit_format = None
+        if needs_fit(video_info, TELEGRAM_UPLOAD_LIMIT, clip_duration):
+            fit_format = (fit_format_id(TELEGRAM_UPLOAD_LIMIT), TELEGRAM_UPLOAD_LIMIT)
+        keyboard = create_format_keyboard(video_info, fit_format=fit_format)
         
         # تحديث الرسالة
         await processing_message.edit_text(
@@ -143,8 +300,10 @@ async def process_youtube_url(update: Update, context: ContextTypes.DEFAULT_TYPE
             reply_markup=keyboard
         )
         
+    except CapacityExceeded as e:
+        await processing_message.edit_text(f"⏳ {str(e)}")
     except Exception as e:
-        logger.error(f"خطأ في معالجة رابط يوتيوب: {str(e)}")
+        logger.error("خطأ في معالجة رابط يوتيوب: %s", e)
         await processing_message.edit_text(
             f"❌ حدث خطأ أثناء معالجة الرابط: {str(e)}"
         )
@@ -162,91 +321,29 @@ async def button_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     # استخراج البيانات من الزر
     data = query.data
     
-    # التحقق من وجود بيانات المستخدم
-    if user_id not in user_data_cache:
+    # استخراج بيانات المستخدم والتحقق من وجودها
+    user_data = user_data_cache.get(user_id)
+    if user_data is None:
         await query.edit_message_text(text="❌ انتهت الجلسة. الرجاء إرسال الرابط مرة أخرى.")
         return
     
-    # استخراج بيانات المستخدم
-    user_data = user_data_cache[user_id]
-    
     # التحقق من نوع الزر
     if data.startswith('format_'):
-        # استخراج معرف التنسيق
-        format_id = data.replace('format_', '')
-        
-        # التحقق من وجود معلومات الفيديو
-        if 'video_info' not in user_data:
-            await query.edit_message_text(text="❌ لم يتم العثور على معلومات الفيديو. الرجاء إرسال الرابط مرة أخرى.")
-            return
+        # استخراج معرف التنسيق ونوعه (format_<id>_<video|audio>)
+        format_id, _, format_type = data[len('format_'):].rpartition('_')
+        if format_type not in ('video', 'audio'):
+            format_id, format_type = data[len('format_'):], 'video'
         
-        # استخراج معلومات الفيديو
-        video_info = user_data['video_info']
-        url = user_data['url']
-        
-        # تحديث الرسالة
-        progress_message = await query.edit_message_text(
-            text="⏳ جاري التحضير للتحميل...",
-            reply_markup=None
-        )
-        
-        # إضافة المستخدم إلى قائمة التحميلات النشطة
-        active_downloads[user_id] = {
-            'url': url,
-            'format_id': format_id,
-            'format_type': 'video',
-            'chat_id': chat_id,
-            'message_id': progress_message.message_id
-        }
-        
-        # بدء التحميل في خيط منفصل
-        threading.Thread(
-            target=lambda: asyncio.run(download_and_send(
-                context, user_id, url, format_id, 'video', 
-                chat_id, progress_message.message_id
-            ))
-        ).start()
+        await start_download(query, context, user_id, chat_id, user_data, format_id, format_type)
         
     elif data == 'audio':
-        # التحقق من وجود معلومات الفيديو
-        if 'video_info' not in user_data:
-            await query.edit_message_text(text="❌ لم يتم العثور على معلومات الفيديو. الرجاء إرسال الرابط مرة أخرى.")
-            return
-        
-        # استخراج معلومات الفيديو
-        url = user_data['url']
-        
-        # تحديث الرسالة
-        progress_message = await query.edit_message_text(
-            text="⏳ جاري التحضير للتحميل...",
-            reply_markup=None
-        )
-        
-        # إضافة المستخدم إلى قائمة التحميلات النشطة
-        active_downloads[user_id] = {
-            'url': url,
-            'format_id': 'best',
-            'format_type': 'audio',
-            'chat_id': chat_id,
-            'message_id': progress_message.message_id
-        }
-        
-        # بدء التحميل في خيط منفصل
-        threading.Thread(
-            target=lambda: asyncio.run(download_and_send(
-                context, user_id, url, 'best', 'audio', 
-                chat_id, progress_message.message_id
-            ))
-        ).start()
+        await start_download(query, context, user_id, chat_id, user_data, 'best', 'audio')
         
     elif data == 'cancel':
         # إلغاء العملية الحالية
         if user_id in active_downloads:
-            # حذف المستخدم من قائمة التحميلات النشطة
-            del active_downloads[user_id]
-            
-            # تحديث الرسالة
-            await query.edit_message_text(text="✅ تم إلغاء العملية. أرسل رابط فيديو آخر للتحميل.")
+            # إيقاف التحميل وتحديث رسالة التقدم
+            await cancel_active_download(context, user_id)
         else:
             # تنظيف بيانات المستخدم
             clean_user_data(user_id)
@@ -258,36 +355,134 @@ async def button_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         # زر غير معروف
         await query.edit_message_text(text="❌ خيار غير صالح. الرجاء إرسال الرابط مرة أخرى.")
 
+async def start_download(query, context: ContextTypes.DEFAULT_TYPE, user_id: int, chat_id: int,
+                         user_data: Dict, format_id: str, format_type: str) -> None:
+    """
+    التحقق من حد المعدل ثم إضافة التحميل إلى الطابور العادل.
+    """
+    # التحقق من وجود معلومات الفيديو
+    if 'video_info' not in user_data:
+        await query.edit_message_text(text="❌ لم يتم العثور على معلومات الفيديو. الرجاء إرسال الرابط مرة أخرى.")
+        return
+    
+    url = user_data['url']
+    start_time, end_time = user_data.get('clip') or (None, None)
+    
+    # الضغط المكرر على نفس التنسيق أثناء تحميله لا يبدأ تحميلًا ثانيًا: رسالة التقدم الحالية
+    # هي رسالة الأزرار نفسها وتستمر في عرض تقدم المهمة الأولى
+    active = active_downloads.get(user_id)
+    if active is not None and (active['url'], active['format_id'], active['format_type'], active.get('clip')) == \
+            (url, format_id, format_type, user_data.get('clip')):
+        logger.info("تجاهل طلب مكرر من المستخدم %s للتحميل %s", user_id, active['job_id'])
+        return
+    
+    # تحديد المعدل حسب المستخدم وتكلفة المهمة المقدرة
+    cost = estimate_job_cost(user_data['video_info'], format_id, format_type,
+                             JOB_BASE_COST, JOB_COST_PER_MB, start_time, end_time)
+    allowed, retry_after = user_rate_limiter.try_acquire(user_id, cost)
+    if not allowed:
+        await query.edit_message_text(
+            text=f"⏳ لقد تجاوزت الحد المسموح من التحميلات. الرجاء المحاولة بعد {int(retry_after) + 1} ثانية."
+        )
+        return
+    
+    # تحديث الرسالة
+    progress_message = await query.edit_message_text(
+        text="⏳ في انتظار دورك في طابور التحميل...",
+        reply_markup=cancel_keyboard()
+    )
+    
+    # تسجيل المهمة في السجل الدائم حتى تُستأنف بعد إعادة التشغيل
+    job_id = str(uuid.uuid4())
+    get_journal().record(job_id, 'telegram', f"tg:{user_id}", url, format_id, format_type, cost, {
+        'user_id': user_id,
+        'chat_id': chat_id,
+        'message_id': progress_message.message_id,
+        'start_time': start_time,
+        'end_time': end_time,
+    })
+    
+    # إضافة المستخدم إلى قائمة التحميلات النشطة
+    active_downloads[user_id] = {
+        'url': url,
+        'format_id': format_id,
+        'format_type': format_type,
+        'chat_id': chat_id,
+        'message_id': progress_message.message_id,
+        'job_id': job_id,
+        'clip': user_data.get('clip')
+    }
+    
+    # تنفيذ التحميل والإرسال دون حجز معالج التحديثات
+    active_downloads[user_id]['task'] = context.application.create_task(download_and_send(
+        context, user_id, url, format_id, format_type,
+        chat_id, progress_message.message_id, cost, job_id, start_time, end_time
+    ))
+
 async def download_and_send(context: ContextTypes.DEFAULT_TYPE, user_id: int, url: str, format_id: str, 
-                     format_type: str, chat_id: int, message_id: int):
+                     format_type: str, chat_id: int, message_id: int, cost: float = JOB_BASE_COST,
+                     job_id: Optional[str] = None, start_time: Optional[float] = None,
+                     end_time: Optional[float] = None, resumed: bool = False):
     """
-    تحميل الفيديو وإرساله للمستخدم.
+    تحميل الفيديو (أو المقطع بين start_time و end_time) وإرساله للمستخدم.
+    
+    تبقى المهمة في السجل حتى يُرسل الملف أو يفشل التحميل، فإذا توقفت العملية قبل ذلك
+    تُستأنف عند التشغيل التالي باسم الملف نفسه (معرف المهمة) مع resumed=True.
     """
-    try:
-        # إرسال رسالة بأن التحميل قد بدأ
-        progress_message = f"⏳ *جاري التحميل...*\n\n" \
-                          f"*الرابط:* {url}\n" \
-                          f"*النوع:* {format_type}\n"
-        
-        # تحديث رسالة التقدم
-        await update_progress_message(context, chat_id, message_id, "جاري التحميل", 0, 100, 0)
-        
-        # تحميل الفيديو أو الصوت
+    global upload_slots
+    loop = asyncio.get_running_loop()
+    last_update = 0.0
+    journal = get_journal()
+    job_id = job_id or str(uuid.uuid4())
+    
+    def on_progress(downloaded: int, total: int, eta: int) -> None:
+        # يُستدعى من خيط العامل: جدولة تحديث الرسالة على حلقة البوت مع تقليل عدد التعديلات
+        nonlocal last_update
+        now = time.monotonic()
+        if now - last_update < PROGRESS_UPDATE_INTERVAL:
+            return
+        last_update = now
+        asyncio.run_coroutine_threadsafe(
+            update_progress_message(context, chat_id, message_id, "جاري التحميل", downloaded, total, eta),
+            loop
+        )
+    
+    def run(job) -> Optional[str]:
+        job.on_progress = on_progress
+        journal.mark(job.id, 'running')
         if format_type == 'video':
-            file_path = downloader.download_video(url, format_id, 
-                                                 progress_callback=lambda progress, file_size, eta: 
-                                                 update_progress_message(context, chat_id, message_id, 
-                                                                               "جاري التحميل", 
-                                                                               progress, file_size, eta))
-        else:
-            file_path = downloader.download_audio(url, 
-                                                 progress_callback=lambda progress, file_size, eta: 
-                                                 update_progress_message(context, chat_id, message_id, 
-                                                                               "جاري التحميل", 
-                                                                               progress, file_size, eta))
+            return downloader.download_video(url, format_id, progress_callback=job.update_progress,
+                                             output_name=job.id, cancel_token=job.cancel_token,
+                                             start_time=start_time, end_time=end_time)
+        return downloader.download_audio(url, format_id, progress_callback=job.update_progress,
+                                         output_name=job.id, cancel_token=job.cancel_token,
+                                         start_time=start_time, end_time=end_time)
+    
+    job = None
+    file_path = None
+    queue_reporter = None
+    # الإبقاء على بيانات المستخدم عند عرض خيار الضغط بعد تجاوز الحجم
+    keep_session = False
+    try:
+        # تحميل الفيديو أو الصوت عبر الطابور العادل المشترك
+        profile_path = None
+        if user_id in profile_next_job:
+            profile_next_job.discard(user_id)
+            profile_path = os.path.join(PROFILE_PATH, f"tg_{user_id}_{int(time.time())}.prof")
+        
+        # المهام المستأنفة قُبلت قبل إعادة التشغيل فلا يطبق عليها حد الطابور
+        job = get_scheduler().submit(run, owner=f"tg:{user_id}", cost=cost, job_id=job_id,
+                                     profile_path=profile_path, admit=not resumed)
+        recent_jobs.set(user_id, job)
+        if user_id in active_downloads:
+            active_downloads[user_id]['job'] = job
+        queue_reporter = context.application.create_task(
+            report_queue_position(context, chat_id, message_id, job))
+        file_path = await asyncio.wrap_future(job.future)
         
         # التحقق من أن الملف قد تم تحميله بنجاح
         if not file_path or not os.path.exists(file_path):
+            journal.remove(job_id)
             await update_progress_message(context, chat_id, message_id, "فشل التحميل", 0, 0, 0)
             return
         
@@ -295,43 +490,80 @@ async def download_and_send(context: ContextTypes.DEFAULT_TYPE, user_id: int, ur
         await update_progress_message(context, chat_id, message_id, "اكتمل التحميل", 100, 100, 0)
         
         # إرسال الملف
-        file_size = os.path.getsize(file_path) / (1024 * 1024)  # حجم الملف بالميجابايت
+        file_size = os.path.getsize(file_path)
         
         # التحقق من حجم الملف
-        if file_size > MAX_FILE_SIZE:
-            # إذا كان الملف كبيرًا جدًا، أرسل رسالة خطأ
+        if file_size > TELEGRAM_UPLOAD_LIMIT:
+            # إذا كان الملف كبيرًا جدًا، أرسل رسالة خطأ مع خيار ضغط الفيديو أو واجهة الويب
             error_message = f"⚠️ *حجم الملف كبير جدًا للإرسال عبر تلغرام*\n\n" \
-                           f"حجم الملف: {file_size:.2f} ميجابايت\n" \
-                           f"الحد الأقصى: {MAX_FILE_SIZE} ميجابايت\n\n" \
-                           f"يمكنك تحميل الملف من خلال الرابط التالي:\n" \
-                           f"{BASE_URL}/download?file={os.path.basename(file_path)}"
+                           f"حجم الملف: {format_size(file_size)}\n" \
+                           f"الحد الأقصى: {format_size(TELEGRAM_UPLOAD_LIMIT)}\n\n"
+            reply_markup = None
+            if format_type == 'video' and parse_fit_format(format_id) is None and user_id in user_data_cache:
+                error_message += "يمكنك ضغط الفيديو ليلائم الحد، أو تحميله من واجهة الويب:\n"
+                reply_markup = InlineKeyboardMarkup([
+                    [fit_button(fit_format_id(TELEGRAM_UPLOAD_LIMIT), TELEGRAM_UPLOAD_LIMIT)],
+                    [InlineKeyboardButton("🔙 إلغاء", callback_data="cancel")],
+                ])
+                keep_session = True
+            else:
+                error_message += "يمكنك تحميل الملف من واجهة الويب:\n"
+            error_message += BASE_URL
             
+            journal.remove(job_id)
+            os.remove(file_path)
             await context.bot.edit_message_text(
                 chat_id=chat_id,
                 message_id=message_id,
                 text=error_message,
-                parse_mode=ParseMode.MARKDOWN
+                parse_mode=ParseMode.MARKDOWN,
+                reply_markup=reply_markup
             )
             return
         
-        # إرسال الملف
-        if format_type == 'video':
-            await context.bot.send_video(
-                chat_id=chat_id,
-                video=open(file_path, 'rb'),
-                filename=os.path.basename(file_path),
-                caption="🎬 تم التحميل بواسطة بوت تحميل يوتيوب",
-                parse_mode=ParseMode.MARKDOWN,
-                supports_streaming=True
-            )
-        else:
-            await context.bot.send_audio(
-                chat_id=chat_id,
-                audio=open(file_path, 'rb'),
-                filename=os.path.basename(file_path),
-                caption="🎵 تم التحميل بواسطة بوت تحميل يوتيوب",
-                parse_mode=ParseMode.MARKDOWN
-            )
+        # إرسال الملف، مع انتظار دوره إذا بلغت عمليات الإرسال المتزامنة MAX_CONCURRENT_UPLOADS
+        if upload_slots is None:
+            upload_slots = asyncio.Semaphore(MAX_CONCURRENT_UPLOADS)
+        async with upload_slots:
+            upload_started_at = time.perf_counter()
+            upload_wall_started_at = time.time()
+            # حجز حصة من الحد العام للرفع طوال الإرسال: مكتبة تلغرام ترسل الملف في طلب واحد،
+            # فتتقلص حصص تنزيلات الويب بدلًا من تنافسها مع الإرسال، وتُمدد مهلة الكتابة حسب الحصة
+            with get_bandwidth().allocate('upload', format_type) as allocation:
+                write_timeout = UPLOAD_WRITE_TIMEOUT
+                if allocation.rate:
+                    write_timeout = max(write_timeout, 2 * os.path.getsize(file_path) / allocation.rate)
+                # مهلة كلية للإرسال (لا تقل عن مهلة الكتابة الممددة للملفات الكبيرة)
+                upload_timeout = max(UPLOAD_TIMEOUT, write_timeout) if UPLOAD_TIMEOUT else None
+                # إغلاق الملف بعد الإرسال مهما كانت النتيجة (نجاح، إلغاء، تجاوز المهلة)
+                with open(file_path, 'rb') as media:
+                    if format_type == 'video':
+                        upload = context.bot.send_video(
+                            chat_id=chat_id,
+                            video=media,
+                            filename=os.path.basename(file_path),
+                            caption="🎬 تم التحميل بواسطة بوت تحميل يوتيوب",
+                            parse_mode=ParseMode.MARKDOWN,
+                            supports_streaming=True,
+                            write_timeout=write_timeout
+                        )
+                    else:
+                        upload = context.bot.send_audio(
+                            chat_id=chat_id,
+                            audio=media,
+                            filename=os.path.basename(file_path),
+                            caption="🎵 تم التحميل بواسطة بوت تحميل يوتيوب",
+                            parse_mode=ParseMode.MARKDOWN,
+                            write_timeout=write_timeout
+                        )
+                    try:
+                        await asyncio.wait_for(upload, timeout=upload_timeout)
+                    except asyncio.TimeoutError:
+                        WATCHDOG_KILLS.inc(stage='upload')
+                        raise StageTimeout('upload', f'تجاوز إرسال الملف المهلة المحددة ({int(upload_timeout)} ثانية).')
+            UPLOAD_SECONDS.observe(time.perf_counter() - upload_started_at, frontend='telegram', type=format_type)
+            job.trace.add('upload', upload_wall_started_at, time.time())
+        journal.remove(job_id)
         
         # حذف رسالة التقدم
         await context.bot.delete_message(
@@ -345,21 +577,79 @@ async def download_and_send(context: ContextTypes.DEFAULT_TYPE, user_id: int, ur
         except:
             pass
         
+    except StageTimeout as e:
+        # أوقف المراقب مرحلة عالقة (وحذف المحمل ملفاتها الجزئية)، أو تجاوز الإرسال مهلته
+        logger.error("تم إيقاف التحميل %s للمستخدم %s: %s", job_id, user_id, e)
+        journal.remove(job_id)
+        if file_path and os.path.exists(file_path):
+            os.remove(file_path)
+        try:
+            await update_progress_message(context, chat_id, message_id, f"فشل التحميل: {str(e)}", 0, 0, 0)
+        except Exception as edit_error:
+            logger.error("خطأ في تحديث رسالة الفشل: %s", edit_error)
+    
+    except JobCancelled:
+        # ألغى المستخدم التحميل: المحمل أوقف التحميل وحذف الملفات الجزئية
+        logger.info("تم إلغاء التحميل %s للمستخدم %s", job_id, user_id)
+        journal.remove(job_id)
+    
+    except CapacityExceeded as e:
+        # طابور التحميل (أو الضغط) ممتلئ: رفض المهمة مع الوقت المقدر لإعادة المحاولة
+        journal.remove(job_id)
+        if job is None:
+            # رفضها طابور التحميل نفسه فلم تُنفذ: لا تُحسب على حد معدل المستخدم
+            user_rate_limiter.refund(user_id, cost)
+        try:
+            await context.bot.edit_message_text(chat_id=chat_id, message_id=message_id, text=f"⏳ {str(e)}")
+        except Exception as edit_error:
+            logger.error("خطأ في تحديث رسالة الرفض: %s", edit_error)
+    
+    except asyncio.CancelledError:
+        # إلغاء أثناء الرفع: حذف الملف المكتمل (أما عند إيقاف البوت فيبقى للاستئناف)
+        if job is not None and job.cancel_token.cancelled and file_path and os.path.exists(file_path):
+            os.remove(file_path)
+        raise
+    
     except Exception as e:
-        logger.error(f"خطأ أثناء تحميل وإرسال الملف: {str(e)}")
+        logger.error("خطأ أثناء تحميل وإرسال الملف: %s", e)
+        journal.remove(job_id)
         try:
             await update_progress_message(context, chat_id, message_id, f"فشل التحميل: {str(e)}", 0, 0, 0)
         except:
             pass
 
     finally:
-        # تنظيف بيانات المستخدم
-        clean_user_data(user_id)
-        
-        # إزالة التحميل من القائمة النشطة
-        if user_id in active_downloads:
+        if queue_reporter is not None:
+            queue_reporter.cancel()
+        # تنظيف بيانات المستخدم ما لم يكن قد ألغى هذا التحميل (قد يكون بدأ تحميلًا جديدًا)
+        entry = active_downloads.get(user_id)
+        if entry is not None and entry.get('job_id') in (None, job_id):
+            if not keep_session:
+                clean_user_data(user_id)
             del active_downloads[user_id]
 
+async def report_queue_position(context: ContextTypes.DEFAULT_TYPE, chat_id: int, message_id: int, job) -> None:
+    """
+    تحديث رسالة الانتظار بموقع المهمة في الطابور والوقت المقدر لبدئها، حتى تبدأ المهمة.
+    """
+    last_text = None
+    while job.status == 'queued':
+        position = get_scheduler().queue_position(job)
+        if position is not None:
+            text = (f"⏳ في انتظار دورك في طابور التحميل...\n\n"
+                    f"ترتيبك: {position[0]}\n"
+                    f"يبدأ خلال: ~{format_duration(int(position[1]))}")
+            # تعديل الرسالة بنفس النص يرفضه تلغرام
+            if text != last_text:
+                try:
+                    await context.bot.edit_message_text(
+                        chat_id=chat_id, message_id=message_id, text=text, reply_markup=cancel_keyboard()
+                    )
+                    last_text = text
+                except Exception as e:
+                    logger.error("خطأ في تحديث موقع الطابور: %s", e)
+        await asyncio.sleep(PROGRESS_UPDATE_INTERVAL)
+
 async def update_progress_message(context: ContextTypes.DEFAULT_TYPE, chat_id: int, message_id: int, 
                            status: str, downloaded: int, total: int, eta: int) -> None:
     """
@@ -379,7 +669,8 @@ async def update_progress_message(context: ContextTypes.DEFAULT_TYPE, chat_id: i
         else:
             progress_bar = "░" * 20
         
-        # تنسيق النص
+        # تنسيق النص (زر الإلغاء يبقى ظاهرًا أثناء التحميل فقط)
+        reply_markup = None
         if status == "جاري التحميل" and total > 0:
             # تحويل الحجم إلى ميجابايت
             downloaded_mb = downloaded / (1024 * 1024)
@@ -397,6 +688,7 @@ async def update_progress_message(context: ContextTypes.DEFAULT_TYPE, chat_id: i
                 f"{progress_bar}\n"
                 f"*الوقت المتبقي:* {eta_str}"
             )
+            reply_markup = cancel_keyboard()
         elif status == "اكتمل التحميل":
             text = f"✅ *تم التحميل بنجاح!*\n\nجاري إرسال الملف..."
         elif status == "فشل التحميل":
@@ -408,16 +700,17 @@ async def update_progress_message(context: ContextTypes.DEFAULT_TYPE, chat_id: i
             chat_id=chat_id,
             message_id=message_id,
             text=text,
-            parse_mode=ParseMode.MARKDOWN
+            parse_mode=ParseMode.MARKDOWN,
+            reply_markup=reply_markup
         )
     except Exception as e:
-        logger.error(f"خطأ في تحديث رسالة التقدم: {str(e)}")
+        logger.error("خطأ في تحديث رسالة التقدم: %s", e)
 
 async def error_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """
     معالجة الأخطاء.
     """
-    logger.error(f"حدث خطأ: {context.error}")
+    logger.error("حدث خطأ: %s", context.error)
     
     try:
         # إرسال رسالة خطأ للمستخدم
@@ -427,36 +720,98 @@ async def error_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> N
                 text=f"❌ حدث خطأ: {context.error}"
             )
     except Exception as e:
-        logger.error(f"خطأ أثناء معالجة الخطأ: {str(e)}")
+        logger.error("خطأ أثناء معالجة الخطأ: %s", e)
 
 async def cleanup_task(context: ContextTypes.DEFAULT_TYPE) -> None:
     """
     مهمة دورية لتنظيف الملفات القديمة.
     """
-    downloader.cleanup_old_files(FILE_EXPIRY)
-    logger.info(f"تم تنظيف الملفات القديمة (أكثر من {FILE_EXPIRY} ساعة)")
+    downloader.cleanup_old_files(FILE_EXPIRY / 3600)
+    # الملفات المنشورة في المخزن (مثل S3) كما في واجهة الويب، في خيط منفصل لأنها قد تمر بالشبكة
+    loop = asyncio.get_running_loop()
+    await loop.run_in_executor(None, get_storage().cleanup, FILE_EXPIRY)
+    get_transcoder().cleanup(FILE_EXPIRY)
+    # الجلسات والمهام المنتهية صلاحيتها لمستخدمين لم يعودوا
+    user_data_cache.prune()
+    recent_jobs.prune()
+    logger.info("تم تنظيف الملفات القديمة (أكثر من %s ساعة)", FILE_EXPIRY)
 
-async def main():
+def register_handlers(application: Application) -> None:
+    """
+    تسجيل معالجات الأوامر والرسائل والأزرار والأخطاء على تطبيق البوت.
+    """
+    # إضافة معالجات الأوامر
+    application.add_handler(CommandHandler("start", start))
+    application.add_handler(CommandHandler("help", help_command))
+    application.add_handler(CommandHandler("cancel", cancel))
+    application.add_handler(CommandHandler("status", status_command))
+    application.add_handler(CommandHandler("profile", profile_command))
+    
+    # إضافة معالج الرسائل (دون حجز التحديثات التالية أثناء انتظار قائمة التنسيقات)
+    application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, process_youtube_url, block=False))
+    
+    # إضافة معالج الأزرار
+    application.add_handler(CallbackQueryHandler(button_callback))
+    
+    # إضافة معالج الأخطاء
+    application.add_error_handler(error_handler)
+
+async def resume_journaled_jobs(application: Application) -> None:
+    """
+    استئناف تحميلات البوت غير المكتملة من السجل بعد إعادة التشغيل.
+    """
+    context = application.context_types.context(application)
+    for record in get_journal().claim_unfinished('telegram'):
+        payload = record['payload']
+        logger.info("استئناف مهمة التحميل %s للمستخدم %s من السجل", record['id'], payload['user_id'])
+        active_downloads[payload['user_id']] = {
+            'url': record['url'],
+            'format_id': record['format_id'],
+            'format_type': record['format_type'],
+            'chat_id': payload['chat_id'],
+            'message_id': payload['message_id'],
+            'job_id': record['id']
+        }
+        active_downloads[payload['user_id']]['task'] = application.create_task(download_and_send(
+            context, payload['user_id'], record['url'], record['format_id'], record['format_type'],
+            payload['chat_id'], payload['message_id'], record['cost'], record['id'],
+            payload.get('start_time'), payload.get('end_time'), resumed=True
+        ))
+
+async def hand_over_downloads() -> None:
+    """
+    تسليم التحميلات الجارية بعد فقدان ملكية دور البوت: إيقافها مع إبقائها في السجل ثم تحرير
+    سجلاتها، فيستأنفها المالك الجديد فورًا بدل أن تكملها هذه العملية بالتوازي معه.
+    """
+    tasks = []
+    for entry in list(active_downloads.values()):
+        # إلغاء مهمة الإرسال قبل مهمة المجدول: لو وصلها JobCancelled أولًا لحذفت المهمة من السجل
+        if entry.get('task') is not None:
+            entry['task'].cancel()
+            tasks.append(entry['task'])
+        if entry.get('job') is not None:
+            get_scheduler().cancel(entry['job'])
+    await asyncio.gather(*tasks, return_exceptions=True)
+    released = await asyncio.get_running_loop().run_in_executor(None, get_journal().release, 'telegram')
+    logger.info("تم تحرير %s من مهام التحميل غير المكتملة للمالك الجديد", released)
+
+async def main(lease: Optional[Lease] = None):
     """
     الدالة الرئيسية لتشغيل البوت.
+    
+    Args:
+        lease: ملكية دور البوت (اختيارية)؛ تُجدد دوريًا ويتوقف البوت إذا فُقدت
     """
+    application = None
+    polling = False
+    demoted = False
     try:
+        # تصدير المقاييس إلى المجلد المشترك مع واجهة الويب
+        metrics_registry.start_flusher(METRICS_DIR, METRICS_FLUSH_INTERVAL)
+        
         # إعداد البوت
         application = Application.builder().token(BOT_TOKEN).build()
-        
-        # إضافة معالجات الأوامر
-        application.add_handler(CommandHandler("start", start))
-        application.add_handler(CommandHandler("help", help_command))
-        application.add_handler(CommandHandler("cancel", cancel))
-        
-        # إضافة معالج الرسائل
-        application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, process_youtube_url))
-        
-        # إضافة معالج الأزرار
-        application.add_handler(CallbackQueryHandler(button_callback))
-        
-        # إضافة معالج الأخطاء
-        application.add_error_handler(error_handler)
+        register_handlers(application)
         
         # إضافة مهمة دورية لتنظيف الملفات القديمة
         application.job_queue.run_repeating(cleanup_task, interval=3600, first=0)
@@ -468,13 +823,38 @@ async def main():
         await application.initialize()
         await application.start()
         await application.updater.start_polling(drop_pending_updates=True)
+        BOT_LEADERS.inc()
+        polling = True
+        
+        # استئناف التحميلات التي توقفت بسبب إعادة التشغيل
+        await resume_journaled_jobs(application)
         
-        # الانتظار حتى يتم إيقاف البوت
-        await application.updater.idle()
+        # الانتظار حتى يتم إيقاف البوت أو فقدان ملكية دوره
+        if lease is None:
+            await asyncio.Event().wait()
+        else:
+            loop = asyncio.get_running_loop()
+            while True:
+                await asyncio.sleep(lease.renew_interval)
+                if not await loop.run_in_executor(None, lease.renew):
+                    logger.warning("تم فقدان ملكية تشغيل البوت، جاري الإيقاف...")
+                    demoted = True
+                    break
         
     except Exception as e:
-        logger.error(f"حدث خطأ: {str(e)}")
+        logger.error("حدث خطأ: %s", e)
+    finally:
+        if polling:
+            BOT_LEADERS.dec()
+        if application is not None:
+            if application.updater.running:
+                await application.updater.stop()
+            if demoted:
+                # application.stop ينتظر انتهاء المهام الجارية، فتُسلم قبله
+                await hand_over_downloads()
+            if application.running:
+                await application.stop()
+            await application.shutdown()
 
 if __name__ == '__main__':
-    import asyncio
     asyncio.run(main())
@@ -4,15 +4,14 @@ from typing import Dict, List, Optional, Tuple, Any
 from telegram import InlineKeyboardButton, InlineKeyboardMarkup, Update
 from telegram.ext import ContextTypes, CallbackContext
 
-# إعداد التسجيل
-logging.basicConfig(
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    level=logging.INFO
-)
+from config import USER_SESSION_CACHE_SIZE, USER_SESSION_TTL
+from common.cache import TTLCache
+
 logger = logging.getLogger(__name__)
 
-# قاموس لتخزين معلومات المستخدمين
-user_data_cache = {}
+# جلسات المستخدمين (الرابط ومعلومات الفيديو حتى اختيار التنسيق)، بحد أقصى ومدة صلاحية
+# حتى لا تبقى جلسات من لم يكملوا الاختيار في الذاكرة
+user_data_cache = TTLCache(USER_SESSION_CACHE_SIZE, USER_SESSION_TTL)
 
 def format_size(size_bytes: int) -> str:
     """
@@ -54,7 +53,8 @@ def format_duration(seconds: int) -> str:
     else:
         return f"{minutes:02d}:{seconds:02d}"
 
-def create_format_keyboard(video_info: Any, page: int = 0, items_per_page: int = 5) -> InlineKeyboardMarkup:
+def create_format_keyboard(video_info: Any, page: int = 0, items_per_page: int = 5,
+                           fit_format: Optional[Tuple[str, int]] = None) -> InlineKeyboardMarkup:
     """
     إنشاء لوحة مفاتيح مضمنة لاختيار تنسيق الفيديو.
     
@@ -62,13 +62,14 @@ def create_format_keyboard(video_info: Any, page: int = 0, items_per_page: int =
         video_info: معلومات الفيديو
         page: رقم الصفحة الحالية
         items_per_page: عدد العناصر في كل صفحة
+        fit_format: (معرف التنسيق، الحجم بالبايت) لخيار ضغط الفيديو ليلائم الحجم، إن وُجد
         
     Returns:
         لوحة مفاتيح مضمنة
     """
     # فصل تنسيقات الفيديو والصوت
-    video_formats = [fmt for fmt in video_info.formats if fmt['type'] == 'video']
-    audio_formats = [fmt for fmt in video_info.formats if fmt['type'] == 'audio']
+    video_formats = [fmt for fmt in video_info['formats'] if fmt['type'] == 'video']
+    audio_formats = [fmt for fmt in video_info['formats'] if fmt['type'] == 'audio']
     
     # إنشاء أزرار لتنسيقات الفيديو
     keyboard = []
@@ -83,19 +84,23 @@ def create_format_keyboard(video_info: Any, page: int = 0, items_per_page: int =
     # إضافة أزرار تنسيقات الفيديو
     for i in range(start_idx, end_idx):
         fmt = video_formats[i]
-        size_str = format_size(fmt['filesize']) if fmt['filesize'] > 0 else "غير معروف"
-        button_text = f"🎬 {fmt['resolution']} ({size_str})"
-        callback_data = f"format_{fmt['format_id']}_video"
+        size_str = format_size(fmt['size']) if fmt.get('size') else "غير معروف"
+        button_text = f"🎬 {fmt['quality']} ({size_str})"
+        callback_data = f"format_{fmt['id']}_video"
         keyboard.append([InlineKeyboardButton(button_text, callback_data=callback_data)])
     
+    # خيار الضغط عندما تتجاوز كل التنسيقات حد الإرسال
+    if fit_format is not None:
+        keyboard.append([fit_button(*fit_format)])
+    
     # إضافة عنوان للصوت
     keyboard.append([InlineKeyboardButton("🎵 تنسيقات الصوت", callback_data="header_audio")])
     
     # إضافة أزرار تنسيقات الصوت
     for fmt in audio_formats[:2]:  # عرض أفضل تنسيقين للصوت فقط
-        size_str = format_size(fmt['filesize']) if fmt['filesize'] > 0 else "غير معروف"
-        button_text = f"🎵 {fmt['resolution']} ({size_str})"
-        callback_data = f"format_{fmt['format_id']}_audio"
+        size_str = format_size(fmt['size']) if fmt.get('size') else "غير معروف"
+        button_text = f"🎵 {fmt['quality']} ({size_str})"
+        callback_data = f"format_{fmt['id']}_audio"
         keyboard.append([InlineKeyboardButton(button_text, callback_data=callback_data)])
     
     # إضافة أزرار التنقل بين الصفحات إذا كان هناك المزيد من التنسيقات
@@ -115,6 +120,19 @@ def create_format_keyboard(video_info: Any, page: int = 0, items_per_page: int =
     
     return InlineKeyboardMarkup(keyboard)
 
+def fit_button(format_id: str, max_bytes: int) -> InlineKeyboardButton:
+    """
+    زر خيار ضغط الفيديو ليلائم حجمًا محددًا.
+    
+    Args:
+        format_id: معرف تنسيق "ملاءمة الحجم"
+        max_bytes: الحجم المستهدف بالبايت
+        
+    Returns:
+        زر مضمن
+    """
+    return InlineKeyboardButton(f"📦 ضغط إلى {format_size(max_bytes)}", callback_data=f"format_{format_id}_video")
+
 def create_progress_keyboard() -> InlineKeyboardMarkup:
     """
     إنشاء لوحة مفاتيح مضمنة لإلغاء التحميل.
@@ -125,25 +143,35 @@ def create_progress_keyboard() -> InlineKeyboardMarkup:
     keyboard = [[InlineKeyboardButton("❌ إلغاء التحميل", callback_data="cancel_download")]]
     return InlineKeyboardMarkup(keyboard)
 
-def format_video_info(video_info: Any) -> str:
+def format_video_info(video_info: Any, clip: Optional[Tuple[Optional[int], Optional[int]]] = None,
+                      loading: bool = False) -> str:
     """
     تنسيق معلومات الفيديو لعرضها للمستخدم.
     
     Args:
         video_info: معلومات الفيديو
+        clip: المقطع المطلوب (البداية، النهاية) بالثواني، أو None للفيديو كاملًا
+        loading: معاينة تنتظر قائمة التنسيقات
         
     Returns:
         نص منسق يحتوي على معلومات الفيديو
     """
-    duration_str = format_duration(video_info.duration)
-    views_str = f"{video_info.views:,}" if video_info.views else "غير معروف"
+    duration = int(video_info.get('duration') or 0)
+    duration_str = format_duration(duration)
+    views_str = f"{video_info['views']:,}" if video_info.get('views') else "غير معروف"
+    
+    clip_str = ""
+    if clip:
+        start, end = clip
+        clip_str = f"✂️ *المقطع:* {format_duration(int(start or 0))} - {format_duration(int(end or duration))}\n"
     
     return (
-        f"*🎬 {video_info.title}*\n\n"
-        f"👤 *القناة:* {video_info.author}\n"
+        f"*🎬 {video_info['title']}*\n\n"
+        f"👤 *القناة:* {video_info['channel']}\n"
         f"⏱ *المدة:* {duration_str}\n"
-        f"👁 *المشاهدات:* {views_str}\n\n"
-        f"الرجاء اختيار تنسيق التحميل:"
+        f"👁 *المشاهدات:* {views_str}\n"
+        f"{clip_str}\n"
+        f"{'⏳ جاري تحميل الجودات المتاحة...' if loading else 'الرجاء اختيار تنسيق التحميل:'}"
     )
 
 async def update_progress_message(context: ContextTypes.DEFAULT_TYPE, chat_id: int, message_id: int, 
@@ -193,7 +221,7 @@ async def update_progress_message(context: ContextTypes.DEFAULT_TYPE, chat_id: i
             reply_markup=create_progress_keyboard()
         )
     except Exception as e:
-        logger.error(f"خطأ في تحديث رسالة التقدم: {str(e)}")
+        logger.error("خطأ في تحديث رسالة التقدم: %s", e)
 
 def generate_progress_bar(percent: float, length: int = 10) -> str:
     """
@@ -217,15 +245,14 @@ def clean_user_data(user_id: int) -> None:
     Args:
         user_id: معرف المستخدم
     """
-    if user_id in user_data_cache:
-        del user_data_cache[user_id]
+    user_data_cache.pop(user_id)
 
 async def check_context_type(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """
     دالة للتحقق من نوع context
     """
     if not isinstance(context, CallbackContext):
-        logger.error(f"نوع context غير صحيح: {type(context)}")
+        logger.error("نوع context غير صحيح: %s", type(context))
         return
     
-    logger.info(f"نوع context صحيح: {type(context)}")
+    logger.info("نوع context صحيح: %s", type(context))
@@ -18,14 +18,10 @@ chmod 777 /tmp/youtube-downloader
 echo "FFmpeg version:"
 ffmpeg -version
 
-# تعطيل البوت في النشر الأول حتى يتم إعادة التشغيل
-export BOT_ENABLED=false
-echo "BOT_ENABLED=false" > .env
-echo "تم تعطيل البوت. يرجى تفعيله يدويًا من لوحة تحكم Render."
-
 # إعداد اسم الخدمة لعنوان URL
+# (لم يعد البوت يُعطل هنا: عملية واحدة فقط تشغله عبر اختيار القائد مهما كان عدد عمال gunicorn)
 export RENDER_SERVICE_NAME=$(echo $RENDER_SERVICE_NAME)
-echo "RENDER_SERVICE_NAME=$RENDER_SERVICE_NAME" >> .env
+echo "RENDER_SERVICE_NAME=$RENDER_SERVICE_NAME" > .env
 echo "تم تعيين اسم الخدمة: $RENDER_SERVICE_NAME"
 
 echo "Build script completed successfully!"
@@ -0,0 +1,148 @@
+import time
+import logging
+import threading
+from contextlib import contextmanager
+from typing import Dict, Iterator, Optional
+
+from common.metrics import ADMISSION_REJECTED
+
+logger = logging.getLogger(__name__)
+
+# متوسط مدة الاحتفاظ المفترض قبل توفر قياسات (بالثواني)
+_DEFAULT_HOLD_SECONDS = 5.0
+# وزن القياس الجديد في المتوسط المتحرك لمدة الاحتفاظ
+_EWMA_ALPHA = 0.2
+
+
+class CapacityExceeded(Exception):
+    """
+    رفض طلب لأن سعة المورد وطابور انتظاره ممتلئان (تُعرض كـ 429 في واجهة الويب)
+    """
+
+    def __init__(self, resource: str, retry_after: float):
+        """
+        Args:
+            resource: اسم المورد ('extract' أو 'download' أو 'transcode' أو 'upload')
+            retry_after: الوقت المقدر لتوفر مكان (بالثواني)
+        """
+        super().__init__(f'الخدمة مشغولة حاليًا. الرجاء المحاولة بعد {int(retry_after) + 1} ثانية.')
+        self.resource = resource
+        self.retry_after = retry_after
+
+
+def estimate_wait(position: int, slots: int, average: float) -> float:
+    """
+    الوقت المقدر حتى يبدأ طلب في موقع position من الطابور
+
+    Args:
+        position: موقع الطلب في الطابور (1 = التالي)
+        slots: عدد العمليات المتزامنة للمورد
+        average: متوسط مدة العملية الواحدة بالثواني
+    """
+    return average * position / max(slots, 1)
+
+
+class Capacity:
+    """
+    سعة مورد واحد: عدد محدود من العمليات المتزامنة وطابور انتظار محدود
+
+    يُرفض الطلب بـ CapacityExceeded إذا امتلأ الطابور بدل تراكم الطلبات حتى نفاد الذاكرة أو القرص،
+    ويُقدر وقت إعادة المحاولة من متوسط مدة العمليات الأخيرة.
+    """
+
+    def __init__(self, name: str, limit: int, queue_limit: int = 0):
+        """
+        Args:
+            name: اسم المورد (للمقاييس والرسائل)
+            limit: الحد الأقصى للعمليات المتزامنة
+            queue_limit: الحد الأقصى للطلبات المنتظرة (0 = الرفض فور امتلاء السعة)
+        """
+        self.name = name
+        self.limit = max(limit, 1)
+        self.queue_limit = queue_limit
+        self.active = 0
+        self.waiting = 0
+        self.average_hold = _DEFAULT_HOLD_SECONDS
+        self._cond = threading.Condition()
+
+    def retry_after(self) -> float:
+        """الوقت المقدر لتوفر مكان لطلب جديد (بالثواني)"""
+        return estimate_wait(self.waiting + 1, self.limit, self.average_hold)
+
+    def _reject(self) -> CapacityExceeded:
+        ADMISSION_REJECTED.inc(resource=self.name)
+        logger.warning("رفض طلب %s: %s عملية جارية و%s في الانتظار", self.name, self.active, self.waiting)
+        return CapacityExceeded(self.name, self.retry_after())
+
+    def acquire(self) -> None:
+        """
+        حجز مكان، مع الانتظار في الطابور إذا امتلأت السعة
+
+        Raises:
+            CapacityExceeded: إذا امتلأ طابور الانتظار أيضًا
+        """
+        with self._cond:
+            if self.active >= self.limit:
+                if self.waiting >= self.queue_limit:
+                    raise self._reject()
+                self.waiting += 1
+                try:
+                    while self.active >= self.limit:
+                        self._cond.wait()
+                finally:
+                    self.waiting -= 1
+            self.active += 1
+
+    def try_acquire(self) -> bool:
+        """حجز مكان دون انتظار (False إذا امتلأت السعة)"""
+        with self._cond:
+            if self.active >= self.limit:
+                ADMISSION_REJECTED.inc(resource=self.name)
+                return False
+            self.active += 1
+            return True
+
+    def release(self, held_for: Optional[float] = None) -> None:
+        """
+        تحرير مكان
+
+        Args:
+            held_for: مدة الاحتفاظ بالمكان بالثواني (لتقدير أوقات الانتظار)
+        """
+        with self._cond:
+            self.active -= 1
+            if held_for is not None:
+                self.average_hold += _EWMA_ALPHA * (held_for - self.average_hold)
+            self._cond.notify()
+
+    @contextmanager
+    def hold(self) -> Iterator[None]:
+        """حجز مكان طوال الكتلة (مع الانتظار في الطابور إن لزم)"""
+        self.acquire()
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.release(time.monotonic() - started)
+
+
+_capacities: Dict[str, Capacity] = {}
+_capacities_lock = threading.Lock()
+
+
+def get_capacity(name: str) -> Capacity:
+    """
+    سعة مورد مشتركة في العملية الحالية حسب الإعدادات:
+    'extract' (MAX_CONCURRENT_EXTRACTIONS و MAX_QUEUED_EXTRACTIONS) أو 'upload' (MAX_CONCURRENT_UPLOADS)
+
+    أما سعة التحميل والضغط فيديرها المجدول ومجمع الترميز نفساهما (MAX_QUEUED_JOBS و MAX_QUEUED_TRANSCODES).
+    """
+    with _capacities_lock:
+        if name not in _capacities:
+            from config import MAX_CONCURRENT_EXTRACTIONS, MAX_QUEUED_EXTRACTIONS, MAX_CONCURRENT_UPLOADS
+            limits = {
+                'extract': (MAX_CONCURRENT_EXTRACTIONS, MAX_QUEUED_EXTRACTIONS),
+                'upload': (MAX_CONCURRENT_UPLOADS, 0),
+            }
+            _capacities[name] = Capacity(name, *limits[name])
+        return _capacities[name]
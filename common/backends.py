@@ -0,0 +1,248 @@
+import time
+import logging
+import threading
+import importlib.util
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Callable, Dict, List, Optional, Sequence, TypeVar
+
+from common.admission import Capacity, CapacityExceeded
+from common.cancellation import StageTimeout
+from common.metrics import BACKEND_REQUESTS, BACKEND_SUCCESS_RATE, EXTRACTION_HEDGES, WATCHDOG_KILLS
+from common.tracing import activate, current_trace
+
+logger = logging.getLogger(__name__)
+
+# أسماء الواجهات الخلفية ووحدات بايثون الخاصة بها
+YTDLP = 'yt-dlp'
+PYTUBE = 'pytube'
+_MODULES = {YTDLP: 'yt_dlp', PYTUBE: 'pytube'}
+
+T = TypeVar('T')
+
+
+def installed_backends(preferred: Sequence[str] = (YTDLP, PYTUBE)) -> List[str]:
+    """الواجهات الخلفية المثبتة من preferred بنفس الترتيب"""
+    return [name for name in preferred
+            if name in _MODULES and importlib.util.find_spec(_MODULES[name]) is not None]
+
+
+class _BackendStats:
+    def __init__(self):
+        self.success_rate = 1.0
+        # متوسط زمن النجاح لكل عملية ('preview' أو 'info')
+        self.latency: Dict[str, float] = {}
+        self.last_attempt = 0.0
+
+
+class BackendRouter:
+    """
+    توجيه الطلبات بين الواجهات الخلفية (yt-dlp و pytube) حسب صحتها وقت التشغيل
+
+    يُتتبع لكل واجهة متوسط متحرك لنسبة النجاح ولزمن كل عملية، فتُقدم الواجهة السليمة الأسرع،
+    وتُؤخر الواجهة التي تقل نسبة نجاحها عن min_success. تُجرب الواجهة المؤخرة مرة كل probe_interval
+    ثانية حتى يُكتشف تعافيها، ويُنتقل عند فشل الاستخراج إلى الواجهة التالية.
+
+    مع hedge_delay > 0 تبدأ الواجهة الثانية إذا لم تُجب الأولى خلال ميزانية الزمن
+    (الأكبر من hedge_delay وضعف متوسط زمن الأولى)، وتُعاد أول نتيجة ناجحة.
+    ومع timeout > 0 يُرفع StageTimeout إذا لم تنجح أي محاولة خلاله، فيتحرر المستدعي
+    بينما تكمل المحاولة العالقة في المجمع حتى مهلة الشبكة في الواجهة الخلفية.
+    """
+
+    def __init__(self, backends: Sequence[str], hedge_delay: float = 0.0, probe_interval: float = 60.0,
+                 min_success: float = 0.5, alpha: float = 0.2, hedge_workers: int = 8,
+                 timeout: float = 0.0):
+        """
+        Args:
+            backends: الواجهات الخلفية المتاحة بترتيب التفضيل الابتدائي
+            hedge_delay: الحد الأدنى لميزانية الزمن قبل بدء الواجهة الثانية (0 = بلا تحوط)
+            probe_interval: الفترة بين تجارب الواجهة المؤخرة (بالثواني)
+            min_success: أقل نسبة نجاح تُعد بعدها الواجهة سليمة
+            alpha: وزن كل نتيجة جديدة في المتوسطات المتحركة
+            hedge_workers: عدد خيوط الاستخراج المتحوط أو المحدد بمهلة
+            timeout: المهلة الكلية لكل طلب بالثواني (0 = بلا حد)
+        """
+        if not backends:
+            raise ValueError('لا توجد واجهة خلفية للتحميل (ثبّت yt-dlp أو pytube)')
+        self.backends = list(backends)
+        self.hedge_delay = hedge_delay
+        self.probe_interval = probe_interval
+        self.min_success = min_success
+        self.alpha = alpha
+        self.hedge_workers = hedge_workers
+        self.timeout = timeout
+        self._stats = {name: _BackendStats() for name in self.backends}
+        self._lock = threading.Lock()
+        self._pool: Optional[ThreadPoolExecutor] = None
+
+    def record(self, backend: str, operation: str, ok: bool, seconds: Optional[float] = None) -> None:
+        """
+        تسجيل نتيجة طلب لواجهة خلفية
+
+        Args:
+            backend: اسم الواجهة
+            operation: اسم العملية ('preview' أو 'info' أو 'download')
+            ok: هل نجح الطلب
+            seconds: زمن الطلب الناجح (يُتجاهل لعمليات يختلف زمنها بالحجم مثل التحميل)
+        """
+        with self._lock:
+            stats = self._stats[backend]
+            stats.success_rate += self.alpha * ((1.0 if ok else 0.0) - stats.success_rate)
+            if ok and seconds is not None:
+                previous = stats.latency.get(operation)
+                stats.latency[operation] = seconds if previous is None else \
+                    previous + self.alpha * (seconds - previous)
+            success_rate = stats.success_rate
+        BACKEND_REQUESTS.inc(backend=backend, operation=operation, result='success' if ok else 'failure')
+        BACKEND_SUCCESS_RATE.set(success_rate, backend=backend)
+
+    def ranked(self, operation: str, probe: bool = False) -> List[str]:
+        """
+        الواجهات الخلفية مرتبة من الأفضل: السليمة أولًا ثم الأسرع (حسب الزمن المقسوم على نسبة النجاح)
+
+        Args:
+            operation: العملية التي يُقارن زمنها
+            probe: تقديم واجهة لم تُجرب منذ probe_interval ثانية لاكتشاف تعافيها
+        """
+        with self._lock:
+            def score(name):
+                stats = self._stats[name]
+                latency = stats.latency.get(operation)
+                return (stats.success_rate < self.min_success,
+                        latency / max(stats.success_rate, 0.05) if latency is not None else float('inf'))
+
+            order = sorted(self.backends, key=score)
+            if probe and len(order) > 1:
+                now = time.time()
+                stale = [name for name in order[1:] if now - self._stats[name].last_attempt > self.probe_interval]
+                if stale:
+                    order.remove(stale[0])
+                    order.insert(0, stale[0])
+            return order
+
+    def hedge_budget(self, backend: str, operation: str) -> Optional[float]:
+        """الزمن المنتظر من backend قبل بدء الواجهة التالية (None إذا كان التحوط معطلًا)"""
+        if self.hedge_delay <= 0 or len(self.backends) < 2:
+            return None
+        with self._lock:
+            latency = self._stats[backend].latency.get(operation, 0.0)
+        return max(self.hedge_delay, 2 * latency)
+
+    def _attempt(self, backend: str, operation: str, attempt: Callable[[str], T],
+                 capacity: Optional[Capacity], held: bool = False, trace=None) -> T:
+        # held: حجز المستدعي مكان المحاولة في السعة مسبقًا، ويُحرر هنا
+        if capacity is not None and not held:
+            capacity.acquire()
+        with self._lock:
+            self._stats[backend].last_attempt = time.time()
+        started = time.monotonic()
+        try:
+            with activate(trace):
+                result = attempt(backend)
+        except Exception:
+            self.record(backend, operation, False)
+            raise
+        finally:
+            if capacity is not None:
+                capacity.release(time.monotonic() - started)
+        self.record(backend, operation, True, time.monotonic() - started)
+        return result
+
+    def call(self, operation: str, attempt: Callable[[str], T], capacity: Optional[Capacity] = None) -> T:
+        """
+        تنفيذ attempt(backend) على أفضل واجهة، مع الانتقال إلى التالية عند الفشل والتحوط عند البطء
+
+        Args:
+            operation: اسم العملية لإحصاءات الزمن ('preview' أو 'info')
+            attempt: دالة تنفذ الطلب بواجهة محددة
+            capacity: سعة تُحجز لكل محاولة؛ لا تبدأ محاولة متحوطة إلا إذا بقي فيها مكان فارغ
+
+        Raises:
+            CapacityExceeded: إذا امتلأ طابور السعة
+            StageTimeout: إذا تجاوز الطلب المهلة الكلية
+            Exception: خطأ آخر محاولة إذا فشلت كل الواجهات
+        """
+        order = self.ranked(operation, probe=True)
+        budget = self.hedge_budget(order[0], operation)
+        if budget is None and not self.timeout:
+            last_error: Optional[Exception] = None
+            for backend in order:
+                try:
+                    return self._attempt(backend, operation, attempt, capacity)
+                except CapacityExceeded:
+                    raise
+                except Exception as e:
+                    logger.warning("فشل %s باستخدام %s: %s", operation, backend, e)
+                    last_error = e
+            raise last_error
+
+        trace = current_trace()
+        with self._lock:
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(max_workers=self.hedge_workers, thread_name_prefix='hedge')
+
+        def submit(backend: str, held: bool = False) -> Future:
+            return self._pool.submit(self._attempt, backend, operation, attempt, capacity, held, trace)
+
+        # حجز مكان المحاولة الأولى قبل تسليمها للمجمع، فيُرفض الطلب فورًا إذا امتلأ الطابور
+        # ولا يتجاوز عدد المحاولات في المجمع ضعف السعة
+        if capacity is not None:
+            capacity.acquire()
+        remaining = order[1:]
+        pending = {submit(order[0], held=True)}
+        last_error = None
+        started = time.monotonic()
+        hedge_at = started + budget if budget is not None else None
+        deadline = started + self.timeout if self.timeout else None
+        while pending:
+            wake = min((t for t in (hedge_at, deadline) if t is not None), default=None)
+            timeout = max(wake - time.monotonic(), 0) if wake is not None else None
+            done, pending = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+            if not done:
+                if deadline is not None and time.monotonic() >= deadline:
+                    WATCHDOG_KILLS.inc(stage='extract')
+                    logger.warning("تجاوز %s المهلة (%.0f ثانية)", operation, self.timeout)
+                    raise StageTimeout('extract', 'تجاوز استخراج معلومات الفيديو المهلة المحددة. '
+                                                  'الرجاء المحاولة مرة أخرى.')
+                # تجاوزت الواجهة الأولى ميزانية الزمن: بدء التالية معها إذا سمحت السعة
+                hedge_at = None
+                if capacity is None or capacity.active < capacity.limit:
+                    EXTRACTION_HEDGES.inc(phase=operation)
+                    logger.info("تحوط %s: بدء %s بعد %.1f ثانية", operation, remaining[0], budget)
+                    pending.add(submit(remaining.pop(0)))
+                continue
+            for future in done:
+                try:
+                    return future.result()
+                except CapacityExceeded as e:
+                    last_error = e
+                except Exception as e:
+                    logger.warning("فشل %s: %s", operation, e)
+                    last_error = e
+            # فشلت المحاولات المنتهية: الانتقال إلى الواجهة التالية إن لم تكن قد بدأت
+            if not pending and remaining and not isinstance(last_error, CapacityExceeded):
+                pending.add(submit(remaining.pop(0)))
+            if not remaining:
+                hedge_at = None
+        raise last_error
+
+
+_router: Optional[BackendRouter] = None
+_router_lock = threading.Lock()
+
+
+def get_backend_router() -> BackendRouter:
+    """
+    موجه الواجهات الخلفية المشترك في العملية الحالية
+    (من إعدادات DOWNLOAD_BACKENDS و EXTRACT_HEDGE_DELAY و EXTRACT_TIMEOUT)
+    """
+    global _router
+    with _router_lock:
+        if _router is None:
+            from config import (
+                DOWNLOAD_BACKENDS, EXTRACT_HEDGE_DELAY, BACKEND_PROBE_INTERVAL,
+                MAX_CONCURRENT_EXTRACTIONS, EXTRACT_TIMEOUT
+            )
+            _router = BackendRouter(installed_backends(DOWNLOAD_BACKENDS), EXTRACT_HEDGE_DELAY,
+                                    BACKEND_PROBE_INTERVAL, hedge_workers=2 * MAX_CONCURRENT_EXTRACTIONS,
+                                    timeout=EXTRACT_TIMEOUT)
+        return _router
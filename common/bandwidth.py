@@ -0,0 +1,148 @@
+import time
+import threading
+from typing import Dict, List, Optional
+
+from common.cancellation import CancelToken
+from common.rate_limit import TokenBucket
+
+# الاتجاهات المدعومة: تحميل من يوتيوب، ورفع إلى المستخدمين (ملفات الويب وإرسال تلغرام)
+DIRECTIONS = ('download', 'upload')
+
+# مدة الدفعة المسموحة فوق الحصة (بالثواني من معدل الحصة)
+BURST_SECONDS = 1.0
+
+
+class Allocation:
+    """
+    حصة مهمة واحدة من عرض النطاق في اتجاه معين، يُعاد حسابها عند بدء وانتهاء المهام الأخرى
+    """
+
+    def __init__(self, manager: 'BandwidthManager', direction: str, weight: float):
+        self.manager = manager
+        self.direction = direction
+        self.weight = weight
+        # المعدل الحالي بالبايت في الثانية (None = بلا حد)
+        self.rate: Optional[float] = None
+        self._bucket: Optional[TokenBucket] = None
+
+    def _set_rate(self, rate: Optional[float]) -> None:
+        self.rate = rate
+        if rate is None:
+            self._bucket = None
+        elif self._bucket is None:
+            self._bucket = TokenBucket(rate, rate * BURST_SECONDS)
+        else:
+            # الحفاظ على الرموز المتراكمة مع تعديل المعدل والسعة
+            self._bucket.rate = rate
+            self._bucket.capacity = rate * BURST_SECONDS
+            self._bucket.tokens = min(self._bucket.tokens, self._bucket.capacity)
+
+    def throttle(self, nbytes: int, cancel_token: Optional[CancelToken] = None) -> None:
+        """
+        الانتظار حتى تسمح الحصة بنقل nbytes (لا شيء إذا لم يكن هناك حد)
+
+        Args:
+            nbytes: عدد البايتات المنقولة أو المراد نقلها
+            cancel_token: رمز إلغاء يوقف الانتظار فورًا
+        """
+        remaining = nbytes
+        while remaining > 0:
+            bucket = self._bucket
+            if bucket is None:
+                return
+            # الكتل الأكبر من سعة الدلو تُستهلك على أجزاء
+            piece = min(remaining, bucket.capacity)
+            allowed, wait = bucket.try_consume(piece)
+            if allowed:
+                remaining -= piece
+                continue
+            wait = min(wait, BURST_SECONDS)
+            if cancel_token is not None:
+                if cancel_token.wait(wait):
+                    return
+            else:
+                time.sleep(wait)
+
+    def release(self) -> None:
+        self.manager._release(self)
+
+    def __enter__(self) -> 'Allocation':
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.release()
+
+
+class BandwidthManager:
+    """
+    مدير عرض النطاق: حد عام للتحميل وحد عام للرفع يُقسم على المهام النشطة بالتناسب مع أوزانها
+
+    كل مهمة تحصل على حصة = الحد × وزنها / مجموع أوزان المهام النشطة، وتُعاد الحصص عند
+    بدء أي مهمة أو انتهائها. مهام الصوت (صغيرة وتفاعلية) تحصل على وزن أعلى.
+    """
+
+    def __init__(self, download_limit: float = 0, upload_limit: float = 0, audio_weight: float = 1.0):
+        """
+        Args:
+            download_limit: الحد العام للتحميل بالبايت في الثانية (0 = بلا حد)
+            upload_limit: الحد العام للرفع بالبايت في الثانية (0 = بلا حد)
+            audio_weight: وزن مهام الصوت مقارنة بالفيديو (وزن 1)
+        """
+        self.limits: Dict[str, float] = {'download': download_limit, 'upload': upload_limit}
+        self.audio_weight = audio_weight
+        self._allocations: Dict[str, List[Allocation]] = {direction: [] for direction in DIRECTIONS}
+        self._lock = threading.Lock()
+
+    def allocate(self, direction: str, media_type: str = 'video') -> Allocation:
+        """
+        حجز حصة لمهمة جديدة وإعادة توزيع الحصص
+
+        Args:
+            direction: 'download' أو 'upload'
+            media_type: 'video' أو 'audio' (لتحديد الوزن)
+
+        Returns:
+            الحصة (تُحرر بـ release أو بالخروج من كتلة with)
+        """
+        weight = self.audio_weight if media_type == 'audio' else 1.0
+        allocation = Allocation(self, direction, weight)
+        with self._lock:
+            self._allocations[direction].append(allocation)
+            self._redistribute(direction)
+        return allocation
+
+    def _release(self, allocation: Allocation) -> None:
+        with self._lock:
+            allocations = self._allocations[allocation.direction]
+            if allocation not in allocations:
+                return
+            allocations.remove(allocation)
+            self._redistribute(allocation.direction)
+
+    def _redistribute(self, direction: str) -> None:
+        """
+        إعادة حساب الحصص وتطبيقها (تحت _lock، حتى لا تطبق إعادة توزيع أقدم حصصًا أكبر
+        بعد أحدث منها فيتجاوز مجموع المعدلات الحد العام)
+        """
+        limit = self.limits[direction]
+        allocations = self._allocations[direction]
+        total_weight = sum(allocation.weight for allocation in allocations)
+        for allocation in allocations:
+            allocation._set_rate(limit * allocation.weight / total_weight if limit > 0 else None)
+
+
+_bandwidth: Optional[BandwidthManager] = None
+_bandwidth_lock = threading.Lock()
+
+
+def get_bandwidth() -> BandwidthManager:
+    """
+    مدير عرض النطاق المشترك للعملية (البوت وواجهة الويب يتقاسمان نفس الحدود)
+    """
+    global _bandwidth
+    with _bandwidth_lock:
+        if _bandwidth is None:
+            from config import BANDWIDTH_DOWNLOAD_LIMIT, BANDWIDTH_UPLOAD_LIMIT, BANDWIDTH_AUDIO_WEIGHT
+            _bandwidth = BandwidthManager(BANDWIDTH_DOWNLOAD_LIMIT, BANDWIDTH_UPLOAD_LIMIT,
+                                          BANDWIDTH_AUDIO_WEIGHT)
+        return _bandwidth
@@ -0,0 +1,123 @@
+import time
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional
+
+
+class TTLCache:
+    """
+    ذاكرة مؤقتة آمنة للخيوط بحد أقصى للحجم ومدة صلاحية للعناصر (LRU)
+    """
+
+    def __init__(self, maxsize: int = 256, ttl: float = 600):
+        """
+        Args:
+            maxsize: الحد الأقصى لعدد العناصر
+            ttl: مدة صلاحية العنصر بالثواني
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: 'OrderedDict[Hashable, tuple]' = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """إرجاع القيمة المخزنة أو القيمة الافتراضية إذا لم توجد أو انتهت صلاحيتها"""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._data[key]
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: Hashable, value: Any) -> None:
+        """تخزين قيمة مع حذف الأقدم عند تجاوز الحجم"""
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        """حذف عنصر وإرجاع قيمته"""
+        with self._lock:
+            entry = self._data.pop(key, None)
+        return entry[1] if entry is not None else default
+
+    def prune(self) -> int:
+        """حذف العناصر المنتهية صلاحيتها (التي لا تُحذف إلا عند قراءتها أو تجاوز الحجم) وإرجاع عددها"""
+        now = time.monotonic()
+        with self._lock:
+            expired = [key for key, (expires_at, _) in self._data.items() if expires_at < now]
+            for key in expired:
+                del self._data[key]
+        return len(expired)
+
+    def __contains__(self, key: Hashable) -> bool:
+        with self._lock:
+            entry = self._data.get(key)
+            return entry is not None and entry[0] >= time.monotonic()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class _Call:
+    """طلب قيد التنفيذ ينتظره المستدعون المتزامنون"""
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+
+
+class SingleFlight:
+    """
+    دمج الطلبات المتزامنة لنفس المفتاح في تنفيذ واحد يتشارك المستدعون نتيجته
+    """
+
+    def __init__(self):
+        self._calls: Dict[Hashable, _Call] = {}
+        self._lock = threading.Lock()
+
+    def do(self, key: Hashable, fn: Callable[[], Any]) -> Any:
+        """
+        تنفيذ الدالة مرة واحدة لكل مفتاح نشط
+
+        Args:
+            key: مفتاح الطلب
+            fn: الدالة المراد تنفيذها
+
+        Returns:
+            نتيجة الدالة (أو يُعاد رفع الاستثناء نفسه لجميع المنتظرين)
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.event.set()
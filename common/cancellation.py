@@ -0,0 +1,121 @@
+import logging
+import threading
+import subprocess
+from typing import Callable, List, Optional, Sequence
+
+logger = logging.getLogger(__name__)
+
+
+class JobCancelled(Exception):
+    """تُرفع داخل خيط المهمة عند إلغائها"""
+
+
+class StageTimeout(JobCancelled):
+    """
+    تُرفع عند إيقاف مرحلة عالقة أو متجاوزة لمهلتها (استخراج، تحميل، معالجة لاحقة، رفع)
+
+    ترث JobCancelled حتى تُحذف الملفات الجزئية كما في الإلغاء، لكن المهمة تُعد فاشلة لا ملغاة.
+    """
+
+    def __init__(self, stage: str, message: str):
+        """
+        Args:
+            stage: اسم المرحلة
+            message: سبب الإيقاف للمستخدم
+        """
+        super().__init__(message)
+        self.stage = stage
+
+
+class CancelToken:
+    """
+    رمز إلغاء تعاوني يُمرر من المهمة إلى المحمل
+
+    يتحقق المحمل منه في دوال التقدم (check)، وتسجل العمليات الطويلة مثل FFmpeg
+    دالة تُستدعى فور الإلغاء (add_callback) لإيقافها دون انتظار.
+    """
+
+    def __init__(self):
+        self._event = threading.Event()
+        self._error: Optional[JobCancelled] = None
+        self._callbacks: List[Callable[[], None]] = []
+        self._lock = threading.Lock()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+    def cancel(self, error: Optional[JobCancelled] = None) -> bool:
+        """
+        طلب الإلغاء وتنفيذ الدوال المسجلة
+
+        Args:
+            error: الاستثناء الذي يرفعه check بدل JobCancelled (مثل StageTimeout من المراقب)
+
+        Returns:
+            False إذا كان الرمز ملغى مسبقًا
+        """
+        with self._lock:
+            if self._event.is_set():
+                return False
+            self._error = error
+            self._event.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception as e:
+                logger.error("خطأ في تنفيذ دالة الإلغاء: %s", e)
+        return True
+
+    def check(self) -> None:
+        """رفع JobCancelled (أو سبب الإلغاء المحدد) إذا طُلب الإلغاء"""
+        if self._event.is_set():
+            raise self._error or JobCancelled()
+
+    def wait(self, timeout: float) -> bool:
+        """الانتظار حتى timeout ثانية أو حتى الإلغاء (أيهما أسبق) وإرجاع حالة الإلغاء"""
+        return self._event.wait(timeout)
+
+    def add_callback(self, callback: Callable[[], None]) -> None:
+        """تسجيل دالة تُستدعى عند الإلغاء (فورًا إذا كان الرمز ملغى)"""
+        with self._lock:
+            if not self._event.is_set():
+                self._callbacks.append(callback)
+                return
+        callback()
+
+    def remove_callback(self, callback: Callable[[], None]) -> None:
+        with self._lock:
+            if callback in self._callbacks:
+                self._callbacks.remove(callback)
+
+
+def run_cancellable(cmd: Sequence[str], cancel_token: Optional[CancelToken] = None) -> None:
+    """
+    تشغيل أمر خارجي (مثل FFmpeg) مع إيقافه فور إلغاء المهمة
+
+    Args:
+        cmd: الأمر ومعاملاته
+        cancel_token: رمز الإلغاء (اختياري)
+
+    Raises:
+        JobCancelled: إذا أُلغيت المهمة أثناء التشغيل
+        subprocess.CalledProcessError: إذا انتهى الأمر برمز خطأ
+    """
+    if cancel_token is not None:
+        cancel_token.check()
+
+    process = subprocess.Popen(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    if cancel_token is not None:
+        cancel_token.add_callback(process.kill)
+    try:
+        _, stderr = process.communicate()
+    finally:
+        if cancel_token is not None:
+            cancel_token.remove_callback(process.kill)
+
+    if cancel_token is not None:
+        cancel_token.check()
+    if process.returncode != 0:
+        raise subprocess.CalledProcessError(process.returncode, cmd, stderr=stderr)
@@ -1,37 +1,92 @@
 import os
+import re
 import logging
 import subprocess
-import re
 import time
 import shutil
-from typing import Dict, List, Optional, Tuple, Union
+from typing import Callable, Dict, List, Optional, Tuple, Union
+
+from common.admission import CapacityExceeded, get_capacity
+from common.backends import PYTUBE, YTDLP, BackendRouter, get_backend_router
+from common.bandwidth import Allocation, BandwidthManager
+from common.cache import TTLCache, SingleFlight
+from common.cancellation import CancelToken, JobCancelled, run_cancellable
+from common.extract_pool import get_extraction_pool
+from common.logging_setup import LogThrottle
+from common.tracing import begin as begin_span, current_trace, span
+from common.watchdog import get_watchdog
+from common.transcode import Transcoder, get_transcoder, parse_fit_format, smallest_video_format
+from common.metrics import (
+    EXTRACTION_SECONDS, DOWNLOAD_BYTES, DOWNLOAD_THROUGHPUT,
+    POSTPROCESS_SECONDS, CACHE_REQUESTS, CLEANUP_EVICTIONS
+)
+from common.url_parser import VideoKey, parse_youtube_url
 
-# استيراد المكتبات
+# استيراد المكتبات: تُستخدم المثبتة منهما ويختار BackendRouter بينهما وقت التشغيل
 try:
     import yt_dlp as youtube_dl
-    USE_YT_DLP = True
-    logging.info("تم استخدام yt-dlp للتحميل")
 except ImportError:
+    youtube_dl = None
+try:
     import pytube
-    USE_YT_DLP = False
-    logging.info("تم استخدام pytube للتحميل")
+except ImportError:
+    pytube = None
 
-# إعداد التسجيل
-logging.basicConfig(
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    level=logging.INFO
-)
 logger = logging.getLogger(__name__)
+# مسجل رسائل yt-dlp (رسائل الشاشة بمستوى debug، والتحذيرات والأخطاء بمستوياتها)
+YTDLP_LOGGER = logging.getLogger('yt_dlp')
+
+# دالة التقدم: (البايتات المحملة، الحجم الكلي، الوقت المتبقي بالثواني)
+ProgressCallback = Callable[[int, int, int], None]
+
+# مقطع زمني من الفيديو: (البداية، النهاية أو None حتى نهاية الفيديو) بالثواني
+ClipRange = Tuple[float, Optional[float]]
+
+# لاحقة ملفات المقاطع، حتى لا تُعامل كفيديو كامل عند استخراج الصوت منها
+CLIP_SUFFIX = '.clip'
+
+# دوال الاستخراج لكل (واجهة خلفية، عملية)، تُنفذ بالاسم في مجمع العمليات
+_EXTRACTORS = {
+    (YTDLP, 'preview'): '_get_video_preview_ytdlp',
+    (YTDLP, 'info'): '_get_video_info_ytdlp',
+    (PYTUBE, 'preview'): '_get_video_preview_pytube',
+    (PYTUBE, 'info'): '_get_video_info_pytube',
+}
 
 class YouTubeDownloader:
-    def __init__(self, download_path: str):
+    def __init__(self, download_path: str, info_cache_size: int = 256, info_cache_ttl: int = 600,
+                 bandwidth: Optional[BandwidthManager] = None, transcoder: Optional[Transcoder] = None,
+                 router: Optional[BackendRouter] = None):
         """
         تهيئة محمل يوتيوب
         
         Args:
             download_path: مسار مجلد التحميل
+            info_cache_size: الحد الأقصى لعدد الفيديوهات في ذاكرة المعلومات المؤقتة
+            info_cache_ttl: مدة صلاحية معلومات الفيديو المخزنة بالثواني
+            bandwidth: مدير عرض النطاق الذي تُحجز منه حصة كل تحميل (افتراضيًا بلا حدود)
+            transcoder: مجمع الترميز لخيار "ملاءمة الحجم" (افتراضيًا get_transcoder() عند أول استخدام)
+            router: موجه الطلبات بين yt-dlp و pytube (افتراضيًا get_backend_router())
         """
         self.download_path = download_path
+        self.bandwidth = bandwidth or BandwidthManager()
+        self.transcoder = transcoder
+        self.router = router or get_backend_router()
+        # مراقب المراحل العالقة (توقف التحميل ومهلة المعالجة اللاحقة)
+        self.watchdog = get_watchdog()
+        # سطور تقدم التحميل في السجل: سطر لكل ملف كل LOG_PROGRESS_INTERVAL ثانية بدل سطر لكل دفعة
+        from config import LOG_PROGRESS_INTERVAL
+        self.progress_log = LogThrottle(LOG_PROGRESS_INTERVAL)
+        logger.info("الواجهات الخلفية المتاحة للتحميل: %s", ', '.join(self.router.backends))
+        # مجمع عمليات الاستخراج مع EXTRACT_EXECUTOR=process (None = الاستخراج في خيوط هذه العملية)
+        self.extract_pool = get_extraction_pool(*self._extractor_factory())
+        
+        # ذاكرة مؤقتة لمعلومات الفيديو ودمج الطلبات المتزامنة، مفتاحها VideoKey
+        self.info_cache = TTLCache(maxsize=info_cache_size, ttl=info_cache_ttl)
+        self._inflight_info = SingleFlight()
+        # المعلومات الأساسية السريعة (دون قائمة التنسيقات) لعرض معاينة فورية
+        self.preview_cache = TTLCache(maxsize=info_cache_size, ttl=info_cache_ttl)
+        self._inflight_preview = SingleFlight()
         
         # التحقق من وجود FFmpeg
         self.has_ffmpeg = self._check_ffmpeg()
@@ -62,17 +117,144 @@ class YouTubeDownloader:
         Returns:
             قاموس يحتوي على معلومات الفيديو
         """
-        logger.info(f"جاري استخراج معلومات الفيديو من: {url}")
+        key = parse_youtube_url(url)
+        if key is None:
+            return self._extract_video_info(url)
+        
+        # معلومات الفيديو لا تتأثر بقائمة التشغيل أو وقت البدء
+        cache_key = key.for_video()
+        video_info = self.info_cache.get(cache_key)
+        if video_info is not None:
+            CACHE_REQUESTS.inc(cache='video_info', result='hit')
+            return video_info
+        
+        CACHE_REQUESTS.inc(cache='video_info', result='miss')
+        return self._inflight_info.do(cache_key, lambda: self._extract_and_cache(cache_key))
+    
+    def get_video_preview(self, url: str) -> Dict:
+        """
+        الحصول على المعلومات الأساسية للفيديو بسرعة (العنوان والقناة والمدة والصورة المصغرة)
+        
+        يتخطى الاستخراج الخفيف حل تواقيع التنسيقات وفرزها، وهو الجزء الأبطأ من get_video_info،
+        فتُعرض المعاينة فورًا بينما تُحمل قائمة التنسيقات في الخلفية.
+        
+        Args:
+            url: رابط الفيديو
+            
+        Returns:
+            قاموس المعلومات الأساسية، أو المعلومات الكاملة (مع formats) إذا كانت مخزنة
+        """
+        key = parse_youtube_url(url)
+        if key is None:
+            return self._extract_video_preview(url)
+        
+        cache_key = key.for_video()
+        video_info = self.info_cache.get(cache_key)
+        if video_info is None:
+            video_info = self.preview_cache.get(cache_key)
+        if video_info is not None:
+            CACHE_REQUESTS.inc(cache='video_preview', result='hit')
+            return video_info
+        
+        CACHE_REQUESTS.inc(cache='video_preview', result='miss')
+        return self._inflight_preview.do(cache_key, lambda: self._extract_preview_and_cache(cache_key))
+    
+    def _extract_preview_and_cache(self, key: VideoKey) -> Dict:
+        """استخراج المعلومات الأساسية وتخزينها في الذاكرة المؤقتة"""
+        preview = self._extract_video_preview(key.watch_url)
+        if not preview.get('thumbnail'):
+            preview['thumbnail'] = f"https://i.ytimg.com/vi/{key.video_id}/hqdefault.jpg"
+        self.preview_cache.set(key, preview)
+        return preview
+    
+    def _extract_video_preview(self, url: str) -> Dict:
+        """استخراج المعلومات الأساسية من الواجهة الخلفية الأسلم حاليًا"""
+        def attempt(backend: str) -> Dict:
+            with EXTRACTION_SECONDS.time(backend=backend, phase='preview'):
+                return self._extract_with(backend, 'preview', url)
         
         try:
-            if USE_YT_DLP:
-                return self._get_video_info_ytdlp(url)
-            else:
-                return self._get_video_info_pytube(url)
+            with span('extract:preview'):
+                return self.router.call('preview', attempt, get_capacity('extract'))
+        except Exception as e:
+            logger.error("خطأ في استخراج المعلومات الأساسية للفيديو: %s", e)
+            raise
+    
+    def _get_video_preview_ytdlp(self, url: str) -> Dict:
+        """المعلومات الأساسية باستخدام yt-dlp دون تحميل مشغل JavaScript ودون معالجة التنسيقات"""
+        ydl_opts = {
+            'quiet': True,
+            'no_warnings': True,
+            'skip_download': True,
+            'ignoreerrors': True,
+            # مشغل JavaScript لازم لفك تواقيع روابط التنسيقات فقط، لا للعنوان والمدة
+            'extractor_args': {'youtube': {'player_skip': ['js']}},
+        }
+        
+        with self._create_ydl(ydl_opts) as ydl:
+            # process=False يتخطى اختيار التنسيقات وفرزها
+            info = ydl.extract_info(url, download=False, process=False)
+            if info is None:
+                raise ValueError("لم يتم العثور على معلومات الفيديو")
+            thumbnails = [thumb['url'] for thumb in info.get('thumbnails') or [] if thumb.get('url')]
+            return {
+                'title': info.get('title', 'فيديو بدون عنوان'),
+                'thumbnail': info.get('thumbnail') or (thumbnails[-1] if thumbnails else ''),
+                'duration': info.get('duration', 0),
+                'channel': info.get('uploader', 'غير معروف'),
+            }
+    
+    def _get_video_preview_pytube(self, url: str) -> Dict:
+        """المعلومات الأساسية باستخدام pytube (من استجابة المشغل دون قراءة التدفقات)"""
+        yt = pytube.YouTube(url)
+        return {
+            'title': yt.title,
+            'thumbnail': yt.thumbnail_url,
+            'duration': yt.length,
+            'channel': yt.author,
+        }
+    
+    def _extract_and_cache(self, key: VideoKey) -> Dict:
+        """استخراج معلومات الفيديو وتخزينها في الذاكرة المؤقتة"""
+        video_info = self._extract_video_info(key.watch_url)
+        self.info_cache.set(key, video_info)
+        return video_info
+    
+    def _extract_video_info(self, url: str) -> Dict:
+        """استخراج معلومات الفيديو من الواجهة الخلفية الأسلم حاليًا"""
+        logger.info("جاري استخراج معلومات الفيديو من: %s", url)
+        
+        def attempt(backend: str) -> Dict:
+            with EXTRACTION_SECONDS.time(backend=backend, phase='full'):
+                return self._extract_with(backend, 'info', url)
+        
+        try:
+            with span('extract'):
+                return self.router.call('info', attempt, get_capacity('extract'))
         except Exception as e:
-            logger.error(f"خطأ في استخراج معلومات الفيديو: {str(e)}")
+            logger.error("خطأ في استخراج معلومات الفيديو: %s", e)
             raise
     
+    def _extract_with(self, backend: str, operation: str, url: str) -> Dict:
+        """تنفيذ الاستخراج بواجهة خلفية محددة، في مجمع العمليات إن كان مفعلًا"""
+        method = _EXTRACTORS[(backend, operation)]
+        if self.extract_pool is not None:
+            return self.extract_pool.run(method, url)
+        return getattr(self, method)(url)
+    
+    def _extractor_factory(self) -> Tuple[Callable, tuple]:
+        """
+        طريقة إنشاء مستخرج مكافئ في عمليات المجمع: (صنف أو دالة قابلة للاستيراد، معاملاتها)
+        
+        يكفي YouTubeDownloader لأن دوال الاستخراج لا تعتمد على حالة المحمل؛ تعيد تعريفها الأصناف
+        الفرعية التي تغير الاستخراج (مثل مستخرج أدوات القياس).
+        """
+        return YouTubeDownloader, (self.download_path,)
+    
+    def _create_ydl(self, ydl_opts: Dict) -> 'youtube_dl.YoutubeDL':
+        """إنشاء كائن YoutubeDL (نقطة توسعة تستخدمها أدوات القياس لاستبدال المستخرج)"""
+        return youtube_dl.YoutubeDL(ydl_opts)
+    
     def _get_video_info_ytdlp(self, url: str) -> Dict:
         """الحصول على معلومات الفيديو باستخدام yt-dlp"""
         ydl_opts = {
@@ -83,7 +265,7 @@ class YouTubeDownloader:
             'ignoreerrors': True,
         }
         
-        with youtube_dl.YoutubeDL(ydl_opts) as ydl:
+        with self._create_ydl(ydl_opts) as ydl:
             try:
                 info = ydl.extract_info(url, download=False)
                 if info is None:
@@ -143,7 +325,7 @@ class YouTubeDownloader:
                     'formats': formats
                 }
             except Exception as e:
-                logger.error(f"خطأ في yt-dlp: {str(e)}")
+                logger.error("خطأ في yt-dlp: %s", e)
                 raise
     
     def _get_video_info_pytube(self, url: str) -> Dict:
@@ -184,53 +366,108 @@ class YouTubeDownloader:
                 'formats': formats
             }
         except Exception as e:
-            logger.error(f"خطأ في pytube: {str(e)}")
+            logger.error("خطأ في pytube: %s", e)
             raise
     
-    def download_video(self, url: str, format_id: str) -> Optional[str]:
+    def download_video(self, url: str, format_id: str,
+                       progress_callback: Optional[ProgressCallback] = None,
+                       output_name: Optional[str] = None,
+                       cancel_token: Optional[CancelToken] = None,
+                       start_time: Optional[float] = None,
+                       end_time: Optional[float] = None) -> Optional[str]:
         """
         تحميل الفيديو
         
         Args:
             url: رابط الفيديو
-            format_id: معرف التنسيق
+            format_id: معرف التنسيق، أو fit:<ميجابايت> لضغط الفيديو ليلائم هذا الحجم
+            progress_callback: دالة اختيارية تُستدعى بتقدم التحميل (محمل، كلي، متبقي)
+            output_name: اسم ثابت لملف الإخراج (مثل معرف المهمة) يسمح باستئناف الملف الجزئي
+                عند إعادة تشغيل نفس المهمة؛ افتراضيًا طابع زمني
+            cancel_token: رمز إلغاء يوقف التحميل ويحذف الملفات الجزئية
+            start_time: بداية المقطع المطلوب بالثواني (افتراضيًا بداية الفيديو)
+            end_time: نهاية المقطع المطلوب بالثواني (افتراضيًا نهاية الفيديو)
             
         Returns:
             مسار الملف المحمل أو None في حالة الفشل
+            
+        Raises:
+            JobCancelled: إذا أُلغي التحميل
         """
-        logger.info(f"بدء تحميل الفيديو من {url} بتنسيق {format_id}")
+        logger.info("بدء تحميل الفيديو من %s بتنسيق %s", url, format_id)
+        url = self._normalize_url(url)
+        output_name = output_name or str(int(time.time()))
+        clip = self._clip_range(start_time, end_time)
         
         try:
-            if USE_YT_DLP:
-                return self._download_video_ytdlp(url, format_id)
-            else:
-                return self._download_video_pytube(url, format_id)
+            if cancel_token is not None:
+                cancel_token.check()
+            max_bytes = parse_fit_format(format_id)
+            if max_bytes is not None:
+                return self._download_fitted(url, max_bytes, progress_callback, output_name, cancel_token, clip)
+            backend = self._download_backend(format_id)
+            # حصة من الحد العام للتحميل طوال مدة جلب الملف
+            with self.watchdog.stage(self._download_stage(backend, clip), cancel_token), \
+                    self.bandwidth.allocate('download', 'video') as allocation:
+                if backend == YTDLP:
+                    file_path = self._download_video_ytdlp(url, format_id, progress_callback, output_name,
+                                                           cancel_token, allocation, clip)
+                    self.router.record(backend, 'download', file_path is not None)
+                    return file_path
+                file_path = self._download_video_pytube(url, format_id, progress_callback, output_name,
+                                                        cancel_token, allocation)
+                self.router.record(backend, 'download', file_path is not None)
+            # pytube لا يحمل أجزاء من الملف، فيُقص المقطع بعد تحميله كاملًا
+            if file_path and clip:
+                file_path = self._trim_media(file_path, clip, cancel_token)
+            return file_path
+        except JobCancelled:
+            logger.info("تم إلغاء تحميل الفيديو %s", output_name)
+            self._remove_output_files('video', output_name)
+            raise
+        except CapacityExceeded:
+            # طابور الضغط ممتلئ: يصل السبب إلى المستخدم بدل "فشل التحميل"
+            self._remove_output_files('video', output_name)
+            raise
         except Exception as e:
-            logger.error(f"خطأ في تحميل الفيديو: {str(e)}")
+            logger.error("خطأ في تحميل الفيديو: %s", e)
             # طباعة تفاصيل الخطأ للتصحيح
             import traceback
             logger.error(traceback.format_exc())
             return None
     
-    def _download_video_ytdlp(self, url: str, format_id: str) -> Optional[str]:
+    def _download_video_ytdlp(self, url: str, format_id: str,
+                        progress_callback: Optional[ProgressCallback],
+                        output_name: str, cancel_token: Optional[CancelToken] = None,
+                        allocation: Optional[Allocation] = None,
+                        clip: Optional[ClipRange] = None) -> Optional[str]:
         """تحميل الفيديو باستخدام yt-dlp"""
-        # إنشاء اسم ملف فريد
-        timestamp = int(time.time())
-        output_template = os.path.join(self.download_path, f'video_{timestamp}_%(id)s.%(ext)s')
+        # اسم ملف ثابت لكل مهمة حتى يُستأنف الملف الجزئي، مع تمييز المقاطع عن الفيديو الكامل
+        clip_options = self._clip_options(clip)
+        suffix = CLIP_SUFFIX if clip_options else ''
+        output_template = os.path.join(self.download_path, f'video_{output_name}_%(id)s{suffix}.%(ext)s')
         
         ydl_opts = {
             'format': format_id,
             'outtmpl': output_template,
             'quiet': False,
             'no_warnings': False,
+            # رسائل yt-dlp عبر التسجيل المركزي، دون سطر تقدم لكل دفعة على stdout
+            'logger': YTDLP_LOGGER,
+            'noprogress': True,
             'ignoreerrors': True,
             'nooverwrites': True,
-            'progress_hooks': [self._progress_hook],
+            # استئناف ملفات .part الجزئية لنفس المهمة بعد إعادة التشغيل
+            'continuedl': True,
+            'progress_hooks': self._progress_hooks(progress_callback, 'video', cancel_token, allocation),
+            'postprocessor_hooks': self._postprocessor_hooks(cancel_token),
+            **clip_options,
         }
         
         try:
-            with youtube_dl.YoutubeDL(ydl_opts) as ydl:
-                logger.info(f"بدء تحميل الفيديو باستخدام yt-dlp: {url}")
+            with self._create_ydl(ydl_opts) as ydl:
+                logger.info("بدء تحميل الفيديو باستخدام yt-dlp: %s", url)
+                begin_span('extract')
                 info = ydl.extract_info(url, download=True)
                 
                 if info is None:
@@ -241,94 +478,214 @@ class YouTubeDownloader:
                 if 'requested_downloads' in info and info['requested_downloads']:
                     file_path = info['requested_downloads'][0].get('filepath')
                     if file_path and os.path.exists(file_path):
-                        logger.info(f"تم تحميل الفيديو بنجاح: {file_path}")
+                        logger.info("تم تحميل الفيديو بنجاح: %s", file_path)
                         return file_path
                 
                 # محاولة بديلة للعثور على الملف
                 video_id = info.get('id', '')
                 ext = info.get('ext', 'mp4')
-                expected_file = os.path.join(self.download_path, f'video_{timestamp}_{video_id}.{ext}')
+                expected_file = os.path.join(self.download_path, f'video_{output_name}_{video_id}{suffix}.{ext}')
                 
                 if os.path.exists(expected_file):
-                    logger.info(f"تم العثور على الملف المحمل: {expected_file}")
+                    logger.info("تم العثور على الملف المحمل: %s", expected_file)
                     return expected_file
                 
                 logger.error("لم يتم العثور على الملف المحمل")
                 return None
+        except youtube_dl.utils.DownloadCancelled:
+            # سبب الإلغاء (من المستخدم أو من المراقب) محفوظ في الرمز
+            if cancel_token is not None:
+                cancel_token.check()
+            raise JobCancelled()
         except Exception as e:
-            logger.error(f"خطأ في yt-dlp أثناء التحميل: {str(e)}")
+            logger.error("خطأ في yt-dlp أثناء التحميل: %s", e)
             return None
     
-    def _download_video_pytube(self, url: str, format_id: str) -> Optional[str]:
+    def _download_fitted(self, url: str, max_bytes: int,
+                         progress_callback: Optional[ProgressCallback],
+                         output_name: str, cancel_token: Optional[CancelToken] = None,
+                         clip: Optional[ClipRange] = None) -> Optional[str]:
+        """
+        تحميل أصغر تنسيق فيديو وضغطه ليلائم max_bytes، أو استخدام نتيجة مخزنة لنفس الملاءمة
+        
+        Returns:
+            مسار ملف الإخراج (رابط صلب أو نسخة من النتيجة المخزنة) أو None في حالة الفشل
+        """
+        if not self.has_ffmpeg:
+            logger.error("ضغط الفيديو ليلائم الحجم يتطلب FFmpeg")
+            return None
+        if self.transcoder is None:
+            self.transcoder = get_transcoder()
+        
+        key = parse_youtube_url(url)
+        video_id = key.video_id if key is not None else output_name
+        output_path = os.path.join(self.download_path, f'video_{output_name}_{video_id}.fit.mp4')
+        
+        fitted = self.transcoder.cached(video_id, max_bytes, clip)
+        if fitted is None:
+            video_info = self.get_video_info(url)
+            duration = video_info.get('duration') or 0
+            if clip:
+                start, end = clip
+                duration = min(end or duration, duration) - start
+            source_format = smallest_video_format(video_info)
+            if source_format is None:
+                logger.error("لا يوجد تنسيق فيديو لضغطه")
+                return None
+            
+            backend = self._download_backend(source_format['id'])
+            with self.watchdog.stage(self._download_stage(backend, clip), cancel_token), \
+                    self.bandwidth.allocate('download', 'video') as allocation:
+                if backend == YTDLP:
+                    source = self._download_video_ytdlp(url, source_format['id'], progress_callback, output_name,
+                                                        cancel_token, allocation, clip)
+                else:
+                    source = self._download_video_pytube(url, source_format['id'], progress_callback,
+                                                         output_name, cancel_token, allocation)
+            self.router.record(backend, 'download', source is not None)
+            if not source:
+                return None
+            try:
+                if clip and backend != YTDLP:
+                    source = self._trim_media(source, clip, cancel_token)
+                fitted = self.transcoder.fit(source, video_id, max_bytes, duration, clip, cancel_token)
+            finally:
+                os.remove(source)
+        
+        # الواجهات تحذف ملف الإخراج أو تنقله بعد الإرسال، فتبقى النتيجة المخزنة كما هي
+        try:
+            os.link(fitted, output_path)
+        except OSError:
+            shutil.copyfile(fitted, output_path)
+        return output_path
+    
+    def _download_video_pytube(self, url: str, format_id: str,
+                        progress_callback: Optional[ProgressCallback],
+                        output_name: str, cancel_token: Optional[CancelToken] = None,
+                        allocation: Optional[Allocation] = None) -> Optional[str]:
         """تحميل الفيديو باستخدام pytube"""
         try:
-            yt = pytube.YouTube(url)
-            stream = yt.streams.get_by_itag(int(format_id))
+            with span('extract'):
+                on_progress = self._pytube_progress(progress_callback, cancel_token, allocation)
+                yt = pytube.YouTube(url, on_progress_callback=on_progress)
+                stream = yt.streams.get_by_itag(int(format_id))
             
             if not stream:
-                logger.error(f"لم يتم العثور على التنسيق المطلوب: {format_id}")
+                logger.error("لم يتم العثور على التنسيق المطلوب: %s", format_id)
                 return None
             
             # تحميل الفيديو
-            logger.info(f"بدء تحميل الفيديو باستخدام pytube: {url}")
-            file_path = stream.download(output_path=self.download_path)
+            logger.info("بدء تحميل الفيديو باستخدام pytube: %s", url)
+            file_path = self._pytube_download(stream, 'video', output_name)
             
             if os.path.exists(file_path):
-                logger.info(f"تم تحميل الفيديو بنجاح: {file_path}")
+                logger.info("تم تحميل الفيديو بنجاح: %s", file_path)
                 return file_path
             else:
                 logger.error("لم يتم العثور على الملف المحمل")
                 return None
+        except JobCancelled:
+            raise
         except Exception as e:
-            logger.error(f"خطأ في pytube أثناء التحميل: {str(e)}")
+            logger.error("خطأ في pytube أثناء التحميل: %s", e)
             return None
     
-    def download_audio(self, url: str, format_id: str) -> Optional[str]:
+    def download_audio(self, url: str, format_id: str,
+                       progress_callback: Optional[ProgressCallback] = None,
+                       output_name: Optional[str] = None,
+                       cancel_token: Optional[CancelToken] = None,
+                       start_time: Optional[float] = None,
+                       end_time: Optional[float] = None) -> Optional[str]:
         """
         تحميل الصوت
         
         Args:
             url: رابط الفيديو
             format_id: معرف التنسيق
+            progress_callback: دالة اختيارية تُستدعى بتقدم التحميل (محمل، كلي، متبقي)
+            output_name: اسم ثابت لملف الإخراج (مثل معرف المهمة) يسمح باستئناف الملف الجزئي
+                عند إعادة تشغيل نفس المهمة؛ افتراضيًا طابع زمني
+            cancel_token: رمز إلغاء يوقف التحميل والتحويل ويحذف الملفات الجزئية
+            start_time: بداية المقطع المطلوب بالثواني (افتراضيًا بداية الفيديو)
+            end_time: نهاية المقطع المطلوب بالثواني (افتراضيًا نهاية الفيديو)
             
         Returns:
             مسار الملف المحمل أو None في حالة الفشل
+            
+        Raises:
+            JobCancelled: إذا أُلغي التحميل
         """
-        logger.info(f"بدء تحميل الصوت من {url} بتنسيق {format_id}")
+        logger.info("بدء تحميل الصوت من %s بتنسيق %s", url, format_id)
+        url = self._normalize_url(url)
+        output_name = output_name or str(int(time.time()))
+        clip = self._clip_range(start_time, end_time)
         
         try:
-            if USE_YT_DLP:
-                return self._download_audio_ytdlp(url, format_id)
-            else:
-                return self._download_audio_pytube(url, format_id)
+            if cancel_token is not None:
+                cancel_token.check()
+            
+            # استخراج الصوت محليًا من فيديو محمل مسبقًا بدل جلبه من الشبكة
+            file_path = self._audio_from_cached_video(url, output_name, clip, cancel_token)
+            if file_path:
+                return file_path
+            
+            # مهام الصوت تحصل على وزن أعلى في توزيع الحد العام للتحميل
+            backend = self._download_backend(format_id)
+            with self.watchdog.stage(self._download_stage(backend, clip), cancel_token), \
+                    self.bandwidth.allocate('download', 'audio') as allocation:
+                if backend == YTDLP:
+                    file_path = self._download_audio_ytdlp(url, format_id, progress_callback, output_name,
+                                                           cancel_token, allocation, clip)
+                else:
+                    file_path = self._download_audio_pytube(url, format_id, progress_callback, output_name,
+                                                            cancel_token, allocation)
+                self.router.record(backend, 'download', file_path is not None)
+                # pytube لا يحمل أجزاء من الملف، فيُقص المقطع بعد تحميله كاملًا
+                if backend != YTDLP and file_path and clip:
+                    file_path = self._trim_media(file_path, clip, cancel_token)
+            
+            # تحويل إلى MP3 إذا كان FFmpeg متاحًا
+            if file_path and self.has_ffmpeg and not file_path.endswith('.mp3'):
+                file_path = self._convert_to_mp3(file_path, cancel_token)
+            return file_path
+        except JobCancelled:
+            logger.info("تم إلغاء تحميل الصوت %s", output_name)
+            self._remove_output_files('audio', output_name)
+            raise
         except Exception as e:
-            logger.error(f"خطأ في تحميل الصوت: {str(e)}")
+            logger.error("خطأ في تحميل الصوت: %s", e)
             return None
     
-    def _download_audio_ytdlp(self, url: str, format_id: str) -> Optional[str]:
-        """تحميل الصوت باستخدام yt-dlp"""
-        # إنشاء اسم ملف فريد
-        timestamp = int(time.time())
-        output_template = os.path.join(self.download_path, f'audio_{timestamp}_%(id)s.%(ext)s')
+    def _download_audio_ytdlp(self, url: str, format_id: str,
+                        progress_callback: Optional[ProgressCallback],
+                        output_name: str, cancel_token: Optional[CancelToken] = None,
+                        allocation: Optional[Allocation] = None,
+                        clip: Optional[ClipRange] = None) -> Optional[str]:
+        """تحميل الصوت باستخدام yt-dlp (التحويل إلى MP3 يتم لاحقًا في _convert_to_mp3)"""
+        # اسم ملف ثابت لكل مهمة حتى يُستأنف الملف الجزئي
+        output_template = os.path.join(self.download_path, f'audio_{output_name}_%(id)s.%(ext)s')
         
         ydl_opts = {
             'format': format_id,
             'outtmpl': output_template,
             'quiet': False,
             'no_warnings': False,
+            # رسائل yt-dlp عبر التسجيل المركزي، دون سطر تقدم لكل دفعة على stdout
+            'logger': YTDLP_LOGGER,
+            'noprogress': True,
             'ignoreerrors': True,
             'nooverwrites': True,
-            'postprocessors': [{
-                'key': 'FFmpegExtractAudio',
-                'preferredcodec': 'mp3',
-                'preferredquality': '192',
-            }] if self.has_ffmpeg else [],
-            'progress_hooks': [self._progress_hook],
+            # استئناف ملفات .part الجزئية لنفس المهمة بعد إعادة التشغيل
+            'continuedl': True,
+            'progress_hooks': self._progress_hooks(progress_callback, 'audio', cancel_token, allocation),
+            'postprocessor_hooks': self._postprocessor_hooks(cancel_token),
+            **self._clip_options(clip),
         }
         
         try:
-            with youtube_dl.YoutubeDL(ydl_opts) as ydl:
-                logger.info(f"بدء تحميل الصوت باستخدام yt-dlp: {url}")
+            with self._create_ydl(ydl_opts) as ydl:
+                logger.info("بدء تحميل الصوت باستخدام yt-dlp: %s", url)
+                begin_span('extract')
                 info = ydl.extract_info(url, download=True)
                 
                 if info is None:
@@ -339,86 +696,400 @@ class YouTubeDownloader:
                 if 'requested_downloads' in info and info['requested_downloads']:
                     file_path = info['requested_downloads'][0].get('filepath')
                     if file_path and os.path.exists(file_path):
-                        logger.info(f"تم تحميل الصوت بنجاح: {file_path}")
+                        logger.info("تم تحميل الصوت بنجاح: %s", file_path)
                         return file_path
                 
                 # محاولة بديلة للعثور على الملف
                 video_id = info.get('id', '')
-                ext = 'mp3' if self.has_ffmpeg else info.get('ext', 'mp3')
-                expected_file = os.path.join(self.download_path, f'audio_{timestamp}_{video_id}.{ext}')
+                ext = info.get('ext', 'm4a')
+                expected_file = os.path.join(self.download_path, f'audio_{output_name}_{video_id}.{ext}')
                 
                 if os.path.exists(expected_file):
-                    logger.info(f"تم العثور على الملف المحمل: {expected_file}")
+                    logger.info("تم العثور على الملف المحمل: %s", expected_file)
                     return expected_file
                 
                 logger.error("لم يتم العثور على الملف المحمل")
                 return None
+        except youtube_dl.utils.DownloadCancelled:
+            # سبب الإلغاء (من المستخدم أو من المراقب) محفوظ في الرمز
+            if cancel_token is not None:
+                cancel_token.check()
+            raise JobCancelled()
         except Exception as e:
-            logger.error(f"خطأ في yt-dlp أثناء تحميل الصوت: {str(e)}")
+            logger.error("خطأ في yt-dlp أثناء تحميل الصوت: %s", e)
             return None
     
-    def _download_audio_pytube(self, url: str, format_id: str) -> Optional[str]:
-        """تحميل الصوت باستخدام pytube"""
+    def _download_audio_pytube(self, url: str, format_id: str,
+                        progress_callback: Optional[ProgressCallback],
+                        output_name: str, cancel_token: Optional[CancelToken] = None,
+                        allocation: Optional[Allocation] = None) -> Optional[str]:
+        """تحميل الصوت باستخدام pytube (التحويل إلى MP3 يتم لاحقًا في _convert_to_mp3)"""
         try:
-            yt = pytube.YouTube(url)
-            stream = yt.streams.get_by_itag(int(format_id))
+            with span('extract'):
+                on_progress = self._pytube_progress(progress_callback, cancel_token, allocation)
+                yt = pytube.YouTube(url, on_progress_callback=on_progress)
+                stream = yt.streams.get_by_itag(int(format_id))
             
             if not stream:
-                logger.error(f"لم يتم العثور على التنسيق المطلوب: {format_id}")
+                logger.error("لم يتم العثور على التنسيق المطلوب: %s", format_id)
                 return None
             
             # تحميل الصوت
-            logger.info(f"بدء تحميل الصوت باستخدام pytube: {url}")
-            file_path = stream.download(output_path=self.download_path)
-            
-            # تحويل إلى MP3 إذا كان FFmpeg متاحًا
-            if self.has_ffmpeg and os.path.exists(file_path):
-                try:
-                    mp3_path = os.path.splitext(file_path)[0] + '.mp3'
-                    cmd = [
-                        'ffmpeg', '-i', file_path, 
-                        '-vn', '-ab', '192k', 
-                        '-ar', '44100', '-y', mp3_path
-                    ]
-                    
-                    subprocess.run(
-                        cmd, 
-                        stdout=subprocess.PIPE, 
-                        stderr=subprocess.PIPE,
-                        check=True
-                    )
-                    
-                    # حذف الملف الأصلي
-                    os.remove(file_path)
-                    file_path = mp3_path
-                except Exception as e:
-                    logger.error(f"خطأ في تحويل الملف إلى MP3: {str(e)}")
+            logger.info("بدء تحميل الصوت باستخدام pytube: %s", url)
+            file_path = self._pytube_download(stream, 'audio', output_name)
             
             if os.path.exists(file_path):
-                logger.info(f"تم تحميل الصوت بنجاح: {file_path}")
+                logger.info("تم تحميل الصوت بنجاح: %s", file_path)
                 return file_path
             else:
                 logger.error("لم يتم العثور على الملف المحمل")
                 return None
+        except JobCancelled:
+            raise
         except Exception as e:
-            logger.error(f"خطأ في pytube أثناء تحميل الصوت: {str(e)}")
+            logger.error("خطأ في pytube أثناء تحميل الصوت: %s", e)
             return None
     
+    def _convert_to_mp3(self, file_path: str, cancel_token: Optional[CancelToken] = None) -> str:
+        """
+        تحويل ملف صوتي إلى MP3 عبر FFmpeg قابل للإيقاف عند الإلغاء
+        
+        Returns:
+            مسار ملف MP3، أو الملف الأصلي إذا فشل التحويل
+        """
+        mp3_path = os.path.splitext(file_path)[0] + '.mp3'
+        cmd = [
+            'ffmpeg', '-i', file_path, 
+            '-vn', '-ab', '192k', 
+            '-ar', '44100', '-y', mp3_path
+        ]
+        
+        try:
+            with span('postprocess:mp3'), POSTPROCESS_SECONDS.time(step='mp3'), \
+                    self.watchdog.stage('postprocess', cancel_token):
+                run_cancellable(cmd, cancel_token)
+        except JobCancelled:
+            raise
+        except Exception as e:
+            logger.error("خطأ في تحويل الملف إلى MP3: %s", e)
+            return file_path
+        
+        # حذف الملف الأصلي
+        os.remove(file_path)
+        return mp3_path
+    
+    def _clip_range(self, start_time: Optional[float], end_time: Optional[float]) -> Optional[ClipRange]:
+        """توحيد حدود المقطع المطلوب، أو None لتحميل الفيديو كاملًا"""
+        start = max(float(start_time or 0), 0.0)
+        end = float(end_time) if end_time is not None else None
+        if end is not None and end <= start:
+            raise ValueError('نهاية المقطع يجب أن تكون بعد بدايته')
+        if start == 0 and end is None:
+            return None
+        return start, end
+    
+    def _clip_options(self, clip: Optional[ClipRange]) -> dict:
+        """
+        خيارات yt-dlp لتحميل المقطع المطلوب فقط
+        
+        يمرر yt-dlp الحدود إلى FFmpeg الذي يقفز إلى البداية بطلبات Range (أو يتخطى أجزاء HLS/DASH
+        خارج المقطع) وينسخ التدفقات دون إعادة ترميز، فلا يُجلب من الملف إلا ما يغطي المقطع.
+        """
+        if clip is None:
+            return {}
+        if not self.has_ffmpeg:
+            logger.warning("تحميل المقاطع يتطلب FFmpeg، سيتم تحميل الفيديو كاملًا")
+            return {}
+        start, end = clip
+        return {
+            'download_ranges': youtube_dl.utils.download_range_func(None, [(start, end if end is not None else float('inf'))]),
+            # القص عند أقرب إطار مفتاحي مع نسخ التدفقات بدل إعادة الترميز
+            'force_keyframes_at_cuts': False,
+        }
+    
+    def _trim_media(self, file_path: str, clip: ClipRange,
+                    cancel_token: Optional[CancelToken] = None) -> str:
+        """
+        قص مقطع من ملف محمل كاملًا عبر FFmpeg بنسخ التدفقات دون إعادة ترميز
+        
+        Returns:
+            مسار الملف المقصوص (باللاحقة .clip)، أو الملف الأصلي إذا تعذر القص
+        """
+        if not self.has_ffmpeg:
+            logger.warning("قص المقاطع يتطلب FFmpeg، سيتم إرسال الفيديو كاملًا")
+            return file_path
+        start, end = clip
+        root, ext = os.path.splitext(file_path)
+        clip_path = f"{root}{CLIP_SUFFIX}{ext}"
+        cmd = ['ffmpeg', '-ss', str(start), '-i', file_path]
+        if end is not None:
+            cmd += ['-t', str(end - start)]
+        cmd += ['-c', 'copy', '-map', '0', '-y', clip_path]
+        
+        try:
+            with span('postprocess:trim'), POSTPROCESS_SECONDS.time(step='trim'), \
+                    self.watchdog.stage('postprocess', cancel_token):
+                run_cancellable(cmd, cancel_token)
+        except JobCancelled:
+            raise
+        except Exception as e:
+            logger.error("خطأ في قص المقطع: %s", e)
+            if os.path.exists(clip_path):
+                os.remove(clip_path)
+            return file_path
+        
+        os.remove(file_path)
+        return clip_path
+    
+    def _find_cached_video(self, video_id: str) -> Optional[str]:
+        """
+        البحث عن فيديو كامل محمل مسبقًا في مجلد التحميل
+        
+        يقبل فقط الاسم النهائي video_<المهمة>_<المعرف>.<الامتداد> الذي يعطيه yt-dlp للملف المكتمل،
+        فتُستبعد الملفات الجزئية (.part) والتنسيقات المنفصلة قبل الدمج (.f137) والمقاطع (.clip).
+        
+        Returns:
+            مسار أحدث ملف مطابق أو None
+        """
+        pattern = re.compile(rf'^video_.+_{re.escape(video_id)}\.[A-Za-z0-9]+$')
+        candidates = []
+        try:
+            for entry in os.scandir(self.download_path):
+                if pattern.match(entry.name) and entry.is_file():
+                    candidates.append((entry.stat().st_mtime, entry.path))
+        except OSError as e:
+            logger.error("خطأ في البحث عن الفيديوهات المحملة: %s", e)
+            return None
+        return max(candidates)[1] if candidates else None
+    
+    def _audio_from_cached_video(self, url: str, output_name: str, clip: Optional[ClipRange] = None,
+                                 cancel_token: Optional[CancelToken] = None) -> Optional[str]:
+        """
+        استخراج مسار الصوت من فيديو محمل مسبقًا لنفس الرابط وتحويله إلى MP3 دون اتصال بالشبكة
+        
+        الصوت الناتج هو مسار الصوت المدمج في الفيديو وليس التنسيق الصوتي المختار، ويُحول
+        إلى MP3 بنفس إعدادات _convert_to_mp3.
+        
+        Returns:
+            مسار ملف MP3، أو None إذا لم يوجد فيديو محمل أو فشل الاستخراج
+        """
+        key = parse_youtube_url(url)
+        if not self.has_ffmpeg or key is None:
+            return None
+        source = self._find_cached_video(key.video_id)
+        if source is None:
+            CACHE_REQUESTS.inc(cache='media', result='miss')
+            return None
+        
+        mp3_path = os.path.join(self.download_path, f'audio_{output_name}_{key.video_id}.mp3')
+        cmd = ['ffmpeg']
+        if clip:
+            start, end = clip
+            cmd += ['-ss', str(start)]
+            if end is not None:
+                cmd += ['-t', str(end - start)]
+        cmd += [
+            '-i', source,
+            '-map', '0:a:0', '-vn', '-ab', '192k',
+            '-ar', '44100', '-y', mp3_path
+        ]
+        
+        try:
+            with span('postprocess:audio_from_video'), POSTPROCESS_SECONDS.time(step='audio_from_video'), \
+                    self.watchdog.stage('postprocess', cancel_token):
+                run_cancellable(cmd, cancel_token)
+        except JobCancelled:
+            raise
+        except Exception as e:
+            # مثل فيديو بلا مسار صوتي أو حُذف أثناء التنظيف: العودة إلى التحميل من الشبكة
+            logger.error("خطأ في استخراج الصوت من %s: %s", source, e)
+            if os.path.exists(mp3_path):
+                os.remove(mp3_path)
+            CACHE_REQUESTS.inc(cache='media', result='miss')
+            return None
+        
+        CACHE_REQUESTS.inc(cache='media', result='hit')
+        logger.info("تم استخراج الصوت من الفيديو المحمل مسبقًا %s", source)
+        return mp3_path
+    
+    def _remove_output_files(self, media_type: str, output_name: str) -> None:
+        """حذف الملفات الجزئية والنهائية لتحميل ملغى (.part و .ytdl والأجزاء وملفات التحويل)"""
+        prefix = f"{media_type}_{output_name}_"
+        try:
+            for filename in os.listdir(self.download_path):
+                if filename.startswith(prefix):
+                    try:
+                        os.remove(os.path.join(self.download_path, filename))
+                    except OSError as e:
+                        logger.error("خطأ في حذف الملف الجزئي %s: %s", filename, e)
+        except OSError as e:
+            logger.error("خطأ في حذف ملفات التحميل الملغى: %s", e)
+    
+    
+    def _download_backend(self, format_id: str) -> str:
+        """
+        الواجهة الخلفية الأسلم حاليًا لتحميل format_id (pytube يحمل بمعرفات itag الرقمية فقط)
+        """
+        ranked = self.router.ranked('download')
+        supported = [backend for backend in ranked if backend == YTDLP or format_id.isdigit()]
+        return (supported or ranked)[0]
+    
+    def _download_stage(self, backend: str, clip: Optional[ClipRange]) -> str:
+        """
+        مرحلة المراقبة للتحميل: 'download' مع كشف التوقف، أو 'clip' بمهلة كلية لأن FFmpeg
+        الذي يجلب المقطع في yt-dlp لا يبلغ عن تقدمه حتى ينتهي
+        """
+        return 'clip' if backend == YTDLP and clip and self.has_ffmpeg else 'download'
+    
+    def _normalize_url(self, url: str) -> str:
+        """تحويل الرابط إلى رابط الفيديو المنفرد لتجنب تحميل قائمة التشغيل كاملة"""
+        key = parse_youtube_url(url)
+        return key.watch_url if key is not None else url
+    
+    def _pytube_download(self, stream, media_type: str, output_name: Optional[str] = None) -> str:
+        """تحميل تدفق pytube مع تسجيل الحجم ومعدل التحميل"""
+        # pytube لا يستأنف الملفات الجزئية، لكنه يتخطى الملف المكتمل بنفس الاسم
+        prefix = f"{media_type}_{output_name}_" if output_name else None
+        start = time.perf_counter()
+        with span('fetch'):
+            # مهلة الشبكة حتى لا تعلق قراءة متوقفة بعد أن يوقف المراقب التحميل
+            file_path = stream.download(output_path=self.download_path, filename_prefix=prefix,
+                                        timeout=self.watchdog.stall_window)
+        elapsed = time.perf_counter() - start
+        
+        if os.path.exists(file_path):
+            size = os.path.getsize(file_path)
+            DOWNLOAD_BYTES.inc(size, type=media_type)
+            if elapsed > 0:
+                DOWNLOAD_THROUGHPUT.observe(size / elapsed, type=media_type)
+        return file_path
+    
+    def _postprocessor_hooks(self, cancel_token: Optional[CancelToken] = None) -> List[Callable]:
+        """
+        قياس زمن كل معالج لاحق في yt-dlp (دمج، إصلاح، ...) وعدم بدء أي منها بعد الإلغاء
+        
+        يُراقب كل معالج كمرحلة 'postprocess' فلا يُعد الدمج الطويل توقفًا للتحميل.
+        """
+        started = {}
+        watches = {}
+        trace = current_trace()
+        
+        def hook(d):
+            name = d.get('postprocessor', 'unknown')
+            if d['status'] == 'started':
+                if cancel_token is not None and cancel_token.cancelled:
+                    raise youtube_dl.utils.DownloadCancelled()
+                started[name] = time.perf_counter()
+                if cancel_token is not None:
+                    watches[name] = self.watchdog.begin('postprocess', cancel_token)
+                if trace is not None:
+                    trace.begin(f'postprocess:{name}')
+            elif d['status'] == 'finished' and name in started:
+                POSTPROCESS_SECONDS.observe(time.perf_counter() - started.pop(name), step=name)
+                if name in watches:
+                    self.watchdog.end(watches.pop(name))
+                if trace is not None:
+                    trace.end(f'postprocess:{name}')
+        
+        return [hook]
+    
+    def _progress_hooks(self, progress_callback: Optional[ProgressCallback],
+                        media_type: str = 'video',
+                        cancel_token: Optional[CancelToken] = None,
+                        allocation: Optional[Allocation] = None) -> List[Callable]:
+        """إنشاء قائمة دوال التقدم لـ yt-dlp"""
+        def metrics_hook(d):
+            if d['status'] == 'finished':
+                downloaded = d.get('downloaded_bytes') or d.get('total_bytes') or 0
+                DOWNLOAD_BYTES.inc(downloaded, type=media_type)
+                elapsed = d.get('elapsed')
+                if elapsed:
+                    DOWNLOAD_THROUGHPUT.observe(downloaded / elapsed, type=media_type)
+        
+        hooks = [self._progress_hook, metrics_hook]
+        
+        if cancel_token is not None:
+            def cancel_hook(d):
+                # DownloadCancelled هو الاستثناء الوحيد الذي يوقف yt-dlp رغم ignoreerrors
+                if cancel_token.cancelled:
+                    raise youtube_dl.utils.DownloadCancelled()
+                if d['status'] == 'downloading':
+                    self.watchdog.progress(cancel_token, d.get('downloaded_bytes') or 0)
+            hooks.insert(0, cancel_hook)
+        
+        if allocation is not None:
+            last = {'filename': None, 'bytes': 0}
+            
+            def bandwidth_hook(d):
+                # الإبطاء داخل حلقة القراءة في yt-dlp يطبق الحصة الحالية حتى بعد إعادة توزيعها
+                if d['status'] != 'downloading':
+                    return
+                downloaded = d.get('downloaded_bytes') or 0
+                if d.get('filename') != last['filename']:
+                    last['filename'], last['bytes'] = d.get('filename'), downloaded
+                    return
+                delta, last['bytes'] = downloaded - last['bytes'], downloaded
+                if delta > 0:
+                    allocation.throttle(delta, cancel_token)
+            hooks.append(bandwidth_hook)
+        
+        trace = current_trace()
+        if trace is not None:
+            def trace_hook(d):
+                # انتهاء الاستخراج عند أول دفعة بيانات، ثم مرحلة جلب الملف حتى اكتماله
+                if d['status'] == 'downloading':
+                    trace.end('extract')
+                    trace.begin('fetch')
+                elif d['status'] in ('finished', 'error'):
+                    trace.end('fetch')
+            hooks.append(trace_hook)
+        if progress_callback is not None:
+            def callback_hook(d):
+                if d['status'] == 'downloading':
+                    total = d.get('total_bytes') or d.get('total_bytes_estimate') or 0
+                    progress_callback(d.get('downloaded_bytes', 0), int(total), int(d.get('eta') or 0))
+            hooks.append(callback_hook)
+        return hooks
+    
+    def _pytube_progress(self, progress_callback: Optional[ProgressCallback],
+                         cancel_token: Optional[CancelToken] = None,
+                         allocation: Optional[Allocation] = None) -> Optional[Callable]:
+        """تحويل دالة التقدم إلى صيغة pytube (مع إيقاف التحميل عند الإلغاء وإبطائه حسب الحصة)"""
+        if progress_callback is None and cancel_token is None and allocation is None:
+            return None
+        
+        def on_progress(stream, chunk, bytes_remaining):
+            if cancel_token is not None:
+                cancel_token.check()
+                self.watchdog.progress(cancel_token, (stream.filesize or 0) - bytes_remaining)
+            if allocation is not None:
+                allocation.throttle(len(chunk), cancel_token)
+                if cancel_token is not None:
+                    cancel_token.check()
+            if progress_callback is not None:
+                total = stream.filesize or 0
+                progress_callback(total - bytes_remaining, total, 0)
+        
+        return on_progress
+    
     def _progress_hook(self, d):
-        """تتبع تقدم التحميل"""
+        """تتبع تقدم التحميل (سطر واحد على الأكثر لكل ملف كل LOG_PROGRESS_INTERVAL ثانية)"""
+        filename = d.get('filename') or ''
         if d['status'] == 'downloading':
-            if 'total_bytes' in d and d['total_bytes'] > 0:
-                percent = d['downloaded_bytes'] / d['total_bytes'] * 100
-                logger.info(f"تقدم التحميل: {percent:.1f}%")
-            elif 'total_bytes_estimate' in d and d['total_bytes_estimate'] > 0:
-                percent = d['downloaded_bytes'] / d['total_bytes_estimate'] * 100
-                logger.info(f"تقدم التحميل (تقديري): {percent:.1f}%")
+            if not self.progress_log.allow(filename):
+                return
+            total = d.get('total_bytes') or d.get('total_bytes_estimate') or 0
+            if total > 0:
+                logger.info("تقدم التحميل%s: %.1f%%", '' if d.get('total_bytes') else ' (تقديري)',
+                            d['downloaded_bytes'] / total * 100)
             else:
-                logger.info(f"تم تحميل {d['downloaded_bytes'] / (1024*1024):.1f} ميجابايت")
+                logger.info("تم تحميل %.1f ميجابايت", d['downloaded_bytes'] / (1024*1024))
         elif d['status'] == 'finished':
-            logger.info(f"اكتمل التحميل. حجم الملف: {d['downloaded_bytes'] / (1024*1024):.1f} ميجابايت")
+            self.progress_log.forget(filename)
+            logger.info("اكتمل التحميل. حجم الملف: %.1f ميجابايت", (d.get('downloaded_bytes') or 0) / (1024*1024))
         elif d['status'] == 'error':
-            logger.error(f"خطأ في التحميل: {d.get('error', 'خطأ غير معروف')}")
+            self.progress_log.forget(filename)
+            logger.error("خطأ في التحميل: %s", d.get('error', 'خطأ غير معروف'))
     
     def is_valid_youtube_url(self, url: str) -> bool:
         """
@@ -430,27 +1101,10 @@ class YouTubeDownloader:
         Returns:
             True إذا كان الرابط صحيحًا، False خلاف ذلك
         """
-        try:
-            # نمط بسيط للتحقق من روابط يوتيوب
-            youtube_patterns = [
-                r'^https?://(?:www\.)?youtube\.com/watch\?v=[\w-]+',
-                r'^https?://(?:www\.)?youtube\.com/embed/[\w-]+',
-                r'^https?://(?:www\.)?youtube\.com/v/[\w-]+',
-                r'^https?://(?:www\.)?youtube\.com/shorts/[\w-]+',
-                r'^https?://youtu\.be/[\w-]+'
-            ]
-            
-            # التحقق من تطابق الرابط مع أي من الأنماط
-            for pattern in youtube_patterns:
-                if re.match(pattern, url):
-                    logger.info(f"تم التحقق من صحة رابط يوتيوب: {url}")
-                    return True
-                    
-            logger.warning(f"رابط غير صالح: {url}")
-            return False
-        except Exception as e:
-            logger.error(f"خطأ في التحقق من صحة الرابط: {str(e)}")
-            return False
+        valid = parse_youtube_url(url) is not None
+        if not valid:
+            logger.debug("رابط غير صالح: %s", url)
+        return valid
             
     def cleanup_old_files(self, expiry_hours=24):
         """
@@ -459,14 +1113,14 @@ class YouTubeDownloader:
         Args:
             expiry_hours: عدد الساعات قبل اعتبار الملف قديمًا
         """
-        logger.info(f"تنظيف الملفات القديمة (أقدم من {expiry_hours} ساعة)...")
+        logger.info("تنظيف الملفات القديمة (أقدم من %s ساعة)...", expiry_hours)
         try:
             current_time = time.time()
             expiry_seconds = expiry_hours * 3600
             
             # التحقق من وجود المجلد
             if not os.path.exists(self.download_path):
-                logger.warning(f"مجلد التحميل غير موجود: {self.download_path}")
+                logger.warning("مجلد التحميل غير موجود: %s", self.download_path)
                 return
                 
             # مسح الملفات القديمة
@@ -479,10 +1133,11 @@ class YouTubeDownloader:
                         try:
                             os.remove(file_path)
                             count += 1
-                            logger.info(f"تم حذف الملف القديم: {filename}")
+                            logger.info("تم حذف الملف القديم: %s", filename)
                         except Exception as e:
-                            logger.error(f"خطأ في حذف الملف {filename}: {str(e)}")
+                            logger.error("خطأ في حذف الملف %s: %s", filename, e)
             
-            logger.info(f"تم حذف {count} ملفات قديمة")
+            CLEANUP_EVICTIONS.inc(count)
+            logger.info("تم حذف %s ملفات قديمة", count)
         except Exception as e:
-            logger.error(f"خطأ في تنظيف الملفات القديمة: {str(e)}")
+            logger.error("خطأ في تنظيف الملفات القديمة: %s", e)
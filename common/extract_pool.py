@@ -0,0 +1,123 @@
+import signal
+import logging
+import threading
+import multiprocessing
+from typing import Any, Callable, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# المستخرج الخاص بكل عملية في المجمع (يُنشأ مرة عند بدء العملية)
+_extractor = None
+_in_pool_process = False
+
+
+def in_pool_process() -> bool:
+    """هل تعمل الشيفرة داخل عملية من مجمع الاستخراج (فلا تنشئ مجمعًا آخر)"""
+    return _in_pool_process
+
+
+def _init_process(factory: Callable[..., Any], args: Tuple, log_queue: Any, log_level: int) -> None:
+    global _extractor, _in_pool_process
+    _in_pool_process = True
+    # الإيقاف بـ Ctrl+C تديره العملية الرئيسية وتنهي المجمع بنفسها
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    # السجلات تمر عبر خيط الكتابة في العملية الرئيسية
+    from common.logging_setup import setup_child_logging
+    setup_child_logging(log_queue, log_level)
+    # سطور بدء المستخرج (الواجهات الخلفية، FFmpeg) سجلتها العملية الرئيسية، فلا تتكرر مع كل عملية
+    logging.disable(logging.WARNING)
+    try:
+        _extractor = factory(*args)
+    finally:
+        logging.disable(logging.NOTSET)
+
+
+def _run(method: str, url: str) -> Dict:
+    try:
+        return getattr(_extractor, method)(url)
+    except Exception as e:
+        # بعض استثناءات yt-dlp و pytube لا تُستعاد عبر pickle، ورسالتها تكفي المستدعي
+        raise RuntimeError(str(e)) from None
+
+
+class ExtractionPool:
+    """
+    مجمع عمليات لاستخراج معلومات الفيديو خارج العملية الرئيسية
+
+    فك التواقيع وتحليل JSON وفرز التنسيقات في yt-dlp عمل Python كثيف يتنافس على GIL مع خيوط
+    البوت وواجهة الويب؛ في المجمع يعمل كل استخراج في عملية مستقلة فيتوزع على الأنوية.
+    تُستبدل كل عملية بعد max_tasks_per_child مهمة حتى لا يتراكم ما تسربه المكتبات من ذاكرة،
+    ولا يعود عبر القناة إلا القاموس المختصر الذي تعيده دوال الاستخراج (لا معلومات yt-dlp الكاملة).
+    """
+
+    def __init__(self, factory: Callable[..., Any], args: Tuple, processes: int,
+                 max_tasks_per_child: int = 100, timeout: float = 0.0):
+        """
+        Args:
+            factory: دالة (أو صنف) تنشئ المستخرج في كل عملية، ويجب أن تكون قابلة للاستيراد
+            args: معاملات factory (تُنقل عبر pickle)
+            processes: عدد العمليات
+            max_tasks_per_child: عدد المهام قبل استبدال العملية (0 = بلا استبدال)
+            timeout: أقصى انتظار لنتيجة المهمة بالثواني (0 = بلا حد)
+        """
+        self.factory = factory
+        self.args = args
+        self.processes = max(processes, 1)
+        self.max_tasks_per_child = max_tasks_per_child or None
+        self.timeout = timeout
+        self._pool = None
+        self._lock = threading.Lock()
+
+    def _ensure_pool(self):
+        with self._lock:
+            if self._pool is None:
+                # spawn بدل fork: العملية الرئيسية فيها خيوط (البوت، التسجيل، المقاييس) قد تحمل أقفالًا
+                context = multiprocessing.get_context('spawn')
+                from common.logging_setup import child_log_queue
+                initargs = (self.factory, self.args, child_log_queue(context), logging.getLogger().level)
+                self._pool = context.Pool(self.processes, _init_process, initargs,
+                                          maxtasksperchild=self.max_tasks_per_child)
+                logger.info("بدأ مجمع الاستخراج بـ %s عملية", self.processes)
+            return self._pool
+
+    def run(self, method: str, url: str) -> Dict:
+        """
+        تنفيذ دالة استخراج للمستخرج في إحدى عمليات المجمع وانتظار نتيجتها
+
+        Args:
+            method: اسم دالة الاستخراج (مثل '_get_video_info_ytdlp')
+            url: رابط الفيديو
+
+        Raises:
+            RuntimeError: إذا فشل الاستخراج في العملية
+            multiprocessing.TimeoutError: إذا تجاوزت المهمة المهلة
+        """
+        return self._ensure_pool().apply_async(_run, (method, url)).get(self.timeout or None)
+
+    def close(self) -> None:
+        """إنهاء عمليات المجمع"""
+        with self._lock:
+            if self._pool is not None:
+                self._pool.terminate()
+                self._pool = None
+
+
+_pools: Dict[Tuple[Callable, str], ExtractionPool] = {}
+_pools_lock = threading.Lock()
+
+
+def get_extraction_pool(factory: Callable[..., Any], args: Tuple) -> Optional[ExtractionPool]:
+    """
+    مجمع الاستخراج المشترك لمستخرج محدد في العملية الحالية، أو None إذا كان الاستخراج في الخيوط
+    (من إعدادات EXTRACT_EXECUTOR و EXTRACT_PROCESSES و EXTRACT_MAX_TASKS_PER_CHILD)
+    """
+    from config import EXTRACT_EXECUTOR, EXTRACT_PROCESSES, EXTRACT_MAX_TASKS_PER_CHILD, EXTRACT_TIMEOUT
+    if EXTRACT_EXECUTOR != 'process' or in_pool_process():
+        return None
+    with _pools_lock:
+        # المعاملات قد تحوي قواميس غير قابلة للتجزئة، فيُستخدم تمثيلها النصي في المفتاح
+        key = (factory, repr(args))
+        if key not in _pools:
+            _pools[key] = ExtractionPool(factory, args, EXTRACT_PROCESSES, EXTRACT_MAX_TASKS_PER_CHILD,
+                                         EXTRACT_TIMEOUT)
+        return _pools[key]
@@ -0,0 +1,153 @@
+import os
+import uuid
+import threading
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Optional
+
+from common.cancellation import CancelToken
+from common.tracing import Trace
+from common.transcode import parse_fit_format, smallest_video_format
+
+
+class Job:
+    """
+    مهمة تحميل واحدة تمر عبر المجدول وتتتبع حالتها وتقدمها
+    """
+
+    def __init__(self, func: Callable[['Job'], Any], owner: str, cost: float = 1.0,
+                 weight: float = 1.0, job_id: Optional[str] = None,
+                 profile_path: Optional[str] = None):
+        """
+        Args:
+            func: الدالة التي تنفذ المهمة وتستقبل كائن المهمة نفسه
+            owner: مالك المهمة (مثل tg:<user_id> أو ip:<address>) لأغراض الجدولة العادلة
+            cost: التكلفة التقديرية للمهمة
+            weight: وزن المالك في الجدولة العادلة
+            job_id: معرف المهمة (يُنشأ تلقائيًا إذا لم يُحدد)
+            profile_path: مسار لحفظ ملف cProfile لهذه المهمة (اختياري)
+        """
+        self.id = job_id or str(uuid.uuid4())
+        self.func = func
+        self.owner = owner
+        self.cost = cost
+        self.weight = weight
+
+        self.status = 'queued'
+        self.progress = 0
+        self.downloaded_bytes = 0
+        self.total_bytes = 0
+        self.eta = 0
+        self.error: Optional[str] = None
+        self.result: Any = None
+
+        # مراحل المهمة والتحليل الاختياري
+        self.trace = Trace(self.id)
+        self.profile_path = profile_path
+
+        self.created_at = self.trace.created_at
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        # زيادة الذاكرة خلال المهمة (تملؤها get_memory_monitor().account)
+        self.memory: Optional[Dict] = None
+
+        # دالة اختيارية تُستدعى عند كل تحديث للتقدم (من خيط التحميل)
+        self.on_progress: Optional[Callable[[int, int, int], None]] = None
+        # رمز الإلغاء التعاوني الذي يُمرر إلى المحمل
+        self.cancel_token = CancelToken()
+        self.future: Future = Future()
+        self._lock = threading.Lock()
+
+    def update_progress(self, downloaded: int, total: int, eta: int = 0) -> None:
+        """
+        تحديث تقدم المهمة (يُمرر إلى المحمل كـ progress_callback)
+
+        Args:
+            downloaded: عدد البايتات المحملة
+            total: الحجم الكلي بالبايت (0 إذا كان غير معروف)
+            eta: الوقت المتبقي بالثواني
+        """
+        with self._lock:
+            self.downloaded_bytes = downloaded
+            self.total_bytes = total
+            self.eta = eta or 0
+            if total > 0:
+                self.progress = min(100, int(downloaded * 100 / total))
+
+        if self.on_progress is not None:
+            self.on_progress(downloaded, total, eta)
+
+    def release(self) -> None:
+        """
+        تحرير مراجع التنفيذ بعد انتهاء المهمة: دالة المهمة ودالة التقدم تحتفظان بمعلومات الفيديو
+        وسياق الواجهة، بينما تبقى المهمة نفسها في سجلات الحالة حتى انتهاء صلاحيتها
+        """
+        self.func = None
+        self.on_progress = None
+
+    @property
+    def done(self) -> bool:
+        return self.status in ('completed', 'failed', 'cancelled')
+
+    def to_dict(self) -> Dict:
+        """تمثيل المهمة لواجهات الحالة"""
+        return {
+            'id': self.id,
+            'status': self.status,
+            'progress': self.progress,
+            'downloaded_bytes': self.downloaded_bytes,
+            'total_bytes': self.total_bytes,
+            'eta': self.eta,
+            'error': self.error,
+            'spans': self.trace.to_list(),
+            'memory': self.memory,
+            'profile': os.path.basename(self.profile_path) if self.profile_path and self.done else None,
+        }
+
+
+def estimate_job_cost(video_info: Optional[Dict], format_id: str, format_type: str,
+                      base_cost: float, cost_per_mb: float,
+                      start_time: Optional[float] = None, end_time: Optional[float] = None) -> float:
+    """
+    تقدير تكلفة مهمة تحميل من حجم التنسيق المطلوب
+
+    Args:
+        video_info: معلومات الفيديو كما يعيدها YouTubeDownloader.get_video_info
+        format_id: معرف التنسيق المطلوب
+        format_type: 'video' أو 'audio'
+        base_cost: التكلفة الثابتة لكل مهمة
+        cost_per_mb: التكلفة لكل ميجابايت من الحجم المقدر
+        start_time: بداية المقطع المطلوب بالثواني (اختياري)
+        end_time: نهاية المقطع المطلوب بالثواني (اختياري)
+
+    Returns:
+        التكلفة التقديرية للمهمة
+    """
+    size = None
+    formats = (video_info or {}).get('formats', [])
+    if parse_fit_format(format_id) is not None:
+        # ملاءمة الحجم تحمل أصغر تنسيق فيديو ثم تضغطه
+        smallest = smallest_video_format(video_info)
+        format_id = smallest['id'] if smallest else format_id
+    for fmt in formats:
+        if fmt.get('id') == format_id:
+            size = fmt.get('size')
+            break
+    else:
+        # التنسيق 'best' للصوت أو تنسيق غير مدرج: استخدام أول تنسيق من نفس النوع
+        for fmt in formats:
+            if fmt.get('type') == format_type:
+                size = fmt.get('size')
+                break
+
+    duration = (video_info or {}).get('duration') or 0
+    if not size:
+        # تقدير الحجم من معدل البت والمدة عند غياب الحجم
+        kbps = 1000 if format_type == 'video' else 160
+        size = duration * kbps * 1000 / 8
+
+    if duration and (start_time or end_time):
+        # المقطع يُحمل وحده، فتتناسب تكلفته مع نسبته من مدة الفيديو
+        clip = min(end_time or duration, duration) - (start_time or 0)
+        size = size * max(clip, 0) / duration
+
+    return base_cost + (size / (1024 * 1024)) * cost_per_mb
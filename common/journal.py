@@ -0,0 +1,276 @@
+import os
+import json
+import time
+import uuid
+import socket
+import logging
+import sqlite3
+import threading
+from typing import Any, Dict, List, Optional
+
+from common.metrics import pid_alive
+
+logger = logging.getLogger(__name__)
+
+# حالات المهمة في السجل: المهام غير المكتملة تُستأنف عند إعادة التشغيل
+UNFINISHED_STATES = ('queued', 'running')
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    frontend TEXT NOT NULL,
+    owner TEXT NOT NULL,
+    url TEXT NOT NULL,
+    format_id TEXT NOT NULL,
+    format_type TEXT NOT NULL,
+    cost REAL NOT NULL,
+    payload TEXT NOT NULL,
+    state TEXT NOT NULL,
+    result_path TEXT,
+    error TEXT,
+    worker TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+)
+"""
+
+
+# رمز تشغيل فريد لكل عملية: الحاوية المعاد تشغيلها تأخذ غالبًا نفس اسم الجهاز ونفس PID (مثل 1)،
+# فلا يكفي host:pid لتمييز العملية الحالية عن سابقتها التي تركت مهامها دون إكمال
+_BOOT_TOKEN = uuid.uuid4().hex[:12]
+
+
+def _worker_id() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}:{_BOOT_TOKEN}"
+
+
+def _process_started_at(pid: int) -> Optional[float]:
+    """وقت بدء العملية pid (من /proc)، أو None إذا لم يتوفر"""
+    try:
+        with open(f'/proc/{pid}/stat') as f:
+            # الحقل 22 بعد اسم العملية (الذي قد يحوي مسافات) بوحدات نبضات الساعة منذ الإقلاع
+            start_ticks = int(f.read().rpartition(')')[2].split()[19])
+        with open('/proc/stat') as f:
+            boot_time = next(int(line.split()[1]) for line in f if line.startswith('btime'))
+        return boot_time + start_ticks / os.sysconf('SC_CLK_TCK')
+    except (OSError, ValueError, IndexError, StopIteration):
+        return None
+
+
+def _worker_alive(worker: str, updated_at: float) -> bool:
+    """
+    التحقق من أن العملية التي تملك المهمة ما زالت تعمل
+
+    Args:
+        worker: معرف المالك (host:pid:token)
+        updated_at: آخر تحديث للمهمة، ولا يكون إلا من مالكها
+    """
+    if not worker:
+        # حررها مالكها (release) فهي بلا مالك
+        return False
+    host, pid, token = (worker.split(':') + ['', ''])[:3]
+    if host != socket.gethostname() or not pid.isdigit():
+        # السجل على قرص يستخدمه جهاز واحد في كل مرة: مالك على جهاز آخر يعني نشرًا سابقًا
+        return False
+    if int(pid) == os.getpid():
+        # نفس PID برمز تشغيل مختلف: عملية سابقة أعيد تشغيلها
+        return token == _BOOT_TOKEN
+    if not pid_alive(int(pid)):
+        return False
+    # PID أعيد استخدامه: العملية الحالية بدأت بعد آخر تحديث كتبه المالك فليست هي المالك
+    started_at = _process_started_at(int(pid))
+    return started_at is None or started_at <= updated_at + 1
+
+
+class JobJournal:
+    """
+    سجل دائم لمهام التحميل (SQLite) يسمح باستئنافها بعد توقف العملية أو إعادة النشر
+
+    تُسجل كل مهمة قبل إضافتها إلى الطابور مع كل ما يلزم لإعادة تشغيلها، وتُحدث حالتها
+    عند بدئها وانتهائها. عند بدء التشغيل تطالب كل واجهة بمهامها غير المكتملة التي
+    تملكها عمليات منتهية وتعيد إضافتها بنفس المعرف، فيستأنف yt-dlp ملفات .part الجزئية.
+    """
+
+    def __init__(self, path: str):
+        """
+        Args:
+            path: مسار ملف قاعدة البيانات
+        """
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._conn_pid: Optional[int] = None
+
+    def _connection(self) -> sqlite3.Connection:
+        # اتصال جديد بعد fork (مثل عمال gunicorn) لأن اتصالات SQLite لا تُشارك بين العمليات
+        if self._conn is None or self._conn_pid != os.getpid():
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute(_SCHEMA)
+            self._conn = conn
+            self._conn_pid = os.getpid()
+        return self._conn
+
+    def _execute(self, sql: str, params: tuple = ()) -> sqlite3.Cursor:
+        with self._lock:
+            return self._connection().execute(sql, params)
+
+    def record(self, job_id: str, frontend: str, owner: str, url: str, format_id: str,
+               format_type: str, cost: float, payload: Optional[Dict[str, Any]] = None) -> None:
+        """
+        تسجيل مهمة جديدة في حالة الانتظار
+
+        Args:
+            job_id: معرف المهمة (يحدد أيضًا اسم ملف الإخراج)
+            frontend: الواجهة المالكة ('web' أو 'telegram')
+            owner: مالك المهمة في المجدول
+            url: رابط الفيديو
+            format_id: معرف التنسيق
+            format_type: 'video' أو 'audio'
+            cost: التكلفة التقديرية
+            payload: بيانات إضافية تحتاجها الواجهة للاستئناف (مثل معرف المحادثة)
+        """
+        now = time.time()
+        try:
+            self._execute(
+                'INSERT OR REPLACE INTO jobs (id, frontend, owner, url, format_id, format_type, cost, '
+                'payload, state, worker, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                (job_id, frontend, owner, url, format_id, format_type, cost,
+                 json.dumps(payload or {}), 'queued', _worker_id(), now, now)
+            )
+        except sqlite3.Error as e:
+            logger.error("خطأ في تسجيل المهمة %s في السجل: %s", job_id, e)
+
+    def mark(self, job_id: str, state: str, result_path: Optional[str] = None,
+             error: Optional[str] = None) -> None:
+        """
+        تحديث حالة مهمة
+
+        Args:
+            job_id: معرف المهمة
+            state: الحالة الجديدة ('running' أو 'completed' أو 'failed')
+            result_path: مسار الملف الناتج (عند الاكتمال)
+            error: رسالة الخطأ (عند الفشل)
+        """
+        try:
+            self._execute(
+                'UPDATE jobs SET state = ?, result_path = ?, error = ?, updated_at = ? WHERE id = ?',
+                (state, result_path, error, time.time(), job_id)
+            )
+        except sqlite3.Error as e:
+            logger.error("خطأ في تحديث المهمة %s في السجل: %s", job_id, e)
+
+    def remove(self, job_id: str) -> None:
+        """حذف مهمة من السجل"""
+        try:
+            self._execute('DELETE FROM jobs WHERE id = ?', (job_id,))
+        except sqlite3.Error as e:
+            logger.error("خطأ في حذف المهمة %s من السجل: %s", job_id, e)
+
+    def claim_unfinished(self, frontend: str) -> List[Dict[str, Any]]:
+        """
+        المطالبة بالمهام غير المكتملة لواجهة معينة التي تملكها عمليات منتهية
+
+        المطالبة ذرية (مقارنة المالك القديم)، فلا تستأنف عمليتان نفس المهمة.
+
+        Args:
+            frontend: الواجهة ('web' أو 'telegram')
+
+        Returns:
+            قائمة المهام المطالب بها (مع payload محللة)
+        """
+        claimed = []
+        try:
+            rows = self._execute(
+                f"SELECT * FROM jobs WHERE frontend = ? AND state IN ({','.join('?' * len(UNFINISHED_STATES))}) "
+                'ORDER BY created_at',
+                (frontend,) + UNFINISHED_STATES
+            ).fetchall()
+            me = _worker_id()
+            for row in rows:
+                # المهمة ملك هذه العملية فقط إذا طابق رمز التشغيل (وليس host:pid وحده)
+                if row['worker'] == me or _worker_alive(row['worker'], row['updated_at']):
+                    continue
+                cursor = self._execute(
+                    "UPDATE jobs SET worker = ?, state = 'queued', updated_at = ? WHERE id = ? AND worker = ?",
+                    (me, time.time(), row['id'], row['worker'])
+                )
+                if cursor.rowcount == 1:
+                    claimed.append(self._row_to_dict(row))
+        except sqlite3.Error as e:
+            logger.error("خطأ في قراءة المهام غير المكتملة من السجل: %s", e)
+        return claimed
+
+    def release(self, frontend: str) -> int:
+        """
+        تحرير المهام غير المكتملة التي تملكها هذه العملية لواجهة معينة، فتطالب بها عملية أخرى
+        بـ claim_unfinished دون انتظار توقف هذه العملية (مثل البوت بعد فقدان ملكية دوره)
+
+        Args:
+            frontend: الواجهة ('web' أو 'telegram')
+
+        Returns:
+            عدد المهام المحررة
+        """
+        try:
+            cursor = self._execute(
+                f"UPDATE jobs SET worker = '', updated_at = ? WHERE frontend = ? AND worker = ? "
+                f"AND state IN ({','.join('?' * len(UNFINISHED_STATES))})",
+                (time.time(), frontend, _worker_id()) + UNFINISHED_STATES
+            )
+            return cursor.rowcount
+        except sqlite3.Error as e:
+            logger.error("خطأ في تحرير المهام غير المكتملة في السجل: %s", e)
+            return 0
+
+    def completed(self, frontend: str) -> List[Dict[str, Any]]:
+        """المهام المكتملة لواجهة معينة (لاستعادة روابط الملفات بعد إعادة التشغيل)"""
+        try:
+            rows = self._execute(
+                "SELECT * FROM jobs WHERE frontend = ? AND state = 'completed'", (frontend,)
+            ).fetchall()
+        except sqlite3.Error as e:
+            logger.error("خطأ في قراءة المهام المكتملة من السجل: %s", e)
+            return []
+        return [self._row_to_dict(row) for row in rows]
+
+    def prune(self, max_age: float) -> int:
+        """
+        حذف المهام المنتهية (مكتملة أو فاشلة) الأقدم من max_age ثانية
+
+        Returns:
+            عدد المهام المحذوفة
+        """
+        try:
+            cursor = self._execute(
+                "DELETE FROM jobs WHERE state IN ('completed', 'failed') AND updated_at < ?",
+                (time.time() - max_age,)
+            )
+            return cursor.rowcount
+        except sqlite3.Error as e:
+            logger.error("خطأ في تنظيف السجل: %s", e)
+            return 0
+
+    @staticmethod
+    def _row_to_dict(row: sqlite3.Row) -> Dict[str, Any]:
+        job = dict(row)
+        job['payload'] = json.loads(job['payload'] or '{}')
+        return job
+
+
+_journal: Optional[JobJournal] = None
+_journal_lock = threading.Lock()
+
+
+def get_journal() -> JobJournal:
+    """
+    سجل المهام المشترك للعملية (يستخدمه البوت وواجهة الويب)
+    """
+    global _journal
+    with _journal_lock:
+        if _journal is None:
+            from config import JOB_JOURNAL_PATH
+            _journal = JobJournal(JOB_JOURNAL_PATH)
+        return _journal
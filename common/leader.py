@@ -0,0 +1,182 @@
+import os
+import time
+import socket
+import logging
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from typing import Optional
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+
+def _holder_id() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+class Lease(ABC):
+    """
+    ملكية حصرية لدور واحد (مثل تشغيل البوت) بين عدة عمليات
+
+    تحاول العمليات الاحتياطية acquire دوريًا، ويجدد المالك ملكيته بـ renew كل renew_interval؛
+    إذا فشل التجديد فقد المالك دوره ويجب أن يتوقف عنه.
+    """
+
+    # الفترة بين التجديدات ومحاولات الاستحواذ (بالثواني)
+    renew_interval: float = 5.0
+
+    @abstractmethod
+    def acquire(self) -> bool:
+        """محاولة الاستحواذ على الدور (True إذا أصبحت هذه العملية مالكته)"""
+
+    def renew(self) -> bool:
+        """تجديد الملكية (False إذا فقدتها هذه العملية)"""
+        return True
+
+    @abstractmethod
+    def release(self) -> None:
+        """التخلي عن الدور إذا كانت هذه العملية مالكته"""
+
+
+class FileLease(Lease):
+    """
+    ملكية عبر قفل ملف (flock) بين العمليات على نفس الجهاز، مثل عمال gunicorn
+
+    يحرر نظام التشغيل القفل تلقائيًا عند توقف العملية المالكة، فتستحوذ عليه عملية أخرى
+    عند محاولتها التالية.
+    """
+
+    def __init__(self, path: str, renew_interval: float = 5.0):
+        """
+        Args:
+            path: مسار ملف القفل
+            renew_interval: الفترة بين محاولات الاستحواذ (بالثواني)
+        """
+        if fcntl is None:
+            raise RuntimeError('أقفال الملفات (fcntl) غير مدعومة على هذا النظام')
+        self.path = path
+        self.renew_interval = renew_interval
+        self._fd: Optional[int] = None
+
+    def acquire(self) -> bool:
+        if self._fd is not None:
+            return True
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            return False
+        # كتابة المالك الحالي للتشخيص فقط
+        os.ftruncate(fd, 0)
+        os.write(fd, _holder_id().encode())
+        self._fd = fd
+        return True
+
+    def release(self) -> None:
+        if self._fd is None:
+            return
+        try:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+        finally:
+            os.close(self._fd)
+            self._fd = None
+
+
+class SQLiteLease(Lease):
+    """
+    ملكية بمدة صلاحية في قاعدة SQLite على قرص مشترك، لعمليات على أجهزة مختلفة
+
+    ينتقل الدور إلى عملية أخرى إذا لم يجدد المالك ملكيته خلال ttl ثانية.
+    """
+
+    def __init__(self, path: str, name: str, ttl: float = 30):
+        """
+        Args:
+            path: مسار ملف قاعدة البيانات
+            name: اسم الدور (مثل 'telegram-bot')
+            ttl: مدة صلاحية الملكية دون تجديد (بالثواني)
+        """
+        self.path = path
+        self.name = name
+        self.ttl = ttl
+        self.renew_interval = ttl / 3
+        self._holder = _holder_id()
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._conn_pid: Optional[int] = None
+
+    def _connection(self) -> sqlite3.Connection:
+        # اتصال جديد بعد fork لأن اتصالات SQLite لا تُشارك بين العمليات
+        if self._conn is None or self._conn_pid != os.getpid():
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            # لا WAL: يعتمد على ذاكرة مشتركة (mmap) لا تعمل عبر أنظمة الملفات الشبكية بين الأجهزة
+            conn.execute('PRAGMA journal_mode=DELETE')
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS leases (name TEXT PRIMARY KEY, holder TEXT NOT NULL, '
+                'expires_at REAL NOT NULL)'
+            )
+            self._conn = conn
+            self._conn_pid = os.getpid()
+            self._holder = _holder_id()
+        return self._conn
+
+    def acquire(self) -> bool:
+        now = time.time()
+        try:
+            with self._lock:
+                conn = self._connection()
+                conn.execute('BEGIN IMMEDIATE')
+                try:
+                    row = conn.execute('SELECT holder, expires_at FROM leases WHERE name = ?',
+                                       (self.name,)).fetchone()
+                    acquired = row is None or row['holder'] == self._holder or row['expires_at'] < now
+                    if acquired:
+                        conn.execute('INSERT OR REPLACE INTO leases (name, holder, expires_at) VALUES (?, ?, ?)',
+                                     (self.name, self._holder, now + self.ttl))
+                    conn.execute('COMMIT')
+                except Exception:
+                    conn.execute('ROLLBACK')
+                    raise
+        except sqlite3.Error as e:
+            logger.error("خطأ في الاستحواذ على الدور %s: %s", self.name, e)
+            return False
+        return acquired
+
+    def renew(self) -> bool:
+        try:
+            with self._lock:
+                cursor = self._connection().execute(
+                    'UPDATE leases SET expires_at = ? WHERE name = ? AND holder = ?',
+                    (time.time() + self.ttl, self.name, self._holder)
+                )
+            return cursor.rowcount == 1
+        except sqlite3.Error as e:
+            logger.error("خطأ في تجديد الدور %s: %s", self.name, e)
+            return False
+
+    def release(self) -> None:
+        try:
+            with self._lock:
+                self._connection().execute('DELETE FROM leases WHERE name = ? AND holder = ?',
+                                           (self.name, self._holder))
+        except sqlite3.Error as e:
+            logger.error("خطأ في تحرير الدور %s: %s", self.name, e)
+
+
+def get_bot_lease() -> Lease:
+    """
+    ملكية تشغيل بوت التلغرام حسب BOT_LEADER_BACKEND ('file' أو 'sqlite')
+    """
+    from config import BOT_LEADER_BACKEND, BOT_LEADER_PATH, BOT_LEADER_TTL
+    if BOT_LEADER_BACKEND == 'sqlite':
+        return SQLiteLease(BOT_LEADER_PATH, 'telegram-bot', BOT_LEADER_TTL)
+    return FileLease(BOT_LEADER_PATH, BOT_LEADER_TTL / 3)
@@ -0,0 +1,230 @@
+import os
+import sys
+import json
+import time
+import queue
+import atexit
+import logging
+import threading
+import multiprocessing
+import logging.handlers
+from typing import Any, Dict, Optional
+
+from common.tracing import current_trace
+
+# صيغة السجلات النصية (نفس الصيغة السابقة لكل الوحدات)
+TEXT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+_lock = threading.Lock()
+_handler: Optional[logging.handlers.QueueHandler] = None
+_listener: Optional[logging.handlers.QueueListener] = None
+# طابور سجلات العمليات الفرعية (spawn) ومستمعه، والعملية التي أنشأته (لا ينتقل خيطه مع fork)
+_child_queue = None
+_child_listener: Optional[logging.handlers.QueueListener] = None
+_child_queue_pid: Optional[int] = None
+
+
+class JobContextFilter(logging.Filter):
+    """
+    إضافة معرف المهمة (job_id) إلى كل سجل من سجل المراحل النشط في الخيط الحالي
+
+    يعمل في خيط المستدعي قبل وضع السجل في الطابور، لأن سجل المراحل خاص بكل خيط.
+    يمكن تمريره صراحة أيضًا: logger.info(..., extra={'job_id': job_id})
+    """
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if getattr(record, 'job_id', None) is None:
+            trace = current_trace()
+            record.job_id = trace.job_id if trace is not None else None
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """صيغة JSON بسطر واحد لكل سجل (لأنظمة جمع السجلات)"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'time': self.formatTime(record),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        if getattr(record, 'job_id', None):
+            entry['job_id'] = record.job_id
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry['exception'] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False)
+
+
+class _DeferredQueueHandler(logging.handlers.QueueHandler):
+    """
+    وضع السجلات في الطابور دون تنسيقها، فيُنسق النص ويُكتب في خيط الكتابة لا في الخيط المستدعي
+
+    يُنسق نص الاستثناء فقط مسبقًا حتى لا يبقي السجل إطارات المستدعي حية في الطابور.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+def _start_listener(handler: logging.Handler) -> None:
+    global _listener
+    _handler.queue = queue.SimpleQueue()
+    _listener = logging.handlers.QueueListener(_handler.queue, handler, respect_handler_level=True)
+    _listener.start()
+
+
+def _stop_listener() -> None:
+    # كتابة ما بقي في الطابور عند خروج العملية
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def setup_logging(level: Optional[str] = None, log_format: Optional[str] = None) -> None:
+    """
+    إعداد التسجيل المركزي للعملية (مرة واحدة، وتُتجاهل الاستدعاءات التالية)
+
+    تضع الخيوط السجلات في طابور، ويُنسقها خيط كتابة واحد ويكتبها إلى stderr،
+    فلا تنتظر خيوط التحميل أو حلقة البوت عمليات الإدخال والإخراج.
+
+    Args:
+        level: مستوى التسجيل (افتراضيًا LOG_LEVEL من الإعدادات)
+        log_format: 'text' أو 'json' (افتراضيًا LOG_FORMAT من الإعدادات)
+    """
+    global _handler
+    # عملية فرعية (spawn) تعيد استيراد الوحدة الرئيسية قبل تشغيل هدفها: يُعد التسجيل بعدها
+    # (setup_child_logging في مجمع الاستخراج، أو setup_logging من وحدة الهدف)
+    if getattr(multiprocessing.current_process(), '_inheriting', False):
+        return
+    with _lock:
+        if _handler is not None:
+            return
+        from config import LOG_LEVEL, LOG_FORMAT
+        level = (level or LOG_LEVEL).upper()
+        log_format = (log_format or LOG_FORMAT).lower()
+
+        output = logging.StreamHandler(sys.stderr)
+        output.setFormatter(JsonFormatter() if log_format == 'json' else logging.Formatter(TEXT_FORMAT))
+
+        _handler = _DeferredQueueHandler(queue.SimpleQueue())
+        _handler.addFilter(JobContextFilter())
+        _start_listener(output)
+
+        root = logging.getLogger()
+        root.setLevel(level)
+        root.addHandler(_handler)
+        atexit.register(_stop_listener)
+        # خيط الكتابة لا ينتقل إلى العمليات الفرعية (fork)، فتبدأ كل عملية فرعية خيطًا وطابورًا جديدين
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=lambda: _start_listener(output))
+
+
+class _PipeQueueHandler(logging.handlers.QueueHandler):
+    """
+    وضع السجلات في طابور بين العمليات (SimpleQueue) يكتب إلى الأنبوب مباشرة دون خيط وسيط،
+    فيصل السجل إلى العملية الرئيسية قبل نتيجة المهمة التي سجلته ولا يضيع عند إنهاء العملية
+    """
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        self.queue.put(record)
+
+
+class _PipeQueueListener(logging.handlers.QueueListener):
+    """مستمع على SimpleQueue (بلا مهلة أو put_nowait)"""
+
+    def dequeue(self, block: bool) -> logging.LogRecord:
+        return self.queue.get()
+
+    def enqueue_sentinel(self) -> None:
+        self.queue.put(self._sentinel)
+
+
+def child_log_queue(context) -> Any:
+    """
+    طابور تضع فيه العمليات الفرعية المنشأة بـ spawn (مثل مجمع الاستخراج) سجلاتها، فيمررها مستمع
+    في هذه العملية إلى خيط الكتابة نفسه ولا تكتب العمليات الفرعية إلى stderr بنفسها
+
+    Args:
+        context: سياق multiprocessing الذي تُنشأ به العمليات الفرعية
+
+    Returns:
+        الطابور الذي يُمرر إلى setup_child_logging في كل عملية فرعية
+    """
+    global _child_queue, _child_listener, _child_queue_pid
+    setup_logging()
+    with _lock:
+        if _child_queue is None or _child_queue_pid != os.getpid():
+            _child_queue = context.SimpleQueue()
+            # السجلات مصفاة حسب المستوى في العملية الفرعية، فتُمرر كما هي
+            _child_listener = _PipeQueueListener(_child_queue, _handler)
+            _child_listener.start()
+            _child_queue_pid = os.getpid()
+            # atexit بترتيب عكسي: يتوقف هذا المستمع قبل خيط الكتابة فلا تضيع سجلاته الأخيرة
+            atexit.register(_child_listener.stop)
+        return _child_queue
+
+
+def setup_child_logging(log_queue: Any, level: int) -> None:
+    """
+    إعداد التسجيل في عملية فرعية: إرسال السجلات إلى طابور العملية الرئيسية (child_log_queue)
+
+    يُستدعى من دالة تهيئة العملية الفرعية، ويستبدل ما أعده استيراد الوحدة الرئيسية فيها
+    (spawn يعيد استيرادها فتستدعي setup_logging) حتى لا يُكتب السجل مرتين، وتصبح
+    استدعاءات setup_logging التالية بلا أثر.
+
+    Args:
+        log_queue: الطابور من child_log_queue في العملية الرئيسية
+        level: مستوى التسجيل في العملية الرئيسية
+    """
+    global _handler
+    with _lock:
+        root = logging.getLogger()
+        if _handler is not None:
+            root.removeHandler(_handler)
+            _stop_listener()
+        # QueueHandler (لا _DeferredQueueHandler) ينسق الرسالة قبل وضعها في الطابور لأن معاملاتها قد لا تُنقل عبر pickle
+        _handler = _PipeQueueHandler(log_queue)
+        _handler.addFilter(JobContextFilter())
+        root.setLevel(level)
+        root.addHandler(_handler)
+
+
+class LogThrottle:
+    """
+    تحديد معدل سجلات متكررة (مثل سطور تقدم التحميل): سجل واحد على الأكثر لكل مفتاح كل interval ثانية
+    """
+
+    def __init__(self, interval: float, max_keys: int = 1024):
+        """
+        Args:
+            interval: أقل فترة بين سجلين لنفس المفتاح بالثواني (0 = بلا تحديد)
+            max_keys: الحد الأقصى للمفاتيح المتتبعة (يُحذف الأقدم عند تجاوزه)
+        """
+        self.interval = interval
+        self.max_keys = max_keys
+        self._last: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def allow(self, key: str) -> bool:
+        """هل يُسجل سطر لهذا المفتاح الآن (ويُحسب وقته إن كان كذلك)"""
+        now = time.monotonic()
+        with self._lock:
+            last = self._last.get(key)
+            if last is not None and now - last < self.interval:
+                return False
+            if last is None and len(self._last) >= self.max_keys:
+                self._last.pop(next(iter(self._last)))
+            self._last[key] = now
+            return True
+
+    def forget(self, key: str) -> None:
+        """إنهاء تتبع مفتاح (مثل اكتمال الملف)"""
+        with self._lock:
+            self._last.pop(key, None)
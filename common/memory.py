@@ -0,0 +1,160 @@
+import os
+import gc
+import time
+import logging
+import threading
+import tracemalloc
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, Optional
+
+from common.metrics import JOB_MEMORY_BYTES, PROCESS_RSS_BYTES
+
+logger = logging.getLogger(__name__)
+
+
+def rss_bytes() -> int:
+    """الذاكرة المقيمة الحالية للعملية بالبايت (أو أعلى قيمة لها إذا لم يتوفر /proc)"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class MemoryMonitor:
+    """
+    تشخيص الذاكرة للعملية الحالية: الذاكرة المقيمة وحجم المخازن المسجلة دائمًا،
+    ومع التفعيل تتبع التخصيصات عبر tracemalloc ومقارنتها بلقطة أساس
+
+    تُحسب لكل مهمة الزيادة في الذاكرة المقيمة (والمخصصة عند التفعيل) بين بدئها وانتهائها، وهي
+    تقريبية عند تزامن المهام لأن القياس على مستوى العملية، لكن تراكمها يكشف المهام التي تبقي ذاكرة بعدها.
+    """
+
+    def __init__(self, enabled: bool = False, frames: int = 1, report_interval: float = 0.0):
+        """
+        Args:
+            enabled: تفعيل tracemalloc (يبطئ التخصيصات، لذا يُفعل للتشخيص فقط)
+            frames: عدد إطارات الاستدعاء المحفوظة لكل تخصيص
+            report_interval: الفترة بين سطور ملخص الذاكرة في السجل بالثواني (0 = بلا سجل دوري)
+        """
+        self.enabled = enabled
+        self.frames = frames
+        self.report_interval = report_interval
+        self._sizes: Dict[str, Callable[[], int]] = {}
+        self._baseline: Optional[tracemalloc.Snapshot] = None
+        self._lock = threading.Lock()
+        if enabled:
+            tracemalloc.start(frames)
+            self._baseline = tracemalloc.take_snapshot()
+        if enabled and report_interval > 0:
+            threading.Thread(target=self._report_loop, name='memory-report', daemon=True).start()
+
+    def register(self, name: str, size: Callable[[], int]) -> None:
+        """
+        تسجيل مخزن في الذاكرة يُعرض عدد عناصره في التقرير (مثل جلسات المستخدمين)
+
+        Args:
+            name: اسم المخزن
+            size: دالة تعيد عدد العناصر الحالي
+        """
+        with self._lock:
+            self._sizes[name] = size
+
+    def sizes(self) -> Dict[str, int]:
+        """عدد العناصر الحالي في كل مخزن مسجل"""
+        with self._lock:
+            sizes = dict(self._sizes)
+        return {name: size() for name, size in sizes.items()}
+
+    @contextmanager
+    def account(self, job) -> Iterator[None]:
+        """
+        قياس زيادة الذاكرة خلال تنفيذ مهمة وحفظها في job.memory
+
+        Args:
+            job: المهمة (Job)
+        """
+        rss_before = rss_bytes()
+        traced_before = tracemalloc.get_traced_memory()[0] if self.enabled else None
+        try:
+            yield
+        finally:
+            rss_delta = rss_bytes() - rss_before
+            job.memory = {'rss_delta': rss_delta}
+            JOB_MEMORY_BYTES.observe(max(rss_delta, 0), kind='rss')
+            if traced_before is not None:
+                traced_delta = tracemalloc.get_traced_memory()[0] - traced_before
+                job.memory['traced_delta'] = traced_delta
+                JOB_MEMORY_BYTES.observe(max(traced_delta, 0), kind='traced')
+
+    def reset_baseline(self) -> None:
+        """أخذ لقطة أساس جديدة تُقارن بها التخصيصات التالية"""
+        if self.enabled:
+            gc.collect()
+            self._baseline = tracemalloc.take_snapshot()
+
+    def report(self, limit: int = 20) -> Dict:
+        """
+        تقرير الذاكرة الحالي
+
+        Args:
+            limit: عدد مواضع التخصيص الأكثر نموًا منذ لقطة الأساس
+
+        Returns:
+            الذاكرة المقيمة، وحجم المخازن المسجلة، وعدد كائنات جامع المهملات،
+            ومع التفعيل الذاكرة المخصصة وأعلى قيمة لها ومواضع نموها
+        """
+        gc.collect()
+        report = {
+            'rss_bytes': rss_bytes(),
+            'gc_objects': len(gc.get_objects()),
+            'sizes': self.sizes(),
+            'tracemalloc': self.enabled,
+        }
+        if self.enabled:
+            current, peak = tracemalloc.get_traced_memory()
+            report['traced_bytes'] = current
+            report['traced_peak_bytes'] = peak
+            snapshot = tracemalloc.take_snapshot().filter_traces((
+                tracemalloc.Filter(False, tracemalloc.__file__),
+                tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+            ))
+            report['top_growth'] = [{
+                'location': str(stat.traceback),
+                'size_diff': stat.size_diff,
+                'size': stat.size,
+                'count_diff': stat.count_diff,
+            } for stat in snapshot.compare_to(self._baseline, 'lineno')[:limit]]
+        return report
+
+    def _report_loop(self) -> None:
+        while True:
+            time.sleep(self.report_interval)
+            try:
+                report = self.report(limit=3)
+            except Exception as e:
+                logger.error("خطأ في تقرير الذاكرة: %s", e)
+                continue
+            growth = ', '.join(f"{item['location']} {item['size_diff'] / 1024:+.0f}KB"
+                               for item in report['top_growth'])
+            logger.info("الذاكرة: مقيمة %.1fMB، مخصصة %.1fMB، المخازن %s، أكثر المواضع نموًا: %s",
+                        report['rss_bytes'] / (1024 * 1024), report['traced_bytes'] / (1024 * 1024),
+                        report['sizes'], growth)
+
+
+_monitor: Optional[MemoryMonitor] = None
+_monitor_lock = threading.Lock()
+
+
+def get_memory_monitor() -> MemoryMonitor:
+    """
+    مراقب الذاكرة المشترك في العملية الحالية (من إعدادات MEMORY_DIAGNOSTICS_*)
+    """
+    global _monitor
+    with _monitor_lock:
+        if _monitor is None:
+            from config import MEMORY_DIAGNOSTICS_ENABLED, MEMORY_TRACE_FRAMES, MEMORY_REPORT_INTERVAL
+            _monitor = MemoryMonitor(MEMORY_DIAGNOSTICS_ENABLED, MEMORY_TRACE_FRAMES, MEMORY_REPORT_INTERVAL)
+            PROCESS_RSS_BYTES.set_function(rss_bytes)
+        return _monitor
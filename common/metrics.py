@@ -0,0 +1,339 @@
+import os
+import json
+import time
+import socket
+import logging
+import threading
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+# حدود الفترات الافتراضية للمدد (بالثواني)
+DEFAULT_TIME_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+# حدود الفترات لمعدل التحميل (بايت/ثانية)
+THROUGHPUT_BUCKETS = (64e3, 256e3, 1e6, 2.5e6, 5e6, 10e6, 25e6, 50e6, 100e6)
+# حدود الفترات لأحجام الذاكرة (بالبايت)
+MEMORY_BUCKETS = (64e3, 256e3, 1e6, 4e6, 16e6, 64e6, 256e6)
+
+
+class _Metric:
+    """أساس المقاييس: قيم مفهرسة بقيم التسميات"""
+    type = ''
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], object] = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, '')) for name in self.labelnames)
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            values = [[list(key), value] for key, value in self._values.items()]
+        return {
+            'type': self.type,
+            'help': self.documentation,
+            'labelnames': list(self.labelnames),
+            'values': values,
+        }
+
+
+class Counter(_Metric):
+    """عداد تراكمي لا يتناقص"""
+    type = 'counter'
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+
+class Gauge(_Metric):
+    """قيمة لحظية يمكن أن تزيد وتنقص، أو تُقرأ من دالة عند التصدير"""
+    type = 'gauge'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._function: Optional[Callable[[], float]] = None
+
+    def set(self, value: float, **labels) -> None:
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, **labels) -> None:
+        self.inc(-amount, **labels)
+
+    def set_function(self, function: Callable[[], float]) -> None:
+        """قراءة القيمة من دالة عند كل تصدير (للمقاييس بدون تسميات)"""
+        self._function = function
+
+    def snapshot(self) -> Dict:
+        if self._function is not None:
+            try:
+                self.set(float(self._function()))
+            except Exception as e:
+                logger.error("خطأ في قراءة المقياس %s: %s", self.name, e)
+        return super().snapshot()
+
+
+class Histogram(_Metric):
+    """توزيع القيم على فترات مع المجموع والعدد"""
+    type = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_TIME_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            # [عدد كل فترة غير تراكمي...، عدد ما فوق آخر فترة، المجموع، العدد]
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [0] * (len(self.buckets) + 1) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry[i] += 1
+                    break
+            else:
+                entry[len(self.buckets)] += 1
+            entry[-2] += value
+            entry[-1] += 1
+
+    @contextmanager
+    def time(self, **labels) -> Iterator[None]:
+        """قياس مدة تنفيذ كتلة من الكود"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def snapshot(self) -> Dict:
+        data = super().snapshot()
+        data['buckets'] = list(self.buckets)
+        return data
+
+
+class MetricsRegistry:
+    """
+    سجل المقاييس للعملية الحالية
+
+    تكتب كل عملية (البوت، عمال gunicorn، ...) لقطة من مقاييسها في ملف داخل مجلد مشترك،
+    وتجمع نقطة /metrics جميع اللقطات حتى تظهر مقاييس البوت وواجهة الويب معًا.
+    """
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+        self._flusher: Optional[threading.Thread] = None
+        self.metrics_dir: Optional[str] = None
+
+    def _register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self._register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_TIME_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def snapshot(self) -> Dict[str, Dict]:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return {metric.name: metric.snapshot() for metric in metrics}
+
+    def _snapshot_path(self) -> str:
+        return os.path.join(self.metrics_dir, f"metrics_{socket.gethostname()}_{os.getpid()}.json")
+
+    def configure(self, metrics_dir: str) -> None:
+        """تحديد المجلد المشترك للقطات المقاييس"""
+        os.makedirs(metrics_dir, exist_ok=True)
+        self.metrics_dir = metrics_dir
+
+    def flush(self) -> None:
+        """كتابة لقطة مقاييس هذه العملية (كتابة ذرية)"""
+        if not self.metrics_dir:
+            return
+        path = self._snapshot_path()
+        tmp_path = f"{path}.tmp"
+        try:
+            with open(tmp_path, 'w') as f:
+                json.dump(self.snapshot(), f)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.error("خطأ في كتابة لقطة المقاييس: %s", e)
+
+    def start_flusher(self, metrics_dir: str, interval: float = 10) -> None:
+        """بدء خيط يكتب لقطة المقاييس دوريًا"""
+        self.configure(metrics_dir)
+        if self._flusher is not None:
+            return
+
+        def loop():
+            while True:
+                self.flush()
+                time.sleep(interval)
+
+        self._flusher = threading.Thread(target=loop, name='metrics-flusher', daemon=True)
+        self._flusher.start()
+
+    def collect(self) -> Dict[str, Dict]:
+        """جمع لقطات جميع العمليات الحية في المجلد المشترك"""
+        if not self.metrics_dir:
+            return self.snapshot()
+
+        self.flush()
+        hostname = socket.gethostname()
+        merged: Dict[str, Dict] = {}
+        for filename in os.listdir(self.metrics_dir):
+            if not (filename.startswith('metrics_') and filename.endswith('.json')):
+                continue
+            path = os.path.join(self.metrics_dir, filename)
+
+            # حذف لقطات العمليات المنتهية على نفس الجهاز
+            host, _, pid = filename[len('metrics_'):-len('.json')].rpartition('_')
+            if host == hostname and pid.isdigit() and not pid_alive(int(pid)):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+                continue
+
+            try:
+                with open(path) as f:
+                    _merge_snapshot(merged, json.load(f))
+            except (OSError, ValueError):
+                continue
+        return merged
+
+    def render(self) -> str:
+        """تصدير المقاييس المجمعة بصيغة Prometheus النصية"""
+        return render_prometheus(self.collect())
+
+
+def pid_alive(pid: int) -> bool:
+    """التحقق من أن العملية ذات المعرف pid ما زالت تعمل على هذا الجهاز"""
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _merge_snapshot(merged: Dict[str, Dict], snapshot: Dict[str, Dict]) -> None:
+    """دمج لقطة في المجموع: جمع العدادات والمقاييس اللحظية والفترات حسب التسميات"""
+    for name, data in snapshot.items():
+        target = merged.setdefault(name, {**data, 'values': []})
+        index = {tuple(key): i for i, (key, _) in enumerate(target['values'])}
+        for key, value in data['values']:
+            i = index.get(tuple(key))
+            if i is None:
+                target['values'].append([key, value])
+                index[tuple(key)] = len(target['values']) - 1
+            elif isinstance(value, list):
+                existing = target['values'][i][1]
+                target['values'][i][1] = [a + b for a, b in zip(existing, value)]
+            else:
+                target['values'][i][1] += value
+
+
+def _format_labels(labelnames: List[str], key: List[str], extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = [(n, v) for n, v in zip(labelnames, key)]
+    if extra is not None:
+        pairs.append(extra)
+    if not pairs:
+        return ''
+    escaped = (v.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, v in pairs)
+    return '{' + ','.join(f'{n}="{v}"' for (n, _), v in zip(pairs, escaped)) + '}'
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value))
+
+
+def render_prometheus(metrics: Dict[str, Dict]) -> str:
+    """تحويل المقاييس إلى صيغة Prometheus النصية (الإصدار 0.0.4)"""
+    lines = []
+    for name in sorted(metrics):
+        data = metrics[name]
+        labelnames = data['labelnames']
+        lines.append(f"# HELP {name} {data['help']}")
+        lines.append(f"# TYPE {name} {data['type']}")
+        for key, value in data['values']:
+            if data['type'] != 'histogram':
+                lines.append(f"{name}{_format_labels(labelnames, key)} {_format_value(value)}")
+                continue
+
+            buckets = data['buckets']
+            cumulative = 0
+            for bound, count in zip(list(buckets) + [float('inf')], value[:len(buckets) + 1]):
+                cumulative += count
+                le = _format_value(bound)
+                lines.append(f"{name}_bucket{_format_labels(labelnames, key, ('le', le))} {cumulative}")
+            lines.append(f"{name}_sum{_format_labels(labelnames, key)} {_format_value(value[-2])}")
+            lines.append(f"{name}_count{_format_labels(labelnames, key)} {value[-1]}")
+    return '\n'.join(lines) + '\n'
+
+
+# السجل المشترك ومقاييس خط التحميل
+registry = MetricsRegistry()
+
+EXTRACTION_SECONDS = registry.histogram(
+    'ytdl_extraction_seconds', 'زمن استخراج معلومات الفيديو', ['backend', 'phase'])
+EXTRACTION_HEDGES = registry.counter(
+    'ytdl_extraction_hedges_total', 'عمليات الاستخراج التي بدأت واجهة خلفية ثانية بعد تجاوز ميزانية الزمن', ['phase'])
+BACKEND_REQUESTS = registry.counter(
+    'ytdl_backend_requests_total', 'طلبات الواجهات الخلفية حسب العملية والنتيجة', ['backend', 'operation', 'result'])
+BACKEND_SUCCESS_RATE = registry.gauge(
+    'ytdl_backend_success_rate', 'المتوسط المتحرك لنسبة نجاح كل واجهة خلفية', ['backend'])
+DOWNLOAD_BYTES = registry.counter(
+    'ytdl_download_bytes_total', 'إجمالي البايتات المحملة', ['type'])
+DOWNLOAD_THROUGHPUT = registry.histogram(
+    'ytdl_download_throughput_bytes_per_second', 'معدل التحميل لكل ملف', ['type'],
+    buckets=THROUGHPUT_BUCKETS)
+POSTPROCESS_SECONDS = registry.histogram(
+    'ytdl_postprocess_seconds', 'زمن المعالجة اللاحقة (FFmpeg)', ['step'])
+UPLOAD_SECONDS = registry.histogram(
+    'ytdl_upload_seconds', 'زمن رفع الملف للمستخدم', ['frontend', 'type'])
+QUEUE_DEPTH = registry.gauge(
+    'ytdl_queue_depth', 'عدد المهام المنتظرة في الطابور')
+ACTIVE_JOBS = registry.gauge(
+    'ytdl_active_jobs', 'عدد المهام قيد التنفيذ')
+WATCHDOG_KILLS = registry.counter(
+    'ytdl_watchdog_kills_total', 'المراحل التي أوقفها المراقب لتجاوز مهلتها أو توقف تقدمها', ['stage'])
+ADMISSION_REJECTED = registry.counter(
+    'ytdl_admission_rejected_total', 'الطلبات المرفوضة لامتلاء السعة حسب المورد', ['resource'])
+JOBS_TOTAL = registry.counter(
+    'ytdl_jobs_total', 'عدد المهام المنتهية حسب الحالة', ['status'])
+CACHE_REQUESTS = registry.counter(
+    'ytdl_cache_requests_total', 'طلبات الذاكرة المؤقتة حسب النتيجة (hit/miss/coalesced)', ['cache', 'result'])
+CLEANUP_EVICTIONS = registry.counter(
+    'ytdl_cleanup_evictions_total', 'عدد الملفات المحذوفة بواسطة التنظيف الدوري')
+PROCESS_RSS_BYTES = registry.gauge(
+    'ytdl_process_rss_bytes', 'الذاكرة المقيمة (مجموع العمليات)')
+JOB_MEMORY_BYTES = registry.histogram(
+    'ytdl_job_memory_bytes', 'زيادة الذاكرة خلال كل مهمة (مقيمة rss، أو مخصصة traced مع التشخيص)', ['kind'],
+    buckets=MEMORY_BUCKETS)
+BOT_LEADERS = registry.gauge(
+    'ytdl_bot_leaders', 'عدد العمليات التي تشغل بوت التلغرام (يجب أن يكون 1)')
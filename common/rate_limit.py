@@ -0,0 +1,121 @@
+import time
+import threading
+from typing import Dict, Hashable, Tuple
+
+
+class TokenBucket:
+    """
+    دلو رموز (Token Bucket) يمتلئ بمعدل ثابت حتى سعة قصوى
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        """
+        Args:
+            rate: عدد الرموز المضافة في الثانية
+            capacity: السعة القصوى للدلو
+        """
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        elapsed = now - self.updated_at
+        if elapsed > 0:
+            self.tokens = min(self.capacity, self.tokens + elapsed * self.rate)
+            self.updated_at = now
+
+    def try_consume(self, cost: float) -> Tuple[bool, float]:
+        """
+        محاولة استهلاك رموز من الدلو
+
+        Args:
+            cost: عدد الرموز المطلوبة
+
+        Returns:
+            (نجاح العملية، عدد الثواني المتبقية حتى تتوفر الرموز)
+        """
+        now = time.monotonic()
+        self._refill(now)
+
+        # الطلب الأكبر من السعة يُقبل عندما يكون الدلو ممتلئًا حتى لا يُرفض للأبد
+        cost = min(cost, self.capacity)
+        if self.tokens >= cost:
+            self.tokens -= cost
+            return True, 0.0
+
+        if self.rate <= 0:
+            return False, float('inf')
+        return False, (cost - self.tokens) / self.rate
+
+    def refund(self, cost: float) -> None:
+        """إعادة رموز استُهلكت لمهمة لم تُنفذ (بحد السعة كما في try_consume)"""
+        self._refill(time.monotonic())
+        self.tokens = min(self.capacity, self.tokens + min(cost, self.capacity))
+
+    @property
+    def is_full(self) -> bool:
+        self._refill(time.monotonic())
+        return self.tokens >= self.capacity
+
+
+class RateLimiter:
+    """
+    محدد معدل يحتفظ بدلو رموز مستقل لكل مفتاح (مستخدم تلغرام أو عنوان IP)
+    """
+
+    def __init__(self, rate: float, capacity: float, max_keys: int = 10000):
+        """
+        Args:
+            rate: معدل امتلاء الدلو (وحدة تكلفة في الثانية)
+            capacity: سعة الدلو (أقصى تكلفة متراكمة مسموحة دفعة واحدة)
+            max_keys: الحد الأقصى لعدد المفاتيح المحفوظة قبل حذف الدلاء الممتلئة
+        """
+        self.rate = rate
+        self.capacity = capacity
+        self.max_keys = max_keys
+        self._buckets: Dict[Hashable, TokenBucket] = {}
+        self._lock = threading.Lock()
+
+    def try_acquire(self, key: Hashable, cost: float = 1.0) -> Tuple[bool, float]:
+        """
+        محاولة حجز تكلفة مهمة لمفتاح معين
+
+        Args:
+            key: مفتاح العميل
+            cost: تكلفة المهمة
+
+        Returns:
+            (السماح بالمهمة، عدد الثواني المقترح قبل إعادة المحاولة)
+        """
+        if self.rate <= 0:
+            return True, 0.0
+
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                if len(self._buckets) >= self.max_keys:
+                    self._evict_full()
+                bucket = self._buckets[key] = TokenBucket(self.rate, self.capacity)
+            return bucket.try_consume(cost)
+
+    def refund(self, key: Hashable, cost: float = 1.0) -> None:
+        """
+        إعادة تكلفة حُجزت بـ try_acquire لمهمة لم تُنفذ (طلب مكرر أعاد مهمة قائمة، أو رفض الطابور)
+
+        Args:
+            key: مفتاح العميل
+            cost: التكلفة المحجوزة
+        """
+        if self.rate <= 0:
+            return
+
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is not None:
+                bucket.refund(cost)
+
+    def _evict_full(self) -> None:
+        """حذف الدلاء الممتلئة لأنها مطابقة لدلو جديد"""
+        for key in [k for k, b in self._buckets.items() if b.is_full]:
+            del self._buckets[key]
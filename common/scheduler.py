@@ -0,0 +1,245 @@
+import time
+import heapq
+import logging
+import threading
+from concurrent.futures import Future, InvalidStateError
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from common.admission import CapacityExceeded, estimate_wait
+from common.cancellation import JobCancelled, StageTimeout
+from common.jobs import Job
+from common.memory import get_memory_monitor
+from common.metrics import QUEUE_DEPTH, ACTIVE_JOBS, JOBS_TOTAL, ADMISSION_REJECTED
+from common.tracing import activate, profile_to
+
+logger = logging.getLogger(__name__)
+
+
+def _settle(future: Future, result: Any = None, error: Optional[BaseException] = None) -> None:
+    """
+    إعطاء مستقبل المهمة نتيجتها، إلا إذا ألغاه منتظره (مثل مهمة asyncio ألغيت أثناء انتظاره
+    عبر wrap_future)، حتى لا يتوقف خيط العامل بخطأ InvalidStateError
+    """
+    try:
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+    except InvalidStateError:
+        pass
+
+
+class FairScheduler:
+    """
+    مجدول مهام بطابور عادل موزون (Start-time Fair Queuing) ومجموعة خيوط محدودة
+
+    تحصل كل مهمة على وسم بداية افتراضي = max(الوقت الافتراضي، وسم نهاية آخر مهمة لنفس المالك)،
+    ويزداد وسم النهاية بمقدار التكلفة / الوزن. تُنفذ المهام بترتيب وسم البداية، فلا يستطيع
+    مالك يرسل مهام كثيرة أو ثقيلة أن يحتكر العمال على حساب الآخرين.
+    """
+
+    # متوسط مدة المهمة المفترض قبل انتهاء أي مهمة (بالثواني)، ووزن كل مهمة جديدة في المتوسط
+    default_duration: float = 30.0
+    _duration_alpha: float = 0.2
+
+    def __init__(self, max_workers: int = 4, max_queued: int = 0):
+        """
+        Args:
+            max_workers: الحد الأقصى لعدد المهام المنفذة بالتوازي
+            max_queued: الحد الأقصى للمهام المنتظرة قبل رفض المهام الجديدة (0 = بلا حد)
+        """
+        self.max_workers = max_workers
+        self.max_queued = max_queued
+        self.average_duration = self.default_duration
+        self._queue: List[Tuple[float, int, Job]] = []
+        self._finish_tags: Dict[str, float] = {}
+        self._virtual_time = 0.0
+        self._seq = 0
+        self._running = 0
+        self._workers: List[threading.Thread] = []
+        self._cond = threading.Condition()
+
+    def submit(self, func: Callable[[Job], Any], owner: str, cost: float = 1.0,
+               weight: float = 1.0, job_id: Optional[str] = None,
+               profile_path: Optional[str] = None, admit: bool = True) -> Job:
+        """
+        إضافة مهمة إلى الطابور
+
+        Args:
+            func: الدالة المنفذة، تستقبل كائن Job
+            owner: مالك المهمة
+            cost: التكلفة التقديرية
+            weight: وزن المالك (وزن أعلى = حصة أكبر)
+            job_id: معرف اختياري للمهمة
+            profile_path: مسار لحفظ ملف cProfile لتنفيذ المهمة (اختياري)
+            admit: تطبيق حد الطابور (False للمهام المستأنفة من السجل التي قُبلت سابقًا)
+
+        Returns:
+            كائن Job (يمكن انتظار job.future)
+
+        Raises:
+            CapacityExceeded: إذا امتلأ الطابور
+        """
+        job = Job(func, owner, cost=cost, weight=weight, job_id=job_id, profile_path=profile_path)
+        return self.submit_job(job, admit)
+
+    def submit_job(self, job: Job, admit: bool = True) -> Job:
+        """إضافة كائن مهمة جاهز إلى الطابور (مع رفع CapacityExceeded إذا امتلأ)"""
+        with self._cond:
+            if admit and self.max_queued and len(self._queue) >= self.max_queued:
+                ADMISSION_REJECTED.inc(resource='download')
+                retry_after = estimate_wait(len(self._queue) + 1, self.max_workers, self.average_duration)
+                raise CapacityExceeded('download', retry_after)
+            start_tag = max(self._virtual_time, self._finish_tags.get(job.owner, 0.0))
+            self._finish_tags[job.owner] = start_tag + job.cost / max(job.weight, 1e-6)
+            self._seq += 1
+            heapq.heappush(self._queue, (start_tag, self._seq, job))
+            self._ensure_workers()
+            self._cond.notify()
+        return job
+
+    def cancel(self, job: Job) -> bool:
+        """
+        إلغاء مهمة: تُحذف من الطابور فورًا إذا لم تبدأ، وإلا يُطلب من المحمل التوقف
+        عبر رمز الإلغاء فيتحرر العامل عند أول تحديث للتقدم
+
+        Args:
+            job: المهمة المراد إلغاؤها
+
+        Returns:
+            False إذا كانت المهمة منتهية أو ملغاة مسبقًا
+        """
+        if job.done or not job.cancel_token.cancel():
+            return False
+
+        with self._cond:
+            for index, (_, _, queued) in enumerate(self._queue):
+                if queued is job:
+                    self._queue.pop(index)
+                    heapq.heapify(self._queue)
+                    break
+            else:
+                # المهمة قيد التنفيذ: سينهيها خيط العامل
+                return True
+
+        self._finish_cancelled(job)
+        return True
+
+    def _finish_cancelled(self, job: Job) -> None:
+        job.status = 'cancelled'
+        job.finished_at = time.time()
+        job.trace.end_all()
+        _settle(job.future, error=JobCancelled())
+        job.release()
+        JOBS_TOTAL.inc(status='cancelled')
+        logger.info("تم إلغاء المهمة %s", job.id)
+
+    def queue_position(self, job: Job) -> Optional[Tuple[int, float]]:
+        """
+        موقع مهمة منتظرة في الطابور والوقت المقدر لبدئها
+
+        الموقع تقديري لأن مهام مالكين جدد قد تتقدم عليها حسب الجدولة العادلة.
+
+        Returns:
+            (الموقع بدءًا من 1، الثواني المقدرة حتى البدء) أو None إذا لم تكن منتظرة
+        """
+        with self._cond:
+            for position, (_, _, queued) in enumerate(sorted(self._queue), start=1):
+                if queued is job:
+                    return position, estimate_wait(position, self.max_workers, self.average_duration)
+        return None
+
+    @property
+    def queue_depth(self) -> int:
+        return len(self._queue)
+
+    @property
+    def active_jobs(self) -> int:
+        return self._running
+
+    def _ensure_workers(self) -> None:
+        """إنشاء خيوط العمال عند أول استخدام"""
+        while len(self._workers) < self.max_workers:
+            worker = threading.Thread(
+                target=self._worker_loop,
+                name=f"job-worker-{len(self._workers)}",
+                daemon=True
+            )
+            self._workers.append(worker)
+            worker.start()
+
+    def _next_job(self) -> Job:
+        with self._cond:
+            while not self._queue:
+                self._cond.wait()
+            start_tag, _, job = heapq.heappop(self._queue)
+            self._virtual_time = max(self._virtual_time, start_tag)
+            if not self._queue:
+                # الطابور فارغ: لا حاجة لتذكر وسوم النهاية القديمة
+                self._finish_tags.clear()
+            self._running += 1
+            return job
+
+    def _worker_loop(self) -> None:
+        while True:
+            job = self._next_job()
+            try:
+                self._run(job)
+            finally:
+                with self._cond:
+                    self._running -= 1
+
+    def _run(self, job: Job) -> None:
+        job.status = 'running'
+        job.started_at = time.time()
+        job.trace.add('queued', job.created_at, job.started_at)
+        try:
+            with activate(job.trace), profile_to(job.profile_path), get_memory_monitor().account(job):
+                job.cancel_token.check()
+                job.result = job.func(job)
+        except StageTimeout as e:
+            # أوقف المراقب مرحلة عالقة: المهمة فاشلة وليست ملغاة من المستخدم
+            logger.error("فشلت المهمة %s: %s", job.id, e)
+            job.status = 'failed'
+            job.error = str(e)
+            _settle(job.future, error=e)
+        except JobCancelled:
+            self._finish_cancelled(job)
+            return
+        except Exception as e:
+            logger.error("فشلت المهمة %s: %s", job.id, e)
+            job.status = 'failed'
+            job.error = str(e)
+            _settle(job.future, error=e)
+        else:
+            job.status = 'completed'
+            job.progress = 100
+            _settle(job.future, job.result)
+        job.trace.end_all()
+        job.finished_at = time.time()
+        job.release()
+        JOBS_TOTAL.inc(status=job.status)
+        if job.status == 'completed':
+            with self._cond:
+                duration = job.finished_at - job.started_at
+                self.average_duration += self._duration_alpha * (duration - self.average_duration)
+
+
+_scheduler: Optional[FairScheduler] = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler() -> FairScheduler:
+    """
+    المجدول المشترك للعملية، يستخدمه البوت وواجهة الويب معًا حتى يتقاسما نفس سعة التحميل
+    """
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            from config import MAX_CONCURRENT_JOBS, MAX_DISPATCHED_JOBS, MAX_QUEUED_JOBS, DOWNLOAD_QUEUE_BACKEND
+            # مع العمال المنفصلين ينتظر خيط المجدول نتيجة المهمة فقط، والسعة الفعلية لدى العمال
+            max_workers = MAX_CONCURRENT_JOBS if DOWNLOAD_QUEUE_BACKEND == 'local' else MAX_DISPATCHED_JOBS
+            _scheduler = FairScheduler(max_workers, MAX_QUEUED_JOBS)
+            QUEUE_DEPTH.set_function(lambda: _scheduler.queue_depth)
+            ACTIVE_JOBS.set_function(lambda: _scheduler.active_jobs)
+        return _scheduler
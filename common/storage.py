@@ -0,0 +1,275 @@
+import os
+import time
+import shutil
+import logging
+import threading
+from abc import ABC, abstractmethod
+from typing import BinaryIO, Optional
+
+try:
+    import boto3
+    from botocore.exceptions import ClientError
+except ImportError:
+    boto3 = None
+
+from common.metrics import CLEANUP_EVICTIONS
+
+logger = logging.getLogger(__name__)
+
+
+class Storage(ABC):
+    """
+    مخزن الملفات المكتملة
+
+    يحمل yt-dlp دائمًا إلى مجلد محلي (scratch_dir)، ثم يُنشر الملف المكتمل في المخزن بـ publish
+    الذي يعيد مفتاحه. تقدم الواجهات الملف من local_path إن وُجد، أو تعيد توجيه المستخدم إلى
+    رابط url موقّع فلا تمر بايتات الملف عبر Python.
+    """
+
+    # المجلد المحلي الذي يحمل إليه المحمل
+    scratch_dir: str
+
+    @abstractmethod
+    def publish(self, local_path: str) -> str:
+        """
+        نشر ملف مكتمل في المخزن
+
+        Args:
+            local_path: مسار الملف في scratch_dir
+
+        Returns:
+            مفتاح الملف في المخزن
+        """
+
+    @abstractmethod
+    def exists(self, key: str) -> bool:
+        """هل الملف موجود في المخزن"""
+
+    def local_path(self, key: str) -> Optional[str]:
+        """مسار الملف على القرص المحلي (أو None إذا لم يكن محليًا)"""
+        return None
+
+    def url(self, key: str, filename: Optional[str] = None) -> Optional[str]:
+        """رابط موقّع مؤقت لتنزيل الملف مباشرة من المخزن (أو None إذا لم يكن مدعومًا)"""
+        return None
+
+    @abstractmethod
+    def open(self, key: str) -> BinaryIO:
+        """فتح الملف للقراءة"""
+
+    @abstractmethod
+    def delete(self, key: str) -> None:
+        """حذف الملف من المخزن"""
+
+    @abstractmethod
+    def cleanup(self, max_age: float) -> int:
+        """
+        حذف الملفات المنشورة الأقدم من max_age ثانية
+
+        Returns:
+            عدد الملفات المحذوفة
+        """
+
+
+class LocalStorage(Storage):
+    """
+    مخزن على القرص المحلي: الملفات تبقى في مجلد التحميل وتقدمها Flask
+    """
+
+    def __init__(self, root: str, scratch_dir: Optional[str] = None):
+        """
+        Args:
+            root: مجلد الملفات المنشورة
+            scratch_dir: مجلد التحميل (افتراضيًا نفس root فيكون النشر دون نقل)
+        """
+        self.root = os.path.abspath(root)
+        self.scratch_dir = os.path.abspath(scratch_dir or root)
+        os.makedirs(self.root, exist_ok=True)
+        os.makedirs(self.scratch_dir, exist_ok=True)
+
+    def publish(self, local_path: str) -> str:
+        key = os.path.basename(local_path)
+        if os.path.dirname(os.path.abspath(local_path)) != self.root:
+            shutil.move(local_path, os.path.join(self.root, key))
+        return key
+
+    def local_path(self, key: str) -> Optional[str]:
+        # basename يمنع الخروج من المجلد، ويقبل المسارات الكاملة المسجلة قبل إضافة المخزن
+        return os.path.join(self.root, os.path.basename(key))
+
+    def exists(self, key: str) -> bool:
+        return os.path.isfile(self.local_path(key))
+
+    def open(self, key: str) -> BinaryIO:
+        return open(self.local_path(key), 'rb')
+
+    def delete(self, key: str) -> None:
+        try:
+            os.remove(self.local_path(key))
+        except FileNotFoundError:
+            pass
+
+    def cleanup(self, max_age: float) -> int:
+        if self.root == self.scratch_dir:
+            # الملفات في مجلد التحميل نفسه ينظفها المحمل (cleanup_old_files)
+            return 0
+        return self._remove_older_than(time.time() - max_age)
+
+    def _remove_older_than(self, cutoff: float) -> int:
+        count = 0
+        for entry in os.scandir(self.root):
+            if entry.is_file() and entry.stat().st_mtime < cutoff:
+                try:
+                    os.remove(entry.path)
+                    count += 1
+                except OSError as e:
+                    logger.error("خطأ في حذف الملف %s: %s", entry.name, e)
+        CLEANUP_EVICTIONS.inc(count)
+        return count
+
+
+class TmpfsStorage(LocalStorage):
+    """
+    مخزن في الذاكرة (tmpfs مثل /dev/shm): تحميل ونشر دون إدخال/إخراج على القرص
+
+    لأن الذاكرة محدودة، تُحذف أقدم الملفات عند النشر إذا تجاوز الحجم الكلي max_bytes.
+    """
+
+    def __init__(self, root: str, max_bytes: int):
+        """
+        Args:
+            root: مجلد على نظام ملفات tmpfs
+            max_bytes: الحد الأقصى لحجم الملفات في المجلد
+        """
+        super().__init__(root)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+
+    def publish(self, local_path: str) -> str:
+        key = super().publish(local_path)
+        with self._lock:
+            self._evict(keep=key)
+        return key
+
+    def _evict(self, keep: str) -> None:
+        """حذف أقدم الملفات المكتملة حتى يعود الحجم الكلي تحت max_bytes"""
+        entries = [entry for entry in os.scandir(self.root) if entry.is_file()]
+        total = sum(entry.stat().st_size for entry in entries)
+        count = 0
+        for entry in sorted(entries, key=lambda entry: entry.stat().st_mtime):
+            if total <= self.max_bytes:
+                break
+            # الملفات الجزئية لمهام جارية والملف المنشور للتو لا تُحذف
+            if entry.name == keep or entry.name.endswith(('.part', '.ytdl')):
+                continue
+            try:
+                size = entry.stat().st_size
+                os.remove(entry.path)
+            except OSError:
+                continue
+            total -= size
+            count += 1
+        if count:
+            CLEANUP_EVICTIONS.inc(count)
+            logger.info("تم حذف %s ملفات من الذاكرة لتجاوز الحد %s بايت", count, self.max_bytes)
+
+
+class S3Storage(Storage):
+    """
+    مخزن كائنات متوافق مع S3 (AWS أو MinIO أو غيرها، يتطلب حزمة boto3)
+
+    يُرفع الملف المكتمل ثم يُحذف من القرص، وتُقدم الملفات بروابط موقّعة مؤقتة.
+    """
+
+    def __init__(self, bucket: str, scratch_dir: str, endpoint_url: Optional[str] = None,
+                 region: Optional[str] = None, access_key: Optional[str] = None,
+                 secret_key: Optional[str] = None, prefix: str = '', presign_expiry: int = 3600):
+        """
+        Args:
+            bucket: اسم الحاوية
+            scratch_dir: مجلد التحميل المحلي قبل الرفع
+            endpoint_url: عنوان الخدمة (مثل http://localhost:9000 لـ MinIO؛ افتراضيًا AWS)
+            region: المنطقة
+            access_key: مفتاح الوصول (افتراضيًا من إعدادات boto3)
+            secret_key: المفتاح السري
+            prefix: بادئة مفاتيح الكائنات
+            presign_expiry: مدة صلاحية الروابط الموقعة (بالثواني)
+        """
+        if boto3 is None:
+            raise RuntimeError('حزمة boto3 غير مثبتة. قم بتثبيتها باستخدام: pip install boto3')
+        self.bucket = bucket
+        self.scratch_dir = os.path.abspath(scratch_dir)
+        self.prefix = prefix
+        self.presign_expiry = presign_expiry
+        self.client = boto3.client(
+            's3',
+            endpoint_url=endpoint_url or None,
+            region_name=region or None,
+            aws_access_key_id=access_key or None,
+            aws_secret_access_key=secret_key or None,
+        )
+        os.makedirs(self.scratch_dir, exist_ok=True)
+
+    def publish(self, local_path: str) -> str:
+        key = f"{self.prefix}{os.path.basename(local_path)}"
+        self.client.upload_file(local_path, self.bucket, key)
+        os.remove(local_path)
+        return key
+
+    def exists(self, key: str) -> bool:
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=key)
+            return True
+        except ClientError:
+            return False
+
+    def url(self, key: str, filename: Optional[str] = None) -> Optional[str]:
+        params = {'Bucket': self.bucket, 'Key': key}
+        if filename:
+            params['ResponseContentDisposition'] = f'attachment; filename="{filename}"'
+        return self.client.generate_presigned_url('get_object', Params=params, ExpiresIn=self.presign_expiry)
+
+    def open(self, key: str) -> BinaryIO:
+        return self.client.get_object(Bucket=self.bucket, Key=key)['Body']
+
+    def delete(self, key: str) -> None:
+        self.client.delete_object(Bucket=self.bucket, Key=key)
+
+    def cleanup(self, max_age: float) -> int:
+        # يُفضل أيضًا ضبط قاعدة انتهاء صلاحية (lifecycle) على الحاوية نفسها
+        cutoff = time.time() - max_age
+        count = 0
+        paginator = self.client.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=self.prefix):
+            for obj in page.get('Contents', []):
+                if obj['LastModified'].timestamp() < cutoff:
+                    self.client.delete_object(Bucket=self.bucket, Key=obj['Key'])
+                    count += 1
+        CLEANUP_EVICTIONS.inc(count)
+        return count
+
+
+_storage: Optional[Storage] = None
+_storage_lock = threading.Lock()
+
+
+def get_storage() -> Storage:
+    """
+    المخزن المشترك حسب STORAGE_BACKEND ('local' أو 'tmpfs' أو 's3')
+    """
+    global _storage
+    with _storage_lock:
+        if _storage is None:
+            from config import (
+                STORAGE_BACKEND, DOWNLOAD_PATH, STORAGE_TMPFS_PATH, STORAGE_TMPFS_MAX_BYTES,
+                S3_BUCKET, S3_ENDPOINT_URL, S3_REGION, S3_ACCESS_KEY_ID, S3_SECRET_ACCESS_KEY,
+                S3_PREFIX, S3_PRESIGN_EXPIRY
+            )
+            if STORAGE_BACKEND == 's3':
+                _storage = S3Storage(S3_BUCKET, DOWNLOAD_PATH, S3_ENDPOINT_URL, S3_REGION,
+                                     S3_ACCESS_KEY_ID, S3_SECRET_ACCESS_KEY, S3_PREFIX, S3_PRESIGN_EXPIRY)
+            elif STORAGE_BACKEND == 'tmpfs':
+                _storage = TmpfsStorage(STORAGE_TMPFS_PATH, STORAGE_TMPFS_MAX_BYTES)
+            else:
+                _storage = LocalStorage(DOWNLOAD_PATH)
+        return _storage
@@ -0,0 +1,129 @@
+import os
+import time
+import cProfile
+import logging
+import threading
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional
+
+logger = logging.getLogger(__name__)
+
+_local = threading.local()
+
+
+class Trace:
+    """
+    سجل مراحل مهمة واحدة (استخراج، تحميل، معالجة لاحقة، رفع) مع مدة كل مرحلة
+    """
+
+    def __init__(self, job_id: str):
+        self.job_id = job_id
+        self.created_at = time.time()
+        self._spans: List[Dict] = []
+        self._open: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def add(self, name: str, start: float, end: float) -> None:
+        """
+        إضافة مرحلة منتهية
+
+        Args:
+            name: اسم المرحلة
+            start: وقت البداية (time.time)
+            end: وقت النهاية (time.time)
+        """
+        with self._lock:
+            self._spans.append({
+                'name': name,
+                'start': round(start - self.created_at, 3),
+                'duration': round(end - start, 3),
+            })
+
+    def begin(self, name: str) -> None:
+        """بدء مرحلة تُنهى لاحقًا بـ end (مفيد داخل دوال التقدم)"""
+        with self._lock:
+            self._open.setdefault(name, time.time())
+
+    def end(self, name: str) -> None:
+        """إنهاء مرحلة بدأت بـ begin (لا يفعل شيئًا إذا لم تكن مفتوحة)"""
+        with self._lock:
+            start = self._open.pop(name, None)
+        if start is not None:
+            self.add(name, start, time.time())
+
+    def end_all(self) -> None:
+        """إنهاء جميع المراحل المفتوحة"""
+        for name in list(self._open):
+            self.end(name)
+
+    @contextmanager
+    def span(self, name: str) -> Iterator[None]:
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.add(name, start, time.time())
+
+    def to_list(self) -> List[Dict]:
+        with self._lock:
+            return list(self._spans)
+
+
+def current_trace() -> Optional[Trace]:
+    """سجل المراحل النشط في الخيط الحالي (إن وجد)"""
+    return getattr(_local, 'trace', None)
+
+
+@contextmanager
+def activate(trace: Optional[Trace]) -> Iterator[None]:
+    """تفعيل سجل مراحل للخيط الحالي حتى تسجل فيه دوال المحمل دون تمريره صراحة"""
+    previous = current_trace()
+    _local.trace = trace
+    try:
+        yield
+    finally:
+        _local.trace = previous
+
+
+@contextmanager
+def span(name: str) -> Iterator[None]:
+    """تسجيل مرحلة في السجل النشط، أو لا شيء إذا لم يكن هناك سجل"""
+    trace = current_trace()
+    if trace is None:
+        yield
+        return
+    with trace.span(name):
+        yield
+
+
+def begin(name: str) -> None:
+    """بدء مرحلة في السجل النشط (إن وجد)"""
+    trace = current_trace()
+    if trace is not None:
+        trace.begin(name)
+
+
+@contextmanager
+def profile_to(path: Optional[str]) -> Iterator[None]:
+    """
+    التقاط ملف cProfile لكتلة من الكود وحفظه (لا شيء إذا كان المسار None)
+
+    Args:
+        path: مسار ملف .prof (يُفحص لاحقًا بـ python -m pstats أو snakeviz)
+    """
+    if not path:
+        yield
+        return
+
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            profiler.dump_stats(path)
+            logger.info("تم حفظ ملف التحليل: %s", path)
+        except OSError as e:
+            logger.error("خطأ في حفظ ملف التحليل: %s", e)
@@ -0,0 +1,272 @@
+import os
+import time
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Optional, Tuple
+
+from common.admission import CapacityExceeded, estimate_wait
+from common.cancellation import CancelToken, run_cancellable
+from common.metrics import POSTPROCESS_SECONDS, CACHE_REQUESTS, CLEANUP_EVICTIONS, ADMISSION_REJECTED
+from common.tracing import span
+from common.watchdog import get_watchdog
+
+logger = logging.getLogger(__name__)
+
+# معرف التنسيق الخاص بخيار "ملاءمة الحجم": fit:<الحجم بالميجابايت>
+FIT_FORMAT_PREFIX = 'fit:'
+
+_MB = 1024 * 1024
+
+# نسبة الحجم المستهدف المخصصة للتدفقات (الباقي لحاوية MP4 وتذبذب معدل البت)
+FIT_SIZE_MARGIN = 0.95
+# معدل بت الصوت في الملف المضغوط، وأقل معدل بت مقبول للفيديو (بت/ثانية)
+FIT_AUDIO_BITRATE = 64_000
+MIN_VIDEO_BITRATE = 100_000
+
+# أقصى ارتفاع حسب معدل بت الفيديو: دقة أقل لمعدلات البت المنخفضة بدل صورة مشوهة
+_HEIGHT_LADDER = ((300_000, 240), (600_000, 360), (1_200_000, 480), (2_500_000, 720))
+
+
+def fit_format_id(max_bytes: int) -> str:
+    """معرف تنسيق "ملاءمة الحجم" لحد أقصى بالبايت"""
+    return f"{FIT_FORMAT_PREFIX}{max_bytes // _MB}"
+
+
+def parse_fit_format(format_id: Optional[str]) -> Optional[int]:
+    """
+    الحجم المستهدف (بالبايت) من معرف تنسيق "ملاءمة الحجم"
+
+    Returns:
+        الحجم بالبايت أو None إذا لم يكن المعرف لهذا الخيار
+    """
+    if not format_id or not format_id.startswith(FIT_FORMAT_PREFIX):
+        return None
+    value = format_id[len(FIT_FORMAT_PREFIX):]
+    return int(value) * _MB if value.isdigit() and int(value) > 0 else None
+
+
+def fit_bitrates(duration: float, max_bytes: int) -> Tuple[int, int]:
+    """
+    حساب معدلات البت اللازمة ليلائم ملف بمدة duration الحجم max_bytes
+
+    Returns:
+        (معدل بت الفيديو، معدل بت الصوت) بالبت في الثانية
+
+    Raises:
+        ValueError: إذا كانت المدة طويلة جدًا على الحجم المطلوب
+    """
+    if not duration or duration <= 0:
+        raise ValueError('مدة الفيديو غير معروفة')
+    total = max_bytes * 8 * FIT_SIZE_MARGIN / duration
+    video = int(total - FIT_AUDIO_BITRATE)
+    if video < MIN_VIDEO_BITRATE:
+        raise ValueError(f'الفيديو أطول من أن يُضغط إلى {max_bytes // _MB} ميجابايت')
+    return video, FIT_AUDIO_BITRATE
+
+
+def smallest_video_format(video_info: Optional[Dict]) -> Optional[Dict]:
+    """أصغر تنسيق فيديو معروف الحجم (أو آخر تنسيق، وهو الأقل دقة، إذا لم تُعرف الأحجام)"""
+    formats = [fmt for fmt in (video_info or {}).get('formats', []) if fmt.get('type') == 'video']
+    if not formats:
+        return None
+    sized = [fmt for fmt in formats if fmt.get('size')]
+    return min(sized, key=lambda fmt: fmt['size']) if sized else formats[-1]
+
+
+def needs_fit(video_info: Optional[Dict], max_bytes: int, clip_duration: Optional[float] = None) -> bool:
+    """
+    هل يتجاوز أصغر تنسيق فيديو الحد max_bytes مع إمكانية ضغطه إليه؟
+
+    Args:
+        video_info: معلومات الفيديو
+        max_bytes: الحد الأقصى للحجم
+        clip_duration: مدة المقطع المطلوب إن لم يكن الفيديو كاملًا
+    """
+    fmt = smallest_video_format(video_info)
+    duration = (video_info or {}).get('duration') or 0
+    if fmt is None or not fmt.get('size') or not duration:
+        return False
+    length = min(clip_duration or duration, duration)
+    if fmt['size'] * length / duration <= max_bytes:
+        return False
+    try:
+        fit_bitrates(length, max_bytes)
+    except ValueError:
+        return False
+    return True
+
+
+class Transcoder:
+    """
+    ضغط الفيديو ليلائم حجمًا محددًا بترميز x264 على مرحلتين (two-pass) في مجمع محدود
+
+    يحدد المجمع عدد عمليات الترميز المتزامنة، وتُحفظ النتائج حسب (الفيديو، الحجم، المقطع)
+    فتُقدم الطلبات اللاحقة لنفس الملاءمة دون تحميل أو ترميز.
+    """
+
+    # متوسط مدة الترميز المفترض قبل انتهاء أي ترميز (بالثواني)، ووزن كل ترميز جديد في المتوسط
+    default_duration: float = 60.0
+    _duration_alpha: float = 0.2
+
+    def __init__(self, cache_dir: str, max_workers: int = 1, threads: int = 2, preset: str = 'veryfast',
+                 max_queued: int = 0):
+        """
+        Args:
+            cache_dir: مجلد النتائج المخزنة
+            max_workers: عدد عمليات الترميز المتزامنة
+            threads: عدد خيوط FFmpeg لكل عملية ترميز
+            preset: إعداد السرعة لـ x264
+            max_queued: الحد الأقصى لعمليات الترميز المنتظرة قبل الرفض (0 = بلا حد)
+        """
+        self.cache_dir = cache_dir
+        self.threads = threads
+        self.preset = preset
+        self.max_workers = max_workers
+        self.max_queued = max_queued
+        self.average_duration = self.default_duration
+        self._pending = 0
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='transcode')
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def cache_path(self, video_id: str, max_bytes: int, clip: Optional[Tuple[float, Optional[float]]] = None) -> str:
+        """مسار النتيجة المخزنة لملاءمة فيديو (أو مقطع منه) لحجم محدد"""
+        name = f"fit_{video_id}_{max_bytes // _MB}mb"
+        if clip:
+            start, end = clip
+            name += f"_{int(start)}-{int(end) if end is not None else 'end'}"
+        return os.path.join(self.cache_dir, f"{name}.mp4")
+
+    def cached(self, video_id: str, max_bytes: int,
+               clip: Optional[Tuple[float, Optional[float]]] = None) -> Optional[str]:
+        """
+        النتيجة المخزنة إن وُجدت (مع تحديث وقت تعديلها حتى لا يحذفها التنظيف)
+        """
+        path = self.cache_path(video_id, max_bytes, clip)
+        try:
+            os.utime(path)
+        except OSError:
+            CACHE_REQUESTS.inc(cache='fit', result='miss')
+            return None
+        CACHE_REQUESTS.inc(cache='fit', result='hit')
+        return path
+
+    def fit(self, source: str, video_id: str, max_bytes: int, duration: float,
+            clip: Optional[Tuple[float, Optional[float]]] = None,
+            cancel_token: Optional[CancelToken] = None) -> str:
+        """
+        ضغط ملف فيديو ليلائم max_bytes وتخزين النتيجة
+
+        Args:
+            source: الملف المحمل (المقطع نفسه إذا طُلب مقطع)
+            video_id: معرف الفيديو لمفتاح التخزين
+            max_bytes: الحد الأقصى لحجم النتيجة
+            duration: مدة الملف المصدر بالثواني
+            clip: المقطع المطلوب لمفتاح التخزين
+            cancel_token: رمز إلغاء يوقف FFmpeg
+
+        Returns:
+            مسار النتيجة المخزنة
+
+        Raises:
+            ValueError: إذا تعذر ضغط المدة المطلوبة إلى الحجم
+            CapacityExceeded: إذا امتلأ طابور الترميز
+            JobCancelled: إذا أُلغيت المهمة
+        """
+        path = self.cache_path(video_id, max_bytes, clip)
+        with self._lock:
+            if self.max_queued and self._pending >= self.max_workers + self.max_queued:
+                ADMISSION_REJECTED.inc(resource='transcode')
+                raise CapacityExceeded('transcode', estimate_wait(
+                    self._pending - self.max_workers + 1, self.max_workers, self.average_duration))
+            self._pending += 1
+        try:
+            future = self._pool.submit(self._encode, source, path, duration, max_bytes, cancel_token)
+            return future.result()
+        finally:
+            with self._lock:
+                self._pending -= 1
+
+    def _encode(self, source: str, path: str, duration: float, max_bytes: int,
+                cancel_token: Optional[CancelToken]) -> str:
+        # طلب مماثل سبقه في المجمع أكمل الترميز
+        if os.path.exists(path):
+            return path
+
+        video_bitrate, audio_bitrate = fit_bitrates(duration, max_bytes)
+        height = next((h for limit, h in _HEIGHT_LADDER if video_bitrate < limit), 1080)
+        # أسماء مؤقتة لكل خيط حتى لا يتداخل ترميزان متزامنان لنفس النتيجة
+        root, ext = os.path.splitext(path)
+        passlog = f"{root}.{threading.get_ident()}"
+        part_path = f"{passlog}.part{ext}"
+        video_args = [
+            '-vf', f"scale=-2:'min({height},ih)'",
+            '-c:v', 'libx264', '-preset', self.preset, '-b:v', str(video_bitrate),
+            '-threads', str(self.threads), '-passlogfile', passlog,
+            # نفس معالجة الإطارات في المرحلتين (الافتراضي يختلف بين المخرج null و mp4 فتفسد الإحصاءات)؛
+            # -vsync بدل -fps_mode للتوافق مع إصدارات FFmpeg الأقدم من 5.1
+            '-vsync', 'cfr',
+        ]
+        first_pass = ['ffmpeg', '-y', '-i', source, *video_args, '-pass', '1', '-an', '-f', 'null', os.devnull]
+        second_pass = [
+            'ffmpeg', '-y', '-i', source, *video_args, '-pass', '2',
+            '-c:a', 'aac', '-b:a', str(audio_bitrate), '-movflags', '+faststart', '-f', 'mp4', part_path
+        ]
+
+        logger.info("ضغط %s إلى %s ميجابايت (فيديو %skbps، حتى %sp)",
+                    source, max_bytes // _MB, video_bitrate // 1000, height)
+        started = time.monotonic()
+        try:
+            with span('postprocess:fit'), POSTPROCESS_SECONDS.time(step='fit'), \
+                    get_watchdog().stage('postprocess', cancel_token):
+                run_cancellable(first_pass, cancel_token)
+                run_cancellable(second_pass, cancel_token)
+            if os.path.getsize(part_path) > max_bytes:
+                raise RuntimeError(f'تجاوز الملف المضغوط {max_bytes // _MB} ميجابايت')
+            os.replace(part_path, path)
+            with self._lock:
+                self.average_duration += self._duration_alpha * (time.monotonic() - started - self.average_duration)
+        finally:
+            for leftover in (part_path, f"{passlog}-0.log", f"{passlog}-0.log.mbtree"):
+                if os.path.exists(leftover):
+                    os.remove(leftover)
+        return path
+
+    def cleanup(self, max_age: float) -> int:
+        """
+        حذف النتائج المخزنة التي لم تُستخدم منذ max_age ثانية
+
+        Returns:
+            عدد الملفات المحذوفة
+        """
+        cutoff = time.time() - max_age
+        count = 0
+        for entry in os.scandir(self.cache_dir):
+            if entry.is_file() and entry.stat().st_mtime < cutoff:
+                try:
+                    os.remove(entry.path)
+                    count += 1
+                except OSError as e:
+                    logger.error("خطأ في حذف الملف %s: %s", entry.name, e)
+        CLEANUP_EVICTIONS.inc(count)
+        return count
+
+
+_transcoder: Optional[Transcoder] = None
+_transcoder_lock = threading.Lock()
+
+
+def get_transcoder() -> Transcoder:
+    """
+    مجمع الترميز المشترك في العملية الحالية (من إعدادات FIT_CACHE_PATH و TRANSCODE_* و MAX_QUEUED_TRANSCODES)
+    """
+    global _transcoder
+    with _transcoder_lock:
+        if _transcoder is None:
+            from config import (
+                FIT_CACHE_PATH, TRANSCODE_WORKERS, TRANSCODE_THREADS, TRANSCODE_PRESET, MAX_QUEUED_TRANSCODES
+            )
+            _transcoder = Transcoder(FIT_CACHE_PATH, TRANSCODE_WORKERS, TRANSCODE_THREADS, TRANSCODE_PRESET,
+                                     MAX_QUEUED_TRANSCODES)
+        return _transcoder
@@ -0,0 +1,171 @@
+import re
+from typing import Dict, NamedTuple, Optional, Tuple
+from urllib.parse import unquote
+
+# نمط واحد مُجمّع مسبقًا يغطي جميع أشكال روابط يوتيوب:
+# watch و embed و v و shorts و live و youtu.be مع النطاقات www و m و music و nocookie
+# (embed/videoseries مشغل قائمة تشغيل وليس معرف فيديو رغم أن طوله 11 حرفًا)
+_YOUTUBE_URL_RE = re.compile(
+    r'^(?:https?://)?(?:(?:www|m|music)\.)?'
+    r'(?:'
+    r'youtu\.be/(?P<short_id>[A-Za-z0-9_-]{11})'
+    r'|youtube(?:-nocookie)?\.com/'
+    r'(?:(?:embed|v|e|shorts|live)/(?!videoseries)(?P<path_id>[A-Za-z0-9_-]{11})|watch/?(?=[?#]|$))'
+    r')'
+    r'(?P<rest>[/?#].*)?$',
+    re.IGNORECASE | re.ASCII,
+)
+
+# معاملات الاستعلام التي يحتاجها المحلل فقط
+_WANTED_PARAMS = frozenset(('v', 'list', 't', 'start', 'time_continue'))
+
+_VIDEO_ID_RE = re.compile(r'^[A-Za-z0-9_-]{11}$')
+_PLAYLIST_ID_RE = re.compile(r'^[A-Za-z0-9_-]{2,64}$')
+
+# صيغ الوقت المقبولة: 90 أو 90s أو 1m30s أو 1h2m3s أو 1:30 أو 01:02:03
+# (الثواني في صيغة الساعة حتى 59، والدقائق كذلك إذا سبقتها الساعات)
+_UNIT_TIME_RE = re.compile(r'^(?:(\d+)h)?(?:(\d+)m)?(?:(\d+)s?)?$', re.IGNORECASE | re.ASCII)
+_CLOCK_TIME_RE = re.compile(r'^(?:(\d+):(?=[0-5]?\d:))?(\d{1,2}):([0-5]?\d)$', re.ASCII)
+
+# مقطع زمني: "1:30-3:45" أو "90-120" أو "1:30-" (حتى النهاية) أو "-2:00" (من البداية)
+_TIME_RANGE_RE = re.compile(r'^\s*([^\s-]*)\s*-\s*([^\s-]*)\s*$')
+
+
+class VideoKey(NamedTuple):
+    """
+    المفتاح الموحد لفيديو يوتيوب، ويُستخدم مفتاحًا في الذاكرة المؤقتة ودمج الطلبات ومنع التكرار
+    """
+    video_id: str
+    playlist_id: Optional[str] = None
+    start_time: Optional[int] = None
+
+    def for_video(self) -> 'VideoKey':
+        """المفتاح بدون قائمة التشغيل ووقت البدء (لا يؤثران على معلومات الفيديو)"""
+        return VideoKey(self.video_id)
+
+    @property
+    def watch_url(self) -> str:
+        """الرابط الأساسي للفيديو المنفرد"""
+        return watch_url(self.video_id)
+
+
+def parse_timestamp(value: Optional[str]) -> Optional[int]:
+    """
+    تحويل نص وقت إلى عدد ثوانٍ
+
+    Args:
+        value: الوقت بصيغة 90 أو 1m30s أو 1:30 أو 01:02:03
+
+    Returns:
+        عدد الثواني أو None إذا كانت الصيغة غير صالحة
+    """
+    if not value:
+        return None
+    value = value.strip()
+
+    match = _CLOCK_TIME_RE.match(value)
+    if match:
+        hours, minutes, seconds = match.groups()
+        return int(hours or 0) * 3600 + int(minutes) * 60 + int(seconds)
+
+    match = _UNIT_TIME_RE.match(value)
+    if match and any(match.groups()):
+        hours, minutes, seconds = match.groups()
+        return int(hours or 0) * 3600 + int(minutes or 0) * 60 + int(seconds or 0)
+
+    return None
+
+
+def parse_time_range(value: Optional[str]) -> Optional[Tuple[Optional[int], Optional[int]]]:
+    """
+    تحويل نص مقطع زمني إلى (البداية، النهاية) بالثواني
+
+    Args:
+        value: المقطع بصيغة 1:30-3:45 أو 90-120، ويمكن حذف أحد الطرفين (1:30- أو -3:45)
+
+    Returns:
+        (البداية أو None، النهاية أو None) أو None إذا كانت الصيغة غير صالحة
+    """
+    if not value:
+        return None
+    match = _TIME_RANGE_RE.match(value)
+    if match is None:
+        return None
+
+    start_text, end_text = match.groups()
+    start = parse_timestamp(start_text)
+    end = parse_timestamp(end_text)
+    if (start_text and start is None) or (end_text and end is None) or (start is None and end is None):
+        return None
+    if start is not None and end is not None and end <= start:
+        return None
+    return start, end
+
+
+def _parse_params(query: str) -> Dict[str, str]:
+    """
+    تحليل سريع لمعاملات الاستعلام مع الاحتفاظ بالمعاملات المطلوبة فقط
+
+    عند تكرار المعامل تُؤخذ القيمة الأولى كما يفعل يوتيوب (?v=...&v=... يشغل الفيديو الأول)
+    """
+    params = {}
+    if not query:
+        return params
+    for pair in query.split('&'):
+        name, _, value = pair.partition('=')
+        if name in _WANTED_PARAMS and value and name not in params:
+            params[name] = unquote(value) if '%' in value else value
+    return params
+
+
+def parse_youtube_url(url: str) -> Optional[VideoKey]:
+    """
+    تحليل رابط يوتيوب واستخراج المفتاح الموحد
+
+    Args:
+        url: الرابط المراد تحليله
+
+    Returns:
+        VideoKey يحتوي على (معرف الفيديو، معرف قائمة التشغيل، وقت البدء) أو None إذا لم يكن رابط فيديو صالحًا
+    """
+    if not url:
+        return None
+
+    match = _YOUTUBE_URL_RE.match(url.strip())
+    if match is None:
+        return None
+
+    video_id = match.group('short_id') or match.group('path_id')
+    rest = match.group('rest') or ''
+
+    # فصل الاستعلام عن الجزء (#t=30)
+    query, _, fragment = rest.partition('#')
+    params = _parse_params(query.partition('?')[2])
+    if fragment:
+        params.update(_parse_params(fragment))
+
+    if video_id is None:
+        video_id = params.get('v', '')
+        if not _VIDEO_ID_RE.match(video_id):
+            return None
+
+    playlist_id = params.get('list')
+    if playlist_id is not None and not _PLAYLIST_ID_RE.match(playlist_id):
+        playlist_id = None
+
+    start_time = parse_timestamp(params.get('t') or params.get('start') or params.get('time_continue'))
+
+    return VideoKey(video_id, playlist_id, start_time or None)
+
+
+def watch_url(video_id: str) -> str:
+    """
+    بناء رابط المشاهدة الأساسي لمعرف فيديو
+
+    Args:
+        video_id: معرف الفيديو
+
+    Returns:
+        رابط https://www.youtube.com/watch?v=...
+    """
+    return f"https://www.youtube.com/watch?v={video_id}"
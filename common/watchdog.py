@@ -0,0 +1,171 @@
+import time
+import logging
+import threading
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional
+
+from common.cancellation import CancelToken, StageTimeout
+from common.metrics import WATCHDOG_KILLS
+
+logger = logging.getLogger(__name__)
+
+
+class Watch:
+    """
+    مراقبة مرحلة جارية لمهمة واحدة: مهلة كلية اختيارية، وحد أدنى لمعدل التقدم خلال نافذة زمنية
+    """
+
+    def __init__(self, stage: str, cancel_token: CancelToken, timeout: Optional[float] = None,
+                 min_rate: float = 0.0, window: float = 60.0):
+        """
+        Args:
+            stage: اسم المرحلة
+            cancel_token: رمز إلغاء المهمة الذي يُوقفها به المراقب
+            timeout: أقصى مدة للمرحلة بالثواني (None = بلا حد)
+            min_rate: أقل معدل تقدم مقبول بالبايت/ثانية خلال window (0 = بلا كشف للتوقف)
+            window: نافذة قياس معدل التقدم بالثواني
+        """
+        self.stage = stage
+        self.cancel_token = cancel_token
+        self.timeout = timeout
+        self.min_rate = min_rate
+        self.window = window
+        self.started_at = time.monotonic()
+        self.paused = False
+        self._window_started = self.started_at
+        self._window_bytes = 0
+        self._last_bytes = 0
+
+    def progress(self, downloaded: int) -> None:
+        """تسجيل عدد البايتات المحملة في الملف الحالي (يبدأ من الصفر عند الانتقال لملف جديد)"""
+        delta = downloaded - self._last_bytes if downloaded >= self._last_bytes else downloaded
+        self._last_bytes = downloaded
+        self._window_bytes += delta
+
+    def resume(self) -> None:
+        """استئناف المراقبة بعد مرحلة متداخلة (مثل الدمج بعد التحميل) مع بدء نافذة جديدة"""
+        self.paused = False
+        self._window_started = time.monotonic()
+        self._window_bytes = 0
+
+    def expired(self, now: float) -> Optional[StageTimeout]:
+        """سبب إيقاف المرحلة إن تجاوزت مهلتها أو توقف تقدمها، وإلا None"""
+        if self.paused:
+            return None
+        if self.timeout and now - self.started_at > self.timeout:
+            return StageTimeout(self.stage, f'تجاوزت المرحلة "{self.stage}" المهلة المحددة ({int(self.timeout)} ثانية).')
+        if self.min_rate and now - self._window_started >= self.window:
+            rate = self._window_bytes / (now - self._window_started)
+            if rate < self.min_rate:
+                return StageTimeout(self.stage, f'توقف التحميل: أقل من {self.min_rate / 1024:.0f} كيلوبايت/ثانية '
+                                                f'خلال {int(self.window)} ثانية.')
+            self._window_started = now
+            self._window_bytes = 0
+        return None
+
+
+class Watchdog:
+    """
+    مراقب المراحل العالقة: خيط واحد يفحص المراحل الجارية كل interval ثانية، ويوقف المرحلة التي
+    تجاوزت مهلتها أو توقف تقدمها بإلغاء رمز مهمتها مع StageTimeout
+
+    يوقف الإلغاء عمليات FFmpeg فورًا (عبر دوال الإلغاء في run_cancellable)، ويوقف yt-dlp و pytube
+    عند أول تحديث للتقدم، ثم تحذف معالجات JobCancelled الملفات الجزئية ويتحرر العامل.
+    المراحل المتداخلة لنفس الرمز (مثل المعالجة اللاحقة داخل التحميل) توقف مراقبة المرحلة الأعلى مؤقتًا.
+    """
+
+    def __init__(self, timeouts: Optional[Dict[str, float]] = None, stall_rate: float = 0.0,
+                 stall_window: float = 60.0, interval: float = 1.0):
+        """
+        Args:
+            timeouts: المهلة الكلية لكل مرحلة بالثواني (مثل {'postprocess': 1800})، 0 أو غيابها = بلا حد
+            stall_rate: أقل معدل تحميل مقبول بالبايت/ثانية لمرحلة 'download' (0 = بلا كشف للتوقف)
+            stall_window: نافذة قياس معدل التحميل بالثواني
+            interval: الفترة بين الفحوص بالثواني
+        """
+        self.timeouts = timeouts or {}
+        self.stall_rate = stall_rate
+        self.stall_window = stall_window
+        self.interval = interval
+        self._stacks: Dict[int, List[Watch]] = {}
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    def begin(self, stage: str, cancel_token: CancelToken) -> Watch:
+        """بدء مراقبة مرحلة (تُنهى بـ end)"""
+        watch = Watch(stage, cancel_token, self.timeouts.get(stage) or None,
+                      self.stall_rate if stage == 'download' else 0.0, self.stall_window)
+        with self._lock:
+            stack = self._stacks.setdefault(id(cancel_token), [])
+            if stack:
+                stack[-1].paused = True
+            stack.append(watch)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._loop, name='watchdog', daemon=True)
+                self._thread.start()
+        return watch
+
+    def end(self, watch: Watch) -> None:
+        """إنهاء مراقبة مرحلة (مع ما بقي داخلها، مثل معالج لاحق فشل) واستئناف المرحلة التي تحتويها"""
+        with self._lock:
+            stack = self._stacks.get(id(watch.cancel_token), [])
+            if watch in stack:
+                del stack[stack.index(watch):]
+            if stack:
+                stack[-1].resume()
+            else:
+                self._stacks.pop(id(watch.cancel_token), None)
+
+    @contextmanager
+    def stage(self, stage: str, cancel_token: Optional[CancelToken]) -> Iterator[Optional[Watch]]:
+        """مراقبة مرحلة طوال الكتلة (لا شيء إذا لم يكن هناك رمز إلغاء)"""
+        if cancel_token is None:
+            yield None
+            return
+        watch = self.begin(stage, cancel_token)
+        try:
+            yield watch
+        finally:
+            self.end(watch)
+
+    def progress(self, cancel_token: Optional[CancelToken], downloaded: int) -> None:
+        """تسجيل تقدم التحميل للمرحلة الجارية لهذا الرمز (من دوال التقدم)"""
+        if cancel_token is None:
+            return
+        with self._lock:
+            stack = self._stacks.get(id(cancel_token))
+            if stack:
+                stack[-1].progress(downloaded)
+
+    def _loop(self) -> None:
+        while True:
+            time.sleep(self.interval)
+            now = time.monotonic()
+            expired = []
+            with self._lock:
+                for stack in self._stacks.values():
+                    error = stack[-1].expired(now)
+                    if error is not None:
+                        expired.append((stack[-1], error))
+            for watch, error in expired:
+                if watch.cancel_token.cancel(error):
+                    WATCHDOG_KILLS.inc(stage=watch.stage)
+                    logger.warning("أوقف المراقب مرحلة عالقة: %s", error)
+
+
+_watchdog: Optional[Watchdog] = None
+_watchdog_lock = threading.Lock()
+
+
+def get_watchdog() -> Watchdog:
+    """
+    المراقب المشترك في العملية الحالية (من إعدادات POSTPROCESS_TIMEOUT و DOWNLOAD_STALL_*)
+    """
+    global _watchdog
+    with _watchdog_lock:
+        if _watchdog is None:
+            from config import POSTPROCESS_TIMEOUT, DOWNLOAD_STALL_RATE, DOWNLOAD_STALL_WINDOW
+            # تحميل المقطع عبر FFmpeg يأخذ مهلة المعالجة اللاحقة لأنه لا يبلغ عن تقدمه
+            timeouts = {'postprocess': POSTPROCESS_TIMEOUT, 'clip': POSTPROCESS_TIMEOUT}
+            _watchdog = Watchdog(timeouts, DOWNLOAD_STALL_RATE, DOWNLOAD_STALL_WINDOW)
+        return _watchdog
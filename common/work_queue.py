@@ -0,0 +1,418 @@
+import os
+import time
+import logging
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from typing import Any, Dict, Optional
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+logger = logging.getLogger(__name__)
+
+# حالات المهمة في الطابور المشترك
+TERMINAL_STATES = ('completed', 'failed', 'cancelled')
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS work_queue (
+    id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    url TEXT NOT NULL,
+    format_id TEXT NOT NULL,
+    start_time REAL,
+    end_time REAL,
+    state TEXT NOT NULL,
+    worker TEXT,
+    downloaded INTEGER NOT NULL DEFAULT 0,
+    total INTEGER NOT NULL DEFAULT 0,
+    eta INTEGER NOT NULL DEFAULT 0,
+    result_path TEXT,
+    error TEXT,
+    cancel_requested INTEGER NOT NULL DEFAULT 0,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS work_queue_state ON work_queue (state, created_at);
+"""
+
+# أعمدة أضيفت بعد إنشاء الجدول: تُضاف إلى قواعد البيانات القديمة عند الاتصال
+_ADDED_COLUMNS = (('start_time', 'REAL'), ('end_time', 'REAL'))
+
+
+class WorkQueue(ABC):
+    """
+    طابور مهام التحميل المشترك بين المنتجين (البوت وواجهة الويب) وعمال التحميل
+
+    ينشر المنتج المهمة بـ enqueue ويتابع حالتها بـ get، ويطالب العامل بها بـ claim وينشر
+    تقدمها بـ heartbeat ثم نتيجتها بـ finish. المهمة التي يتوقف عاملها عن إرسال النبضات
+    لمدة lease_timeout تعود إلى الطابور فيستأنفها عامل آخر.
+    """
+
+    @abstractmethod
+    def enqueue(self, job_id: str, kind: str, url: str, format_id: str,
+                start_time: Optional[float] = None, end_time: Optional[float] = None) -> None:
+        """
+        نشر مهمة (لا شيء إذا كانت المهمة موجودة وغير فاشلة، مثل استئناف مهمة بعد إعادة التشغيل)
+
+        Args:
+            job_id: معرف المهمة (يحدد أيضًا اسم ملف الإخراج)
+            kind: 'video' أو 'audio'
+            url: رابط الفيديو
+            format_id: معرف التنسيق
+            start_time: بداية المقطع المطلوب بالثواني (اختياري)
+            end_time: نهاية المقطع المطلوب بالثواني (اختياري)
+        """
+
+    @abstractmethod
+    def claim(self, worker: str) -> Optional[Dict[str, Any]]:
+        """المطالبة بأقدم مهمة منتظرة (أو None إذا كان الطابور فارغًا)"""
+
+    @abstractmethod
+    def heartbeat(self, job_id: str, worker: str, downloaded: int, total: int, eta: int) -> bool:
+        """
+        نشر تقدم المهمة وتجديد ملكيتها
+
+        Returns:
+            False إذا طُلب إلغاء المهمة أو فقد العامل ملكيتها
+        """
+
+    @abstractmethod
+    def finish(self, job_id: str, worker: str, state: str, result_path: Optional[str] = None,
+               error: Optional[str] = None) -> None:
+        """تسجيل نتيجة المهمة ('completed' أو 'failed' أو 'cancelled')"""
+
+    @abstractmethod
+    def cancel(self, job_id: str) -> None:
+        """طلب إلغاء المهمة: تُلغى فورًا إذا لم تبدأ، وإلا يوقفها عاملها عند النبضة التالية"""
+
+    @abstractmethod
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """حالة المهمة الحالية (أو None إذا لم تكن موجودة)"""
+
+    @abstractmethod
+    def remove(self, job_id: str) -> None:
+        """حذف المهمة بعد قراءة نتيجتها"""
+
+    def prune(self, max_age: float) -> int:
+        """حذف المهام المنتهية الأقدم من max_age ثانية (التي لم يقرأها منتجها)"""
+        return 0
+
+
+class SQLiteWorkQueue(WorkQueue):
+    """
+    طابور مشترك في قاعدة SQLite على قرص مشترك (عدة عمليات على نفس الجهاز أو مجلد شبكي)
+    """
+
+    def __init__(self, path: str, lease_timeout: float = 60):
+        """
+        Args:
+            path: مسار ملف قاعدة البيانات
+            lease_timeout: المدة (بالثواني) دون نبضات قبل إعادة المهمة إلى الطابور
+        """
+        self.path = path
+        self.lease_timeout = lease_timeout
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._conn_pid: Optional[int] = None
+
+    def _connection(self) -> sqlite3.Connection:
+        # اتصال جديد بعد fork لأن اتصالات SQLite لا تُشارك بين العمليات
+        if self._conn is None or self._conn_pid != os.getpid():
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            # لا WAL: يعتمد على ذاكرة مشتركة (mmap) لا تعمل عبر أنظمة الملفات الشبكية بين الأجهزة
+            conn.execute('PRAGMA journal_mode=DELETE')
+            conn.executescript(_SCHEMA)
+            columns = {row['name'] for row in conn.execute('PRAGMA table_info(work_queue)')}
+            for name, column_type in _ADDED_COLUMNS:
+                if name not in columns:
+                    conn.execute(f'ALTER TABLE work_queue ADD COLUMN {name} {column_type}')
+            self._conn = conn
+            self._conn_pid = os.getpid()
+        return self._conn
+
+    def _execute(self, sql: str, params: tuple = ()) -> sqlite3.Cursor:
+        with self._lock:
+            return self._connection().execute(sql, params)
+
+    def enqueue(self, job_id: str, kind: str, url: str, format_id: str,
+                start_time: Optional[float] = None, end_time: Optional[float] = None) -> None:
+        now = time.time()
+        with self._lock:
+            conn = self._connection()
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                row = conn.execute('SELECT state FROM work_queue WHERE id = ?', (job_id,)).fetchone()
+                if row is None or row['state'] in ('failed', 'cancelled'):
+                    conn.execute(
+                        'INSERT OR REPLACE INTO work_queue (id, kind, url, format_id, start_time, end_time, '
+                        "state, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?, 'queued', ?, ?)",
+                        (job_id, kind, url, format_id, start_time, end_time, now, now)
+                    )
+                conn.execute('COMMIT')
+            except Exception:
+                conn.execute('ROLLBACK')
+                raise
+
+    def claim(self, worker: str) -> Optional[Dict[str, Any]]:
+        now = time.time()
+        with self._lock:
+            conn = self._connection()
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                # إعادة مهام العمال المتوقفين إلى الطابور
+                conn.execute(
+                    "UPDATE work_queue SET state = 'queued', worker = NULL, updated_at = ? "
+                    "WHERE state = 'running' AND updated_at < ?",
+                    (now, now - self.lease_timeout)
+                )
+                row = conn.execute(
+                    "SELECT * FROM work_queue WHERE state = 'queued' ORDER BY created_at LIMIT 1"
+                ).fetchone()
+                if row is not None:
+                    conn.execute(
+                        "UPDATE work_queue SET state = 'running', worker = ?, updated_at = ? WHERE id = ?",
+                        (worker, now, row['id'])
+                    )
+                conn.execute('COMMIT')
+            except Exception:
+                conn.execute('ROLLBACK')
+                raise
+        if row is None:
+            return None
+        return dict(row, state='running', worker=worker, updated_at=now)
+
+    def heartbeat(self, job_id: str, worker: str, downloaded: int, total: int, eta: int) -> bool:
+        self._execute(
+            'UPDATE work_queue SET downloaded = ?, total = ?, eta = ?, updated_at = ? '
+            "WHERE id = ? AND worker = ? AND state = 'running'",
+            (downloaded, total, eta, time.time(), job_id, worker)
+        )
+        row = self._execute(
+            'SELECT state, worker, cancel_requested FROM work_queue WHERE id = ?', (job_id,)
+        ).fetchone()
+        return (row is not None and row['state'] == 'running' and row['worker'] == worker
+                and not row['cancel_requested'])
+
+    def finish(self, job_id: str, worker: str, state: str, result_path: Optional[str] = None,
+               error: Optional[str] = None) -> None:
+        self._execute(
+            'UPDATE work_queue SET state = ?, result_path = ?, error = ?, updated_at = ? '
+            'WHERE id = ? AND worker = ?',
+            (state, result_path, error, time.time(), job_id, worker)
+        )
+
+    def cancel(self, job_id: str) -> None:
+        now = time.time()
+        self._execute(
+            "UPDATE work_queue SET cancel_requested = 1, updated_at = ?, "
+            "state = CASE state WHEN 'queued' THEN 'cancelled' ELSE state END WHERE id = ?",
+            (now, job_id)
+        )
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        row = self._execute('SELECT * FROM work_queue WHERE id = ?', (job_id,)).fetchone()
+        return dict(row) if row is not None else None
+
+    def remove(self, job_id: str) -> None:
+        self._execute('DELETE FROM work_queue WHERE id = ?', (job_id,))
+
+    def prune(self, max_age: float) -> int:
+        cursor = self._execute(
+            f"DELETE FROM work_queue WHERE state IN ({','.join('?' * len(TERMINAL_STATES))}) AND updated_at < ?",
+            TERMINAL_STATES + (time.time() - max_age,)
+        )
+        return cursor.rowcount
+
+
+# سكربتات Lua تنفذها Redis ذريًا: لا يتداخل معها أمر آخر بين الفحص والتعديل.
+# مفاتيح المهام تُبنى من البادئة داخل سكربت المطالبة، فالتصميم لخادم Redis واحد (لا Redis Cluster).
+
+# KEYS: الطابور، قيد التنفيذ | ARGV: البادئة، العامل، الآن، الموعد الأقصى لآخر نبضة
+_CLAIM_SCRIPT = """
+for _, id in ipairs(redis.call('ZRANGEBYSCORE', KEYS[2], '-inf', ARGV[4])) do
+    redis.call('ZREM', KEYS[2], id)
+    local key = ARGV[1] .. ':job:' .. id
+    if redis.call('HGET', key, 'state') == 'running' then
+        redis.call('HSET', key, 'state', 'queued', 'worker', '', 'updated_at', ARGV[3])
+        redis.call('RPUSH', KEYS[1], id)
+    end
+end
+while true do
+    local id = redis.call('RPOP', KEYS[1])
+    if not id then
+        return false
+    end
+    local key = ARGV[1] .. ':job:' .. id
+    if redis.call('HGET', key, 'state') == 'queued' then
+        redis.call('HSET', key, 'state', 'running', 'worker', ARGV[2], 'updated_at', ARGV[3])
+        redis.call('ZADD', KEYS[2], ARGV[3], id)
+        return id
+    end
+end
+"""
+
+# KEYS: المهمة، قيد التنفيذ | ARGV: المعرف، العامل، المحمل، الحجم، الوقت المتبقي، الآن
+_HEARTBEAT_SCRIPT = """
+local job = redis.call('HMGET', KEYS[1], 'state', 'worker', 'cancel_requested')
+if job[1] ~= 'running' or job[2] ~= ARGV[2] then
+    return 0
+end
+redis.call('HSET', KEYS[1], 'downloaded', ARGV[3], 'total', ARGV[4], 'eta', ARGV[5], 'updated_at', ARGV[6])
+redis.call('ZADD', KEYS[2], ARGV[6], ARGV[1])
+if job[3] == '1' then
+    return 0
+end
+return 1
+"""
+
+# KEYS: المهمة، قيد التنفيذ | ARGV: المعرف، العامل، الحالة، مسار النتيجة، الخطأ، الآن، مدة الاحتفاظ
+_FINISH_SCRIPT = """
+if redis.call('HGET', KEYS[1], 'worker') ~= ARGV[2] then
+    return 0
+end
+redis.call('HSET', KEYS[1], 'state', ARGV[3], 'result_path', ARGV[4], 'error', ARGV[5], 'updated_at', ARGV[6])
+redis.call('EXPIRE', KEYS[1], ARGV[7])
+redis.call('ZREM', KEYS[2], ARGV[1])
+return 1
+"""
+
+# KEYS: المهمة | ARGV: الآن، مدة الاحتفاظ
+_CANCEL_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    return 0
+end
+redis.call('HSET', KEYS[1], 'cancel_requested', 1)
+if redis.call('HGET', KEYS[1], 'state') == 'queued' then
+    redis.call('HSET', KEYS[1], 'state', 'cancelled', 'updated_at', ARGV[1])
+    redis.call('EXPIRE', KEYS[1], ARGV[2])
+end
+return 1
+"""
+
+
+class RedisWorkQueue(WorkQueue):
+    """
+    طابور مشترك في Redis لعمال على أجهزة متعددة (يتطلب حزمة redis)
+
+    المفاتيح: قائمة المعرفات المنتظرة، وجدول hash لكل مهمة، ومجموعة مرتبة للمهام قيد
+    التنفيذ حسب وقت آخر نبضة. المهام المنتهية تنتهي صلاحيتها تلقائيًا بعد result_ttl.
+    كل انتقال في حالة المهمة (المطالبة، النبضة، الإنهاء، الإلغاء) سكربت Lua واحد ينفذ ذريًا،
+    فلا يطالب عاملان بنفس المهمة ولا تضيع مهمة بين إخراجها من قيد التنفيذ وإعادتها إلى الطابور.
+    """
+
+    def __init__(self, url: str, lease_timeout: float = 60, result_ttl: int = 24 * 60 * 60,
+                 prefix: str = 'downloads'):
+        """
+        Args:
+            url: عنوان Redis (مثل redis://localhost:6379/0)
+            lease_timeout: المدة (بالثواني) دون نبضات قبل إعادة المهمة إلى الطابور
+            result_ttl: مدة الاحتفاظ بالمهام المنتهية (بالثواني)
+            prefix: بادئة المفاتيح
+        """
+        if redis is None:
+            raise RuntimeError('حزمة redis غير مثبتة. قم بتثبيتها باستخدام: pip install redis')
+        self.client = redis.Redis.from_url(url, decode_responses=True)
+        self.lease_timeout = lease_timeout
+        self.result_ttl = int(result_ttl)
+        self._queue_key = f'{prefix}:queue'
+        self._running_key = f'{prefix}:running'
+        self._prefix = prefix
+
+    def _job_key(self, job_id: str) -> str:
+        return f'{self._prefix}:job:{job_id}'
+
+    def enqueue(self, job_id: str, kind: str, url: str, format_id: str,
+                start_time: Optional[float] = None, end_time: Optional[float] = None) -> None:
+        key = self._job_key(job_id)
+        now = time.time()
+        with self.client.pipeline() as pipe:
+            while True:
+                try:
+                    pipe.watch(key)
+                    state = pipe.hget(key, 'state')
+                    if state is not None and state not in ('failed', 'cancelled'):
+                        pipe.unwatch()
+                        return
+                    pipe.multi()
+                    pipe.delete(key)
+                    pipe.hset(key, mapping={
+                        'id': job_id, 'kind': kind, 'url': url, 'format_id': format_id,
+                        # Redis لا يخزن None، فالقيمة الفارغة تعني بلا حد
+                        'start_time': '' if start_time is None else start_time,
+                        'end_time': '' if end_time is None else end_time,
+                        'state': 'queued', 'worker': '', 'downloaded': 0, 'total': 0, 'eta': 0,
+                        'cancel_requested': 0, 'created_at': now, 'updated_at': now,
+                    })
+                    pipe.lpush(self._queue_key, job_id)
+                    pipe.execute()
+                    return
+                except redis.WatchError:
+                    continue
+
+    def claim(self, worker: str) -> Optional[Dict[str, Any]]:
+        # EVAL وليس EVALSHA: السكربتات قصيرة، ولا تعتمد على ذاكرة السكربتات في الخادم بعد إعادة تشغيله
+        now = time.time()
+        job_id = self.client.eval(_CLAIM_SCRIPT, 2, self._queue_key, self._running_key,
+                                  self._prefix, worker, now, now - self.lease_timeout)
+        if job_id is None:
+            return None
+        return self.get(job_id)
+
+    def heartbeat(self, job_id: str, worker: str, downloaded: int, total: int, eta: int) -> bool:
+        return bool(self.client.eval(_HEARTBEAT_SCRIPT, 2, self._job_key(job_id), self._running_key,
+                                     job_id, worker, downloaded, total, eta, time.time()))
+
+    def finish(self, job_id: str, worker: str, state: str, result_path: Optional[str] = None,
+               error: Optional[str] = None) -> None:
+        self.client.eval(_FINISH_SCRIPT, 2, self._job_key(job_id), self._running_key,
+                         job_id, worker, state, result_path or '', error or '', time.time(), self.result_ttl)
+
+    def cancel(self, job_id: str) -> None:
+        self.client.eval(_CANCEL_SCRIPT, 1, self._job_key(job_id), time.time(), self.result_ttl)
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        job = self.client.hgetall(self._job_key(job_id))
+        if not job:
+            return None
+        for field in ('downloaded', 'total', 'eta', 'cancel_requested'):
+            job[field] = int(float(job.get(field) or 0))
+        for field in ('created_at', 'updated_at'):
+            job[field] = float(job.get(field) or 0)
+        for field in ('start_time', 'end_time'):
+            job[field] = float(job[field]) if job.get(field) else None
+        for field in ('worker', 'result_path', 'error'):
+            job[field] = job.get(field) or None
+        return job
+
+    def remove(self, job_id: str) -> None:
+        with self.client.pipeline() as pipe:
+            pipe.delete(self._job_key(job_id))
+            pipe.zrem(self._running_key, job_id)
+            pipe.execute()
+
+
+_work_queue: Optional[WorkQueue] = None
+_work_queue_lock = threading.Lock()
+
+
+def get_work_queue() -> WorkQueue:
+    """
+    الطابور المشترك حسب DOWNLOAD_QUEUE_BACKEND ('redis' أو SQLite لغير ذلك)
+    """
+    global _work_queue
+    with _work_queue_lock:
+        if _work_queue is None:
+            from config import (
+                DOWNLOAD_QUEUE_BACKEND, DOWNLOAD_QUEUE_PATH, DOWNLOAD_QUEUE_REDIS_URL,
+                WORKER_LEASE_TIMEOUT, FILE_EXPIRY
+            )
+            if DOWNLOAD_QUEUE_BACKEND == 'redis':
+                _work_queue = RedisWorkQueue(DOWNLOAD_QUEUE_REDIS_URL, WORKER_LEASE_TIMEOUT, FILE_EXPIRY)
+            else:
+                _work_queue = SQLiteWorkQueue(DOWNLOAD_QUEUE_PATH, WORKER_LEASE_TIMEOUT)
+        return _work_queue
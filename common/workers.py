@@ -0,0 +1,228 @@
+import os
+import time
+import uuid
+import socket
+import logging
+import threading
+from typing import Any, Dict, List, Optional
+
+from common.bandwidth import BandwidthManager
+from common.cancellation import CancelToken, JobCancelled, StageTimeout
+from common.downloader import YouTubeDownloader, ProgressCallback
+from common.work_queue import WorkQueue, get_work_queue
+
+logger = logging.getLogger(__name__)
+
+
+class QueueDownloader(YouTubeDownloader):
+    """
+    محمل المنتجين (البوت وواجهة الويب) عند استخدام عمال منفصلين
+
+    استخراج المعلومات يبقى محليًا لأنه تفاعلي، أما التحميل فيُنشر في الطابور المشترك
+    ويُنتظر حتى يكمله أحد العمال مع تمرير التقدم والإلغاء في الاتجاهين. الواجهة مطابقة
+    لـ YouTubeDownloader فلا تتغير الواجهات الأمامية.
+    """
+
+    def __init__(self, download_path: str, info_cache_size: int = 256, info_cache_ttl: int = 600,
+                 queue: Optional[WorkQueue] = None, poll_interval: float = 0.5):
+        """
+        Args:
+            download_path: مسار مجلد التحميل المشترك مع العمال
+            info_cache_size: الحد الأقصى لعدد الفيديوهات في ذاكرة المعلومات المؤقتة
+            info_cache_ttl: مدة صلاحية معلومات الفيديو المخزنة بالثواني
+            queue: الطابور المشترك (افتراضيًا get_work_queue())
+            poll_interval: الفترة بين قراءات حالة المهمة (بالثواني)
+        """
+        super().__init__(download_path, info_cache_size, info_cache_ttl)
+        self.queue = queue or get_work_queue()
+        self.poll_interval = poll_interval
+
+    def download_video(self, url: str, format_id: str,
+                       progress_callback: Optional[ProgressCallback] = None,
+                       output_name: Optional[str] = None,
+                       cancel_token: Optional[CancelToken] = None,
+                       start_time: Optional[float] = None,
+                       end_time: Optional[float] = None) -> Optional[str]:
+        return self._dispatch('video', url, format_id, progress_callback, output_name, cancel_token,
+                              start_time, end_time)
+
+    def download_audio(self, url: str, format_id: str,
+                       progress_callback: Optional[ProgressCallback] = None,
+                       output_name: Optional[str] = None,
+                       cancel_token: Optional[CancelToken] = None,
+                       start_time: Optional[float] = None,
+                       end_time: Optional[float] = None) -> Optional[str]:
+        return self._dispatch('audio', url, format_id, progress_callback, output_name, cancel_token,
+                              start_time, end_time)
+
+    def _dispatch(self, kind: str, url: str, format_id: str,
+                  progress_callback: Optional[ProgressCallback],
+                  output_name: Optional[str], cancel_token: Optional[CancelToken],
+                  start_time: Optional[float] = None, end_time: Optional[float] = None) -> Optional[str]:
+        """
+        نشر مهمة التحميل في الطابور وانتظار نتيجتها
+
+        Returns:
+            مسار الملف المحمل أو None في حالة الفشل
+
+        Raises:
+            JobCancelled: إذا أُلغي التحميل
+        """
+        job_id = output_name or str(uuid.uuid4())
+        # المهمة المستأنفة بنفس المعرف تلتحق بالمهمة الموجودة بدل تكرارها
+        self.queue.enqueue(job_id, kind, url, format_id, start_time, end_time)
+        logger.info("تم نشر مهمة تحميل %s %s في الطابور المشترك", kind, job_id)
+
+        last_progress = None
+        while True:
+            if cancel_token is not None:
+                if cancel_token.wait(self.poll_interval):
+                    self.queue.cancel(job_id)
+                    raise JobCancelled()
+            else:
+                time.sleep(self.poll_interval)
+
+            job = self.queue.get(job_id)
+            if job is None:
+                logger.error("اختفت المهمة %s من الطابور المشترك", job_id)
+                return None
+
+            if job['state'] == 'completed':
+                self.queue.remove(job_id)
+                return job['result_path']
+            if job['state'] in ('failed', 'cancelled'):
+                logger.error("فشلت المهمة %s لدى العامل: %s", job_id, job.get('error'))
+                self.queue.remove(job_id)
+                return None
+
+            progress = (job['downloaded'], job['total'], job['eta'])
+            if progress_callback is not None and job['state'] == 'running' and progress != last_progress:
+                last_progress = progress
+                progress_callback(*progress)
+
+
+class DownloadWorker:
+    """
+    عامل تحميل عديم الحالة: يطالب بالمهام من الطابور المشترك وينفذها وينشر تقدمها ونتيجتها
+
+    يمكن تشغيل أي عدد من العمال على أجهزة متعددة ما دام مجلد التحميل مشتركًا بينها.
+    """
+
+    def __init__(self, queue: WorkQueue, downloader: YouTubeDownloader, concurrency: int = 2,
+                 poll_interval: float = 1.0, heartbeat_interval: float = 1.0):
+        """
+        Args:
+            queue: الطابور المشترك
+            downloader: المحمل المحلي الذي ينفذ التحميل
+            concurrency: عدد المهام المنفذة بالتوازي في هذه العملية
+            poll_interval: الفترة بين محاولات المطالبة عندما يكون الطابور فارغًا (بالثواني)
+            heartbeat_interval: الفترة بين نبضات نشر التقدم (بالثواني)
+        """
+        self.queue = queue
+        self.downloader = downloader
+        self.concurrency = concurrency
+        self.poll_interval = poll_interval
+        self.heartbeat_interval = heartbeat_interval
+        self._stopping = threading.Event()
+        self._threads: List[threading.Thread] = []
+        self._base_id = f"{socket.gethostname()}:{os.getpid()}"
+
+    def start(self) -> 'DownloadWorker':
+        for index in range(self.concurrency):
+            thread = threading.Thread(
+                target=self._loop,
+                args=(f"{self._base_id}:{index}",),
+                name=f"download-worker-{index}",
+                daemon=True
+            )
+            self._threads.append(thread)
+            thread.start()
+        logger.info("بدأ عامل التحميل %s بـ %s مهام متوازية", self._base_id, self.concurrency)
+        return self
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        """
+        التوقف عن المطالبة بمهام جديدة وانتظار المهام الجارية
+
+        المهام التي لا تنتهي خلال timeout تعود إلى الطابور بعد انتهاء ملكيتها ويستأنفها عامل آخر.
+        """
+        self._stopping.set()
+        for thread in self._threads:
+            thread.join(timeout)
+
+    def _loop(self, worker_id: str) -> None:
+        while not self._stopping.is_set():
+            try:
+                job = self.queue.claim(worker_id)
+            except Exception as e:
+                logger.error("خطأ في المطالبة بمهمة من الطابور: %s", e)
+                job = None
+            if job is None:
+                self._stopping.wait(self.poll_interval)
+                continue
+            self._process(job, worker_id)
+
+    def _process(self, job: Dict[str, Any], worker_id: str) -> None:
+        job_id = job['id']
+        logger.info("العامل %s يبدأ المهمة %s", worker_id, job_id)
+        cancel_token = CancelToken()
+        progress = {'downloaded': 0, 'total': 0, 'eta': 0}
+        finished = threading.Event()
+
+        def on_progress(downloaded: int, total: int, eta: int) -> None:
+            progress.update(downloaded=downloaded, total=total, eta=eta)
+
+        def heartbeat() -> None:
+            # النبضات مستقلة عن التقدم حتى لا تنتهي الملكية أثناء استخراج طويل
+            while not finished.wait(self.heartbeat_interval):
+                try:
+                    if not self.queue.heartbeat(job_id, worker_id, progress['downloaded'],
+                                                progress['total'], progress['eta']):
+                        cancel_token.cancel()
+                except Exception as e:
+                    logger.error("خطأ في نشر تقدم المهمة %s: %s", job_id, e)
+
+        heartbeat_thread = threading.Thread(target=heartbeat, name=f"heartbeat-{job_id}", daemon=True)
+        heartbeat_thread.start()
+        try:
+            download = self.downloader.download_video if job['kind'] == 'video' else self.downloader.download_audio
+            file_path = download(job['url'], job['format_id'], progress_callback=on_progress,
+                                 output_name=job_id, cancel_token=cancel_token,
+                                 start_time=job.get('start_time'), end_time=job.get('end_time'))
+        except StageTimeout as e:
+            logger.error("أوقف المراقب المهمة %s: %s", job_id, e)
+            self.queue.finish(job_id, worker_id, 'failed', error=str(e))
+        except JobCancelled:
+            self.queue.finish(job_id, worker_id, 'cancelled')
+            logger.info("تم إلغاء المهمة %s", job_id)
+        except Exception as e:
+            logger.error("فشلت المهمة %s: %s", job_id, e)
+            self.queue.finish(job_id, worker_id, 'failed', error=str(e))
+        else:
+            if file_path and os.path.exists(file_path):
+                self.queue.finish(job_id, worker_id, 'completed', result_path=file_path)
+            else:
+                self.queue.finish(job_id, worker_id, 'failed', error='فشل التحميل')
+        finally:
+            finished.set()
+            heartbeat_thread.join()
+
+
+def create_downloader(download_path: str, info_cache_size: int = 256, info_cache_ttl: int = 600,
+                      bandwidth: Optional[BandwidthManager] = None) -> YouTubeDownloader:
+    """
+    محمل الواجهات الأمامية: محلي افتراضيًا، أو عبر الطابور المشترك إذا حُدد DOWNLOAD_QUEUE_BACKEND
+
+    Args:
+        download_path: مسار مجلد التحميل
+        info_cache_size: الحد الأقصى لعدد الفيديوهات في ذاكرة المعلومات المؤقتة
+        info_cache_ttl: مدة صلاحية معلومات الفيديو المخزنة بالثواني
+        bandwidth: مدير عرض النطاق للتحميل المحلي
+
+    Returns:
+        YouTubeDownloader أو QueueDownloader
+    """
+    from config import DOWNLOAD_QUEUE_BACKEND
+    if DOWNLOAD_QUEUE_BACKEND == 'local':
+        return YouTubeDownloader(download_path, info_cache_size, info_cache_ttl, bandwidth)
+    return QueueDownloader(download_path, info_cache_size, info_cache_ttl, get_work_queue())
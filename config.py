@@ -30,9 +30,146 @@ if not os.path.exists(DOWNLOAD_PATH):
 # الحد الأقصى لحجم الملف (بالبايت) - 200 ميجابايت افتراضيًا
 MAX_FILE_SIZE = int(os.getenv('MAX_FILE_SIZE', 200 * 1024 * 1024))
 
+# الحد الأقصى لحجم الملفات التي يرسلها البوت عبر واجهة تلغرام (بالبايت) - 50 ميجابايت
+TELEGRAM_UPLOAD_LIMIT = int(os.getenv('TELEGRAM_UPLOAD_LIMIT', 50 * 1024 * 1024))
+
+# خيار "ملاءمة الحجم" (ضغط الفيديو ليلائم حدًا مثل حد تلغرام): مجلد النتائج المخزنة،
+# وعدد عمليات الترميز المتزامنة، وعدد خيوط FFmpeg لكل عملية، وإعداد السرعة لـ x264
+FIT_CACHE_PATH = os.getenv('FIT_CACHE_PATH', os.path.join(DOWNLOAD_PATH, '.fit'))
+TRANSCODE_WORKERS = int(os.getenv('TRANSCODE_WORKERS', 1))
+TRANSCODE_THREADS = int(os.getenv('TRANSCODE_THREADS', 2))
+TRANSCODE_PRESET = os.getenv('TRANSCODE_PRESET', 'veryfast')
+
 # مدة انتهاء صلاحية الملفات المؤقتة (بالثواني) - 24 ساعة افتراضيًا
 FILE_EXPIRY = int(os.getenv('FILE_EXPIRY', 24 * 60 * 60))
 
+# ذاكرة معلومات الفيديو المؤقتة: عدد الفيديوهات ومدة الصلاحية (بالثواني)
+INFO_CACHE_SIZE = int(os.getenv('INFO_CACHE_SIZE', 256))
+INFO_CACHE_TTL = int(os.getenv('INFO_CACHE_TTL', 10 * 60))
+# عدد عمليات استخراج قائمة التنسيقات المتزامنة في الخلفية (بعد عرض المعاينة السريعة)
+METADATA_WORKERS = int(os.getenv('METADATA_WORKERS', 4))
+# الاستخراج الدفعي (/api/extract/batch): الحد الأقصى للروابط في الطلب، وعدد ما يُستخرج منها
+# بالتوازي (أقل من METADATA_WORKERS حتى لا تؤخر دفعة واحدة المعاينات التفاعلية)
+BATCH_EXTRACT_MAX_URLS = int(os.getenv('BATCH_EXTRACT_MAX_URLS', 50))
+BATCH_EXTRACT_CONCURRENCY = int(os.getenv('BATCH_EXTRACT_CONCURRENCY', 2))
+
+# الواجهات الخلفية للاستخراج والتحميل بترتيب التفضيل الابتدائي؛ تُوجه الطلبات وقت التشغيل
+# إلى الواجهة الأسلم والأسرع منها، وتُجرب الواجهة المؤخرة كل BACKEND_PROBE_INTERVAL ثانية
+DOWNLOAD_BACKENDS = [name.strip() for name in os.getenv('DOWNLOAD_BACKENDS', 'yt-dlp,pytube').split(',') if name.strip()]
+BACKEND_PROBE_INTERVAL = float(os.getenv('BACKEND_PROBE_INTERVAL', 60))
+# الاستخراج المتحوط: بدء الواجهة الثانية إذا لم تُجب الأولى خلال هذه المدة (بالثواني)
+# أو ضعف متوسط زمنها أيهما أكبر؛ 0 لتعطيل التحوط
+EXTRACT_HEDGE_DELAY = float(os.getenv('EXTRACT_HEDGE_DELAY', 3))
+# تنفيذ الاستخراج: 'thread' في خيوط العملية نفسها، أو 'process' في مجمع عمليات منفصلة يتوزع على الأنوية
+# (عدد العمليات، وعدد المهام قبل استبدال كل عملية للتخلص مما تسربه المكتبات)
+EXTRACT_EXECUTOR = os.getenv('EXTRACT_EXECUTOR', 'thread').lower()
+EXTRACT_PROCESSES = int(os.getenv('EXTRACT_PROCESSES', os.cpu_count() or 1))
+EXTRACT_MAX_TASKS_PER_CHILD = int(os.getenv('EXTRACT_MAX_TASKS_PER_CHILD', 100))
+
+# الحد الأقصى لعدد مهام التحميل المنفذة بالتوازي (مشترك بين البوت وواجهة الويب)
+MAX_CONCURRENT_JOBS = int(os.getenv('MAX_CONCURRENT_JOBS', 4))
+
+# التحكم في القبول: سعة كل مرحلة وطول طابور انتظارها؛ عند امتلاء الطابور تُرفض الطلبات
+# (429 مع Retry-After في واجهة الويب) بدل تراكمها حتى نفاد الذاكرة أو القرص
+MAX_CONCURRENT_EXTRACTIONS = int(os.getenv('MAX_CONCURRENT_EXTRACTIONS', 4))
+MAX_QUEUED_EXTRACTIONS = int(os.getenv('MAX_QUEUED_EXTRACTIONS', 16))
+# مهام التحميل المنتظرة في المجدول (سعة التنفيذ MAX_CONCURRENT_JOBS)
+MAX_QUEUED_JOBS = int(os.getenv('MAX_QUEUED_JOBS', 50))
+# عمليات الضغط المنتظرة (سعة التنفيذ TRANSCODE_WORKERS)
+MAX_QUEUED_TRANSCODES = int(os.getenv('MAX_QUEUED_TRANSCODES', 4))
+# عمليات إرسال الملفات المتزامنة (إرسال البوت إلى تلغرام، وتنزيلات الملفات من واجهة الويب)
+MAX_CONCURRENT_UPLOADS = int(os.getenv('MAX_CONCURRENT_UPLOADS', 8))
+
+# مهل المراحل (بالثواني، 0 لتعطيلها): يوقف المراقب المرحلة العالقة ويحذف ملفاتها ويحرر عاملها
+EXTRACT_TIMEOUT = float(os.getenv('EXTRACT_TIMEOUT', 60))
+# كشف توقف التحميل: أقل معدل مقبول (بايت/ثانية) خلال النافذة المحددة
+DOWNLOAD_STALL_RATE = float(os.getenv('DOWNLOAD_STALL_RATE', 1024))
+DOWNLOAD_STALL_WINDOW = float(os.getenv('DOWNLOAD_STALL_WINDOW', 60))
+# لكل خطوة FFmpeg (التحويل والقص والضغط ودمج yt-dlp وتحميل المقاطع)
+POSTPROCESS_TIMEOUT = float(os.getenv('POSTPROCESS_TIMEOUT', 30 * 60))
+# إرسال الملف إلى تلغرام (تُمدد حسب حصة الرفع للملفات الكبيرة)
+UPLOAD_TIMEOUT = float(os.getenv('UPLOAD_TIMEOUT', 10 * 60))
+
+# تحديد المعدل لكل مستخدم تلغرام ولكل عنوان IP (دلو رموز)
+# السعة: أقصى تكلفة مسموحة دفعة واحدة، والمعدل: وحدات التكلفة المستعادة في الثانية (0 لتعطيل التحديد)
+RATE_LIMIT_CAPACITY = float(os.getenv('RATE_LIMIT_CAPACITY', 500))
+RATE_LIMIT_REFILL_RATE = float(os.getenv('RATE_LIMIT_REFILL_RATE', 1))
+
+# تكلفة المهمة = تكلفة ثابتة + تكلفة لكل ميجابايت من الحجم المقدر
+JOB_BASE_COST = float(os.getenv('JOB_BASE_COST', 10))
+JOB_COST_PER_MB = float(os.getenv('JOB_COST_PER_MB', 1))
+
+# مجلد لقطات المقاييس المشترك بين عمليات البوت وواجهة الويب، وفترة كتابتها (بالثواني)
+METRICS_DIR = os.getenv('METRICS_DIR', os.path.join(DOWNLOAD_PATH, '.metrics'))
+METRICS_FLUSH_INTERVAL = float(os.getenv('METRICS_FLUSH_INTERVAL', 10))
+
+# التسجيل: المستوى، والصيغة ('text' أو 'json' بسطر لكل سجل مع معرف المهمة)،
+# وأقل فترة بين سطري تقدم لنفس الملف (بالثواني، 0 = كل دفعة)
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO').upper()
+LOG_FORMAT = os.getenv('LOG_FORMAT', 'text').lower()
+LOG_PROGRESS_INTERVAL = float(os.getenv('LOG_PROGRESS_INTERVAL', 10))
+
+# التحليل الاختياري (cProfile) لمهام فردية: يجب تفعيله صراحة، وتُحفظ الملفات في PROFILE_PATH
+JOB_PROFILING_ENABLED = os.getenv('JOB_PROFILING_ENABLED', 'False').lower() == 'true'
+PROFILE_PATH = os.getenv('PROFILE_PATH', os.path.join(DOWNLOAD_PATH, '.profiles'))
+
+# تشخيص الذاكرة (tracemalloc ونقطة /debug/memory): يجب تفعيله صراحة لأنه يبطئ التخصيصات،
+# مع عدد إطارات الاستدعاء لكل تخصيص والفترة بين سطور ملخص الذاكرة في السجل (بالثواني، 0 = بلا سجل)
+MEMORY_DIAGNOSTICS_ENABLED = os.getenv('MEMORY_DIAGNOSTICS_ENABLED', 'False').lower() == 'true'
+MEMORY_TRACE_FRAMES = int(os.getenv('MEMORY_TRACE_FRAMES', 1))
+MEMORY_REPORT_INTERVAL = float(os.getenv('MEMORY_REPORT_INTERVAL', 600))
+# جلسات مستخدمي البوت (الرابط ومعلومات الفيديو حتى اختيار التنسيق): الحد الأقصى لعددها ومدة صلاحيتها بالثواني
+USER_SESSION_CACHE_SIZE = int(os.getenv('USER_SESSION_CACHE_SIZE', 1000))
+USER_SESSION_TTL = float(os.getenv('USER_SESSION_TTL', 3600))
+# جلسات واجهة الويب (الرابط ومعلومات الفيديو ومعرف التحميل): الحد الأقصى لعددها ومدة صلاحيتها بالثواني
+WEB_SESSION_CACHE_SIZE = int(os.getenv('WEB_SESSION_CACHE_SIZE', 1000))
+WEB_SESSION_TTL = float(os.getenv('WEB_SESSION_TTL', 3600))
+
+# سجل مهام التحميل لاستئنافها بعد توقف العملية أو إعادة النشر
+# (يجب أن يكون على قرص دائم مع DOWNLOAD_PATH حتى تُستأنف الملفات الجزئية)
+JOB_JOURNAL_PATH = os.getenv('JOB_JOURNAL_PATH', os.path.join(DOWNLOAD_PATH, '.journal', 'jobs.db'))
+
+# مخزن الملفات المكتملة: 'local' (مجلد التحميل)، أو 'tmpfs' (في الذاكرة بحد أقصى للحجم)،
+# أو 's3' (مخزن كائنات متوافق مع S3 مثل MinIO، تُقدم ملفاته بروابط موقّعة)
+STORAGE_BACKEND = os.getenv('STORAGE_BACKEND', 'local').lower()
+STORAGE_TMPFS_PATH = os.getenv('STORAGE_TMPFS_PATH', '/dev/shm/youtube-downloader')
+STORAGE_TMPFS_MAX_BYTES = int(os.getenv('STORAGE_TMPFS_MAX_BYTES', 512 * 1024 * 1024))
+S3_BUCKET = os.getenv('S3_BUCKET', 'youtube-downloader')
+S3_ENDPOINT_URL = os.getenv('S3_ENDPOINT_URL', '')
+S3_REGION = os.getenv('S3_REGION', '')
+S3_ACCESS_KEY_ID = os.getenv('S3_ACCESS_KEY_ID', '')
+S3_SECRET_ACCESS_KEY = os.getenv('S3_SECRET_ACCESS_KEY', '')
+S3_PREFIX = os.getenv('S3_PREFIX', 'downloads/')
+# مدة صلاحية روابط التنزيل الموقعة (بالثواني)
+S3_PRESIGN_EXPIRY = int(os.getenv('S3_PRESIGN_EXPIRY', 60 * 60))
+
+# طابور التحميل المشترك بين الواجهات وعمال التحميل (worker.py):
+# 'local' للتحميل داخل عملية الواجهة، أو 'sqlite' / 'redis' لنشر المهام إلى عمال منفصلين
+# (يجب أن يكون DOWNLOAD_PATH مشتركًا بين الواجهات والعمال)
+DOWNLOAD_QUEUE_BACKEND = os.getenv('DOWNLOAD_QUEUE_BACKEND', 'local').lower()
+DOWNLOAD_QUEUE_PATH = os.getenv('DOWNLOAD_QUEUE_PATH', os.path.join(DOWNLOAD_PATH, '.queue', 'queue.db'))
+DOWNLOAD_QUEUE_REDIS_URL = os.getenv('DOWNLOAD_QUEUE_REDIS_URL', 'redis://localhost:6379/0')
+# عدد المهام المنشورة إلى العمال في نفس الوقت من كل واجهة (بدل MAX_CONCURRENT_JOBS)
+MAX_DISPATCHED_JOBS = int(os.getenv('MAX_DISPATCHED_JOBS', 32))
+# عدد المهام المتوازية لكل عامل، ومدة الملكية دون نبضات قبل إعادة المهمة إلى الطابور (بالثواني)
+WORKER_CONCURRENCY = int(os.getenv('WORKER_CONCURRENCY', 2))
+WORKER_LEASE_TIMEOUT = float(os.getenv('WORKER_LEASE_TIMEOUT', 60))
+
+# اختيار عملية واحدة لتشغيل البوت عند تعدد العمليات (مثل عمال gunicorn):
+# 'file' قفل ملف على نفس الجهاز، أو 'sqlite' ملكية بمدة صلاحية على قرص مشترك بين الأجهزة
+BOT_LEADER_BACKEND = os.getenv('BOT_LEADER_BACKEND', 'file').lower()
+BOT_LEADER_PATH = os.getenv('BOT_LEADER_PATH', os.path.join(
+    DOWNLOAD_PATH, '.leader', 'bot.db' if BOT_LEADER_BACKEND == 'sqlite' else 'bot.lock'))
+# مدة صلاحية الملكية دون تجديد (بالثواني)، وتُجدد أو تُحاول كل ثلثها
+BOT_LEADER_TTL = float(os.getenv('BOT_LEADER_TTL', 30))
+
+# الحد العام لعرض النطاق (بالبايت في الثانية، 0 = بلا حد) مقسمًا بالتساوي على المهام النشطة:
+# التحميل من يوتيوب، والرفع إلى المستخدمين (ملفات الويب وإرسال تلغرام)
+BANDWIDTH_DOWNLOAD_LIMIT = float(os.getenv('BANDWIDTH_DOWNLOAD_LIMIT', 0))
+BANDWIDTH_UPLOAD_LIMIT = float(os.getenv('BANDWIDTH_UPLOAD_LIMIT', 0))
+# وزن مهام الصوت (الصغيرة والتفاعلية) في التوزيع مقارنة بالفيديو
+BANDWIDTH_AUDIO_WEIGHT = float(os.getenv('BANDWIDTH_AUDIO_WEIGHT', 3))
+
 # عنوان الموقع للوصول إلى الملفات
 if ON_RENDER:
     # استخدام عنوان Render
@@ -6,21 +6,20 @@ import threading
 import logging
 from multiprocessing import Process
 
-# إعداد التسجيل
-logging.basicConfig(
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    level=logging.INFO
-)
+from common.logging_setup import setup_logging
+
+# إعداد التسجيل المركزي (طابور وخيط كتابة واحد)
+setup_logging()
 logger = logging.getLogger(__name__)
 
 def run_bot():
     """تشغيل بوت التلغرام."""
     try:
-        from bot.telegram_bot import main as bot_main
+        from bot import start_bot
         logger.info("جاري تشغيل بوت التلغرام...")
-        bot_main()
+        start_bot()
     except Exception as e:
-        logger.error(f"خطأ في تشغيل بوت التلغرام: {str(e)}")
+        logger.error("خطأ في تشغيل بوت التلغرام: %s", e)
         sys.exit(1)
 
 def run_web():
@@ -28,10 +27,10 @@ def run_web():
     try:
         from web.app import app
         from config import WEB_HOST, WEB_PORT, DEBUG
-        logger.info(f"جاري تشغيل واجهة الويب على {WEB_HOST}:{WEB_PORT}...")
+        logger.info("جاري تشغيل واجهة الويب على %s:%s...", WEB_HOST, WEB_PORT)
         app.run(host=WEB_HOST, port=WEB_PORT, debug=DEBUG)
     except Exception as e:
-        logger.error(f"خطأ في تشغيل واجهة الويب: {str(e)}")
+        logger.error("خطأ في تشغيل واجهة الويب: %s", e)
         sys.exit(1)
 
 def main():
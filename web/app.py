@@ -1,35 +1,136 @@
 import os
 import sys
 import json
+import time
 import uuid
 import logging
 import threading
-from typing import Dict, Optional, Any, List
-from flask import Flask, render_template, request, jsonify, send_file, abort, url_for
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Dict, Optional, Any, List, Tuple
+from flask import Flask, Response, render_template, request, jsonify, send_file, abort, url_for, redirect
+from werkzeug.wsgi import ClosingIterator
 
 # إضافة المجلد الرئيسي إلى مسار النظام
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
-from config import DOWNLOAD_PATH, FILE_EXPIRY, MAX_FILE_SIZE, BASE_URL, ON_RENDER
-from common.downloader import YouTubeDownloader
-
-# إعداد التسجيل
-logging.basicConfig(
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    level=logging.INFO
+from config import (
+    FILE_EXPIRY, MAX_FILE_SIZE, BASE_URL, ON_RENDER,
+    INFO_CACHE_SIZE, INFO_CACHE_TTL, METADATA_WORKERS, BATCH_EXTRACT_MAX_URLS,
+    BATCH_EXTRACT_CONCURRENCY, RATE_LIMIT_CAPACITY, RATE_LIMIT_REFILL_RATE,
+    JOB_BASE_COST, JOB_COST_PER_MB, METRICS_DIR, METRICS_FLUSH_INTERVAL,
+    JOB_PROFILING_ENABLED, PROFILE_PATH, MEMORY_DIAGNOSTICS_ENABLED,
+    WEB_SESSION_CACHE_SIZE, WEB_SESSION_TTL
 )
+from common.admission import CapacityExceeded, get_capacity
+from common.bandwidth import get_bandwidth
+from common.cache import TTLCache
+from common.cancellation import JobCancelled, StageTimeout
+from common.jobs import Job, estimate_job_cost
+from common.journal import get_journal
+from common.logging_setup import setup_logging
+from common.memory import get_memory_monitor
+from common.metrics import registry as metrics_registry, UPLOAD_SECONDS
+from common.rate_limit import RateLimiter
+from common.scheduler import get_scheduler
+from common.storage import get_storage
+from common.transcode import get_transcoder
+from common.url_parser import parse_timestamp, parse_youtube_url
+from common.workers import create_downloader
+
+# إعداد التسجيل المركزي (طابور وخيط كتابة واحد)
+setup_logging()
 logger = logging.getLogger(__name__)
 
 # إنشاء تطبيق Flask
 app = Flask(__name__)
 
+# تصدير المقاييس إلى المجلد المشترك
+metrics_registry.start_flusher(METRICS_DIR, METRICS_FLUSH_INTERVAL)
+
 # إنشاء محمل YouTube
-downloader = YouTubeDownloader(DOWNLOAD_PATH)
+downloader = create_downloader(get_storage().scratch_dir, INFO_CACHE_SIZE, INFO_CACHE_TTL, get_bandwidth())
 
-# قاموس لتخزين معلومات التحميل
-download_sessions = {}
+# جلسات التحميل حسب معرف الجلسة (تنتهي صلاحية جلسات العملاء الذين لم يعودوا)
+download_sessions = TTLCache(maxsize=WEB_SESSION_CACHE_SIZE, ttl=WEB_SESSION_TTL)
+# مهام التحميل حسب معرف التحميل، ما دام ملفها متاحًا
+download_jobs = TTLCache(maxsize=10000, ttl=FILE_EXPIRY)
 # قفل للتزامن
 sessions_lock = threading.Lock()
+# مفتاح كل طلب تحميل -> (معرف التحميل، معاملات الطلب)، لإعادة المهمة نفسها للطلبات المكررة
+idempotent_jobs = TTLCache(maxsize=10000, ttl=FILE_EXPIRY)
+
+# أحجام المخازن في الذاكرة لتقرير /debug/memory
+memory_monitor = get_memory_monitor()
+memory_monitor.register('web_sessions', lambda: len(download_sessions))
+memory_monitor.register('web_jobs', lambda: len(download_jobs))
+memory_monitor.register('web_idempotent_jobs', lambda: len(idempotent_jobs))
+memory_monitor.register('web_info_cache', lambda: len(downloader.info_cache))
+
+# استخراج قوائم التنسيقات في الخلفية بعد إرجاع المعاينة السريعة
+metadata_executor = ThreadPoolExecutor(max_workers=METADATA_WORKERS, thread_name_prefix='metadata')
+
+# تحديد معدل التحميل لكل عنوان IP
+ip_rate_limiter = RateLimiter(RATE_LIMIT_REFILL_RATE, RATE_LIMIT_CAPACITY)
+
+def parse_clip_times(data: Dict, duration: Optional[int]) -> Tuple[Optional[float], Optional[float]]:
+    """
+    قراءة حدود المقطع المطلوب من طلب التحميل
+    
+    Args:
+        data: جسم الطلب (start_time و end_time بالثواني أو بصيغة 1:30)
+        duration: مدة الفيديو بالثواني إن كانت معروفة
+        
+    Returns:
+        (البداية، النهاية) أو (None، None) للفيديو كاملًا
+        
+    Raises:
+        ValueError: إذا كانت الحدود غير صالحة
+    """
+    times = []
+    for name in ('start_time', 'end_time'):
+        value = data.get(name)
+        if value is None or value == '':
+            times.append(None)
+        elif isinstance(value, (int, float)) and not isinstance(value, bool) and value >= 0:
+            times.append(float(value))
+        else:
+            seconds = parse_timestamp(str(value))
+            if seconds is None:
+                raise ValueError('صيغة وقت المقطع غير صالحة. استخدم مثلًا 90 أو 1:30.')
+            times.append(float(seconds))
+    
+    start, end = times
+    if duration:
+        if start is not None and start >= duration:
+            raise ValueError('بداية المقطع بعد نهاية الفيديو.')
+        if end is not None and end >= duration:
+            end = None
+    if start is not None and end is not None and end <= start:
+        raise ValueError('نهاية المقطع يجب أن تكون بعد بدايته.')
+    return start or None, end
+
+def session_video_info(session_data: Dict) -> Dict:
+    """
+    أحدث معلومات فيديو للجلسة: الكاملة إذا اكتمل استخراج التنسيقات، وإلا المعاينة
+    """
+    future = session_data.get('formats_future')
+    if future is not None and future.done() and future.exception() is None:
+        session_data['video_info'] = future.result()
+        session_data.pop('formats_future', None)
+    return session_data.get('video_info') or {}
+
+def busy_response(error: CapacityExceeded) -> Tuple[Response, int]:
+    """رد 429 عند امتلاء سعة الخدمة، مع Retry-After بالوقت المقدر لتوفر مكان"""
+    response = jsonify({'error': str(error), 'retry_after': int(error.retry_after) + 1})
+    response.headers['Retry-After'] = str(int(error.retry_after) + 1)
+    return response, 429
+
+def get_client_ip() -> str:
+    """عنوان IP الخاص بالعميل (مع مراعاة الوكيل العكسي على Render)"""
+    forwarded_for = request.headers.get('X-Forwarded-For', '')
+    if forwarded_for:
+        return forwarded_for.split(',')[0].strip()
+    return request.remote_addr or 'unknown'
 
 @app.route('/')
 def index():
@@ -50,30 +151,120 @@ def extract_info():
         return jsonify({'error': 'الرابط الذي أدخلته غير صالح. الرجاء إدخال رابط يوتيوب صحيح.'}), 400
     
     try:
-        # استخراج معلومات الفيديو
-        video_info = downloader.get_video_info(url)
+        # معاينة سريعة (العنوان والمدة والصورة)، وقائمة التنسيقات تتبع في الخلفية
+        video_info = downloader.get_video_preview(url)
+        formats_ready = 'formats' in video_info
         
         # إنشاء معرف جلسة فريد
         session_id = str(uuid.uuid4())
         
         # تخزين معلومات الجلسة
         with sessions_lock:
-            download_sessions[session_id] = {
+            download_sessions.set(session_id, {
                 'url': url,
                 'video_info': video_info,
+                'formats_future': None if formats_ready else metadata_executor.submit(downloader.get_video_info, url),
                 'created_at': os.path.getmtime(__file__),  # وقت الإنشاء
-            }
+            })
+        
+        # وقت البدء من الرابط المشارك (t=) يُعرض بداية افتراضية للمقطع
+        key = parse_youtube_url(url)
         
         return jsonify({
             'success': True,
             'session_id': session_id,
-            'video_info': video_info
+            'video_info': video_info,
+            'formats_ready': formats_ready,
+            'start_time': key.start_time if key is not None else None
         })
     
+    except CapacityExceeded as e:
+        return busy_response(e)
     except Exception as e:
-        logger.error(f"خطأ في استخراج معلومات الفيديو: {str(e)}")
+        logger.error("خطأ في استخراج معلومات الفيديو: %s", e)
         return jsonify({'error': f'حدث خطأ أثناء معالجة الرابط: {str(e)}'}), 500
 
+@app.route('/api/extract/batch', methods=['POST'])
+def extract_batch():
+    """
+    استخراج معلومات عدة روابط دفعة واحدة مع بث كل نتيجة فور جهوزها بصيغة NDJSON.
+    
+    كل سطر كائن JSON فيه index و url، ثم video_info عند النجاح أو error عند الفشل، بترتيب
+    اكتمال الاستخراج لا بترتيب الروابط؛ والسطر الأخير {"done": true, ...}. لا تُنشأ جلسات
+    تحميل: يستدعي العميل /api/extract للرابط الذي يريد تحميله فيُجاب من الذاكرة المؤقتة.
+    """
+    data = request.get_json(silent=True) or {}
+    urls = data.get('urls')
+    
+    if not isinstance(urls, list) or not urls or not all(isinstance(url, str) for url in urls):
+        return jsonify({'error': 'الرجاء إرسال قائمة روابط يوتيوب في الحقل urls'}), 400
+    if len(urls) > BATCH_EXTRACT_MAX_URLS:
+        return jsonify({'error': f'الحد الأقصى {BATCH_EXTRACT_MAX_URLS} رابطًا في الطلب الواحد'}), 400
+    
+    return Response(stream_batch_results(urls), mimetype='application/x-ndjson')
+
+def stream_batch_results(urls: List[str]):
+    """
+    استخراج الروابط في مجمع المعلومات المشترك (مع الذاكرة المؤقتة أمامه) وإرجاع سطر لكل نتيجة
+    
+    لا يُستخرج من الدفعة أكثر من BATCH_EXTRACT_CONCURRENCY رابطًا في آن واحد، فيُكمل الباقي
+    في الخانات الأخرى إذا تأخر رابط، وتبقى للمعاينات التفاعلية خانات في المجمع.
+    """
+    pending = []
+    errors = 0
+    for index, url in enumerate(urls):
+        if downloader.is_valid_youtube_url(url):
+            pending.append((index, url))
+        else:
+            errors += 1
+            yield app.json.dumps({'index': index, 'url': url, 'error': 'الرابط غير صالح'}) + '\n'
+    
+    pending.reverse()
+    running = {}
+    try:
+        while pending or running:
+            while pending and len(running) < BATCH_EXTRACT_CONCURRENCY:
+                index, url = pending.pop()
+                running[metadata_executor.submit(downloader.get_video_info, url)] = (index, url)
+            
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                index, url = running.pop(future)
+                if future.exception() is not None:
+                    errors += 1
+                    logger.error("خطأ في استخراج معلومات %s: %s", url, future.exception())
+                    item = {'index': index, 'url': url, 'error': str(future.exception())}
+                else:
+                    item = {'index': index, 'url': url, 'video_info': future.result()}
+                yield app.json.dumps(item) + '\n'
+    finally:
+        # انقطع العميل: لا داعي لإكمال ما لم يبدأ بعد
+        for future in running:
+            future.cancel()
+    
+    yield app.json.dumps({'done': True, 'count': len(urls), 'errors': errors}) + '\n'
+
+@app.route('/api/formats/<session_id>', methods=['GET'])
+def get_formats(session_id):
+    """قائمة تنسيقات الفيديو بعد اكتمال استخراجها في الخلفية (تستطلعها الواجهة بعد المعاينة)."""
+    with sessions_lock:
+        session_data = download_sessions.get(session_id)
+        if session_data is None:
+            return jsonify({'error': 'انتهت صلاحية الجلسة. الرجاء إعادة استخراج معلومات الفيديو.'}), 404
+        future = session_data.get('formats_future')
+        video_info = session_video_info(session_data)
+    
+    if future is not None and future.done() and future.exception() is not None:
+        error = future.exception()
+        if isinstance(error, CapacityExceeded):
+            return busy_response(error)
+        logger.error("خطأ في استخراج تنسيقات الفيديو: %s", error)
+        return jsonify({'error': f'حدث خطأ أثناء استخراج التنسيقات: {str(error)}'}), 500
+    
+    if 'formats' not in video_info:
+        return jsonify({'ready': False})
+    return jsonify({'ready': True, 'video_info': video_info})
+
 @app.route('/api/download', methods=['POST'])
 def download_video():
     """تحميل الفيديو بالتنسيق المحدد."""
@@ -81,118 +272,313 @@ def download_video():
     session_id = data.get('session_id')
     format_id = data.get('format_id')
     format_type = data.get('format_type')  # 'video' أو 'audio'
+    profile = bool(data.get('profile')) and JOB_PROFILING_ENABLED  # التقاط cProfile لهذه المهمة
     
     if not session_id or not format_id or not format_type:
         return jsonify({'error': 'بيانات غير كاملة'}), 400
     
     # التحقق من وجود الجلسة
     with sessions_lock:
-        if session_id not in download_sessions:
+        session_data = download_sessions.get(session_id)
+        if session_data is None:
             return jsonify({'error': 'انتهت صلاحية الجلسة. الرجاء إعادة استخراج معلومات الفيديو.'}), 400
+        video_info = session_video_info(session_data)
+    
+    url = session_data['url']
+    
+    try:
+        start_time, end_time = parse_clip_times(data, video_info.get('duration'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    # الطلبات المكررة (نقر مزدوج أو إعادة محاولة) تعيد المهمة نفسها بدل تحميل جديد؛ المفتاح
+    # من العميل (ترويسة Idempotency-Key أو الحقل idempotency_key) أو من الجلسة والتنسيق والمقطع
+    client_ip = get_client_ip()
+    params = (session_id, format_id, format_type, start_time, end_time)
+    client_key = request.headers.get('Idempotency-Key') or data.get('idempotency_key')
+    job_key = ('client', client_ip, str(client_key)) if client_key else ('request',) + params
+    try:
+        job = find_idempotent_job(job_key, params)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 409
+    if job is not None:
+        return download_response(job, reused=True)
+    
+    # تحديد المعدل حسب عنوان IP وتكلفة المهمة المقدرة
+    cost = estimate_job_cost(video_info, format_id, format_type,
+                             JOB_BASE_COST, JOB_COST_PER_MB, start_time, end_time)
+    allowed, retry_after = ip_rate_limiter.try_acquire(client_ip, cost)
+    if not allowed:
+        response = jsonify({'error': 'لقد تجاوزت الحد المسموح من التحميلات. الرجاء المحاولة لاحقًا.'})
+        response.headers['Retry-After'] = str(int(retry_after) + 1)
+        return response, 429
     
     try:
-        # الحصول على معلومات الجلسة
         with sessions_lock:
-            session_data = download_sessions[session_id]
-        url = session_data['url']
-        
-        # إنشاء معرف تحميل فريد
-        download_id = str(uuid.uuid4())
+            # طلب مكرر متزامن سبق هذا الطلب إلى الطابور: لا يدفع تكلفة مهمة لن تُنفذ
+            try:
+                job = find_idempotent_job(job_key, params, include_completed=False)
+            except ValueError as e:
+                ip_rate_limiter.refund(client_ip, cost)
+                return jsonify({'error': str(e)}), 409
+            if job is not None:
+                ip_rate_limiter.refund(client_ip, cost)
+                return download_response(job, reused=True)
+            
+            # إضافة المهمة إلى طابور التحميل العادل
+            logger.info("إضافة تحميل %s بمعرف %s من الرابط %s إلى الطابور", format_type, format_id, url)
+            download_id = str(uuid.uuid4())
+            owner = f"ip:{client_ip}"
+            get_journal().record(download_id, 'web', owner, url, format_id, format_type, cost,
+                                 {'session_id': session_id, 'start_time': start_time, 'end_time': end_time})
+            job = get_scheduler().submit(
+                lambda job: run_download_job(job, url, format_id, format_type, start_time, end_time),
+                owner=owner,
+                cost=cost,
+                job_id=download_id,
+                profile_path=os.path.join(PROFILE_PATH, f"{download_id}.prof") if profile else None
+            )
+            # تخزين معلومات التحميل
+            download_jobs.set(download_id, job)
+            idempotent_jobs.set(job_key, (download_id, params))
+            session_data.update({
+                'download_id': download_id,
+                'format_id': format_id,
+                'format_type': format_type,
+            })
         
-        # تخزين معلومات التحميل
-        with sessions_lock:
-            download_sessions[session_id]['download_id'] = download_id
-            download_sessions[session_id]['format_id'] = format_id
-            download_sessions[session_id]['format_type'] = format_type
-            download_sessions[session_id]['status'] = 'preparing'
-            download_sessions[session_id]['progress'] = 0
+        return download_response(job)
         
-        # بدء التحميل (في تطبيق حقيقي، يجب استخدام Celery أو خيوط)
-        logger.info(f"بدء تحميل {format_type} بمعرف {format_id} من الرابط {url}")
+    except CapacityExceeded as e:
+        # طابور التحميل ممتلئ: المهمة لم تُقبل فلا تبقى في السجل ولا تُحسب على حد معدل العميل
+        get_journal().remove(download_id)
+        ip_rate_limiter.refund(client_ip, cost)
+        return busy_response(e)
+    except Exception as e:
+        logger.error("خطأ في تحميل الفيديو: %s", e)
+        return jsonify({'error': f'حدث خطأ أثناء التحميل: {str(e)}'}), 500
+
+def find_idempotent_job(job_key: Tuple, params: Tuple, include_completed: bool = True) -> Optional[Job]:
+    """
+    المهمة السابقة لنفس مفتاح الطلب إن كان يمكن إعادتها (جارية، أو مكتملة وملفها موجود)
+    
+    Args:
+        job_key: مفتاح الطلب
+        params: معاملات الطلب (الجلسة، التنسيق، نوعه، بداية المقطع ونهايته)
+        include_completed: إعادة المهمة المكتملة أيضًا (بعد التحقق من بقاء ملفها في المخزن)
         
-        # تحميل الفيديو أو الصوت
+    Raises:
+        ValueError: إذا استُخدم مفتاح العميل نفسه لطلب بمعاملات مختلفة
+    """
+    entry = idempotent_jobs.get(job_key)
+    if entry is None:
+        return None
+    download_id, entry_params = entry
+    if entry_params != params:
+        raise ValueError('مفتاح الطلب مستخدم لتحميل مختلف.')
+    job = download_jobs.get(download_id)
+    # المهمة الجارية التي طُلب إلغاؤها تبقى "running" حتى يلاحظ العامل الإلغاء
+    if job is None or job.status in ('failed', 'cancelled') or job.cancel_token.cancelled:
+        return None
+    if job.status == 'completed' and not (include_completed and get_storage().exists(job.result)):
+        return None
+    return job
+
+def download_response(job: Job, reused: bool = False) -> Response:
+    """رد طلب التحميل: معرف المهمة ورابط الملف وحالتها الحالية"""
+    if ON_RENDER:
+        # استخدام BASE_URL على Render
+        download_url = f"{BASE_URL}/api/file/{job.id}"
+    else:
+        # استخدام url_for المحلي
+        download_url = url_for('get_file', download_id=job.id, _external=True)
+    if not reused:
+        logger.info("تم إنشاء رابط تحميل: %s", download_url)
+    
+    return jsonify({
+        'success': True,
+        'download_id': job.id,
+        'download_url': download_url,
+        'status': job.status,
+        'progress': job.progress,
+        'reused': reused
+    })
+
+def run_download_job(job: Job, url: str, format_id: str, format_type: str,
+                     start_time: Optional[float] = None, end_time: Optional[float] = None) -> str:
+    """
+    تنفيذ مهمة التحميل داخل عامل المجدول (للفيديو كاملًا أو لمقطع منه).
+    
+    Returns:
+        مفتاح الملف في المخزن
+    """
+    logger.info("بدء تحميل %s بمعرف %s من الرابط %s", format_type, format_id, url)
+    journal = get_journal()
+    journal.mark(job.id, 'running')
+    
+    try:
+        # تحميل الفيديو أو الصوت باسم ملف ثابت لكل مهمة (لاستئنافه بعد إعادة التشغيل)
         if format_type == 'video':
-            file_path = downloader.download_video(url, format_id)
+            file_path = downloader.download_video(url, format_id, progress_callback=job.update_progress,
+                                                  output_name=job.id, cancel_token=job.cancel_token,
+                                                  start_time=start_time, end_time=end_time)
         else:  # audio
-            file_path = downloader.download_audio(url, format_id)
+            file_path = downloader.download_audio(url, format_id, progress_callback=job.update_progress,
+                                                  output_name=job.id, cancel_token=job.cancel_token,
+                                                  start_time=start_time, end_time=end_time)
         
         # التحقق من نجاح التحميل
         if not file_path or not os.path.exists(file_path):
-            logger.error(f"فشل التحميل: لم يتم إنشاء الملف {file_path}")
-            return jsonify({'error': 'فشل التحميل. الرجاء المحاولة مرة أخرى.'}), 500
+            logger.error("فشل التحميل: لم يتم إنشاء الملف %s", file_path)
+            raise RuntimeError('فشل التحميل. الرجاء المحاولة مرة أخرى.')
         
         # التحقق من حجم الملف
         file_size = os.path.getsize(file_path)
-        logger.info(f"تم التحميل بنجاح. حجم الملف: {file_size/(1024*1024):.1f} ميجابايت")
+        logger.info("تم التحميل بنجاح. حجم الملف: %.1f ميجابايت", file_size/(1024*1024))
         
         if file_size > MAX_FILE_SIZE:
             # حذف الملف
             os.remove(file_path)
-            return jsonify({
-                'error': f'حجم الملف ({file_size/(1024*1024):.1f} ميجابايت) أكبر من الحد المسموح به ({MAX_FILE_SIZE/(1024*1024):.1f} ميجابايت).'
-            }), 400
-        
-        # تحديث حالة التحميل
-        with sessions_lock:
-            download_sessions[session_id]['status'] = 'completed'
-            download_sessions[session_id]['progress'] = 100
-            download_sessions[session_id]['file_path'] = file_path
-        
-        # إنشاء رابط للتحميل
-        if ON_RENDER:
-            # استخدام BASE_URL على Render
-            download_url = f"{BASE_URL}/api/file/{download_id}"
-            logger.info(f"تم إنشاء رابط تحميل Render: {download_url}")
-        else:
-            # استخدام url_for المحلي
-            download_url = url_for('get_file', download_id=download_id, _external=True)
-            logger.info(f"تم إنشاء رابط تحميل محلي: {download_url}")
-        
-        return jsonify({
-            'success': True,
-            'download_id': download_id,
-            'download_url': download_url
-        })
+            raise RuntimeError(
+                f'حجم الملف ({file_size/(1024*1024):.1f} ميجابايت) أكبر من الحد المسموح به ({MAX_FILE_SIZE/(1024*1024):.1f} ميجابايت).'
+            )
         
+        # نشر الملف في المخزن (نقل أو رفع إلى مخزن الكائنات)
+        key = get_storage().publish(file_path)
+    except StageTimeout as e:
+        # أوقف المراقب مرحلة عالقة وحذف ملفاتها: فشل يُعرض للمستخدم
+        journal.mark(job.id, 'failed', error=str(e))
+        raise
+    except JobCancelled:
+        journal.remove(job.id)
+        raise
     except Exception as e:
-        logger.error(f"خطأ في تحميل الفيديو: {str(e)}")
-        return jsonify({'error': f'حدث خطأ أثناء التحميل: {str(e)}'}), 500
+        journal.mark(job.id, 'failed', error=str(e))
+        raise
+    
+    journal.mark(job.id, 'completed', result_path=key)
+    return key
 
 @app.route('/api/status/<download_id>', methods=['GET'])
 def get_status(download_id):
     """الحصول على حالة التحميل."""
-    # البحث عن معرف التحميل في جميع الجلسات
-    for session_id, session_data in download_sessions.items():
-        if session_data.get('download_id') == download_id:
-            return jsonify({
-                'status': session_data.get('status', 'unknown'),
-                'progress': session_data.get('progress', 0)
-            })
+    job = download_jobs.get(download_id)
+    if job is None:
+        return jsonify({'error': 'لم يتم العثور على التحميل'}), 404
+    
+    status = job.to_dict()
+    # موقع المهمة المنتظرة في الطابور والوقت المقدر لبدئها
+    position = get_scheduler().queue_position(job) if job.status == 'queued' else None
+    if position is not None:
+        status['queue_position'], status['queue_eta'] = position[0], int(position[1])
+    return jsonify(status)
+
+def cancel_job(job: Job) -> None:
+    """إلغاء مهمة تحميل: إيقاف التحميل وتحرير العامل، أو حذف الملف إذا كانت قد اكتملت"""
+    if not get_scheduler().cancel(job) and job.status == 'completed' and job.result:
+        try:
+            get_storage().delete(job.result)
+        except Exception as e:
+            logger.error("خطأ في حذف الملف: %s", e)
+    get_journal().remove(job.id)
+
+@app.route('/api/cancel/<download_id>', methods=['POST'])
+def cancel_download(download_id):
+    """إلغاء التحميل وإيقافه فورًا."""
+    with sessions_lock:
+        job = download_jobs.get(download_id)
+    if job is None:
+        return jsonify({'error': 'لم يتم العثور على التحميل'}), 404
     
-    return jsonify({'error': 'لم يتم العثور على التحميل'}), 404
+    cancel_job(job)
+    return jsonify({'success': True, 'status': job.status})
 
 @app.route('/download/<download_id>', methods=['GET'])
 def get_file(download_id):
     """تحميل الملف المحمل."""
-    # البحث عن معرف التحميل في جميع الجلسات
-    for session_id, session_data in download_sessions.items():
-        if session_data.get('download_id') == download_id:
-            file_path = session_data.get('file_path')
-            
-            if not file_path or not os.path.exists(file_path):
-                abort(404)
-            
-            # تحديد اسم الملف
-            filename = os.path.basename(file_path)
-            
-            # إرسال الملف
-            return send_file(
-                file_path,
-                as_attachment=True,
-                download_name=filename
-            )
+    job = download_jobs.get(download_id)
+    if job is None or job.status != 'completed':
+        abort(404)
+    
+    storage = get_storage()
+    key = job.result
+    if not key or not storage.exists(key):
+        abort(404)
+    
+    # تحديد اسم الملف
+    filename = os.path.basename(key)
+    
+    # مخزن الكائنات: إعادة التوجيه إلى رابط موقّع فلا تمر بايتات الملف عبر Python
+    presigned_url = storage.url(key, filename)
+    if presigned_url:
+        return redirect(presigned_url)
+    
+    # سعة الإرسال المتزامن: الرفض بدل إبطاء كل التنزيلات الجارية
+    uploads = get_capacity('upload')
+    if not uploads.try_acquire():
+        return busy_response(CapacityExceeded('upload', uploads.retry_after()))
+    
+    # إرسال الملف مع قياس زمن الرفع حتى إغلاق الاستجابة
+    started_at = time.perf_counter()
+    wall_started_at = time.time()
+    try:
+        response = send_file(
+            storage.local_path(key),
+            as_attachment=True,
+            download_name=filename
+        )
+    except Exception:
+        uploads.release()
+        raise
+    format_type = 'audio' if filename.startswith('audio_') else 'video'
+    
+    def on_close():
+        uploads.release(time.perf_counter() - started_at)
+        UPLOAD_SECONDS.observe(time.perf_counter() - started_at, frontend='web', type=format_type)
+        job.trace.add('upload', wall_started_at, time.time())
+    
+    callbacks = [on_close]
+    body = response.response
+    if hasattr(body, 'close'):
+        callbacks.insert(0, body.close)
     
-    abort(404)
+    # حصة من الحد العام للرفع (يُعاد توزيعها عند بدء وانتهاء التحميلات والإرسال عبر تلغرام)
+    bandwidth = get_bandwidth()
+    if bandwidth.limits['upload'] > 0:
+        allocation = bandwidth.allocate('upload', format_type)
+        callbacks.append(allocation.release)
+        body = _throttled_body(body, allocation)
+    
+    # استجابة send_file من نوع direct_passthrough لا تستدعي call_on_close عند الإغلاق،
+    # لذا تُغلف بـ ClosingIterator الذي يستدعيها الخادم بعد انتهاء الإرسال
+    response.response = ClosingIterator(body, callbacks)
+    return response
+
+def _throttled_body(body, allocation):
+    """تمرير أجزاء الملف بمعدل حصة الرفع الحالية"""
+    for chunk in body:
+        allocation.throttle(len(chunk))
+        yield chunk
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """مقاييس خط التحميل بصيغة Prometheus (مجمعة من البوت وواجهة الويب)."""
+    return Response(metrics_registry.render(), mimetype='text/plain; version=0.0.4; charset=utf-8')
+
+@app.route('/debug/memory', methods=['GET'])
+def memory_report():
+    """
+    تقرير ذاكرة هذه العملية (يجب تفعيل MEMORY_DIAGNOSTICS_ENABLED): الذاكرة المقيمة والمخصصة،
+    وأحجام المخازن، وأكثر مواضع التخصيص نموًا منذ لقطة الأساس (?reset=1 لأخذ لقطة جديدة).
+    """
+    if not MEMORY_DIAGNOSTICS_ENABLED:
+        abort(404)
+    limit = request.args.get('limit', 20, type=int)
+    report = memory_monitor.report(limit=max(1, min(limit, 200)))
+    report['pid'] = os.getpid()
+    if request.args.get('reset') == '1':
+        memory_monitor.reset_baseline()
+    return jsonify(report)
 
 @app.route('/api/cleanup', methods=['POST'])
 def cleanup_session():
@@ -203,17 +589,13 @@ def cleanup_session():
     if not session_id:
         return jsonify({'error': 'معرف الجلسة مطلوب'}), 400
     
-    if session_id in download_sessions:
-        # حذف الملف إذا كان موجودًا
-        file_path = download_sessions[session_id].get('file_path')
-        if file_path and os.path.exists(file_path):
-            try:
-                os.remove(file_path)
-            except Exception as e:
-                logger.error(f"خطأ في حذف الملف: {str(e)}")
-        
-        # حذف الجلسة
-        del download_sessions[session_id]
+    with sessions_lock:
+        session_data = download_sessions.pop(session_id, None)
+        job = download_jobs.pop(session_data.get('download_id'), None) if session_data else None
+    
+    if job is not None:
+        # إلغاء التحميل الجاري (مثل إغلاق الصفحة) أو حذف الملف المكتمل
+        cancel_job(job)
     
     return jsonify({'success': True})
 
@@ -229,10 +611,66 @@ def server_error(e):
 
 def cleanup_old_files():
     """تنظيف الملفات القديمة."""
-    downloader.cleanup_old_files(FILE_EXPIRY)
+    # الملفات الجزئية وغير المنشورة في مجلد التحميل، ثم الملفات المنشورة في المخزن
+    downloader.cleanup_old_files(FILE_EXPIRY / 3600)
+    get_storage().cleanup(FILE_EXPIRY)
+    get_transcoder().cleanup(FILE_EXPIRY)
+    get_journal().prune(FILE_EXPIRY)
+
+def restore_session(job: Job, record: Dict) -> None:
+    """ربط مهمة مستعادة من السجل بجلستها ومعرف تحميلها"""
+    session_id = record['payload'].get('session_id') or str(uuid.uuid4())
+    with sessions_lock:
+        download_jobs.set(job.id, job)
+        session_data = download_sessions.get(session_id)
+        if session_data is None:
+            session_data = {
+                'url': record['url'],
+                'video_info': None,
+                'created_at': record['created_at'],
+            }
+            download_sessions.set(session_id, session_data)
+        session_data.update({
+            'download_id': job.id,
+            'format_id': record['format_id'],
+            'format_type': record['format_type'],
+        })
+
+def resume_journaled_jobs() -> None:
+    """
+    استعادة مهام الويب من السجل بعد إعادة التشغيل: إعادة إضافة المهام غير المكتملة
+    إلى الطابور بنفس المعرف (فيستأنف yt-dlp ملفاتها الجزئية)، واستعادة روابط الملفات المكتملة.
+    """
+    journal = get_journal()
+    
+    for record in journal.completed('web'):
+        if not record['result_path'] or not get_storage().exists(record['result_path']):
+            journal.remove(record['id'])
+            continue
+        job = Job(lambda job: None, record['owner'], cost=record['cost'], job_id=record['id'])
+        job.status = 'completed'
+        job.progress = 100
+        job.result = record['result_path']
+        job.future.set_result(job.result)
+        restore_session(job, record)
+    
+    for record in journal.claim_unfinished('web'):
+        logger.info("استئناف مهمة التحميل %s من السجل", record['id'])
+        url, format_id, format_type = record['url'], record['format_id'], record['format_type']
+        start_time, end_time = record['payload'].get('start_time'), record['payload'].get('end_time')
+        job = Job(
+            lambda job, url=url, format_id=format_id, format_type=format_type,
+                   start_time=start_time, end_time=end_time:
+                run_download_job(job, url, format_id, format_type, start_time, end_time),
+            record['owner'], cost=record['cost'], job_id=record['id']
+        )
+        restore_session(job, record)
+        # المهام المستأنفة قُبلت قبل إعادة التشغيل فلا يطبق عليها حد الطابور
+        get_scheduler().submit_job(job, admit=False)
 
-# تنظيف الملفات القديمة عند تحميل الوحدة
+# تنظيف الملفات القديمة واستئناف المهام المسجلة عند تحميل الوحدة
 cleanup_old_files()
+resume_journaled_jobs()
 
 if __name__ == '__main__':
     # تشغيل التطبيق
@@ -2,6 +2,7 @@
 let sessionId = null;
 let downloadId = null;
 let statusCheckInterval = null;
+let formatsCheckTimeout = null;
 
 // عناصر DOM
 const youtubeForm = document.getElementById('youtube-form');
@@ -16,12 +17,15 @@ const videoDuration = document.getElementById('video-duration');
 const videoViews = document.getElementById('video-views');
 const videoFormatsList = document.getElementById('video-formats-list');
 const audioFormatsList = document.getElementById('audio-formats-list');
+const clipStart = document.getElementById('clip-start');
+const clipEnd = document.getElementById('clip-end');
 const downloadProgress = document.getElementById('download-progress');
 const progressBar = document.getElementById('progress-bar');
 const downloadStatus = document.getElementById('download-status');
 const downloadComplete = document.getElementById('download-complete');
 const downloadLink = document.getElementById('download-link');
 const newDownload = document.getElementById('new-download');
+const cancelDownloadButton = document.getElementById('cancel-download');
 
 // تنسيق الحجم من بايت إلى صيغة مقروءة
 function formatSize(sizeBytes) {
@@ -92,22 +96,68 @@ function showVideoInfo(videoData) {
     videoTitle.textContent = videoData.title;
     
     // تعيين اسم القناة
-    videoAuthor.textContent = `بواسطة: ${videoData.author}`;
+    videoAuthor.textContent = `بواسطة: ${videoData.channel}`;
     
     // تعيين المدة
     videoDuration.textContent = `⏱ ${formatDuration(videoData.duration)}`;
     
-    // تعيين عدد المشاهدات
-    videoViews.textContent = `👁 ${formatViews(videoData.views)} مشاهدة`;
+    // تعيين عدد المشاهدات (إذا كان متاحًا)
+    videoViews.textContent = videoData.views ? `👁 ${formatViews(videoData.views)} مشاهدة` : '';
     
-    // تحديث قوائم التنسيقات
-    updateFormatLists(videoData.formats);
+    // تحديث قوائم التنسيقات (أو انتظارها إذا كانت هذه معاينة سريعة)
+    if (videoData.formats) {
+        updateFormatLists(videoData.formats);
+    } else {
+        showFormatsLoading();
+        checkFormats();
+    }
     
     // إظهار معلومات الفيديو
     videoInfo.classList.remove('d-none');
     hideLoading();
 }
 
+// عرض مؤشر تحميل مكان قوائم التنسيقات
+function showFormatsLoading() {
+    const placeholder = `
+        <div class="list-group-item text-center text-muted">
+            <span class="spinner-border spinner-border-sm" role="status"></span>
+            جاري تحميل الجودات المتاحة...
+        </div>
+    `;
+    videoFormatsList.innerHTML = placeholder;
+    audioFormatsList.innerHTML = placeholder;
+}
+
+// انتظار قائمة التنسيقات التي تُستخرج في الخلفية بعد المعاينة
+function checkFormats() {
+    const currentSession = sessionId;
+    fetch(`/api/formats/${currentSession}`)
+        .then(response => response.json())
+        .then(data => {
+            // تجاهل الرد إذا بدأ المستخدم رابطًا جديدًا
+            if (currentSession !== sessionId) return;
+            
+            if (data.error) {
+                videoInfo.classList.add('d-none');
+                showError(data.error);
+                return;
+            }
+            
+            if (data.ready) {
+                updateFormatLists(data.video_info.formats);
+            } else {
+                formatsCheckTimeout = setTimeout(checkFormats, 500);
+            }
+        })
+        .catch(error => {
+            console.error('خطأ في تحميل التنسيقات:', error);
+            if (currentSession === sessionId) {
+                formatsCheckTimeout = setTimeout(checkFormats, 1000);
+            }
+        });
+}
+
 // تحديث قوائم التنسيقات
 function updateFormatLists(formats) {
     // تفريغ القوائم
@@ -120,20 +170,20 @@ function updateFormatLists(formats) {
     
     // إضافة تنسيقات الفيديو
     videoFormats.forEach(format => {
-        const sizeStr = format.filesize > 0 ? formatSize(format.filesize) : 'غير معروف';
+        const sizeStr = format.size > 0 ? formatSize(format.size) : 'غير معروف';
         const item = document.createElement('button');
         item.type = 'button';
         item.className = 'list-group-item list-group-item-action d-flex justify-content-between align-items-center';
         item.innerHTML = `
             <span>
-                <i class="bi bi-film"></i> ${format.resolution}
+                <i class="bi bi-film"></i> ${format.quality}
             </span>
             <span class="badge bg-primary rounded-pill">${sizeStr}</span>
         `;
         
         // إضافة حدث النقر
         item.addEventListener('click', () => {
-            startDownload(format.format_id, 'video');
+            startDownload(format.id, 'video');
         });
         
         videoFormatsList.appendChild(item);
@@ -141,20 +191,20 @@ function updateFormatLists(formats) {
     
     // إضافة تنسيقات الصوت
     audioFormats.forEach(format => {
-        const sizeStr = format.filesize > 0 ? formatSize(format.filesize) : 'غير معروف';
+        const sizeStr = format.size > 0 ? formatSize(format.size) : 'غير معروف';
         const item = document.createElement('button');
         item.type = 'button';
         item.className = 'list-group-item list-group-item-action d-flex justify-content-between align-items-center';
         item.innerHTML = `
             <span>
-                <i class="bi bi-music-note-beamed"></i> ${format.resolution}
+                <i class="bi bi-music-note-beamed"></i> ${format.quality}
             </span>
             <span class="badge bg-success rounded-pill">${sizeStr}</span>
         `;
         
         // إضافة حدث النقر
         item.addEventListener('click', () => {
-            startDownload(format.format_id, 'audio');
+            startDownload(format.id, 'audio');
         });
         
         audioFormatsList.appendChild(item);
@@ -182,7 +232,9 @@ function startDownload(formatId, formatType) {
         body: JSON.stringify({
             session_id: sessionId,
             format_id: formatId,
-            format_type: formatType
+            format_type: formatType,
+            start_time: clipStart.value.trim(),
+            end_time: clipEnd.value.trim()
         })
     })
     .then(response => response.json())
@@ -239,14 +291,25 @@ function checkDownloadStatus() {
             updateProgressBar(data.progress);
             
             // تحديث حالة التحميل
-            if (data.status === 'preparing') {
-                downloadStatus.textContent = 'جاري تجهيز الملف...';
-            } else if (data.status === 'downloading') {
+            if (data.status === 'queued') {
+                downloadStatus.textContent = 'في انتظار دورك في طابور التحميل...';
+                if (data.queue_position) {
+                    downloadStatus.textContent += ` ترتيبك: ${data.queue_position}، يبدأ خلال ~${formatDuration(data.queue_eta)}`;
+                }
+            } else if (data.status === 'running') {
                 downloadStatus.textContent = `جاري التحميل... ${data.progress}%`;
             } else if (data.status === 'completed') {
                 clearInterval(statusCheckInterval);
                 downloadProgress.classList.add('d-none');
                 downloadComplete.classList.remove('d-none');
+            } else if (data.status === 'failed') {
+                clearInterval(statusCheckInterval);
+                downloadProgress.classList.add('d-none');
+                showError(data.error || 'فشل التحميل. الرجاء المحاولة مرة أخرى.');
+            } else if (data.status === 'cancelled') {
+                clearInterval(statusCheckInterval);
+                downloadProgress.classList.add('d-none');
+                videoInfo.classList.remove('d-none');
             }
         })
         .catch(error => {
@@ -254,6 +317,26 @@ function checkDownloadStatus() {
         });
 }
 
+// إلغاء التحميل الجاري وإيقافه على الخادم
+function cancelDownload() {
+    if (statusCheckInterval) {
+        clearInterval(statusCheckInterval);
+        statusCheckInterval = null;
+    }
+    
+    if (downloadId) {
+        fetch(`/api/cancel/${downloadId}`, { method: 'POST' })
+            .catch(error => {
+                console.error('خطأ في إلغاء التحميل:', error);
+            });
+        downloadId = null;
+    }
+    
+    // العودة إلى قائمة التنسيقات لاختيار تنسيق آخر
+    downloadProgress.classList.add('d-none');
+    videoInfo.classList.remove('d-none');
+}
+
 // تحديث شريط التقدم
 function updateProgressBar(progress) {
     progressBar.style.width = `${progress}%`;
@@ -294,11 +377,15 @@ function resetForm() {
     sessionId = null;
     downloadId = null;
     
-    // إيقاف التحقق من حالة التحميل
+    // إيقاف التحقق من حالة التحميل وانتظار التنسيقات
     if (statusCheckInterval) {
         clearInterval(statusCheckInterval);
         statusCheckInterval = null;
     }
+    if (formatsCheckTimeout) {
+        clearTimeout(formatsCheckTimeout);
+        formatsCheckTimeout = null;
+    }
 }
 
 // معالجة تقديم النموذج
@@ -334,10 +421,14 @@ youtubeForm.addEventListener('submit', function(event) {
         }
         
         // تخزين معرف الجلسة
-        sessionId = data.video.session_id;
+        sessionId = data.session_id;
+        
+        // بداية المقطع من معامل t= في الرابط (إن وُجد)
+        clipStart.value = data.start_time ? formatDuration(data.start_time) : '';
+        clipEnd.value = '';
         
         // إظهار معلومات الفيديو
-        showVideoInfo(data.video);
+        showVideoInfo(data.video_info);
     })
     .catch(error => {
         console.error('خطأ في استخراج معلومات الفيديو:', error);
@@ -348,5 +439,8 @@ youtubeForm.addEventListener('submit', function(event) {
 // معالجة نقر زر "تحميل فيديو جديد"
 newDownload.addEventListener('click', resetForm);
 
+// معالجة نقر زر "إلغاء التحميل"
+cancelDownloadButton.addEventListener('click', cancelDownload);
+
 // تنظيف الجلسة عند إغلاق الصفحة
 window.addEventListener('beforeunload', cleanupSession);
@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+import os
+import sys
+import signal
+import argparse
+import threading
+import logging
+
+# إضافة المجلد الرئيسي إلى مسار النظام
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from config import (
+    INFO_CACHE_SIZE, INFO_CACHE_TTL, FILE_EXPIRY,
+    METRICS_DIR, METRICS_FLUSH_INTERVAL, WORKER_CONCURRENCY
+)
+from common.bandwidth import get_bandwidth
+from common.downloader import YouTubeDownloader
+from common.logging_setup import setup_logging
+from common.metrics import registry as metrics_registry
+from common.storage import get_storage
+from common.transcode import get_transcoder
+from common.work_queue import get_work_queue
+from common.workers import DownloadWorker
+
+# إعداد التسجيل المركزي (طابور وخيط كتابة واحد)
+setup_logging()
+logger = logging.getLogger(__name__)
+
+# الفترة بين عمليات تنظيف الطابور والملفات القديمة (بالثواني)
+CLEANUP_INTERVAL = 10 * 60
+
+
+def main():
+    """تشغيل عامل تحميل يسحب المهام من الطابور المشترك."""
+    parser = argparse.ArgumentParser(description='عامل تحميل يسحب المهام من الطابور المشترك')
+    parser.add_argument('--concurrency', type=int, default=WORKER_CONCURRENCY, help='عدد المهام المتوازية')
+    args = parser.parse_args()
+
+    metrics_registry.start_flusher(METRICS_DIR, METRICS_FLUSH_INTERVAL)
+    queue = get_work_queue()
+    downloader = YouTubeDownloader(get_storage().scratch_dir, INFO_CACHE_SIZE, INFO_CACHE_TTL, get_bandwidth())
+    worker = DownloadWorker(queue, downloader, concurrency=args.concurrency).start()
+
+    stopping = threading.Event()
+
+    def handle_signal(signum, frame):
+        logger.info("جاري إيقاف عامل التحميل بعد إنهاء المهام الجارية...")
+        stopping.set()
+
+    signal.signal(signal.SIGTERM, handle_signal)
+    signal.signal(signal.SIGINT, handle_signal)
+
+    while not stopping.wait(CLEANUP_INTERVAL):
+        # حذف نتائج المهام التي لم يقرأها منتجها (مثل واجهة توقفت)
+        pruned = queue.prune(FILE_EXPIRY)
+        if pruned:
+            logger.info("تم حذف %s مهمة منتهية من الطابور", pruned)
+        # نتائج "ملاءمة الحجم" المخزنة التي لم تُطلب مؤخرًا
+        get_transcoder().cleanup(FILE_EXPIRY)
+
+    worker.stop()
+    logger.info("تم إيقاف عامل التحميل")
+
+
+if __name__ == '__main__':
+    main()